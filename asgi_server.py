@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Modalità di servizio ASGI per il server SPARQL di produzione.
+
+Con il server WSGI threaded ogni connessione occupa un thread per tutta la
+durata della risposta, anche quando il client scarica lentamente un export
+o un risultato SPARQL grande. AsgiAdapter espone la stessa app Flask (le
+stesse route) come applicazione ASGI:
+
+- la view Flask (valutazione delle query, lettura degli indici, ingest)
+  viene eseguita in un pool di thread limitato;
+- le risposte in streaming vengono prodotte un blocco alla volta nel pool,
+  ma l'invio al client avviene sull'event loop: mentre un client lento
+  riceve i dati nessun thread resta occupato;
+- file statici ed export pre-generati (send_file / send_from_directory,
+  anche con Range) vengono letti e inviati direttamente dall'event loop;
+- il corpo della richiesta viene letto su richiesta della view, quindi un
+  upload NDJSON molto grande non viene accumulato in memoria.
+
+Migliaia di connessioni inattive o lente costano quindi solo memoria
+dell'event loop. Il server ASGI usato è uvicorn (dipendenza opzionale).
+"""
+
+import asyncio
+import contextvars
+import io
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+from werkzeug.wsgi import FileWrapper
+
+try:
+    import uvicorn
+    HAS_UVICORN = True
+except ImportError:
+    HAS_UVICORN = False
+
+logger = logging.getLogger(__name__)
+
+FILE_CHUNK_SIZE = 256 * 1024
+
+
+class _AsgiFileWrapper(FileWrapper):
+    """wsgi.file_wrapper: segnala all'adattatore che la risposta è un file"""
+
+
+class _InputStream(io.RawIOBase):
+    """wsgi.input che chiede i blocchi del corpo all'event loop quando la view li legge"""
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = b''
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def _fill(self):
+        if self._done:
+            return False
+        message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+        if message['type'] == 'http.disconnect':
+            self._done = True
+            return False
+        self._buffer += message.get('body', b'')
+        if not message.get('more_body', False):
+            self._done = True
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            while self._fill():
+                pass
+            data, self._buffer = self._buffer, b''
+            return data
+        while len(self._buffer) < size and self._fill():
+            pass
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readinto(self, target):
+        data = self.read(len(target))
+        target[:len(data)] = data
+        return len(data)
+
+    def readline(self, size=-1):
+        while b'\n' not in self._buffer and (size < 0 or len(self._buffer) < size) and self._fill():
+            pass
+        end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+        if size >= 0:
+            end = min(end, size)
+        data, self._buffer = self._buffer[:end], self._buffer[end:]
+        return data
+
+
+class AsgiAdapter:
+    """Applicazione ASGI che serve un'app WSGI (Flask) senza tenere occupato
+    un thread durante l'invio della risposta"""
+
+    def __init__(self, wsgi_app, threads=32, on_startup=None, on_shutdown=None):
+        self.wsgi_app = wsgi_app
+        self.threads = threads
+        self.on_startup = on_startup
+        self.on_shutdown = on_shutdown
+        self.executor = None
+        self.active = 0
+
+    def _executor(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='asgi-view')
+        return self.executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'websocket':
+            await send({'type': 'websocket.close', 'code': 1003})
+
+    async def _lifespan(self, receive, send):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    if self.on_startup:
+                        await loop.run_in_executor(self._executor(), self.on_startup)
+                except Exception as e:
+                    logger.error(f"Errore all'avvio dell'app ASGI: {e}", exc_info=True)
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.on_shutdown:
+                    await loop.run_in_executor(self._executor(), self.on_shutdown)
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': unquote(scope['path']).encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            # Il corpo termina con l'ultimo messaggio ASGI, anche senza Content-Length
+            'wsgi.input_terminated': True,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': _AsgiFileWrapper,
+        }
+        for raw_name, raw_value in scope.get('headers', []):
+            name = raw_name.decode('latin-1').upper().replace('-', '_')
+            value = raw_value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name == 'CONTENT_LENGTH':
+                environ['CONTENT_LENGTH'] = value
+            else:
+                key = 'HTTP_' + name
+                environ[key] = environ[key] + ',' + value if key in environ else value
+        return environ
+
+    async def _http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        executor = self._executor()
+        environ = self._environ(scope, _InputStream(receive, loop))
+        # Tutte le chiamate all'app WSGI usano lo stesso contesto: i context
+        # manager di Flask aperti nella view restano validi durante lo streaming
+        context = contextvars.copy_context()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                  for name, value in headers]
+
+        self.active += 1
+        result = None
+        try:
+            result = await loop.run_in_executor(executor, context.run, self.wsgi_app, environ, start_response)
+            await send({'type': 'http.response.start', 'status': started['status'],
+                        'headers': started['headers']})
+            started['sent'] = True
+            if scope['method'] == 'HEAD':
+                await send({'type': 'http.response.body', 'body': b''})
+            elif isinstance(result, (list, tuple)):
+                await send({'type': 'http.response.body', 'body': b''.join(result)})
+            else:
+                file_range = _file_range(result)
+                if file_range is not None:
+                    await _send_file(send, *file_range)
+                else:
+                    await self._send_iterable(send, result, context, executor)
+        except OSError as e:
+            # Client disconnesso durante l'invio
+            logger.debug(f"Invio interrotto: {e}")
+        except Exception as e:
+            logger.error(f"Errore nella risposta a {scope['method']} {scope['path']}: {e}", exc_info=True)
+            if not started.get('sent'):
+                await send({'type': 'http.response.start', 'status': 500,
+                            'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+                await send({'type': 'http.response.body', 'body': b'Internal Server Error'})
+        finally:
+            self.active -= 1
+            close = getattr(result, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(executor, context.run, close)
+
+    @staticmethod
+    async def _send_iterable(send, result, context, executor):
+        loop = asyncio.get_running_loop()
+        iterator = iter(result)
+        done = object()
+        while True:
+            # Il blocco successivo (es. righe SPARQL serializzate) nel pool di thread
+            chunk = await loop.run_in_executor(executor, context.run, next, iterator, done)
+            if chunk is done:
+                break
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    def stats(self):
+        return {'activeRequests': self.active, 'threads': self.threads}
+
+
+def _file_range(result):
+    """(file, offset, lunghezza o None) se la risposta è un file servito con send_file"""
+    if isinstance(result, _AsgiFileWrapper):
+        return result.file, None, None
+    # Richiesta Range: werkzeug avvolge il file wrapper in un _RangeWrapper
+    inner = getattr(result, 'iterable', None)
+    if isinstance(inner, _AsgiFileWrapper) and hasattr(result, 'start_byte'):
+        return inner.file, result.start_byte, result.byte_range
+    return None
+
+
+async def _send_file(send, file, offset, length):
+    """Invia un file dall'event loop a blocchi (letture dalla page cache)"""
+    if offset is not None:
+        file.seek(offset)
+    remaining = length
+    while remaining is None or remaining > 0:
+        size = FILE_CHUNK_SIZE if remaining is None else min(FILE_CHUNK_SIZE, remaining)
+        chunk = file.read(size)
+        if not chunk:
+            break
+        if remaining is not None:
+            remaining -= len(chunk)
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+def serve(asgi_app, host, port, backlog=2048, limit_concurrency=None):
+    """Avvia l'app ASGI con uvicorn"""
+    if not HAS_UVICORN:
+        raise RuntimeError("la modalità ASGI richiede uvicorn (pip install uvicorn)")
+    uvicorn.run(asgi_app, host=host, port=port, backlog=backlog, lifespan='on',
+                limit_concurrency=limit_concurrency, log_level='info')
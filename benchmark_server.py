@@ -0,0 +1,624 @@
+#!/usr/bin/env python3
+"""
+Benchmark HTTP del server SPARQL di produzione.
+
+Avvia il server su una porta effimera contro un grafo sintetico di
+dimensione configurabile, riproduce un mix realistico di richieste (/sparql,
+/api/stats, /api/contributions, /api/platforms, /api/search e ingest) con un
+numero fisso di client concorrenti e scrive in un file JSON:
+
+- latenza p50/p95/p99, media e massima, per endpoint e complessiva;
+- throughput ed errori;
+- memoria residente del server (all'avvio, massima, alla fine).
+
+Il file è una baseline da confrontare tra commit con --compare: il confronto
+stampa le variazioni e termina con codice 1 se il p95 di un endpoint peggiora
+oltre --max-regression.
+
+Il grafo sintetico è il grafo di partenza (--kg-file) replicato --scale
+volte, con gli URI delle risorse rinominati per ogni copia: la forma del
+grafo (piattaforme, processi, contributi, fallacie) resta quella reale e la
+dimensione cresce linearmente. In alternativa --synthetic-triples genera un
+grafo della dimensione richiesta con create_synthetic_kg.py (da 10k a 50M
+triple, deterministico a parità di --seed).
+
+Modalità:
+- subprocess (default): sparql_server_production.py in un processo separato
+  con le opzioni di --server-arg, misura la memoria da /proc sommando quella
+  del server e di tutti i suoi processi figli (worker pre-fork e worker delle
+  query), con la PSS, che divide le pagine condivise copy-on-write tra i
+  processi, dove disponibile;
+- inprocess: l'app Flask servita da un server werkzeug in un thread dello
+  stesso processo (più rapido da avviare, RSS comprensiva dei client).
+
+Esempi:
+    python benchmark_server.py --scale 4 --concurrency 16 --duration 30 --output bench_baseline.json
+    python benchmark_server.py --scale 4 --compare bench_baseline.json --output bench_new.json
+    python benchmark_server.py --mix sparql=5,search=5 --server-arg=--query-workers=0
+    python benchmark_server.py --synthetic-triples 1000000 --output bench_1m.json
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+from rdflib import Graph, URIRef
+
+from create_synthetic_kg import create_synthetic_kg
+from kg_metrics import process_rss_bytes
+
+RESOURCE_NS = 'https://w3id.org/deliberation/resource/'
+
+# Peso di ogni tipo di richiesta nel mix predefinito
+DEFAULT_MIX = {
+    'sparql': 3,
+    'stats': 2,
+    'contributions': 3,
+    'platforms': 1,
+    'search': 3,
+    'ingest': 1,
+}
+
+SPARQL_QUERIES = [
+    """PREFIX del: <https://w3id.org/deliberation/ontology#>
+    SELECT ?process ?name WHERE { ?process a del:DeliberationProcess ; del:name ?name } LIMIT 50""",
+    """PREFIX del: <https://w3id.org/deliberation/ontology#>
+    SELECT ?platform (COUNT(?c) AS ?contributions) WHERE {
+        ?c a del:Contribution ; del:partOf ?p . ?p del:platform ?platform
+    } GROUP BY ?platform""",
+    """PREFIX del: <https://w3id.org/deliberation/ontology#>
+    SELECT ?c ?text ?author WHERE {
+        ?c a del:Contribution ; del:text ?text .
+        OPTIONAL { ?c del:madeBy ?author }
+    } LIMIT 100""",
+    """PREFIX del: <https://w3id.org/deliberation/ontology#>
+    SELECT ?c ?type WHERE { ?c del:containsFallacy ?f . ?f a ?type } LIMIT 200""",
+]
+
+SEARCH_TERMS = ['climate', 'clima', 'energia', 'energy', 'madrid', 'parco', 'transport*', 'green',
+                'policy', 'citizens', 'barcelona', 'ciudad', 'emission*', 'europe']
+
+PERCENTILES = (50, 95, 99)
+
+
+def scaled_graph(base_file, scale):
+    """Grafo di partenza replicato `scale` volte (URI delle risorse rinominati per copia)"""
+    base = Graph()
+    base.parse(base_file, format='turtle' if base_file.endswith('.ttl') else None)
+    if scale <= 1:
+        return base
+    graph = Graph()
+    for prefix, namespace in base.namespaces():
+        graph.bind(prefix, namespace, override=True, replace=True)
+    graph.addN((s, p, o, graph) for s, p, o in base)
+    for copy in range(1, scale):
+        suffix = f"-copy{copy}"
+
+        def rename(term):
+            if isinstance(term, URIRef) and term.startswith(RESOURCE_NS):
+                return URIRef(term + suffix)
+            return term
+
+        graph.addN((rename(s), p, rename(o), graph) for s, p, o in base)
+    return graph
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def proc_rss_bytes(pid):
+    """RSS di un altro processo da /proc (None se non disponibile)"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def proc_pss_bytes(pid):
+    """PSS di un processo da /proc (le pagine condivise sono divise tra i
+    processi che le usano); None se smaps_rollup non è disponibile"""
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def proc_descendants(pid):
+    """Pid di tutti i discendenti di un processo (figli, nipoti, ...) da /proc"""
+    children = {}
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Il nome del comando (tra parentesi) può contenere spazi
+        fields = stat[stat.rfind(')') + 2:].split()
+        if len(fields) > 1:
+            children.setdefault(int(fields[1]), []).append(int(entry))
+    descendants = []
+    pending = [pid]
+    while pending:
+        for child in children.get(pending.pop(), []):
+            descendants.append(child)
+            pending.append(child)
+    return descendants
+
+
+def proc_tree_memory_bytes(pid):
+    """Memoria del processo e dei suoi discendenti: somma delle PSS se
+    disponibili (le pagine ereditate con fork non vengono contate più
+    volte), altrimenti somma delle RSS; None se /proc non è disponibile"""
+    pids = [pid] + proc_descendants(pid)
+    pss = [proc_pss_bytes(p) for p in pids]
+    if pss[0] is not None:
+        return sum(value for value in pss if value is not None)
+    rss = [proc_rss_bytes(p) for p in pids]
+    if rss[0] is None:
+        return None
+    return sum(value for value in rss if value is not None)
+
+
+class SubprocessServer:
+    """sparql_server_production.py avviato in un processo separato"""
+
+    def __init__(self, kg_file, port, server_args, log_file):
+        self.kg_file = kg_file
+        self.port = port
+        self.server_args = server_args
+        self.log_file = log_file
+        self.process = None
+
+    def start(self):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sparql_server_production.py')
+        command = [sys.executable, script, '--kg-file', self.kg_file, '--host', '127.0.0.1',
+                   '--port', str(self.port), '--export-dir', 'none',
+                   '--slow-query-log', 'none'] + self.server_args
+        self._log = open(self.log_file, 'wb')
+        self.process = subprocess.Popen(command, stdout=self._log, stderr=subprocess.STDOUT,
+                                        cwd=os.path.dirname(self.kg_file))
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def rss(self):
+        return proc_tree_memory_bytes(self.process.pid)
+
+    def stop(self):
+        if self.process is not None and self.alive():
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self._log.close()
+
+
+class InProcessServer:
+    """App Flask di produzione servita da werkzeug in un thread"""
+
+    def __init__(self, kg_file, port):
+        self.kg_file = kg_file
+        self.port = port
+        self.server = None
+
+    def start(self):
+        from werkzeug.serving import make_server
+        import sparql_server_production as production
+
+        for name in (None, 'werkzeug'):
+            logging.getLogger(name).setLevel(logging.WARNING)
+        production.configure_slow_query_log('none', 1000.0, 1.0, 10)
+        if not production.load_knowledge_graph(self.kg_file):
+            raise RuntimeError(f"caricamento di {self.kg_file} non riuscito")
+        self.server = make_server('127.0.0.1', self.port, production.app, threaded=True)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def alive(self):
+        return True
+
+    def rss(self):
+        return process_rss_bytes()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+
+class Client:
+    """Connessione HTTP/1.1 persistente di un client del benchmark"""
+
+    def __init__(self, port, timeout):
+        self.port = port
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, path, body=body, headers=headers or {})
+                response = self.conn.getresponse()
+                data = response.read()
+                if response.getheader('Connection', '').lower() == 'close' or response.version == 10:
+                    self.close()
+                return response.status, len(data)
+            except (http.client.HTTPException, OSError):
+                # Connessione chiusa dal server: un solo nuovo tentativo
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class Workload:
+    """Genera le richieste del mix (deterministiche a parità di seme)"""
+
+    def __init__(self, mix, platforms, seed):
+        self.kinds = sorted(kind for kind, weight in mix.items() if weight > 0)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.platforms = platforms
+        self.seed = seed
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def rng(self, client_id):
+        return random.Random(f"{self.seed}-{client_id}")
+
+    def next_request(self, rng):
+        kind = rng.choices(self.kinds, self.weights)[0]
+        return (kind,) + getattr(self, f'_{kind}')(rng)
+
+    def _sparql(self, rng):
+        query = rng.choice(SPARQL_QUERIES)
+        params = {'query': query}
+        if rng.random() < 0.5:
+            params['cache'] = 'false'  # Metà delle query rivalutate, metà servite dalla cache
+        return 'GET', '/sparql?' + urlencode(params), None, {'Accept': 'application/sparql-results+json'}
+
+    def _stats(self, rng):
+        return 'GET', '/api/stats', None, None
+
+    def _contributions(self, rng):
+        params = {'limit': rng.choice([50, 100, 500])}
+        if self.platforms and rng.random() < 0.5:
+            params['platform'] = rng.choice(self.platforms)
+        return 'GET', '/api/contributions?' + urlencode(params), None, None
+
+    def _platforms(self, rng):
+        return 'GET', '/api/platforms', None, None
+
+    def _search(self, rng):
+        return 'GET', '/api/search?' + urlencode({'q': rng.choice(SEARCH_TERMS), 'limit': 50}), None, None
+
+    def _ingest(self, rng):
+        with self._lock:
+            self._counter += 1
+            number = self._counter
+        item = {
+            'contribution_id': f"bench-{self.seed}-{number}",
+            'text': f"Contributo di benchmark {number} sul clima e l'energia",
+            'user_id': f"bench-user-{rng.randrange(200)}",
+            'user_name': f"Utente {rng.randrange(200)}",
+            'post_id': f"bench-post-{rng.randrange(50)}",
+            'group_id': f"bench-group-{rng.randrange(5)}",
+            'value': rng.choice([-1, 0, 1]),
+            'fallacies': [{'type': 'Ad Hominem', 'score': round(rng.random(), 2), 'rationale': 'benchmark'}]
+            if rng.random() < 0.3 else []
+        }
+        return 'POST', '/api/ingest/fallacy', json.dumps(item), {'Content-Type': 'application/json'}
+
+
+def percentile(sorted_values, pct):
+    """Percentile con il metodo nearest-rank"""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    summary = {
+        'requests': len(values),
+        'errors': errors,
+        'throughputRps': round(len(values) / elapsed, 2) if elapsed else None,
+    }
+    if values:
+        summary['meanMs'] = round(sum(values) / len(values) * 1000, 3)
+        summary['maxMs'] = round(values[-1] * 1000, 3)
+        for pct in PERCENTILES:
+            summary[f'p{pct}Ms'] = round(percentile(values, pct) * 1000, 3)
+    return summary
+
+
+def run_load(port, workload, concurrency, duration, max_requests, timeout, server):
+    """Client concorrenti a ciclo chiuso fino a `duration` secondi o `max_requests` richieste"""
+    results = {kind: {'latencies': [], 'errors': 0, 'statuses': {}} for kind in workload.kinds}
+    results_lock = threading.Lock()
+    issued = [0]
+    deadline = time.monotonic() + duration
+    rss_samples = []
+    stop = threading.Event()
+
+    def sample_rss():
+        while not stop.wait(0.5):
+            rss = server.rss()
+            if rss:
+                rss_samples.append(rss)
+
+    def client_main(client_id):
+        rng = workload.rng(client_id)
+        client = Client(port, timeout)
+        try:
+            while time.monotonic() < deadline:
+                with results_lock:
+                    if max_requests and issued[0] >= max_requests:
+                        return
+                    issued[0] += 1
+                kind, method, path, body, headers = workload.next_request(rng)
+                start = time.perf_counter()
+                try:
+                    status, _ = client.request(method, path, body, headers)
+                except Exception:
+                    status = None
+                latency = time.perf_counter() - start
+                with results_lock:
+                    entry = results[kind]
+                    entry['statuses'][str(status)] = entry['statuses'].get(str(status), 0) + 1
+                    if status is None or status >= 400:
+                        entry['errors'] += 1
+                    else:
+                        entry['latencies'].append(latency)
+        finally:
+            client.close()
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+    threads = [threading.Thread(target=client_main, args=(i,), daemon=True) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    sampler.join()
+    return results, elapsed, rss_samples
+
+
+def wait_ready(port, server, timeout):
+    """Attende che il server risponda a /api/stats"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not server.alive():
+            raise RuntimeError("il server è terminato durante l'avvio")
+        try:
+            status, _ = Client(port, 5).request('GET', '/api/stats')
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"il server non ha risposto entro {timeout}s")
+
+
+def fetch_json(port, path):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        conn.request('GET', path)
+        return json.loads(conn.getresponse().read())
+    finally:
+        conn.close()
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        kind, _, weight = part.partition('=')
+        kind = kind.strip()
+        if kind not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"tipo di richiesta sconosciuto: {kind} "
+                                             f"(disponibili: {', '.join(sorted(DEFAULT_MIX))})")
+        mix[kind] = float(weight) if weight else 1.0
+    return mix
+
+
+def compare(baseline, current, max_regression):
+    """Stampa le variazioni rispetto alla baseline; True se nessun p95 peggiora oltre la soglia"""
+    ok = True
+    print(f"\nConfronto con la baseline {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')})")
+    for key in ('mode', 'serverArgs', 'scale', 'syntheticTriples', 'concurrency', 'mix', 'cpus'):
+        if baseline['meta'].get(key) != current['meta'].get(key):
+            print(f"Attenzione: {key} diverso dalla baseline ({baseline['meta'].get(key)} -> {current['meta'].get(key)})")
+    print(f"{'endpoint':<15}{'p50 ms':>18}{'p95 ms':>18}{'p99 ms':>18}{'req/s':>18}")
+    names = ['overall'] + sorted(current['endpoints'])
+    for name in names:
+        old = baseline['overall'] if name == 'overall' else baseline['endpoints'].get(name)
+        new = current['overall'] if name == 'overall' else current['endpoints'][name]
+        if not old:
+            continue
+        cells = []
+        for key in ('p50Ms', 'p95Ms', 'p99Ms', 'throughputRps'):
+            before, after = old.get(key), new.get(key)
+            if not before or after is None:
+                cells.append(f"{'-':>18}")
+                continue
+            change = (after - before) / before * 100
+            cells.append(f"{after:>10.2f} {change:>+6.1f}%")
+            if key == 'p95Ms' and name != 'overall' and change > max_regression:
+                ok = False
+        print(f"{name:<15}" + ''.join(cells))
+    old_rss = (baseline.get('rss') or {}).get('peakBytes')
+    new_rss = (current.get('rss') or {}).get('peakBytes')
+    if old_rss and new_rss:
+        print(f"Memoria massima del server: {new_rss / 1048576:.1f} MB ({(new_rss - old_rss) / old_rss * 100:+.1f}%)")
+    if not ok:
+        print(f"\nRegressione: p95 peggiorato oltre {max_regression}% per almeno un endpoint")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark HTTP del server del Deliberation Knowledge Graph')
+    parser.add_argument('--kg-file', default='comprehensive_real_kg.ttl',
+                        help='Grafo di partenza (default: comprehensive_real_kg.ttl)')
+    parser.add_argument('--scale', type=int, default=1,
+                        help='Copie del grafo di partenza nel grafo sintetico (default: 1)')
+    parser.add_argument('--synthetic-triples', type=int, default=0,
+                        help='Usa un grafo generato da create_synthetic_kg.py di circa N triple al posto di --kg-file')
+    parser.add_argument('--mode', choices=['subprocess', 'inprocess'], default='subprocess')
+    parser.add_argument('--server-arg', action='append', default=[],
+                        help='Opzione passata al server in modalità subprocess (ripetibile, es. --server-arg=--workers=4)')
+    parser.add_argument('--concurrency', type=int, default=16, help='Client concorrenti (default: 16)')
+    parser.add_argument('--duration', type=float, default=30.0, help='Durata della misura in secondi (default: 30)')
+    parser.add_argument('--requests', type=int, default=0, help='Numero massimo di richieste (0 = solo durata)')
+    parser.add_argument('--warmup', type=float, default=3.0, help='Secondi di riscaldamento non misurati (default: 3)')
+    parser.add_argument('--mix', type=parse_mix, default=dict(DEFAULT_MIX),
+                        help='Pesi delle richieste, es. sparql=3,stats=2,contributions=3,platforms=1,search=3,ingest=1')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Timeout di ogni richiesta in secondi')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench_baseline.json', help='File JSON dei risultati')
+    parser.add_argument('--compare', help='Baseline JSON con cui confrontare i risultati')
+    parser.add_argument('--max-regression', type=float, default=20.0,
+                        help='Peggioramento massimo del p95 per endpoint in percentuale (default: 20)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='dkg-bench-')
+    server = None
+    try:
+        start = time.perf_counter()
+        if args.synthetic_triples > 0:
+            kg_file = os.path.join(workdir, 'bench_kg.nt')
+            triples = create_synthetic_kg(kg_file, args.synthetic_triples, args.seed)['triples']
+            print(f"Grafo generato: {triples} triple in {time.perf_counter() - start:.1f}s")
+        else:
+            graph = scaled_graph(args.kg_file, args.scale)
+            triples = len(graph)
+            kg_file = os.path.join(workdir, 'bench_kg.ttl')
+            graph.serialize(destination=kg_file, format='turtle')
+            del graph
+            print(f"Grafo sintetico: {triples} triple (scala {args.scale}) in {time.perf_counter() - start:.1f}s")
+
+        port = free_port()
+        if args.mode == 'subprocess':
+            server = SubprocessServer(kg_file, port, args.server_arg, os.path.join(workdir, 'server.log'))
+        else:
+            server = InProcessServer(kg_file, port)
+        start = time.perf_counter()
+        server.start()
+        wait_ready(port, server, timeout=600)
+        load_seconds = time.perf_counter() - start
+        rss_start = server.rss()
+        print(f"Server pronto sulla porta {port} in {load_seconds:.1f}s")
+
+        platforms = sorted(entry['id'] for entry in fetch_json(port, '/api/platforms').get('platforms', []))
+        workload = Workload(args.mix, platforms, args.seed)
+
+        if args.warmup > 0:
+            run_load(port, workload, args.concurrency, args.warmup, 0, args.timeout, server)
+        print(f"Misura: {args.concurrency} client per {args.duration}s...")
+        results, elapsed, rss_samples = run_load(port, workload, args.concurrency, args.duration,
+                                                 args.requests, args.timeout, server)
+        rss_end = server.rss()
+
+        all_latencies = [latency for entry in results.values() for latency in entry['latencies']]
+        report = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'commit': git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'mode': args.mode,
+                'serverArgs': args.server_arg,
+                'kgFile': args.kg_file,
+                'scale': args.scale,
+                'syntheticTriples': args.synthetic_triples,
+                'triples': triples,
+                'concurrency': args.concurrency,
+                'durationSeconds': round(elapsed, 3),
+                'mix': args.mix,
+                'seed': args.seed
+            },
+            'loadSeconds': round(load_seconds, 3),
+            'overall': summarize(all_latencies, sum(entry['errors'] for entry in results.values()), elapsed),
+            'endpoints': {kind: dict(summarize(entry['latencies'], entry['errors'], elapsed),
+                                     statuses=entry['statuses'])
+                          for kind, entry in sorted(results.items())},
+            'rss': {
+                'startBytes': rss_start,
+                'peakBytes': max(rss_samples + [rss_start or 0, rss_end or 0]) or None,
+                'endBytes': rss_end
+            }
+        }
+    finally:
+        if server is not None:
+            server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    overall = report['overall']
+    print(f"\n{'endpoint':<15}{'richieste':>10}{'errori':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, summary in [('overall', overall)] + sorted(report['endpoints'].items()):
+        print(f"{name:<15}{summary['requests']:>10}{summary['errors']:>8}{summary['throughputRps']:>10.1f}"
+              + ''.join(f"{summary.get(key) or 0:>10.2f}" for key in ('p50Ms', 'p95Ms', 'p99Ms')))
+    if report['rss']['peakBytes']:
+        print(f"Memoria del server (processi figli inclusi): {report['rss']['peakBytes'] / 1048576:.1f} MB (massima)")
+    print(f"Risultati scritti in {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(baseline, report, args.max_regression):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Create a synthetic deliberation knowledge graph for scale testing.
+
+The graph follows the shape of create_optimized_demo_kg.py and of the
+real graphs built from the platform dumps (ontologies/deliberation.owl):
+deliberation processes on several platforms, each with its own participants
+(organizations, roles), topics and contributions. Contributions carry
+multilingual text, timestamps inside the process period, reply trees
+(del:respondsTo), stances (del:supports / del:attacks), arguments with
+premises and conclusions, and detected fallacies.
+
+The output is written as N-Triples while it is generated: only the state of
+the current process (its participants and a window of recent contributions
+used as reply targets) is kept in memory, so graphs from 10k to 50M triples
+can be produced with a small, constant footprint. The same seed and target
+size always produce the same file.
+
+Usage:
+    python create_synthetic_kg.py --triples 1000000 --output synthetic_1m.nt
+    python create_synthetic_kg.py --triples 50000000 --seed 7 --output synthetic_50m.nt.gz
+"""
+
+import argparse
+import gzip
+import json
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from rdflib import Literal, Namespace, URIRef, RDF, RDFS, XSD
+from rdflib.namespace import SKOS
+
+from sparql_results import nt_term
+
+DEL = Namespace("https://w3id.org/deliberation/ontology#")
+BASE_URI = "https://w3id.org/deliberation/resource/"
+
+# Platform mix: (del:platform value, URI prefix, share of processes, languages, participant type)
+PLATFORMS = [
+    ("EU Parliament", "ep_debate", 0.25, ["en", "de", "fr", "it", "es"], "MEP"),
+    ("Decide Madrid", "decidemadrid", 0.20, ["es"], "Citizen"),
+    ("Decidim Barcelona", "decidim_barcelona", 0.20, ["ca", "es"], "Citizen"),
+    ("EU Have Your Say", "haveyoursay", 0.15, ["en", "de", "fr", "it"], "Stakeholder"),
+    ("Your Priorities", "yourpriorities", 0.10, ["it", "en"], "Citizen"),
+    ("DeliData", "delidata", 0.05, ["en"], "Participant"),
+    ("US Supreme Court", "scotus", 0.05, ["en"], "Justice"),
+]
+
+TOPICS = [
+    "Climate Policy", "Renewable Energy", "Public Transport", "Housing", "Digital Services",
+    "Air Quality", "Urban Green Spaces", "Migration", "Public Health", "Education",
+    "Circular Economy", "Water Management", "Cycling Infrastructure", "Tourism", "Data Protection",
+    "Agriculture", "Energy Poverty", "Noise Pollution", "Citizen Participation", "Taxation",
+]
+
+ORGANIZATIONS = [
+    "European People's Party", "Progressive Alliance of Socialists and Democrats", "Renew Europe",
+    "Greens/European Free Alliance", "European Conservatives and Reformists", "The Left",
+    "Neighbourhood Association", "Environmental NGO", "Chamber of Commerce", "Trade Union",
+    "University Research Group", "Cycling Collective", "Housing Cooperative",
+]
+
+ROLES = ["MEP", "Rapporteur", "Shadow Rapporteur", "Citizen", "Expert", "Moderator",
+         "Civil Servant", "Activist", "Researcher", "Stakeholder"]
+
+FIRST_NAMES = ["María", "Carlos", "Ana", "David", "Laura", "Josep", "Elena", "Marco", "Giulia",
+               "Luca", "Sophie", "Pierre", "Anna", "Jan", "Eva", "Tomás", "Lucía", "Martina",
+               "Jonas", "Clara", "Pablo", "Irene", "Hugo", "Nora", "Paolo", "Ines", "Kai", "Marta"]
+LAST_NAMES = ["García", "Martínez", "Rossi", "Müller", "Dubois", "Puig", "Ferrari", "Schmidt",
+              "López", "Bernard", "Vidal", "Romano", "Fischer", "Moreau", "Sánchez", "Costa",
+              "Weber", "Petit", "Serra", "Colombo", "Novak", "Jansen", "Santos", "Ricci"]
+
+# Sentence pieces per language: opening, proposal, reason
+TEXT_TEMPLATES = {
+    "en": (["I believe that", "In my opinion", "We must recognise that", "The evidence shows that",
+            "Many residents agree that", "It is clear that"],
+           ["the plan on {topic} should be expanded", "funding for {topic} is insufficient",
+            "the proposal on {topic} goes too far", "{topic} must become a priority",
+            "the current approach to {topic} is not working"],
+           ["because it affects every neighbourhood.", "since the costs fall on the most vulnerable.",
+            "as other cities have already shown.", "otherwise we will miss our targets.",
+            "and the data from last year confirm it."]),
+    "es": (["Creo que", "En mi opinión", "Debemos reconocer que", "Los datos muestran que",
+            "Muchos vecinos opinan que"],
+           ["el plan sobre {topic} debería ampliarse", "la financiación de {topic} es insuficiente",
+            "la propuesta sobre {topic} va demasiado lejos", "{topic} debe ser una prioridad"],
+           ["porque afecta a todos los barrios.", "ya que los costes recaen en los más vulnerables.",
+            "como ya han demostrado otras ciudades.", "o no cumpliremos los objetivos."]),
+    "ca": (["Crec que", "Al meu parer", "Hem de reconèixer que", "Les dades mostren que"],
+           ["el pla sobre {topic} s'hauria d'ampliar", "el finançament de {topic} és insuficient",
+            "la proposta sobre {topic} va massa lluny", "{topic} ha de ser una prioritat"],
+           ["perquè afecta tots els barris.", "ja que els costos recauen en els més vulnerables.",
+            "com ja han demostrat altres ciutats."]),
+    "it": (["Credo che", "A mio parere", "Dobbiamo riconoscere che", "I dati mostrano che",
+            "Molti cittadini pensano che"],
+           ["il piano su {topic} dovrebbe essere ampliato", "i fondi per {topic} sono insufficienti",
+            "la proposta su {topic} va troppo oltre", "{topic} deve diventare una priorità"],
+           ["perché riguarda tutti i quartieri.", "visto che i costi ricadono sui più deboli.",
+            "come hanno già dimostrato altre città.", "altrimenti non raggiungeremo gli obiettivi."]),
+    "de": (["Ich bin der Meinung, dass", "Wir müssen anerkennen, dass", "Die Daten zeigen, dass"],
+           ["der Plan zu {topic} ausgeweitet werden sollte", "die Mittel für {topic} nicht ausreichen",
+            "der Vorschlag zu {topic} zu weit geht"],
+           ["weil er alle Stadtteile betrifft.", "da die Kosten die Schwächsten treffen.",
+            "wie andere Städte bereits gezeigt haben."]),
+    "fr": (["Je pense que", "À mon avis", "Nous devons reconnaître que", "Les données montrent que"],
+           ["le plan sur {topic} devrait être élargi", "le financement de {topic} est insuffisant",
+            "la proposition sur {topic} va trop loin"],
+           ["car il concerne tous les quartiers.", "puisque les coûts pèsent sur les plus fragiles.",
+            "comme d'autres villes l'ont déjà montré."]),
+}
+
+# Fallacy labels with their relative frequency
+FALLACIES = [("Ad Hominem", 5), ("Straw Man", 4), ("Appeal to Emotion", 4), ("Slippery Slope", 3),
+             ("False Dilemma", 3), ("Hasty Generalization", 3), ("Appeal to Authority", 2),
+             ("Red Herring", 2), ("Bandwagon", 1), ("Circular Reasoning", 1)]
+
+# Hour-of-day weights for contribution timestamps (activity peaks mid-morning and evening)
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 3, 5, 8, 10, 11, 10, 9, 8, 8, 8, 8, 9, 11, 12, 11, 8, 5, 2]
+
+# Reply targets kept per process: replies go to recent or popular contributions
+REPLY_WINDOW = 2000
+WRITE_BUFFER_LINES = 10000
+
+EPOCH_START = datetime(2015, 1, 1, tzinfo=timezone.utc)
+EPOCH_DAYS = 11 * 365
+
+
+class TripleWriter:
+    """Writes triples as N-Triples lines in buffered blocks and counts them"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+        self._buffer = []
+
+    def add(self, s, p, o):
+        self._buffer.append(f"{nt_term(s)} {nt_term(p)} {nt_term(o)} .\n")
+        self.count += 1
+        if len(self._buffer) >= WRITE_BUFFER_LINES:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.stream.write(''.join(self._buffer))
+            self._buffer = []
+
+
+def _uri(*parts):
+    return URIRef(BASE_URI + "_".join(str(part) for part in parts))
+
+
+def _weighted(rng, pairs):
+    return rng.choices([value for value, _ in pairs], [weight for _, weight in pairs])[0]
+
+
+class SyntheticGenerator:
+    """Deterministic generator of a deliberation graph of a target size"""
+
+    def __init__(self, target_triples, seed=42, mean_contributions=400, fallacy_rate=0.15,
+                 reply_rate=0.45, argument_rate=0.25):
+        self.target = target_triples
+        self.seed = seed
+        self.mean_contributions = mean_contributions
+        self.fallacy_rate = fallacy_rate
+        self.reply_rate = reply_rate
+        self.argument_rate = argument_rate
+        self.stats = {'processes': 0, 'participants': 0, 'contributions': 0, 'replies': 0,
+                      'fallacies': 0, 'arguments': 0, 'platforms': {}}
+        self._topic_uris = [_uri("synthetic_topic", i) for i in range(len(TOPICS))]
+        self._org_uris = [_uri("synthetic_org", i) for i in range(len(ORGANIZATIONS))]
+        self._role_uris = [_uri("synthetic_role", i) for i in range(len(ROLES))]
+
+    def generate(self, out):
+        """Write the graph to `out` (a TripleWriter) until the target size is reached"""
+        self._write_vocabulary(out)
+        index = 0
+        while out.count < self.target:
+            # Each process has its own random stream: the output does not depend on buffering
+            rng = random.Random(f"{self.seed}:process:{index}")
+            self._write_process(out, rng, index)
+            index += 1
+        out.flush()
+        return self.stats
+
+    def _write_vocabulary(self, out):
+        """Shared topics, organizations and roles (like the demo graph)"""
+        for uri, name in zip(self._topic_uris, TOPICS):
+            out.add(uri, RDF.type, DEL.Topic)
+            out.add(uri, DEL.name, Literal(name))
+        for i in range(0, len(self._topic_uris) - 1, 2):
+            out.add(self._topic_uris[i], SKOS.related, self._topic_uris[i + 1])
+        for uri, name in zip(self._org_uris, ORGANIZATIONS):
+            out.add(uri, RDF.type, DEL.Organization)
+            out.add(uri, DEL.name, Literal(name))
+        for uri, name in zip(self._role_uris, ROLES):
+            out.add(uri, RDF.type, DEL.Role)
+            out.add(uri, DEL.name, Literal(name))
+
+    def _write_process(self, out, rng, index):
+        platform, prefix, _, languages, participant_type = rng.choices(
+            PLATFORMS, [share for _, _, share, _, _ in PLATFORMS])[0]
+        process_uri = _uri(prefix, "process", index)
+        topics = rng.sample(range(len(TOPICS)), rng.randint(1, 3))
+        start = EPOCH_START + timedelta(days=rng.randrange(EPOCH_DAYS))
+        duration_days = max(1, int(rng.lognormvariate(math.log(30), 1.0)))
+        end = start + timedelta(days=duration_days)
+
+        out.add(process_uri, RDF.type, DEL.DeliberationProcess)
+        out.add(process_uri, DEL.name, Literal(f"{platform} - {TOPICS[topics[0]]} ({start.year}) #{index}"))
+        out.add(process_uri, DEL.identifier, Literal(f"{prefix}_process_{index}"))
+        out.add(process_uri, DEL.platform, Literal(platform))
+        out.add(process_uri, DEL.startDate, Literal(start.date().isoformat(), datatype=XSD.date))
+        out.add(process_uri, DEL.endDate, Literal(end.date().isoformat(), datatype=XSD.date))
+        for topic in topics:
+            out.add(process_uri, DEL.hasTopic, self._topic_uris[topic])
+
+        # Heavy-tailed process sizes, bounded by the remaining budget (~12 triples per contribution)
+        contributions = max(5, int(rng.lognormvariate(math.log(self.mean_contributions), 0.9)))
+        remaining = max(5, (self.target - out.count) // 12)
+        contributions = min(contributions, remaining)
+        participants = self._write_participants(out, rng, process_uri, prefix, index, platform,
+                                                participant_type, max(3, contributions // 6))
+
+        # Zipf-like activity: few participants write most contributions
+        activity = [1.0 / (rank + 1) ** 1.1 for rank in range(len(participants))]
+        recent = []   # window of possible reply targets
+        replies = []  # their weights (1 + replies received)
+        for number in range(contributions):
+            uri = _uri(prefix, "contribution", index, number)
+            author = rng.choices(participants, activity)[0]
+            language = rng.choice(languages)
+            topic = rng.choice(topics)
+            # Bursty activity: most contributions early in the process
+            moment = start + timedelta(days=duration_days * rng.betavariate(1.2, 3.0))
+            moment = moment.replace(hour=rng.choices(range(24), HOUR_WEIGHTS)[0],
+                                    minute=rng.randrange(60), second=rng.randrange(60))
+
+            out.add(uri, RDF.type, DEL.Contribution)
+            out.add(uri, DEL.identifier, Literal(f"{prefix}_contribution_{index}_{number}"))
+            out.add(uri, DEL.text, Literal(self._text(rng, language, TOPICS[topic]), lang=language))
+            out.add(uri, DEL.timestamp, Literal(moment.strftime('%Y-%m-%dT%H:%M:%S'), datatype=XSD.dateTime))
+            out.add(uri, DEL.madeBy, author)
+            out.add(uri, DEL.hasTopic, self._topic_uris[topic])
+            out.add(uri, DEL.partOf, process_uri)
+            out.add(process_uri, DEL.hasContribution, uri)
+
+            if recent and rng.random() < self.reply_rate:
+                # Replies favour recent contributions and those that already have replies
+                position = len(recent) - 1 - min(int(rng.expovariate(1 / 20)), len(recent) - 1)
+                if replies and rng.random() < 0.3:
+                    position = rng.choices(range(len(recent)), replies)[0]
+                target = recent[position]
+                out.add(uri, DEL.respondsTo, target)
+                stance = rng.random()
+                if stance < 0.4:
+                    out.add(uri, DEL.supports, target)
+                elif stance < 0.75:
+                    out.add(uri, DEL.attacks, target)
+                replies[position] += 1
+                self.stats['replies'] += 1
+            elif rng.random() < 0.5:
+                out.add(uri, DEL.supports if rng.random() < 0.6 else DEL.attacks, self._topic_uris[topic])
+
+            if rng.random() < self.argument_rate:
+                self._write_argument(out, rng, uri, language, TOPICS[topic])
+            if rng.random() < self.fallacy_rate:
+                self._write_fallacies(out, rng, uri, language)
+
+            recent.append(uri)
+            replies.append(1)
+            if len(recent) > REPLY_WINDOW:
+                del recent[:REPLY_WINDOW // 2]
+                del replies[:REPLY_WINDOW // 2]
+
+        self.stats['processes'] += 1
+        self.stats['contributions'] += contributions
+        self.stats['platforms'][platform] = self.stats['platforms'].get(platform, 0) + 1
+
+    def _write_participants(self, out, rng, process_uri, prefix, index, platform, participant_type, count):
+        participants = []
+        for number in range(count):
+            uri = _uri(prefix, "participant", index, number)
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            out.add(uri, RDF.type, DEL.Participant)
+            out.add(uri, DEL.name, Literal(name))
+            out.add(uri, DEL.identifier, Literal(f"{prefix}_participant_{index}_{number}"))
+            out.add(uri, DEL.platform, Literal(platform))
+            out.add(uri, DEL.participantType, Literal(participant_type))
+            if rng.random() < 0.4:
+                out.add(uri, DEL.isAffiliatedWith, rng.choice(self._org_uris))
+            if rng.random() < 0.2:
+                out.add(uri, DEL.hasRole, rng.choice(self._role_uris))
+            out.add(process_uri, DEL.hasParticipant, uri)
+            participants.append(uri)
+        self.stats['participants'] += count
+        return participants
+
+    def _text(self, rng, language, topic):
+        openings, proposals, reasons = TEXT_TEMPLATES[language]
+        return f"{rng.choice(openings)} {rng.choice(proposals).format(topic=topic.lower())} {rng.choice(reasons)}"
+
+    def _write_argument(self, out, rng, contribution, language, topic):
+        argument = URIRef(f"{contribution}_argument")
+        out.add(contribution, DEL.containsArgument, argument)
+        out.add(argument, RDF.type, DEL.Argument)
+        for kind, predicate, cls in (("premise", DEL.hasPremise, DEL.Premise),
+                                     ("conclusion", DEL.hasConclusion, DEL.Conclusion)):
+            part = URIRef(f"{argument}_{kind}")
+            out.add(argument, predicate, part)
+            out.add(part, RDF.type, cls)
+            out.add(part, DEL.text, Literal(self._text(rng, language, topic), lang=language))
+        self.stats['arguments'] += 1
+
+    def _write_fallacies(self, out, rng, contribution, language):
+        for number in range(1 if rng.random() < 0.8 else 2):
+            fallacy = URIRef(f"{contribution}_fallacy_{number}")
+            label = _weighted(rng, FALLACIES)
+            out.add(fallacy, RDF.type, DEL.FallacyType)
+            out.add(fallacy, RDFS.label, Literal(label))
+            out.add(fallacy, DEL.hasConfidence, Literal(round(rng.uniform(0.5, 0.99), 2), datatype=XSD.float))
+            out.add(fallacy, RDFS.comment, Literal(f"{label}: synthetic detection", lang="en"))
+            out.add(contribution, DEL.containsFallacy, fallacy)
+            self.stats['fallacies'] += 1
+
+
+def open_output(path):
+    if path == '-':
+        return sys.stdout
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)
+    return open(path, 'w', encoding='utf-8')
+
+
+def create_synthetic_kg(output, target_triples, seed=42, **options):
+    """Write a synthetic graph of about `target_triples` triples to `output`; return the statistics"""
+    stream = open_output(output)
+    try:
+        writer = TripleWriter(stream)
+        stats = SyntheticGenerator(target_triples, seed, **options).generate(writer)
+        stats['triples'] = writer.count
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create a synthetic deliberation knowledge graph (N-Triples)')
+    parser.add_argument('--triples', type=int, default=100000,
+                        help='Target number of triples (default: 100000)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+    parser.add_argument('--output', default='synthetic_kg.nt',
+                        help='Output file (.nt, .nt.gz or - for stdout, default: synthetic_kg.nt)')
+    parser.add_argument('--mean-contributions', type=int, default=400,
+                        help='Median number of contributions per process (default: 400)')
+    parser.add_argument('--fallacy-rate', type=float, default=0.15,
+                        help='Share of contributions with detected fallacies (default: 0.15)')
+    parser.add_argument('--reply-rate', type=float, default=0.45,
+                        help='Share of contributions replying to another one (default: 0.45)')
+    parser.add_argument('--stats', help='Also write the generation statistics to this JSON file')
+    args = parser.parse_args()
+
+    start = time.time()
+    stats = create_synthetic_kg(args.output, args.triples, args.seed,
+                                mean_contributions=args.mean_contributions,
+                                fallacy_rate=args.fallacy_rate, reply_rate=args.reply_rate)
+    stats['seconds'] = round(time.time() - start, 2)
+    if args.stats:
+        with open(args.stats, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, indent=2, sort_keys=True)
+    if args.output != '-':
+        print(f"Created {args.output}: {stats['triples']} triples, {stats['processes']} processes, "
+              f"{stats['participants']} participants, {stats['contributions']} contributions "
+              f"({stats['replies']} replies, {stats['fallacies']} fallacies) in {stats['seconds']}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
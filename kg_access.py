@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Accesso diretto alle entità del grafo per le API REST.
+
+Le API che restituiscono forme semplici (tutte le proprietà di un soggetto,
+le istanze di una classe con qualche attributo) non passano dal motore
+SPARQL: leggono gli indici dello store e gli indici dedicati di questo
+modulo, costruiti al caricamento del grafo e aggiornati dall'ingest:
+
+- classe -> istanze (processi e partecipanti);
+- righe già risolte di /api/processes e /api/participants, ricalcolate solo
+  per le entità toccate da un ingest.
+
+Le righe hanno la stessa forma dei risultati delle query SPARQL
+equivalenti in sparql_queries.API_QUERIES (una riga per combinazione di
+valori, stesso ordinamento); con ?engine=sparql le API usano ancora la
+query, per confrontare i risultati e i tempi.
+"""
+
+import threading
+
+from rdflib import Namespace, RDF
+
+DEL = Namespace("https://w3id.org/deliberation/ontology#")
+
+# Predicati che cambiano le righe di un processo o di un partecipante
+_PROCESS_PREDICATES = frozenset([RDF.type, DEL.name, DEL.startDate, DEL.endDate])
+_PARTICIPANT_PREDICATES = frozenset([RDF.type, DEL.name, DEL.isAffiliatedWith, DEL.hasRole])
+
+
+def _value(term):
+    return str(term) if term is not None else None
+
+
+def _sorted_terms(terms):
+    return sorted(set(terms), key=str)
+
+
+class GraphAccess:
+    """Viste tipizzate del grafo mantenute in memoria"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._instances = {}         # classe -> insieme delle istanze
+        self._process_rows = {}      # processo -> righe di /api/processes
+        self._participant_rows = {}  # partecipante -> righe di /api/participants
+        self._processes = None       # righe ordinate (None = da ricalcolare)
+        self._participants = None
+
+    def rebuild(self, graph):
+        """Costruisce tutti gli indici con una scansione del grafo"""
+        with self._lock:
+            self._reset()
+            for subject, cls in graph.subject_objects(RDF.type):
+                self._instances.setdefault(cls, set()).add(subject)
+            for process in self._instances.get(DEL.DeliberationProcess, ()):
+                self._resolve_process(graph, process)
+            for participant in self._instances.get(DEL.Participant, ()):
+                self._resolve_participant(graph, participant)
+
+    def record_added(self, graph, triples):
+        """Aggiorna gli indici con triple appena aggiunte al grafo"""
+        processes = set()
+        participants = set()
+        names = set()
+        with self._lock:
+            for s, p, o in triples:
+                if p == RDF.type:
+                    self._instances.setdefault(o, set()).add(s)
+                if p in _PROCESS_PREDICATES:
+                    processes.add(s)
+                if p in _PARTICIPANT_PREDICATES:
+                    participants.add(s)
+                if p == DEL.name:
+                    names.add(s)
+
+            # Il nome di un'organizzazione o di un ruolo compare nelle righe dei partecipanti
+            for entity in names:
+                participants.update(graph.subjects(DEL.isAffiliatedWith, entity))
+                participants.update(graph.subjects(DEL.hasRole, entity))
+
+            process_class = self._instances.get(DEL.DeliberationProcess, set())
+            for process in processes & process_class:
+                self._resolve_process(graph, process)
+                self._processes = None
+            participant_class = self._instances.get(DEL.Participant, set())
+            for participant in participants & participant_class:
+                self._resolve_participant(graph, participant)
+                self._participants = None
+
+    def _resolve_process(self, graph, process):
+        names = _sorted_terms(graph.objects(process, DEL.name))
+        starts = _sorted_terms(graph.objects(process, DEL.startDate)) or [None]
+        ends = _sorted_terms(graph.objects(process, DEL.endDate)) or [None]
+        self._process_rows[process] = [{
+            'uri': str(process),
+            'name': str(name),
+            'startDate': _value(start),
+            'endDate': _value(end)
+        } for name in names for start in starts for end in ends]
+
+    def _resolve_participant(self, graph, participant):
+        names = _sorted_terms(graph.objects(participant, DEL.name))
+        organizations = _sorted_terms(org_name for org in graph.objects(participant, DEL.isAffiliatedWith)
+                                      for org_name in graph.objects(org, DEL.name)) or [None]
+        roles = _sorted_terms(role_name for role in graph.objects(participant, DEL.hasRole)
+                              for role_name in graph.objects(role, DEL.name)) or [None]
+        self._participant_rows[participant] = [{
+            'uri': str(participant),
+            'name': str(name),
+            'organization': _value(organization),
+            'role': _value(role)
+        } for name in names for organization in organizations for role in roles]
+
+    def processes(self):
+        """Righe di /api/processes, ordinate per data di inizio (prima quelle senza data)"""
+        with self._lock:
+            if self._processes is None:
+                rows = [row for rows in self._process_rows.values() for row in rows]
+                rows.sort(key=lambda row: (row['startDate'] is not None, row['startDate'] or '', row['uri']))
+                self._processes = rows
+            return self._processes
+
+    def participants(self):
+        """Righe di /api/participants, ordinate per nome"""
+        with self._lock:
+            if self._participants is None:
+                rows = [row for rows in self._participant_rows.values() for row in rows]
+                rows.sort(key=lambda row: (row['name'], row['uri']))
+                self._participants = rows
+            return self._participants
+
+    @staticmethod
+    def properties(graph, subject):
+        """Coppie (predicato, oggetto) di un soggetto, lette dall'indice dello store"""
+        return sorted(graph.predicate_objects(subject), key=lambda po: (str(po[0]), str(po[1])))
+
+
+def sparql_engine_requested(req):
+    """True se la richiesta chiede di calcolare la risposta con la query SPARQL
+    equivalente (parametro engine=sparql), ad esempio per confrontare i risultati"""
+    return req.args.get('engine', '').lower() == 'sparql'
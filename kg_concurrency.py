@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Controllo della concorrenza sul knowledge graph.
+
+Il server serve le richieste su più thread: le letture (query SPARQL,
+API basate sugli indici, export) possono procedere in parallelo, mentre ogni
+scrittura (il payload di un ingest con l'aggiornamento di tutti gli indici)
+deve essere applicata per intero prima che una lettura la veda.
+
+- ReadWriteLock: più lettori o un solo scrittore; uno scrittore in attesa
+  blocca i nuovi lettori, quindi un flusso continuo di query non rinvia
+  l'ingest all'infinito.
+- GraphSnapshot: copia congelata delle triple presa sotto il lock di lettura
+  (una lista di tuple che condivide i termini del grafo). Le serializzazioni
+  lunghe (salvataggio del file base, export) vengono scritte direttamente
+  dalla lista, senza costruire un secondo Graph e senza bloccare l'ingest
+  per tutta la loro durata.
+- iter_locked: righe di una valutazione pigra lette a blocchi sotto il lock
+  di lettura, senza accumulare l'intero risultato.
+
+iter_all_triples e all_subjects leggono l'indice privato dello store Memory
+di rdflib (_Memory__spo) solo per le versioni di rdflib verificate
+(MEMORY_INDEX_RDFLIB_VERSIONS); con altre versioni usano l'API pubblica.
+"""
+
+import itertools
+import os
+import threading
+from contextlib import contextmanager
+
+import rdflib
+from rdflib import Graph
+from rdflib.plugins.stores.memory import Memory
+
+from kg_store import CompactStore
+from sparql_results import TRIPLE_WRITERS
+
+# Versioni principali di rdflib in cui Memory ha l'indice __spo
+# (soggetto -> predicato -> oggetti) letto direttamente qui
+MEMORY_INDEX_RDFLIB_VERSIONS = ('6', '7')
+_MEMORY_INDEX_SUPPORTED = rdflib.__version__.split('.')[0] in MEMORY_INDEX_RDFLIB_VERSIONS
+
+
+class ReadWriteLock:
+    """Lock lettori/scrittore con precedenza agli scrittori.
+
+    Il lock di lettura è rientrante nello stesso thread; il lock di scrittura
+    non lo è e non può essere preso da un thread che sta leggendo."""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._waiting_writers = 0
+        self._local = threading.local()
+        self.reads = 0
+        self.writes = 0
+
+    @contextmanager
+    def read(self):
+        depth = getattr(self._local, 'depth', 0)
+        if depth == 0:
+            with self._cond:
+                while self._writer is not None or self._waiting_writers:
+                    if self._writer is threading.get_ident():
+                        break  # Lo scrittore può leggere ciò che sta modificando
+                    self._cond.wait()
+                self._readers += 1
+                self.reads += 1
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if depth == 0:
+                with self._cond:
+                    self._readers -= 1
+                    if not self._readers:
+                        self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        if getattr(self._local, 'depth', 0):
+            raise RuntimeError("lock di scrittura richiesto da un thread che sta leggendo")
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = threading.get_ident()
+            self.writes += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = None
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'readers': self._readers,
+                'writerActive': self._writer is not None,
+                'waitingWriters': self._waiting_writers,
+                'reads': self.reads,
+                'writes': self.writes
+            }
+
+
+def iter_locked(items, lock, batch_size):
+    """Consuma un iteratore pigro (es. le righe di una query SPARQL) a blocchi
+    di batch_size elementi sotto il lock di lettura, rilasciandolo mentre il
+    chiamante elabora il blocco: una risposta lunga non blocca l'ingest per
+    tutta la sua durata. Ogni blocco vede una scrittura per intero o per nulla."""
+    items = iter(items)
+    while True:
+        with lock.read():
+            batch = list(itertools.islice(items, batch_size))
+        yield from batch
+        if len(batch) < batch_size:
+            return
+
+
+def memory_index(graph):
+    """Indice soggetto -> predicato -> oggetti dello store Memory di un Graph
+    con un solo contesto; None se lo store o la versione di rdflib sono diversi"""
+    if not _MEMORY_INDEX_SUPPORTED or type(graph) is not Graph or type(graph.store) is not Memory:
+        return None
+    spo = getattr(graph.store, '_Memory__spo', None)
+    return spo if isinstance(spo, dict) else None
+
+
+def iter_all_triples(graph):
+    """Tutte le triple del grafo senza copiarne l'insieme.
+
+    Lo store Memory di rdflib, per il pattern (None, None, None), copia prima
+    l'intero insieme delle triple; per un Graph con un solo contesto si
+    percorre direttamente l'indice soggetto -> predicato -> oggetti."""
+    spo = memory_index(graph)
+    if spo is None:
+        yield from graph.triples((None, None, None))
+        return
+    for subject, predicates in spo.items():
+        for predicate, objects in predicates.items():
+            for obj in objects:
+                yield subject, predicate, obj
+
+
+def all_subjects(graph):
+    """Soggetti distinti del grafo (senza copiare l'insieme delle triple).
+
+    Con CompactStore e con lo store Memory l'iterazione può essere ripresa
+    dopo aver rilasciato il lock di lettura, anche se nel frattempo l'ingest
+    ha aggiunto triple: i soggetti nuovi possono comparire o no, quelli già
+    presenti vengono restituiti una sola volta (l'ingest non rimuove triple)."""
+    if isinstance(graph.store, CompactStore):
+        return graph.store.subjects()
+    spo = memory_index(graph)
+    if spo is None:
+        return graph.subjects(unique=True)
+    return _resumable_keys(spo)
+
+
+def _resumable_keys(mapping):
+    """Chiavi di un dizionario in ordine di inserimento, riprendendo dalla
+    stessa posizione se il dizionario cresce tra una chiave e l'altra"""
+    position = 0
+    keys = iter(mapping)
+    while True:
+        try:
+            key = next(keys)
+        except StopIteration:
+            return
+        except RuntimeError:
+            # Nuove chiavi accodate: le precedenti restano nelle stesse posizioni
+            keys = itertools.islice(iter(mapping), position, None)
+            continue
+        position += 1
+        yield key
+
+
+class GraphSnapshot:
+    """Triple del grafo congelate a una versione (da creare sotto il lock di lettura)"""
+
+    def __init__(self, graph, version=None):
+        self.version = version
+        self.triples = list(iter_all_triples(graph))
+        self._namespaces = list(graph.namespaces())
+
+    def namespaces(self):
+        return iter(self._namespaces)
+
+    def __len__(self):
+        return len(self.triples)
+
+    def __iter__(self):
+        return iter(self.triples)
+
+    def serialize(self, rdf_format):
+        """Blocchi di byte della serializzazione della copia (formati di
+        rdflib: turtle, nt, json-ld, xml), senza costruire un Graph"""
+        return TRIPLE_WRITERS[rdf_format](self.triples, self._namespaces)
+
+    def write(self, destination, rdf_format):
+        """Scrive la serializzazione della copia su file (con fsync)"""
+        with open(destination, 'wb') as f:
+            for chunk in self.serialize(rdf_format):
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
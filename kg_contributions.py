@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Indice dei contributi per /api/contributions con paginazione a cursore.
+
+Ogni contributo viene risolto una sola volta (testo, data, partecipante,
+processo, piattaforma, presenza di fallacie) al caricamento del grafo e
+aggiornato dall'ingest. I contributi sono ordinati per (nome del processo,
+timestamp, URI) e ogni filtro indicizzato (piattaforma, processo,
+partecipante, fallacie) ha la propria lista ordinata delle stesse chiavi:
+una pagina parte dalla lista più selettiva, si posiziona dopo il cursore con
+una ricerca binaria e legge solo i contributi necessari. Nelle chiavi di uno
+stesso processo i timestamp sono ordinati: con un filtro per data la lettura
+salta con una ricerca binaria all'inizio dell'intervallo di ogni processo e,
+alla fine dell'intervallo, al processo successivo, senza scorrere i
+contributi fuori dall'intervallo.
+
+Il cursore è l'ultima chiave della pagina precedente codificata in base64,
+quindi la paginazione resta stabile anche se nel frattempo vengono aggiunti
+contributi.
+"""
+
+import base64
+import bisect
+import heapq
+import json
+import threading
+
+from rdflib import Namespace, RDF
+
+from kg_platforms import OTHER_PLATFORM, platform_id_from_name
+
+DEL = Namespace("https://w3id.org/deliberation/ontology#")
+
+UNKNOWN_PROCESS = 'Unknown Process'
+UNKNOWN_PARTICIPANT = 'Unknown'
+
+# Predicati del contributo che ne modificano la voce nell'indice
+_CONTRIBUTION_PREDICATES = frozenset([
+    RDF.type, DEL.text, DEL.timestamp, DEL.hasTimestamp, DEL.platform,
+    DEL.madeBy, DEL.partOf, DEL.containsFallacy
+])
+# Predicati di processi e partecipanti mostrati nelle voci dei loro contributi
+_OWNER_PREDICATES = frozenset([DEL.name, DEL.platform])
+
+
+class InvalidCursor(ValueError):
+    """Cursore di paginazione non valido"""
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise InvalidCursor(f"cursore non valido: {cursor}")
+    if not isinstance(key, list) or len(key) != 3 or not all(isinstance(k, str) for k in key):
+        raise InvalidCursor(f"cursore non valido: {cursor}")
+    return tuple(key)
+
+
+def _first(terms):
+    """Primo termine in ordine lessicografico (scelta stabile tra più valori)"""
+    return min(terms, key=str, default=None)
+
+
+class _Entry:
+    __slots__ = ('key', 'uri', 'text', 'timestamp', 'participant', 'participant_name',
+                 'process', 'process_name', 'platform', 'platform_name', 'has_fallacy')
+
+    def to_json(self):
+        return {
+            'uri': str(self.uri),
+            'text': str(self.text) if self.text else '',
+            'timestamp': str(self.timestamp) if self.timestamp else None,
+            'participantName': self.participant_name,
+            'processName': self.process_name,
+            'platform': self.platform_name,
+            'platformId': self.platform
+        }
+
+
+class ContributionIndex:
+    """Contributi ordinati e indicizzati per i filtri di /api/contributions"""
+
+    def __init__(self, platform_index):
+        self.platform_index = platform_index
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._keys = []              # chiavi ordinate di tutti i contributi
+        self._entries = {}           # URI -> _Entry
+        self._by_platform = {}       # ID della piattaforma -> chiavi ordinate
+        self._by_process = {}        # URI del processo -> chiavi ordinate
+        self._by_participant = {}    # URI del partecipante -> chiavi ordinate
+        self._by_fallacy = {True: [], False: []}
+        self._process_names = {}     # nome (minuscolo) -> URI dei processi
+        self._participant_names = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def rebuild(self, graph):
+        """Indicizza tutti i contributi del grafo"""
+        with self._lock:
+            self._reset()
+            entries = [self._resolve(graph, c) for c in graph.subjects(RDF.type, DEL.Contribution)]
+            entries.sort(key=lambda entry: entry.key)
+            for entry in entries:
+                self._insert(entry, append=True)
+
+    def record_added(self, graph, triples):
+        """Aggiorna i contributi toccati da triple appena aggiunte"""
+        touched = {}   # URI -> termine del contributo, una sola volta per contributo
+        has_contribution = DEL.hasContribution
+        with self._lock:
+            for s, p, o in triples:
+                if p in _CONTRIBUTION_PREDICATES:
+                    touched.setdefault(str(s), s)
+                if p == has_contribution:
+                    touched.setdefault(str(o), o)
+                elif p in _OWNER_PREDICATES:
+                    # Nome o piattaforma di un processo/partecipante: cambiano i suoi contributi
+                    for index in (self._by_process, self._by_participant):
+                        for key in index.get(str(s), ()):
+                            touched.setdefault(key[2], self._entries[key[2]].uri)
+            for uri, contribution in touched.items():
+                old = self._entries.get(uri)
+                if old is not None:
+                    self._delete(old)
+                if (contribution, RDF.type, DEL.Contribution) in graph:
+                    self._insert(self._resolve(graph, contribution))
+
+    def _resolve(self, graph, contribution):
+        entry = _Entry()
+        entry.uri = contribution
+        # Alcuni contributi hanno anche un del:text vuoto
+        entry.text = _first(text for text in graph.objects(contribution, DEL.text) if text)
+        entry.timestamp = (_first(graph.objects(contribution, DEL.timestamp))
+                           or _first(graph.objects(contribution, DEL.hasTimestamp)))
+
+        entry.participant = _first(graph.objects(contribution, DEL.madeBy))
+        name = _first(graph.objects(entry.participant, DEL.name)) if entry.participant else None
+        entry.participant_name = str(name) if name else UNKNOWN_PARTICIPANT
+
+        processes = set(graph.subjects(DEL.hasContribution, contribution))
+        processes.update(graph.objects(contribution, DEL.partOf))
+        entry.process = _first(processes)
+        name = _first(graph.objects(entry.process, DEL.name)) if entry.process else None
+        entry.process_name = str(name) if name else UNKNOWN_PROCESS
+
+        entry.platform = self.platform_index.platform_of(contribution) or OTHER_PLATFORM
+        entry.platform_name = self.platform_index.name(entry.platform)
+
+        entry.has_fallacy = (contribution, DEL.containsFallacy, None) in graph
+        entry.key = (entry.process_name, str(entry.timestamp or ''), str(contribution))
+        return entry
+
+    def _lists(self, entry):
+        """Liste ordinate in cui compare la chiave del contributo"""
+        lists = [self._keys,
+                 self._by_platform.setdefault(entry.platform, []),
+                 self._by_fallacy[entry.has_fallacy]]
+        if entry.process is not None:
+            lists.append(self._by_process.setdefault(str(entry.process), []))
+            self._process_names.setdefault(entry.process_name.lower(), set()).add(str(entry.process))
+        if entry.participant is not None:
+            lists.append(self._by_participant.setdefault(str(entry.participant), []))
+            self._participant_names.setdefault(entry.participant_name.lower(), set()).add(str(entry.participant))
+        return lists
+
+    def _insert(self, entry, append=False):
+        self._entries[entry.key[2]] = entry
+        for keys in self._lists(entry):
+            if append:
+                keys.append(entry.key)
+            else:
+                bisect.insort(keys, entry.key)
+
+    def _delete(self, entry):
+        del self._entries[entry.key[2]]
+        for keys in self._lists(entry):
+            position = bisect.bisect_left(keys, entry.key)
+            if position < len(keys) and keys[position] == entry.key:
+                del keys[position]
+
+    def _filter_lists(self, index, names, value):
+        """Liste per un filtro per URI o, in alternativa, per nome"""
+        if value in index:
+            return [index[value]]
+        return [index[uri] for uri in names.get(value.lower(), ()) if uri in index]
+
+    def page(self, limit, cursor=None, platform=None, process=None, participant=None,
+             date_from=None, date_to=None, has_fallacy=None):
+        """Restituisce (contributi, cursore successivo o None)"""
+        after = decode_cursor(cursor) if cursor else None
+        if platform:
+            platform = platform_id_from_name(platform)
+        with self._lock:
+            sources = []
+            if platform:
+                sources.append([self._by_platform.get(platform, [])])
+            if process:
+                sources.append(self._filter_lists(self._by_process, self._process_names, process))
+            if participant:
+                sources.append(self._filter_lists(self._by_participant, self._participant_names, participant))
+            if has_fallacy is not None:
+                sources.append([self._by_fallacy[has_fallacy]])
+            # Si scorre la lista più selettiva; gli altri filtri vengono verificati sulle voci
+            base = min(sources, key=lambda lists: sum(map(len, lists))) if sources else [self._keys]
+
+            iterators = [self._iter_after(keys, after, date_from, date_to) for keys in base]
+            keys = iterators[0] if len(iterators) == 1 else heapq.merge(*iterators)
+
+            entries = []
+            for key in keys:
+                entry = self._entries[key[2]]
+                if self._matches(entry, platform, process, participant, date_from, date_to, has_fallacy):
+                    entries.append(entry)
+                    if len(entries) > limit:
+                        break
+
+        next_cursor = encode_cursor(entries[limit - 1].key) if len(entries) > limit else None
+        return [entry.to_json() for entry in entries[:limit]], next_cursor
+
+    @staticmethod
+    def _iter_after(keys, after, date_from=None, date_to=None):
+        """Chiavi dopo il cursore; con un filtro per data salta con una
+        ricerca binaria le chiavi di ogni processo fuori dall'intervallo"""
+        position = bisect.bisect_right(keys, after) if after else 0
+        if not date_from and not date_to:
+            yield from (keys[i] for i in range(position, len(keys)))
+            return
+        # I contributi senza data ('') non soddisfano mai un filtro per data
+        lowest = date_from or '\x00'
+        end = len(keys)
+        while position < end:
+            key = keys[position]
+            timestamp = key[1]
+            if timestamp < lowest:
+                position = bisect.bisect_left(keys, (key[0], lowest), position + 1)
+            elif date_to and timestamp[:len(date_to)] > date_to:
+                # Fine dell'intervallo per questo processo: le chiavi del
+                # processo successivo sono tutte maggiori di (nome + '\x00',)
+                position = bisect.bisect_left(keys, (key[0] + '\x00',), position + 1)
+            else:
+                yield key
+                position += 1
+
+    @staticmethod
+    def _matches(entry, platform, process, participant, date_from, date_to, has_fallacy):
+        if platform and entry.platform != platform:
+            return False
+        if process and process != str(entry.process) and process.lower() != entry.process_name.lower():
+            return False
+        if participant and participant != str(entry.participant) \
+                and participant.lower() != entry.participant_name.lower():
+            return False
+        if has_fallacy is not None and entry.has_fallacy != has_fallacy:
+            return False
+        if date_from or date_to:
+            timestamp = entry.key[1]
+            if not timestamp:
+                return False
+            if date_from and timestamp < date_from:
+                return False
+            # date_to è inclusiva anche se indica solo il giorno (2025-03-12)
+            if date_to and timestamp[:len(date_to)] > date_to:
+                return False
+        return True
+
+
+def group_by_platform(contributions):
+    """Raggruppa una pagina di contributi per piattaforma e processo
+    (formato storico della risposta di /api/contributions)"""
+    platforms = {}
+    for contribution in contributions:
+        platform = platforms.setdefault(contribution['platform'], {
+            'name': contribution['platform'],
+            'processes': {}
+        })
+        process = platform['processes'].setdefault(contribution['processName'], {
+            'name': contribution['processName'],
+            'contributions': []
+        })
+        process['contributions'].append(contribution)
+    return platforms
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Export del knowledge graph pre-generati per /api/export e per il feed
+JSON-LD della visualizzazione.
+
+Ogni formato viene serializzato una sola volta per versione del grafo, in
+background (dopo il caricamento e dopo ogni ingest, raggruppando le
+modifiche ravvicinate), e salvato su disco insieme alle versioni compresse
+(gzip sempre; brotli e zstd se i moduli sono installati). Le richieste
+servono direttamente il file già pronto con ETag (hash del contenuto),
+If-None-Match e Range, scegliendo la codifica in base ad Accept-Encoding.
+
+Per ogni formato un manifest JSON indica i file della versione più recente:
+in modalità pre-fork il master genera gli export e i worker leggono il
+manifest, quindi non serializzano mai il grafo.
+
+In alternativa, stream_export() percorre lo store e produce N-Triples o
+N-Quads a blocchi direttamente nella risposta (con gzip al volo e filtri
+per prefisso del soggetto o piattaforma), con memoria costante
+indipendentemente dalla dimensione del grafo.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import zlib
+
+from itertools import islice
+
+from flask import send_file
+from rdflib import URIRef
+
+from kg_concurrency import all_subjects, iter_all_triples
+from sparql_results import NQUADS_MIMETYPE, NTRIPLES_MIMETYPE, iter_nquads, iter_ntriples
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+logger = logging.getLogger(__name__)
+
+# Nome dell'export -> (formato rdflib, mimetype, nome del file scaricato)
+EXPORT_FORMATS = {
+    'ttl': ('turtle', 'text/turtle', 'deliberation_kg.ttl'),
+    'rdf': ('xml', 'application/rdf+xml', 'deliberation_kg.rdf'),
+    'jsonld': ('json-ld', 'application/ld+json', 'deliberation_kg.jsonld'),
+    'nt': ('nt', 'application/n-triples', 'deliberation_kg.nt'),
+}
+
+FORMAT_ALIASES = {
+    'turtle': 'ttl',
+    'xml': 'rdf',
+    'json': 'jsonld',
+    'ntriples': 'nt',
+}
+
+COPY_BUFFER = 1024 * 1024
+
+
+def _gzip_file(source, destination):
+    with open(source, 'rb') as src, gzip.open(destination, 'wb', compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, COPY_BUFFER)
+
+
+def _brotli_file(source, destination):
+    compressor = brotli.Compressor(quality=9)
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        for block in iter(lambda: src.read(COPY_BUFFER), b''):
+            dst.write(compressor.process(block))
+        dst.write(compressor.finish())
+
+
+def _zstd_file(source, destination):
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        zstandard.ZstdCompressor(level=10).copy_stream(src, dst)
+
+
+# Codifiche in ordine di preferenza: (Content-Encoding, estensione, compressore)
+ENCODINGS = []
+if HAS_BROTLI:
+    ENCODINGS.append(('br', '.br', _brotli_file))
+if HAS_ZSTD:
+    ENCODINGS.append(('zstd', '.zst', _zstd_file))
+ENCODINGS.append(('gzip', '.gz', _gzip_file))
+
+
+def export_format(name):
+    """Nome canonico dell'export (None se il formato non è supportato)"""
+    name = name.lower()
+    name = FORMAT_ALIASES.get(name, name)
+    return name if name in EXPORT_FORMATS else None
+
+
+# Formati disponibili in streaming: nome -> (mimetype, nome del file scaricato)
+STREAM_FORMATS = {
+    'nt': (NTRIPLES_MIMETYPE, 'deliberation_kg.nt'),
+    'nq': (NQUADS_MIMETYPE, 'deliberation_kg.nq'),
+}
+
+STREAM_ALIASES = {
+    'ntriples': 'nt',
+    'nquads': 'nq',
+}
+
+# Negli N-Quads ogni piattaforma è un grafo con nome
+PLATFORM_GRAPH_BASE = 'https://w3id.org/deliberation/graph/'
+
+
+def stream_format(name):
+    """Nome canonico del formato in streaming (None se non supportato)"""
+    name = name.lower()
+    name = STREAM_ALIASES.get(name, name)
+    return name if name in STREAM_FORMATS else None
+
+
+# Soggetti letti per ogni acquisizione del lock negli export in streaming
+STREAM_LOCK_BATCH = 1000
+
+
+def _iter_triples(graph, subject_prefixes=None, subjects=None):
+    if subjects is not None:
+        for subject in subjects:
+            yield from graph.triples((subject, None, None))
+        return
+    for triple in iter_all_triples(graph):
+        # str.startswith: URIRef.startswith non accetta una tupla di prefissi
+        if subject_prefixes and not (isinstance(triple[0], URIRef)
+                                     and str.startswith(triple[0], subject_prefixes)):
+            continue
+        yield triple
+
+
+def _iter_triples_locked(graph, lock, subject_prefixes=None, subjects=None):
+    """Come _iter_triples, ma legge il grafo sotto il lock di lettura a
+    blocchi di soggetti, senza tenerlo mentre il client scarica i dati.
+
+    I soggetti vengono letti un blocco alla volta (vedi all_subjects per le
+    modifiche concorrenti); ogni soggetto viene esportato con le triple
+    presenti quando viene letto."""
+    subjects = iter(all_subjects(graph) if subjects is None else subjects)
+    while True:
+        batch = []
+        with lock.read():
+            taken = 0
+            for subject in islice(subjects, STREAM_LOCK_BATCH):
+                taken += 1
+                if subject_prefixes and not (isinstance(subject, URIRef)
+                                             and str.startswith(subject, subject_prefixes)):
+                    continue
+                batch.extend(graph.triples((subject, None, None)))
+        yield from batch
+        if taken < STREAM_LOCK_BATCH:
+            return
+
+
+def stream_export(graph, name, subject_prefixes=None, subjects=None, platform_of=None, lock=None):
+    """Genera l'export a blocchi di byte senza materializzare la serializzazione.
+
+    subject_prefixes: tupla di prefissi IRI ammessi per il soggetto;
+    subjects: iterabile dei soli soggetti da esportare (filtro per piattaforma);
+    platform_of: per gli N-Quads, funzione soggetto -> ID della piattaforma;
+    lock: ReadWriteLock del grafo, se può essere modificato durante l'export."""
+    if lock is not None:
+        triples = _iter_triples_locked(graph, lock, subject_prefixes, subjects)
+    else:
+        triples = _iter_triples(graph, subject_prefixes, subjects)
+        if subject_prefixes and subjects is not None:
+            triples = (t for t in triples
+                       if isinstance(t[0], URIRef) and str.startswith(t[0], subject_prefixes))
+
+    if name == 'nq':
+        graphs = {}
+
+        def graph_of(subject):
+            platform_id = platform_of(subject) if platform_of else None
+            if platform_id is None:
+                return None
+            if platform_id not in graphs:
+                graphs[platform_id] = URIRef(PLATFORM_GRAPH_BASE + platform_id)
+            return graphs[platform_id]
+        chunks = iter_nquads((s, p, o, graph_of(s)) for s, p, o in triples)
+    else:
+        chunks = iter_ntriples(triples)
+
+    try:
+        yield from chunks
+    except Exception as e:
+        # La risposta viene interrotta: il client vede un trasferimento fallito,
+        # non un export troncato con esito 200
+        logger.error(f"Export in streaming interrotto: {e}")
+        raise
+
+
+def gzip_chunks(chunks, level=6):
+    """Comprime al volo in formato gzip una sequenza di blocchi di byte"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BUFFER), b''):
+            digest.update(block)
+    return digest.hexdigest()[:32]
+
+
+class ExportCache:
+    """Export pre-generati su disco, rigenerati in background"""
+
+    def __init__(self, directory, graph_provider, version_provider, delay=2.0):
+        self.directory = directory
+        # Funzione che restituisce una copia congelata del grafo (GraphSnapshot)
+        self.graph_provider = graph_provider
+        self.version_provider = version_provider
+        # Attesa dopo una modifica per raggruppare ingest ravvicinati
+        self.delay = delay
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._owner_pid = None
+        self._manifests = {}
+        self._manifest_lock = threading.Lock()
+        self.builds = 0
+        self.last_build_seconds = None
+
+    def start(self):
+        """Avvia il thread che genera gli export (nel processo che possiede il grafo)"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._owner_pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='export-builder', daemon=True)
+        self._thread.start()
+        self._wakeup.set()
+
+    def schedule(self):
+        """Richiede la rigenerazione degli export per la versione corrente"""
+        # I worker pre-fork ereditano l'oggetto ma non il thread: genera solo il master
+        if self._thread is not None and os.getpid() == self._owner_pid:
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            if self.builds:
+                time.sleep(self.delay)
+            self._wakeup.clear()
+            version = self.version_provider()
+            start = time.time()
+            try:
+                graph = self.graph_provider()
+            except Exception as e:
+                logger.error(f"Errore nella lettura del grafo per gli export: {e}", exc_info=True)
+                continue
+            for name in EXPORT_FORMATS:
+                try:
+                    self._build(name, version, graph)
+                except Exception as e:
+                    logger.error(f"Errore nella generazione dell'export {name}: {e}", exc_info=True)
+            self.builds += 1
+            self.last_build_seconds = round(time.time() - start, 3)
+            logger.info(f"Export del grafo (versione {version}) generati in {self.last_build_seconds}s")
+
+    def _build(self, name, version, graph):
+        rdf_format = EXPORT_FORMATS[name][0]
+        tmp_file = os.path.join(self.directory, f".{name}.{os.getpid()}.tmp")
+        graph.write(tmp_file, rdf_format)
+
+        digest = _file_digest(tmp_file)
+        base = os.path.join(self.directory, f"{name}-{digest}")
+        files = {'identity': os.path.basename(base)}
+        if os.path.exists(base):
+            os.remove(tmp_file)
+        else:
+            os.replace(tmp_file, base)
+        for encoding, extension, compress in ENCODINGS:
+            path = base + extension
+            if not os.path.exists(path):
+                compress(base, path + '.tmp')
+                os.replace(path + '.tmp', path)
+            files[encoding] = os.path.basename(path)
+
+        manifest = {
+            'format': name,
+            'version': version,
+            'etag': digest,
+            'created': time.time(),
+            'files': files,
+            'sizes': {enc: os.path.getsize(os.path.join(self.directory, f)) for enc, f in files.items()}
+        }
+        # I file della generazione precedente restano finché non vengono
+        # sostituiti: un worker può averne appena letto il manifest
+        keep = set(files.values())
+        previous = self.current(name)
+        if previous:
+            keep.update(previous['files'].values())
+
+        manifest_file = os.path.join(self.directory, f"{name}.json")
+        with open(manifest_file + '.tmp', 'w') as f:
+            json.dump(manifest, f)
+        os.replace(manifest_file + '.tmp', manifest_file)
+        self._remove_stale(name, keep)
+
+    def _remove_stale(self, name, keep):
+        for filename in os.listdir(self.directory):
+            if filename.startswith(f"{name}-") and filename not in keep:
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except OSError:
+                    pass
+
+    def current(self, name):
+        """Manifest dell'export più recente del formato (None se non ancora generato)"""
+        manifest_file = os.path.join(self.directory, f"{name}.json")
+        try:
+            stat = os.stat(manifest_file)
+        except OSError:
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._manifest_lock:
+            cached = self._manifests.get(name)
+            if cached and cached[0] == stamp:
+                return cached[1]
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+        with self._manifest_lock:
+            self._manifests[name] = (stamp, manifest)
+        return manifest
+
+    def wait(self, name, timeout):
+        """Attende che l'export sia disponibile (primo avvio)"""
+        deadline = time.monotonic() + timeout
+        while True:
+            manifest = self.current(name)
+            if manifest is not None or time.monotonic() >= deadline:
+                return manifest
+            time.sleep(0.2)
+
+    def response(self, req, manifest, as_attachment=True):
+        """Risposta HTTP per un export, con la codifica migliore accettata dal
+        client, ETag/If-None-Match (304) e Range (206)"""
+        _, mimetype, filename = EXPORT_FORMATS[manifest['format']]
+        encoding = 'identity'
+        for candidate, _, _ in ENCODINGS:
+            if candidate in manifest['files'] and req.accept_encodings[candidate] > 0:
+                encoding = candidate
+                break
+
+        path = os.path.join(self.directory, manifest['files'][encoding])
+        etag = manifest['etag'] if encoding == 'identity' else f"{manifest['etag']}-{encoding}"
+        response = send_file(path, mimetype=mimetype, as_attachment=as_attachment,
+                             download_name=filename, conditional=True, etag=etag,
+                             max_age=0)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['X-Graph-Version'] = str(manifest['version'])
+        return response
+
+    def stats(self):
+        exports = {}
+        for name in EXPORT_FORMATS:
+            manifest = self.current(name)
+            if manifest:
+                exports[name] = {key: manifest[key] for key in ('version', 'etag', 'created', 'sizes')}
+        return {
+            'directory': self.directory,
+            'encodings': [encoding for encoding, _, _ in ENCODINGS],
+            'builds': self.builds,
+            'lastBuildSeconds': self.last_build_seconds,
+            'exports': exports
+        }
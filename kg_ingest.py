@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Conversione in triple dei contributi di Your Priorities annotati con fallacie.
+
+Usata da /api/ingest/fallacy (un contributo per richiesta) e da
+/api/ingest/fallacy/batch, che accetta NDJSON (un oggetto JSON per riga) o
+un array JSON. Ogni elemento viene validato e convertito separatamente, così
+un elemento non valido produce un errore nel suo esito senza scartare il
+resto del lotto; le triple degli elementi validi vengono poi aggiunte al
+grafo con un'unica operazione.
+"""
+
+import json
+import numbers
+import re
+import uuid
+
+from rdflib import Literal, Namespace, RDF, RDFS, URIRef, XSD
+
+DEL = Namespace("https://w3id.org/deliberation/ontology#")
+YP = Namespace("https://yourpriorities.org/")
+
+# Campi che, se presenti, devono essere stringhe
+_STRING_FIELDS = ('text', 'timestamp', 'user_name', 'post_name', 'group_name', 'community_name')
+# Campi identificativi: stringhe non vuote o interi
+_ID_FIELDS = ('contribution_id', 'user_id', 'post_id', 'group_id', 'community_id', 'parent_point_id')
+# Caratteri non ammessi negli identificativi, che finiscono in un IRI:
+# spazi, caratteri di controllo e quelli esclusi dagli IRIREF di N-Triples/Turtle
+_INVALID_ID_CHARS_RE = re.compile(r'[\x00-\x20\x7f-\x9f<>"{}|^`\\]')
+
+
+class InvalidItem(ValueError):
+    """Elemento di un lotto di ingest non valido"""
+
+
+def _is_id(value):
+    if isinstance(value, bool):
+        return False
+    return isinstance(value, int) or (isinstance(value, str) and value != ''
+                                      and not _INVALID_ID_CHARS_RE.search(value))
+
+
+def vote_value(value):
+    """Valore del voto (-1 contro, 1 a favore, 0 neutro) da un intero, un
+    numero o una stringa numerica; None se il valore non è numerico.
+    Come prima della validazione, i valori diversi da -1 e 1 sono neutri."""
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return None
+    if not isinstance(value, numbers.Real):
+        return None
+    return 1 if value == 1 else -1 if value == -1 else 0
+
+
+def validate_fallacy_item(data):
+    """Solleva InvalidItem se il contributo non ha il formato atteso
+    (vedi ingest_fallacy nel server per il formato)"""
+    if not isinstance(data, dict):
+        raise InvalidItem("l'elemento deve essere un oggetto JSON")
+    if not data:
+        raise InvalidItem("nessun dato ricevuto")
+    for field in _ID_FIELDS:
+        if data.get(field) is not None and not _is_id(data[field]):
+            raise InvalidItem(f"{field} deve essere una stringa non vuota senza spazi, caratteri di controllo "
+                              f"o caratteri tra <>\"{{}}|^`\\, oppure un intero")
+    for field in _STRING_FIELDS:
+        if data.get(field) is not None and not isinstance(data[field], str):
+            raise InvalidItem(f"{field} deve essere una stringa")
+    if vote_value(data.get('value')) is None:
+        raise InvalidItem("value deve essere un numero (-1 contro, 1 a favore)")
+
+    fallacies = data.get('fallacies', [])
+    if not isinstance(fallacies, list):
+        raise InvalidItem("fallacies deve essere una lista")
+    for position, fallacy in enumerate(fallacies):
+        if not isinstance(fallacy, dict) or not isinstance(fallacy.get('type'), str):
+            raise InvalidItem(f"fallacies[{position}] deve avere un campo type")
+        score = fallacy.get('score')
+        if 'score' in fallacy and (isinstance(score, bool) or not isinstance(score, numbers.Real)):
+            raise InvalidItem(f"fallacies[{position}].score deve essere un numero")
+        if 'rationale' in fallacy and not isinstance(fallacy['rationale'], str):
+            raise InvalidItem(f"fallacies[{position}].rationale deve essere una stringa")
+
+
+def build_fallacy_triples(data):
+    """Triple di un contributo di Your Priorities e riepilogo dell'ingest.
+
+    Restituisce (triple, riepilogo); il riepilogo non contiene il numero di
+    triple del grafo, che viene aggiunto da chi applica la scrittura."""
+    triples = []
+
+    # Create contribution URI
+    contrib_id = str(data.get('contribution_id') or f"point-{uuid.uuid4()}")
+    contrib_uri = URIRef(f"{YP}{contrib_id}")
+
+    # Add contribution as both Contribution and Argument
+    triples.append((contrib_uri, RDF.type, DEL.Contribution))
+    triples.append((contrib_uri, RDF.type, DEL.Argument))
+
+    # Add platform name
+    triples.append((contrib_uri, DEL.platform, Literal("Your Priorities")))
+
+    # Add text content
+    if data.get('text'):
+        triples.append((contrib_uri, DEL.text, Literal(data['text'], lang='it')))
+
+    # Add timestamp
+    if data.get('timestamp'):
+        triples.append((contrib_uri, DEL.hasTimestamp,
+                        Literal(data['timestamp'], datatype=XSD.dateTime)))
+
+    # Create and link Participant (user)
+    if data.get('user_id'):
+        user_uri = URIRef(f"{YP}user-{data['user_id']}")
+        triples.append((user_uri, RDF.type, DEL.Participant))
+        if data.get('user_name'):
+            triples.append((user_uri, RDFS.label, Literal(data['user_name'])))
+            triples.append((user_uri, DEL.name, Literal(data['user_name'])))
+
+        # Link contribution to participant
+        triples.append((contrib_uri, DEL.madeBy, user_uri))
+
+    # Create Topic (post/proposal)
+    if data.get('post_id'):
+        topic_uri = URIRef(f"{YP}post-{data['post_id']}")
+        triples.append((topic_uri, RDF.type, DEL.Topic))
+        if data.get('post_name'):
+            triples.append((topic_uri, RDFS.label, Literal(data['post_name'])))
+            triples.append((topic_uri, DEL.name, Literal(data['post_name'])))
+
+        # Link contribution to topic
+        triples.append((contrib_uri, DEL.isAbout, topic_uri))
+
+        # Add supports/attacks relationship based on value
+        value = vote_value(data.get('value'))
+        if value == 1:
+            # FOR = supports the topic/post
+            triples.append((contrib_uri, DEL.supports, topic_uri))
+        elif value == -1:
+            # AGAINST = attacks the topic/post
+            triples.append((contrib_uri, DEL.attacks, topic_uri))
+
+    # Handle point-to-point responses (parent_point_id)
+    if data.get('parent_point_id'):
+        parent_uri = URIRef(f"{YP}point-{data['parent_point_id']}")
+        # Link as response
+        triples.append((contrib_uri, DEL.respondsTo, parent_uri))
+
+        # Add supports/attacks relationship based on value
+        value = vote_value(data.get('value'))
+        if value == 1:
+            triples.append((contrib_uri, DEL.supports, parent_uri))
+        elif value == -1:
+            triples.append((contrib_uri, DEL.attacks, parent_uri))
+
+    # Create DeliberationProcess (group/community)
+    process_created = False
+    if data.get('group_id'):
+        process_uri = URIRef(f"{YP}group-{data['group_id']}")
+        triples.append((process_uri, RDF.type, DEL.DeliberationProcess))
+        if data.get('group_name'):
+            triples.append((process_uri, RDFS.label, Literal(data['group_name'])))
+            triples.append((process_uri, DEL.name, Literal(data['group_name'])))
+
+        # Link contribution to process
+        triples.append((contrib_uri, DEL.partOf, process_uri))
+
+        # Link topic to process
+        if data.get('post_id'):
+            triples.append((process_uri, DEL.hasTopic, topic_uri))
+
+        # Link participant to process
+        if data.get('user_id'):
+            triples.append((process_uri, DEL.hasParticipant, user_uri))
+
+        process_created = True
+
+    # Add fallacies
+    fallacy_count = 0
+    for fallacy in data.get('fallacies', []):
+        fallacy_id = f"fallacy-{uuid.uuid4()}"
+        fallacy_uri = URIRef(f"{YP}{fallacy_id}")
+
+        # Create fallacy instance
+        triples.append((fallacy_uri, RDF.type, DEL.FallacyType))
+        triples.append((fallacy_uri, RDFS.label, Literal(fallacy.get('type'))))
+
+        # Add confidence score
+        if 'score' in fallacy:
+            triples.append((fallacy_uri, DEL.hasConfidence,
+                            Literal(fallacy['score'], datatype=XSD.float)))
+
+        # Add rationale
+        if 'rationale' in fallacy:
+            triples.append((fallacy_uri, RDFS.comment,
+                            Literal(fallacy['rationale'], lang='it')))
+
+        # Link fallacy to contribution
+        triples.append((contrib_uri, DEL.containsFallacy, fallacy_uri))
+        fallacy_count += 1
+
+    summary = {
+        'status': 'success',
+        'contribution_id': contrib_id,
+        'fallacies_added': fallacy_count,
+        'participant_created': bool(data.get('user_id')),
+        'topic_created': bool(data.get('post_id')),
+        'process_created': process_created
+    }
+    return triples, summary
+
+
+def build_fallacy_batch(items):
+    """Valida e converte un lotto di contributi.
+
+    `items` contiene coppie (posizione nel lotto, dati o InvalidItem se la
+    riga non era JSON valido). Restituisce (triple degli elementi validi,
+    esiti nell'ordine del lotto)."""
+    triples = []
+    results = []
+    for index, data in items:
+        try:
+            if isinstance(data, InvalidItem):
+                raise data
+            validate_fallacy_item(data)
+            item_triples, summary = build_fallacy_triples(data)
+        except InvalidItem as e:
+            contrib_id = data.get('contribution_id') if isinstance(data, dict) else None
+            results.append({'index': index, 'status': 'error',
+                            'contribution_id': contrib_id, 'error': str(e)})
+            continue
+        triples.extend(item_triples)
+        summary['index'] = index
+        results.append(summary)
+    return triples, results
+
+
+def iter_batch_items(stream, chunk_size=65536):
+    """Elementi di un corpo NDJSON o array JSON letti da uno stream binario.
+
+    Restituisce coppie (posizione, dati); una riga NDJSON non valida produce
+    un InvalidItem al posto dei dati. L'NDJSON viene letto riga per riga,
+    quindi non tiene in memoria l'intero caricamento; un array JSON viene
+    invece decodificato per intero."""
+    head = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        head += chunk
+        if head.strip():
+            break
+
+    if head.lstrip().startswith(b'['):
+        body = head + stream.read()
+        try:
+            items = json.loads(body)
+        except ValueError as e:
+            raise InvalidItem(f"array JSON non valido: {e}")
+        for index, data in enumerate(items):
+            yield index, data
+        return
+
+    index = 0
+    pending = head
+    while True:
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            if line.strip():
+                yield index, _decode_line(line)
+                index += 1
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        pending += chunk
+    if pending.strip():
+        yield index, _decode_line(pending)
+
+
+def _decode_line(line):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return InvalidItem(f"riga JSON non valida: {e}")
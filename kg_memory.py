@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Profilo della memoria del knowledge graph caricato dal server.
+
+Carica un file del knowledge graph come fa sparql_server_production.py
+(stesso store, stessi indici derivati) e attribuisce la memoria ai
+componenti percorrendo gli oggetti Python raggiungibili da ciascuno:
+
+- indici dello store (dizionari annidati dello store Memory o array e
+  dizionario dei termini di kg_store.CompactStore);
+- oggetti termine: URI, blank node e letterali, con il testo dei letterali
+  (la forma lessicale, dentro l'oggetto Literal) separato dal valore Python
+  convertito che ogni Literal tiene in _value;
+- gestore dei namespace, indici derivati del server (statistiche,
+  piattaforme, ricerca, contributi, accesso diretto) e cache delle query.
+
+Ogni oggetto viene contato una volta sola, nel primo componente che lo
+raggiunge (nell'ordine sopra). La differenza con la crescita della RSS del
+processo è riportata come memoria non attribuita (frammentazione,
+allocatore, moduli importati durante il caricamento).
+
+Il riepilogo per predicato e per piattaforma (del soggetto) riporta triple,
+byte dei letterali oggetto e quanto si risparmierebbe con l'interning:
+i letterali con lo stesso valore tenuti in oggetti distinti (tipicamente i
+valori ripetuti di del:platform o le date) e i datatype duplicati.
+
+Uso:
+    python kg_memory.py comprehensive_real_kg.ttl
+    python kg_memory.py comprehensive_real_kg.ttl --compact-store --warmup --json memory.json
+"""
+
+import argparse
+import gc
+import json
+import logging
+import sys
+import time
+from types import BuiltinFunctionType, FunctionType, MethodType, ModuleType
+
+from rdflib import BNode, Literal, URIRef
+from rdflib.term import Identifier
+
+from kg_metrics import process_rss_bytes
+
+NO_PLATFORM = '(nessuna)'
+
+# Oggetti condivisi con il resto del programma, mai attribuiti a un componente
+_SKIP_TYPES = (type, ModuleType, FunctionType, BuiltinFunctionType, MethodType)
+
+
+class MemoryWalker:
+    """Somma le dimensioni degli oggetti raggiungibili, ognuno contato una volta.
+
+    I termini rdflib vengono contati nelle categorie 'uri', 'bnode',
+    'literal' (oggetto Literal con la forma lessicale) e 'literal_value'
+    (valore Python in _value), qualunque sia il componente che li raggiunge."""
+
+    def __init__(self, boundaries=()):
+        self.seen = set()
+        self.bytes = {}
+        self.objects = {}
+        # Oggetti attraversati solo come radice (es. il grafo raggiunto dal namespace manager)
+        self.boundaries = {id(obj) for obj in boundaries}
+
+    def _count(self, category, size):
+        self.bytes[category] = self.bytes.get(category, 0) + size
+        self.objects[category] = self.objects.get(category, 0) + 1
+
+    def walk(self, root, category):
+        """Byte degli oggetti non ancora visti raggiungibili da `root`, in `category`"""
+        before = sum(self.bytes.values())
+        stack = [root]
+        seen = self.seen
+        while stack:
+            obj = stack.pop()
+            if id(obj) in seen or isinstance(obj, _SKIP_TYPES) or \
+                    (id(obj) in self.boundaries and obj is not root):
+                continue
+            seen.add(id(obj))
+            if isinstance(obj, Identifier):
+                self._walk_term(obj)
+                continue
+            self._count(category, sys.getsizeof(obj))
+            if isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+                continue
+            stack.extend(gc.get_referents(obj))
+        return sum(self.bytes.values()) - before
+
+    def _walk_term(self, term):
+        if isinstance(term, Literal):
+            self._count('literal', sys.getsizeof(term))
+            value = term._value
+            if value is not None and id(value) not in self.seen and not isinstance(value, _SKIP_TYPES):
+                self.seen.add(id(value))
+                self._count('literal_value', sys.getsizeof(value))
+            datatype = term._datatype
+            if datatype is not None and id(datatype) not in self.seen:
+                self.seen.add(id(datatype))
+                self._count('uri', sys.getsizeof(datatype))
+        elif isinstance(term, BNode):
+            self._count('bnode', sys.getsizeof(term))
+        else:
+            self._count('uri', sys.getsizeof(term))
+
+
+def _literal_size(literal):
+    value = literal._value
+    return sys.getsizeof(literal) + (sys.getsizeof(value) if value is not None else 0)
+
+
+class _Breakdown:
+    """Triple e letterali oggetto di un gruppo (predicato o piattaforma)"""
+    __slots__ = ('triples', 'literals', 'literal_objects', 'literal_bytes', 'values', 'internable_bytes',
+                 'literal_chars')
+
+    def __init__(self):
+        self.triples = 0
+        self.literals = 0          # triple con oggetto letterale
+        self.literal_objects = set()  # id degli oggetti Literal distinti
+        self.literal_bytes = 0     # byte degli oggetti Literal distinti (con _value)
+        self.values = {}           # valore del letterale -> byte dell'oggetto più piccolo
+        self.internable_bytes = 0
+        self.literal_chars = 0
+
+    def add(self, obj):
+        self.triples += 1
+        if not isinstance(obj, Literal):
+            return
+        self.literals += 1
+        self.literal_chars += len(obj)
+        if id(obj) in self.literal_objects:
+            return
+        self.literal_objects.add(id(obj))
+        size = _literal_size(obj)
+        self.literal_bytes += size
+        if obj in self.values:
+            self.internable_bytes += size
+        else:
+            self.values[obj] = size
+
+    def to_json(self, index_bytes_per_triple):
+        return {
+            'triples': self.triples,
+            'indexBytes': round(self.triples * index_bytes_per_triple),
+            'literals': self.literals,
+            'literalObjects': len(self.literal_objects),
+            'distinctLiterals': len(self.values),
+            'literalBytes': self.literal_bytes,
+            'avgLiteralChars': round(self.literal_chars / self.literals, 1) if self.literals else None,
+            'internableBytes': self.internable_bytes
+        }
+
+
+def breakdown(graph, platform_index=None):
+    """Triple, letterali e byte internabili per predicato e per piattaforma del soggetto"""
+    predicates = {}
+    platforms = {}
+    datatype_objects = set()
+    datatypes = set()
+    uri_objects = set()
+    uri_values = {}
+    uri_internable = 0
+    for s, p, o in graph:
+        predicate = predicates.get(p)
+        if predicate is None:
+            predicate = predicates[p] = _Breakdown()
+        predicate.add(o)
+        platform_id = platform_index.platform_of(s) if platform_index is not None else None
+        platform = platforms.get(platform_id or NO_PLATFORM)
+        if platform is None:
+            platform = platforms[platform_id or NO_PLATFORM] = _Breakdown()
+        platform.add(o)
+        if isinstance(o, Literal) and o.datatype is not None:
+            datatype_objects.add(id(o.datatype))
+            datatypes.add(o.datatype)
+        for term in (s, p, o):
+            if isinstance(term, URIRef) and id(term) not in uri_objects:
+                uri_objects.add(id(term))
+                if term in uri_values:
+                    uri_internable += sys.getsizeof(term)
+                else:
+                    uri_values[term] = True
+    return {
+        'predicates': predicates,
+        'platforms': platforms,
+        'datatypeObjects': len(datatype_objects),
+        'distinctDatatypes': len(datatypes),
+        'uriObjects': len(uri_objects),
+        'distinctUris': len(uri_values),
+        'uriInternableBytes': uri_internable
+    }
+
+
+def profile(server, warmup=False):
+    """Profilo del grafo caricato nel modulo del server (sparql_server_production)"""
+    graph = server.knowledge_graph
+    if warmup:
+        _warm_caches(server)
+    gc.collect()
+
+    walker = MemoryWalker(boundaries=(graph, graph.store))
+    components = {}
+    components['namespaces'] = walker.walk(graph.namespace_manager, 'namespaces') + sum(
+        walker.walk(value, 'namespaces') for name, value in vars(graph.store).items()
+        if name.endswith(('namespace', 'prefix')))
+    store_bytes = walker.walk(graph.store, 'store')
+    components['derivedIndexes'] = {
+        name: walker.walk(getattr(server, name), 'derived')
+        for name in ('platform_index', 'graph_stats', 'search_index', 'contribution_index', 'graph_access')
+    }
+    components['queryCaches'] = {
+        'sparql_cache': walker.walk(server.sparql_cache, 'caches'),
+        'api_queries': walker.walk(server.api_queries, 'caches'),
+        'slow_queries': walker.walk(server.slow_queries, 'caches'),
+    }
+    terms = {category: walker.bytes.get(category, 0) for category in ('uri', 'bnode', 'literal', 'literal_value')}
+    components['storeIndexes'] = walker.bytes.get('store', 0)
+    components['terms'] = terms
+    triples = len(graph)
+
+    details = breakdown(graph, server.platform_index)
+    index_per_triple = components['storeIndexes'] / triples if triples else 0.0
+    literal_internable = sum(entry.internable_bytes for entry in details['predicates'].values())
+    return {
+        'store': type(graph.store).__name__,
+        'triples': triples,
+        'components': components,
+        'termObjects': {category: walker.objects.get(category, 0) for category in terms},
+        'storeBytesPerTriple': round(store_bytes / triples, 1) if triples else None,
+        'internability': {
+            'literalObjects': sum(len(entry.literal_objects) for entry in details['predicates'].values()),
+            'distinctLiterals': len({value for entry in details['predicates'].values() for value in entry.values}),
+            'literalInternableBytes': literal_internable,
+            'uriObjects': details['uriObjects'],
+            'distinctUris': details['distinctUris'],
+            'uriInternableBytes': details['uriInternableBytes'],
+            'datatypeObjects': details['datatypeObjects'],
+            'distinctDatatypes': details['distinctDatatypes']
+        },
+        'predicates': {str(p): entry.to_json(index_per_triple) for p, entry in details['predicates'].items()},
+        'platforms': {platform: entry.to_json(index_per_triple) for platform, entry in details['platforms'].items()}
+    }
+
+
+def _warm_caches(server):
+    """Riempie le cache con le richieste tipiche (query del benchmark e API principali)"""
+    from benchmark_server import SPARQL_QUERIES
+    client = server.app.test_client()
+    for query in SPARQL_QUERIES:
+        client.get('/sparql', query_string={'query': query},
+                   headers={'Accept': 'application/sparql-results+json'})
+    for url in ('/api/stats', '/api/platforms', '/api/processes', '/api/participants',
+                '/api/contributions?limit=500', '/api/search?q=climate'):
+        client.get(url)
+
+
+def _mb(value):
+    return f"{value / (1024 * 1024):10.2f} MB"
+
+
+def print_report(report, top):
+    triples = report['triples']
+    components = report['components']
+    print(f"Store {report['store']}: {triples} triple")
+    print(f"RSS: {_mb(report['rssBefore'])} prima, {_mb(report['rssAfter'])} dopo il caricamento "
+          f"({(report['rssAfter'] - report['rssBefore']) / max(triples, 1):.1f} byte/tripla)")
+
+    print("\nComponenti")
+    rows = [('indici dello store', components['storeIndexes'])]
+    rows += [(f"termini: {name}", size) for name, size in components['terms'].items()]
+    rows.append(('namespace manager', components['namespaces']))
+    rows += [(f"indice derivato: {name}", size) for name, size in components['derivedIndexes'].items()]
+    rows += [(f"cache: {name}", size) for name, size in components['queryCaches'].items()]
+    rows.append(('non attribuita', report['unattributed']))
+    for name, size in rows:
+        print(f"  {name:34} {_mb(size)} {size / max(triples, 1):9.1f} byte/tripla")
+
+    internability = report['internability']
+    print("\nInterning")
+    print(f"  letterali: {internability['literalObjects']} oggetti, {internability['distinctLiterals']} valori "
+          f"distinti, {_mb(internability['literalInternableBytes']).strip()} risparmiabili")
+    print(f"  URI: {internability['uriObjects']} oggetti, {internability['distinctUris']} distinti, "
+          f"{_mb(internability['uriInternableBytes']).strip()} risparmiabili")
+    print(f"  datatype: {internability['datatypeObjects']} oggetti per {internability['distinctDatatypes']} "
+          f"datatype distinti")
+
+    for title, key in (('Predicati', 'predicates'), ('Piattaforme', 'platforms')):
+        print(f"\n{title} (per byte dei letterali)")
+        print(f"  {'':60} {'triple':>9} {'letterali MB':>13} {'internabili MB':>15} {'car. medi':>10}")
+        ranked = sorted(report[key].items(), key=lambda item: item[1]['literalBytes'] + item[1]['indexBytes'],
+                        reverse=True)
+        for name, entry in ranked[:top]:
+            avg = entry['avgLiteralChars']
+            print(f"  {name[-60:]:60} {entry['triples']:9d} {entry['literalBytes'] / 1048576:13.2f} "
+                  f"{entry['internableBytes'] / 1048576:15.2f} {avg if avg is not None else '-':>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profilo della memoria del Deliberation Knowledge Graph')
+    parser.add_argument('kg_file', help='File del knowledge graph (.ttl, .nt)')
+    parser.add_argument('--compact-store', action='store_true', help='Carica il grafo in kg_store.CompactStore')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='Usa (e crea se manca) lo snapshot binario come il server')
+    parser.add_argument('--warmup', action='store_true', help='Riempie le cache con richieste tipiche prima della misura')
+    parser.add_argument('--top', type=int, default=20, help='Predicati e piattaforme mostrati (default: 20)')
+    parser.add_argument('--json', help='Scrive il profilo completo in questo file JSON')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    import sparql_server_production as server
+    logging.getLogger('sparql_server_production').setLevel(logging.WARNING)
+    server.compact_store = args.compact_store
+    server.use_snapshots = args.snapshot
+    server.use_wal = False
+    server.configure_slow_query_log('none', 1000.0, 0.0, 1)
+    gc.collect()
+    rss_before = process_rss_bytes()
+
+    start = time.time()
+    if not server.load_knowledge_graph(args.kg_file):
+        print(f"Caricamento di {args.kg_file} non riuscito")
+        return 1
+    load_seconds = time.time() - start
+    report = profile(server, warmup=args.warmup)
+    gc.collect()
+    report['rssBefore'] = rss_before
+    report['rssAfter'] = process_rss_bytes()
+    report['loadSeconds'] = round(load_seconds, 2)
+    attributed = report['components']['storeIndexes'] + sum(report['components']['terms'].values()) + \
+        report['components']['namespaces'] + sum(report['components']['derivedIndexes'].values()) + \
+        sum(report['components']['queryCaches'].values())
+    report['unattributed'] = max(0, report['rssAfter'] - report['rssBefore'] - attributed)
+
+    print_report(report, args.top)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nProfilo scritto in {args.json}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Metriche del server in formato di esposizione Prometheus (text 0.0.4).
+
+Il registro contiene contatori e istogrammi aggiornati dal codice del server
+e gauge calcolati al momento della lettura (dimensione del grafo, contatori
+delle cache, memoria del processo). /metrics restituisce il testo prodotto
+da MetricsRegistry.render().
+
+instrument_app() misura ogni richiesta Flask: il numero di richieste per
+metodo, route e stato e la latenza per route, fino all'invio dell'ultimo
+byte della risposta (anche in streaming). La route è il pattern registrato
+(es. /api/contribution/<path:contribution_id>), non il percorso richiesto,
+così il numero di serie resta limitato.
+
+Le metriche sono per processo. In modalità pre-fork ogni worker HTTP azzera
+i contatori e gli istogrammi ereditati dal master e aggiunge a tutte le
+serie l'etichetta worker con il numero del suo posto (0..N-1), che il worker
+creato al posto di uno sostituito (nuova versione del grafo o riavvio)
+mantiene: una serie appartiene sempre a un solo processo alla volta e
+l'azzeramento dopo un fork appare a Prometheus come un riavvio del
+contatore. I totali si ottengono con sum() sull'etichetta worker; le
+metriche aggiornate solo dal master (ricaricamenti, salvataggi) non sono
+esposte dai worker.
+"""
+
+import os
+import resource
+import threading
+import time
+
+from flask import g, request
+
+# Limiti superiori degli istogrammi di latenza (secondi)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Limiti superiori dell'istogramma del numero di righe dei risultati
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+# Limiti superiori delle durate dei salvataggi (secondi)
+SAVE_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None, constant=()):
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    pairs.extend(constant)
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: etichette attese {self.labelnames}, ricevute {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self, constant=()):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples(constant))
+        return lines
+
+    def clear(self):
+        """Azzera i valori accumulati (nessun effetto sui gauge)"""
+
+
+class Counter(_Metric):
+    """Contatore monotono, con etichette"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def _samples(self, constant):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key, constant=constant)} {_format_value(value)}'
+                for key, value in values]
+
+
+class Histogram(_Metric):
+    """Istogramma cumulativo con somma e conteggio, con etichette"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # etichette -> [conteggi per bucket..., somma, conteggio]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def _samples(self, constant):
+        with self._lock:
+            values = sorted((key, list(series)) for key, series in self._values.items())
+        lines = []
+        for key, series in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(float(bound))}"', constant)
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"', constant)
+            lines.append(f'{self.name}_bucket{labels} {series[-1]}')
+            labels = _format_labels(self.labelnames, key, constant=constant)
+            lines.append(f'{self.name}_sum{labels} {_format_value(series[-2])}')
+            lines.append(f'{self.name}_count{labels} {series[-1]}')
+        return lines
+
+
+class Gauge(_Metric):
+    """Valore letto al momento dell'esposizione.
+
+    `function` restituisce un numero oppure, se il gauge ha etichette, un
+    dizionario {tupla di valori delle etichette: numero}. Con kind='counter'
+    espone un contatore mantenuto altrove (es. gli hit di una cache)."""
+
+    def __init__(self, name, documentation, function, labelnames=(), kind='gauge'):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+        self.kind = kind
+
+    def _samples(self, constant):
+        value = self.function()
+        if value is None:
+            return []
+        if not self.labelnames:
+            return [f'{self.name}{_format_labels((), (), constant=constant)} {_format_value(value)}']
+        return [f'{self.name}{_format_labels(self.labelnames, key, constant=constant)} {_format_value(v)}'
+                for key, v in sorted(value.items()) if v is not None]
+
+
+class MetricsRegistry:
+    """Insieme delle metriche esposte da /metrics"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._constant = ()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metrica già registrata: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, function, labelnames=()):
+        return self._register(Gauge(name, documentation, function, labelnames))
+
+    def counter_function(self, name, documentation, function, labelnames=()):
+        return self._register(Gauge(name, documentation, function, labelnames, kind='counter'))
+
+    def set_constant_labels(self, **labels):
+        """Etichette aggiunte a tutte le serie (es. worker in modalità pre-fork)"""
+        self._constant = tuple(f'{name}="{_escape_label(value)}"' for name, value in sorted(labels.items()))
+
+    def reset(self):
+        """Azzera contatori e istogrammi (es. nel worker appena creato con fork)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+    def render(self):
+        """Testo di tutte le metriche; un gauge che fallisce viene omesso"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render(self._constant))
+            except Exception:
+                continue
+        return '\n'.join(lines) + '\n'
+
+
+def process_rss_bytes():
+    """Memoria residente del processo (picco massimo se /proc non è disponibile)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux riporta kilobyte, macOS byte
+        return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+def register_process_metrics(registry):
+    """Memoria residente, tempo di CPU e ora di avvio del processo"""
+    started = time.time()
+    registry.gauge('process_resident_memory_bytes', 'Memoria residente del processo in byte',
+                   process_rss_bytes)
+    registry.counter_function('process_cpu_seconds_total', 'Tempo di CPU utente e di sistema del processo in secondi',
+                   lambda: sum(os.times()[:2]))
+    registry.gauge('process_start_time_seconds', 'Ora di avvio del processo (epoch Unix)',
+                   lambda: started)
+
+
+def timed_chunks(chunks, observe):
+    """Inoltra i blocchi di una risposta e passa a `observe` il tempo speso a
+    produrli (senza l'attesa del client), al termine dello stream"""
+    elapsed = 0.0
+    iterator = iter(chunks)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - start
+                break
+            elapsed += time.perf_counter() - start
+            yield chunk
+    finally:
+        observe(elapsed)
+
+
+def instrument_app(app, registry, prefix='dkg'):
+    """Conteggio e latenza per route di tutte le richieste di un'app Flask"""
+    requests_total = registry.counter(f'{prefix}_http_requests_total', 'Richieste HTTP servite',
+                                      ('method', 'route', 'status'))
+    request_seconds = registry.histogram(f'{prefix}_http_request_duration_seconds',
+                                         'Durata delle richieste HTTP fino all\'ultimo byte della risposta',
+                                         ('method', 'route'))
+    in_flight = [0]
+    in_flight_lock = threading.Lock()
+    registry.gauge(f'{prefix}_http_requests_in_flight', 'Richieste HTTP in corso', lambda: in_flight[0])
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+        with in_flight_lock:
+            in_flight[0] += 1
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('_metrics_start', None)
+        if start is None:
+            return response
+        method = request.method
+        route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        status = str(response.status_code)
+
+        def finished():
+            request_seconds.observe(time.perf_counter() - start, method=method, route=route)
+            requests_total.inc(method=method, route=route, status=status)
+            with in_flight_lock:
+                in_flight[0] -= 1
+
+        response.call_on_close(finished)
+        return response
+
+    return requests_total, request_seconds
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Indice delle piattaforme del Deliberation Knowledge Graph.
+
+Ogni contributo, processo e partecipante riceve un ID canonico di
+piattaforma con un'unica risoluzione al caricamento del grafo (e per le
+entità toccate dall'ingest); tutte le API usano questo indice invece di
+ripetere per ogni riga le euristiche sugli URI e sui nomi, quindi i
+conteggi sono coerenti tra gli endpoint.
+
+Ordine di risoluzione:
+- valore esplicito di del:platform sull'entità;
+- processo: nome del processo, poi URI;
+- contributo: piattaforma del processo (del:hasContribution o del:partOf), poi URI;
+- partecipante: piattaforma prevalente dei suoi contributi, poi dei suoi
+  processi (del:hasParticipant), poi URI;
+- altrimenti 'other'.
+"""
+
+import threading
+from collections import Counter
+
+from rdflib import Literal, Namespace, RDF
+
+DEL = Namespace("https://w3id.org/deliberation/ontology#")
+
+OTHER_PLATFORM = 'other'
+
+# ID canonico -> nome leggibile
+PLATFORM_NAMES = {
+    'ep_debate': 'European Parliament Debates',
+    'decidemadrid': 'Decide Madrid',
+    'decidim_barcelona': 'Decidim Barcelona',
+    'delidata': 'DeliData',
+    'habermas': 'Habermas Machine',
+    'haveyoursay': 'EU Have Your Say',
+    'scotus': 'US Supreme Court',
+    'yourpriorities': 'Your Fallacious Priorities',
+    OTHER_PLATFORM: 'Other Platform'
+}
+
+# Valori di del:platform (e nomi usati in passato dalle API) -> ID canonico
+PLATFORM_ALIASES = {
+    'eu parliament': 'ep_debate',
+    'european parliament': 'ep_debate',
+    'eu_parliament': 'ep_debate',
+    'decide_madrid': 'decidemadrid',
+    'have your say': 'haveyoursay',
+    'eu_have_your_say': 'haveyoursay',
+    'supreme court': 'scotus',
+    'us_supreme_court': 'scotus',
+    'your priorities': 'yourpriorities',
+    'your fallacious priorities': 'yourpriorities',
+    'unknown platform': OTHER_PLATFORM,
+}
+PLATFORM_ALIASES.update({name.lower(): platform_id for platform_id, name in PLATFORM_NAMES.items()})
+PLATFORM_ALIASES.update({platform_id: platform_id for platform_id in PLATFORM_NAMES})
+
+_KINDS = {
+    DEL.Contribution: 'contributions',
+    DEL.DeliberationProcess: 'processes',
+    DEL.Participant: 'participants',
+}
+
+# Predicati che possono cambiare la piattaforma di un'entità
+_PLATFORM_PREDICATES = frozenset([
+    RDF.type, DEL.platform, DEL.name, DEL.madeBy, DEL.partOf,
+    DEL.hasContribution, DEL.hasParticipant
+])
+# Predicati che collegano due entità: la piattaforma può cambiare per entrambe
+_LINK_PREDICATES = frozenset([DEL.madeBy, DEL.partOf, DEL.hasContribution, DEL.hasParticipant])
+
+
+def platform_id_from_name(name):
+    """ID canonico a partire da un valore di del:platform"""
+    name = str(name).strip().lower()
+    return PLATFORM_ALIASES.get(name, name.replace(' ', '_').replace('.', '_'))
+
+
+def platform_from_uri(uri):
+    """Piattaforma dedotta dall'URI di un'entità (None se non riconoscibile)"""
+    uri = str(uri).lower()
+    if 'yourpriorities' in uri or '/point-' in uri:
+        return 'yourpriorities'
+    if 'habermas' in uri or 'hm_' in uri:
+        return 'habermas'
+    if 'decidemadrid' in uri or 'madrid' in uri or 'dm_' in uri:
+        return 'decidemadrid'
+    if 'haveyoursay' in uri or 'eu_hys' in uri or 'have_your_say' in uri:
+        return 'haveyoursay'
+    if 'scotus' in uri or 'sc_' in uri or 'supreme_court' in uri:
+        return 'scotus'
+    if 'decidim' in uri or 'db_' in uri:
+        return 'decidim_barcelona'
+    if 'delidata' in uri or 'dd_' in uri:
+        return 'delidata'
+    if 'ep_debate' in uri or 'eu_parliament' in uri:
+        return 'ep_debate'
+    return None
+
+
+def platform_from_process_name(process_name):
+    """Piattaforma dedotta dal nome di un processo (None se non riconoscibile)"""
+    name = str(process_name).lower()
+    if 'madrid' in name:
+        return 'decidemadrid'
+    if 'parliament' in name or 'ep_debate' in name:
+        return 'ep_debate'
+    if 'decidim' in name or 'barcelona' in name:
+        return 'decidim_barcelona'
+    if 'delidata' in name:
+        return 'delidata'
+    if 'habermas' in name:
+        return 'habermas'
+    if 'eu_have_your_say' in name or 'have your say' in name:
+        return 'haveyoursay'
+    if 'supreme_court' in name or 'us_supreme' in name or 'supreme court' in name:
+        return 'scotus'
+    return None
+
+
+def _first(terms):
+    return min(terms, key=str, default=None)
+
+
+class PlatformIndex:
+    """Piattaforma canonica di contributi, processi e partecipanti"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._platforms = {}   # termine -> ID della piattaforma
+        self._kinds = {}       # termine -> 'contributions' | 'processes' | 'participants'
+        self._counts = {kind: Counter() for kind in _KINDS.values()}
+        self._names = dict(PLATFORM_NAMES)
+
+    def rebuild(self, graph):
+        """Risolve la piattaforma di tutte le entità del grafo"""
+        with self._lock:
+            self._reset()
+            for cls in (DEL.DeliberationProcess, DEL.Contribution, DEL.Participant):
+                for entity in graph.subjects(RDF.type, cls):
+                    self._assign(graph, entity)
+
+    def record_added(self, graph, triples):
+        """Risolve di nuovo le entità toccate da triple appena aggiunte"""
+        touched = set()
+        for s, p, o in triples:
+            if p in _PLATFORM_PREDICATES:
+                touched.add(s)
+                if p in _LINK_PREDICATES:
+                    touched.add(o)
+        if not touched:
+            return
+
+        # La piattaforma dei processi determina quella dei contributi, che a
+        # sua volta determina quella dei partecipanti
+        processes = {e for e in touched if (e, RDF.type, DEL.DeliberationProcess) in graph}
+        contributions = {e for e in touched if (e, RDF.type, DEL.Contribution) in graph}
+        for process in processes:
+            contributions.update(graph.objects(process, DEL.hasContribution))
+            contributions.update(graph.subjects(DEL.partOf, process))
+        participants = {e for e in touched if (e, RDF.type, DEL.Participant) in graph}
+        for contribution in contributions:
+            participants.update(graph.objects(contribution, DEL.madeBy))
+
+        with self._lock:
+            for entities in (processes, contributions, participants):
+                for entity in entities:
+                    self._assign(graph, entity)
+
+    def _assign(self, graph, entity):
+        kind = None
+        for cls in graph.objects(entity, RDF.type):
+            kind = _KINDS.get(cls) or kind
+        if kind is None:
+            return
+        platform_id = self._resolve(graph, entity, kind)
+
+        old_kind = self._kinds.get(entity)
+        if old_kind is not None:
+            self._counts[old_kind][self._platforms[entity]] -= 1
+        self._platforms[entity] = platform_id
+        self._kinds[entity] = kind
+        self._counts[kind][platform_id] += 1
+
+    def _resolve(self, graph, entity, kind):
+        explicit = _first(graph.objects(entity, DEL.platform))
+        if explicit is not None:
+            platform_id = platform_id_from_name(explicit)
+            self._names.setdefault(platform_id, str(explicit))
+            return platform_id
+
+        if kind == 'processes':
+            name = _first(graph.objects(entity, DEL.name))
+            platform_id = platform_from_process_name(name) if name is not None else None
+            return platform_id or platform_from_uri(entity) or OTHER_PLATFORM
+
+        if kind == 'contributions':
+            processes = set(graph.subjects(DEL.hasContribution, entity))
+            processes.update(graph.objects(entity, DEL.partOf))
+            for process in sorted(processes, key=str):
+                platform_id = self._platforms.get(process)
+                if platform_id is None:
+                    platform_id = self._resolve(graph, process, 'processes')
+                if platform_id != OTHER_PLATFORM:
+                    return platform_id
+            return platform_from_uri(entity) or OTHER_PLATFORM
+
+        votes = Counter(self._platforms.get(c) for c in graph.subjects(DEL.madeBy, entity))
+        if not votes:
+            votes = Counter(self._platforms.get(p) for p in graph.subjects(DEL.hasParticipant, entity))
+        votes.pop(None, None)
+        votes.pop(OTHER_PLATFORM, None)
+        if votes:
+            return max(sorted(votes), key=votes.get)
+        return platform_from_uri(entity) or OTHER_PLATFORM
+
+    def platform_of(self, entity):
+        """ID della piattaforma di un'entità (None se non indicizzata)"""
+        return self._platforms.get(entity)
+
+    def entities(self, platform_id):
+        """Entità (contributi, processi, partecipanti) assegnate alla piattaforma"""
+        with self._lock:
+            return [entity for entity, assigned in self._platforms.items() if assigned == platform_id]
+
+    def name(self, platform_id):
+        """Nome leggibile di una piattaforma"""
+        return self._names.get(platform_id, platform_id.replace('_', ' ').title())
+
+    def resolve_filter(self, value):
+        """ID canonico per un filtro espresso come ID o come nome"""
+        return platform_id_from_name(value)
+
+    def platforms(self):
+        """Piattaforme con i conteggi nel formato di /api/platforms"""
+        with self._lock:
+            counts = {kind: dict(counter) for kind, counter in self._counts.items()}
+            names = dict(self._names)
+        ids = set()
+        for counter in counts.values():
+            ids.update(platform_id for platform_id, count in counter.items() if count > 0)
+
+        platforms = [{
+            'id': platform_id,
+            'name': names.get(platform_id, platform_id),
+            'count': counts['contributions'].get(platform_id, 0),
+            'processes': counts['processes'].get(platform_id, 0),
+            'participants': counts['participants'].get(platform_id, 0)
+        } for platform_id in ids]
+        platforms.sort(key=lambda x: (-x['count'], x['id']))
+        return platforms
+
+    def materialize(self, graph):
+        """Triple del:platform per le entità che non ne hanno una esplicita"""
+        with self._lock:
+            assigned = list(self._platforms.items())
+        return [(entity, DEL.platform, Literal(self.name(platform_id)))
+                for entity, platform_id in assigned
+                if platform_id != OTHER_PLATFORM and (entity, DEL.platform, None) not in graph]
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Ricaricamento a caldo del knowledge graph.
+
+Un nuovo file del grafo (una nuova build messa al posto di --kg-file, con il
+suo snapshot binario) viene caricato senza fermare il server: il server
+costruisce in background il nuovo grafo e tutti i suoi indici derivati e poi
+sostituisce i riferimenti globali con un'unica scrittura breve (vedi
+reload_knowledge_graph in sparql_server_production.py).
+
+Questo modulo contiene le parti indipendenti dal server:
+
+- Reloader: esegue il ricaricamento in un thread, uno alla volta, e ne
+  conserva lo stato per /admin/reload;
+- FileWatcher: controlla periodicamente la firma (inode, dimensione, mtime)
+  del file base e dello snapshot e avvia il ricaricamento quando cambiano.
+  Una modifica viene considerata completa quando la firma resta uguale per
+  due controlli consecutivi, così un file copiato lentamente non viene letto
+  a metà; ogni nuova firma avvia al più un ricaricamento, anche se fallisce.
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def file_signature(path):
+    """(inode, dimensione, mtime in ns) del file, None se non esiste"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class Reloader:
+    """Esegue `reload_function(reason)` in background, un ricaricamento alla volta"""
+
+    def __init__(self, reload_function):
+        self.reload_function = reload_function
+        self._lock = threading.Lock()
+        self._thread = None
+        self._status = {'state': 'idle'}
+        self.reloads = 0
+        self.failures = 0
+
+    @property
+    def running(self):
+        with self._lock:
+            return self._thread is not None
+
+    def start(self, reason='admin'):
+        """Avvia un ricaricamento; False se ce n'è già uno in corso"""
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self._status = {'state': 'running', 'reason': reason, 'started': time.time()}
+            self._thread = threading.Thread(target=self._run, args=(reason,), name='kg-reload', daemon=True)
+            self._thread.start()
+        return True
+
+    def _run(self, reason):
+        start = time.monotonic()
+        try:
+            details = self.reload_function(reason) or {}
+            status = dict(details, state='ok')
+            self.reloads += 1
+        except Exception as e:
+            logger.error(f"Ricaricamento del knowledge graph non riuscito: {e}", exc_info=True)
+            status = {'state': 'error', 'error': str(e)}
+            self.failures += 1
+        with self._lock:
+            status.update(reason=reason, started=self._status['started'], finished=time.time(),
+                          seconds=round(time.monotonic() - start, 3))
+            self._status = status
+            self._thread = None
+
+    def status(self):
+        with self._lock:
+            return dict(self._status)
+
+    def wait(self, timeout=None):
+        """Attende la fine del ricaricamento in corso (per script e test)"""
+        with self._lock:
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        return not self.running
+
+
+class FileWatcher:
+    """Avvia `on_change` quando la firma dei file base cambia rispetto a quella nota"""
+
+    def __init__(self, current, known, on_change, interval=10.0):
+        self.current = current      # funzione: firma attuale dei file
+        self.known = known          # funzione: firma dell'ultimo caricamento o salvataggio del server
+        self.on_change = on_change
+        self.interval = interval
+        self._observed = None
+        self._triggered = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='kg-watch', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Errore nel controllo del file del knowledge graph: {e}")
+
+    def check(self):
+        """Un controllo: True se ha avviato un ricaricamento"""
+        signature = self.current()
+        stable = signature == self._observed
+        self._observed = signature
+        if not stable or signature == self.known() or signature == self._triggered:
+            return False
+        if signature[0] is None:
+            return False  # File base rimosso (es. durante la sostituzione)
+        if self.on_change():
+            self._triggered = signature
+            logger.info("File del knowledge graph modificato: ricaricamento avviato")
+            return True
+        return False
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Indice full-text per /api/search.
+
+L'indice invertito copre i nomi (del:name) di tutte le entità tipizzate e il
+testo (del:text) dei contributi. Viene costruito al caricamento del grafo e
+aggiornato dall'ingest, quindi una ricerca non scandisce più i letterali del
+grafo e il testo dell'utente non viene mai interpolato in una query SPARQL.
+
+- Tokenizzazione: minuscole, rimozione degli accenti (NFKD) e parole di
+  almeno due caratteri; le parole vuote di italiano, spagnolo, catalano e
+  inglese vengono ignorate sia nei documenti sia nelle query.
+- Ranking: BM25, con il nome pesato più del testo.
+- Query: tutti i termini devono comparire; `term*` cerca per prefisso.
+- Filtri: tipo dell'entità (nome locale della classe) e piattaforma.
+
+Per ogni termine le occorrenze sono due colonne parallele (array('I') degli
+identificativi dei documenti, in ordine crescente, e array('f') delle
+frequenze pesate); i documenti sono tuple che riusano i letterali del grafo.
+I documenti reindicizzati dall'ingest lasciano una voce vuota nella lista dei
+documenti e le loro occorrenze restano nelle colonne, ignorate dalla ricerca;
+quando le voci vuote superano quelle vive la lista e le colonne vengono
+compattate e gli identificativi rinumerati.
+"""
+
+import bisect
+import heapq
+from array import array
+import itertools
+import logging
+import math
+import re
+import threading
+import unicodedata
+
+from rdflib import Namespace, RDF
+
+from kg_platforms import platform_id_from_name
+
+DEL = Namespace("https://w3id.org/deliberation/ontology#")
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r'\w+')
+_QUERY_TERM_RE = re.compile(r'\w+\*?')
+
+STOPWORDS = frozenset('''
+    il lo la gli le un uno una di del dello della dei degli delle da dal dalla
+    in nel nella nei nelle su sul sulla con per tra fra che chi non come anche
+    ma ed se sono era questo questa quello quella ha hanno essere al alla ai
+    el los las unos unas en con por para que es son del al se lo como pero mas
+    su sus este esta ese esa muy sin sobre
+    els les uns unes dels als amb per que es son pel pels aquest aquesta pero
+    mes com seu seva hi ho
+    the of and to in is are was were be been it that this for on with as by
+    at an or from not but have has had
+'''.split())
+
+# Peso del nome rispetto al testo nel calcolo della frequenza dei termini
+NAME_WEIGHT = 2.0
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Numero massimo di termini in cui si espande una ricerca per prefisso (default)
+MAX_PREFIX_EXPANSION = 64
+# Documenti rimossi oltre i quali la lista dei documenti viene compattata
+COMPACT_MIN_REMOVED = 1024
+SNIPPET_LENGTH = 200
+
+# Predicati che cambiano il documento di un'entità
+_INDEXED_PREDICATES = frozenset([DEL.name, DEL.text, RDF.type])
+
+# Tipo mostrato nei risultati quando un'entità ha più classi
+_TYPE_PRIORITY = ['Contribution', 'DeliberationProcess', 'Participant', 'Topic', 'Organization']
+
+# Campi di un documento indicizzato
+_SUBJECT, _TYPE, _TYPES, _NAME, _TEXT = range(5)
+
+
+def fold(text):
+    """Minuscole e senza accenti"""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def tokenize(text):
+    """Termini indicizzabili di un testo"""
+    return [token for token in _TOKEN_RE.findall(fold(text))
+            if len(token) > 1 and token not in STOPWORDS]
+
+
+def parse_query(query):
+    """Termini della query: lista di (termine, is_prefix)"""
+    terms = []
+    for raw in _QUERY_TERM_RE.findall(fold(query)):
+        prefix = raw.endswith('*')
+        term = raw.rstrip('*')
+        if not term or (not prefix and (len(term) < 2 or term in STOPWORDS)):
+            continue
+        terms.append((term, prefix))
+    return terms
+
+
+def split_values(value):
+    """Valori di un parametro di filtro separati da virgole"""
+    return [v.strip() for v in (value or '').split(',') if v.strip()]
+
+
+def local_name(uri):
+    uri = str(uri)
+    return uri.rsplit('#', 1)[-1] if '#' in uri else uri.rsplit('/', 1)[-1]
+
+
+class SearchIndex:
+    """Indice invertito con ranking BM25"""
+
+    def __init__(self, platform_index, max_prefix_expansion=MAX_PREFIX_EXPANSION):
+        # La piattaforma viene letta dall'indice delle piattaforme al momento
+        # della ricerca, così resta coerente con le altre API
+        self.platform_index = platform_index
+        self.max_prefix_expansion = max_prefix_expansion
+        self.truncated_expansions = 0
+        self.compactions = 0
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._postings = {}     # termine -> (array('I') doc_id, array('f') frequenza pesata)
+        self._sorted_terms = None
+        self._doc_ids = {}      # soggetto -> doc_id
+        self._docs = []         # doc_id -> (soggetto, tipo, tipi, nome, testo), None se rimosso
+        self._lengths = array('I')
+        self._type_sets = {}    # insiemi di tipi condivisi tra i documenti
+        self._total_length = 0.0
+        self._live = 0
+
+    def rebuild(self, graph):
+        """Indicizza tutto il grafo"""
+        with self._lock:
+            self._reset()
+            subjects = set(graph.subjects(DEL.name, None))
+            subjects.update(s for s in graph.subjects(DEL.text, None)
+                            if (s, RDF.type, DEL.Contribution) in graph)
+            for subject in subjects:
+                self._index(graph, subject)
+
+    def record_added(self, graph, triples):
+        """Reindicizza le entità toccate da triple appena aggiunte"""
+        touched = {s for s, p, o in triples if p in _INDEXED_PREDICATES}
+        if not touched:
+            return
+        with self._lock:
+            for subject in touched:
+                self._remove(subject)
+                self._index(graph, subject)
+            removed = len(self._docs) - self._live
+            if removed > max(COMPACT_MIN_REMOVED, self._live):
+                self._compact()
+
+    def _index(self, graph, subject):
+        types = [local_name(t) for t in graph.objects(subject, RDF.type)]
+        if not types:
+            return
+        names = list(graph.objects(subject, DEL.name))
+        texts = list(graph.objects(subject, DEL.text)) if 'Contribution' in types else []
+        if not names and not texts:
+            return
+
+        weights = {}
+        length = 0
+        for value, weight in [(name, NAME_WEIGHT) for name in names] + [(text, 1.0) for text in texts]:
+            tokens = tokenize(value)
+            length += len(tokens)
+            for token in tokens:
+                weights[token] = weights.get(token, 0.0) + weight
+        if not weights:
+            return
+
+        # Il testo viene troncato solo nei risultati: il documento riusa il letterale del grafo
+        text = next((t for t in texts if t.strip()), None)
+        type_set = frozenset(types)
+        type_set = self._type_sets.setdefault(type_set, type_set)
+        display_type = next((t for t in _TYPE_PRIORITY if t in types), types[0])
+
+        doc_id = len(self._docs)
+        self._doc_ids[subject] = doc_id
+        self._docs.append((subject, display_type, type_set, names[0] if names else None, text))
+        self._lengths.append(length)
+        self._total_length += length
+        self._live += 1
+        for token, weight in weights.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = (array('I'), array('f'))
+                self._sorted_terms = None
+            postings[0].append(doc_id)
+            postings[1].append(weight)
+
+    def _remove(self, subject):
+        doc_id = self._doc_ids.pop(subject, None)
+        if doc_id is None:
+            return
+        # Le occorrenze restano nelle colonne fino alla prossima compattazione
+        self._total_length -= self._lengths[doc_id]
+        self._docs[doc_id] = None
+        self._live -= 1
+
+    def _compact(self):
+        """Elimina i documenti rimossi e le loro occorrenze rinumerando i documenti vivi"""
+        renumber = array('i', [-1]) * len(self._docs)
+        docs, lengths = [], array('I')
+        for doc_id, doc in enumerate(self._docs):
+            if doc is None:
+                continue
+            renumber[doc_id] = len(docs)
+            docs.append(doc)
+            lengths.append(self._lengths[doc_id])
+        postings = {}
+        for token, (doc_ids, weights) in self._postings.items():
+            live_ids, live_weights = array('I'), array('f')
+            for doc_id, weight in zip(doc_ids, weights):
+                new_id = renumber[doc_id]
+                if new_id >= 0:
+                    live_ids.append(new_id)
+                    live_weights.append(weight)
+            if live_ids:
+                postings[token] = (live_ids, live_weights)
+        self._postings = postings
+        self._sorted_terms = None
+        self._doc_ids = {subject: renumber[doc_id] for subject, doc_id in self._doc_ids.items()}
+        self._docs = docs
+        self._lengths = lengths
+        self.compactions += 1
+
+    def _expand(self, term, prefix):
+        if not prefix:
+            return [term] if term in self._postings else []
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._postings)
+        start = bisect.bisect_left(self._sorted_terms, term)
+        expanded = []
+        for candidate in itertools.islice(self._sorted_terms, start, start + self.max_prefix_expansion + 1):
+            if not candidate.startswith(term):
+                break
+            expanded.append(candidate)
+        if len(expanded) > self.max_prefix_expansion:
+            # Prefisso troppo generico: i termini oltre il limite non vengono cercati
+            expanded.pop()
+            self.truncated_expansions += 1
+            logger.debug(f"Ricerca per prefisso '{term}*' limitata ai primi {self.max_prefix_expansion} termini")
+        return expanded
+
+    def search(self, query, limit=50, types=None, platforms=None):
+        """Restituisce i documenti più rilevanti (dict con uri, type, name,
+        text, platform, score) che contengono tutti i termini della query"""
+        terms = parse_query(query)
+        if not terms:
+            return []
+        types = set(types) if types else None
+        platforms = {platform_id_from_name(p) for p in platforms} if platforms else None
+        platform_of = self.platform_index.platform_of
+
+        with self._lock:
+            if not self._live:
+                return []
+            avg_length = self._total_length / self._live or 1.0
+            groups = [self._expand(term, prefix) for term, prefix in terms]
+            if not all(groups):
+                return []
+
+            # Documenti che contengono ogni termine (o un'espansione del
+            # prefisso); le occorrenze dei documenti rimossi vengono escluse
+            docs = self._docs
+            all_live = self._live == len(docs)
+            candidate_sets = []
+            for group in groups:
+                group_docs = set()
+                for term in group:
+                    group_docs.update(self._postings[term][0])
+                candidate_sets.append(group_docs)
+            candidate_sets.sort(key=len)
+            candidates = set.intersection(*candidate_sets)
+            if not all_live:
+                candidates = {doc_id for doc_id in candidates if docs[doc_id] is not None}
+            if not candidates:
+                return []
+
+            scores = {}
+            for group in groups:
+                for term in group:
+                    doc_ids, weights = self._postings[term]
+                    frequency = len(doc_ids) if all_live else \
+                        sum(1 for doc_id in doc_ids if docs[doc_id] is not None)
+                    idf = math.log(1 + (self._live - frequency + 0.5) / (frequency + 0.5))
+                    if len(candidates) * 8 < len(doc_ids):
+                        # Pochi candidati: ricerca binaria nella colonna ordinata
+                        matches = []
+                        for doc_id in candidates:
+                            position = bisect.bisect_left(doc_ids, doc_id)
+                            if position < len(doc_ids) and doc_ids[position] == doc_id:
+                                matches.append((doc_id, weights[position]))
+                    else:
+                        matches = [(doc_id, tf) for doc_id, tf in zip(doc_ids, weights)
+                                   if doc_id in candidates]
+                    for doc_id, tf in matches:
+                        norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[doc_id] / avg_length)
+                        scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+            def accepted(doc_id):
+                doc = docs[doc_id]
+                if types and not (doc[_TYPES] & types):
+                    return False
+                return not platforms or platform_of(doc[_SUBJECT]) in platforms
+
+            best = heapq.nlargest(limit, (item for item in scores.items() if accepted(item[0])),
+                                  key=lambda item: item[1])
+            results = []
+            for doc_id, score in best:
+                subject, display_type, _, name, text = docs[doc_id]
+                if text is not None:
+                    text = str(text)
+                    if len(text) > SNIPPET_LENGTH:
+                        text = text[:SNIPPET_LENGTH] + '...'
+                results.append({
+                    'uri': str(subject),
+                    'type': display_type,
+                    'name': str(name) if name is not None else None,
+                    'text': text,
+                    'platform': platform_of(subject),
+                    'score': round(score, 4)
+                })
+            return results
+
+    def stats(self):
+        with self._lock:
+            return {'documents': self._live, 'terms': len(self._postings),
+                    'removedDocuments': len(self._docs) - self._live, 'compactions': self.compactions,
+                    'truncatedPrefixExpansions': self.truncated_expansions}
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Snapshot binario del knowledge graph per un avvio rapido del server.
+
+Il parsing del Turtle domina il tempo di avvio di sparql_server_production.py.
+Lo snapshot memorizza il grafo già codificato:
+
+- una tabella dei termini (dizionario): tipo, datatype, lingua e testo di
+  ogni termine distinto, con il testo concatenato in un unico blocco UTF-8;
+- tre array di interi (soggetto, predicato, oggetto) con gli id dei termini.
+
+Il file viene letto con mmap e gli array vengono usati direttamente come
+memoryview; ogni termine distinto viene costruito una sola volta e condiviso
+da tutte le triple che lo usano.
+
+L'header registra dimensione, mtime e inode del file sorgente: lo snapshot
+viene usato solo se corrispondono ancora al file (snapshot_is_fresh), quindi
+la sostituzione del file con una build più vecchia lo rende non valido.
+
+Uso da riga di comando:
+    python kg_snapshot.py build comprehensive_real_kg.ttl
+    python kg_snapshot.py info comprehensive_real_kg.ttl.snap
+"""
+
+import argparse
+import json
+import mmap
+import os
+import sys
+import time
+from array import array
+
+from rdflib import BNode, Graph, Literal, URIRef
+
+MAGIC = b'DKGSNAP\x01'
+FORMAT_VERSION = 1
+SNAPSHOT_SUFFIX = '.snap'
+
+KIND_URI = 0
+KIND_BNODE = 1
+KIND_LITERAL = 2
+
+# Sezioni del file: nome -> typecode dell'array
+_SECTIONS = [
+    ('kinds', 'B'),
+    ('datatypes', 'I'),
+    ('languages', 'I'),
+    ('offsets', 'Q'),
+    ('text', 'B'),
+    ('subjects', 'I'),
+    ('predicates', 'I'),
+    ('objects', 'I'),
+]
+
+
+def snapshot_path(kg_file):
+    """Percorso dello snapshot associato a un file del knowledge graph"""
+    return kg_file + SNAPSHOT_SUFFIX
+
+
+def snapshot_is_fresh(kg_file, snap_file=None):
+    """True se lo snapshot esiste ed è stato scritto da questa versione del
+    file sorgente: dimensione, mtime (in ns) e inode registrati nell'header
+    devono coincidere con quelli attuali. Il solo confronto delle date non
+    basta: un deploy con mv, rsync -a o cp -p mantiene la data della build,
+    che può essere precedente a quella dello snapshot."""
+    snap_file = snap_file or snapshot_path(kg_file)
+    if not os.path.exists(snap_file):
+        return False
+    if not os.path.exists(kg_file):
+        return True
+    try:
+        recorded = read_header(snap_file).get('source')
+    except (OSError, ValueError):
+        return False
+    return source_matches(recorded, kg_file)
+
+
+def source_matches(recorded, kg_file):
+    """True se i metadati registrati in uno snapshot descrivono il file attuale"""
+    if not recorded or not os.path.exists(kg_file):
+        return False
+    current = source_info(kg_file)
+    return all(recorded.get(key) == current[key] for key in ('size', 'mtime_ns', 'inode'))
+
+
+class _TermTable:
+    """Dizionario termine -> id costruito durante la scrittura"""
+
+    def __init__(self):
+        self.ids = {}
+        self.kinds = array('B')
+        self.datatypes = array('I')
+        self.languages = array('I')
+        self.offsets = array('Q', [0])
+        self.text = []
+        self.text_length = 0
+        self.datatype_ids = {}
+        self.language_ids = {}
+
+    def intern(self, term):
+        term_id = self.ids.get(term)
+        if term_id is not None:
+            return term_id
+        term_id = len(self.kinds)
+        self.ids[term] = term_id
+
+        datatype = language = 0
+        if isinstance(term, Literal):
+            kind = KIND_LITERAL
+            if term.language:
+                language = self.language_ids.setdefault(term.language, len(self.language_ids) + 1)
+            elif term.datatype:
+                datatype = self.datatype_ids.setdefault(str(term.datatype), len(self.datatype_ids) + 1)
+        elif isinstance(term, BNode):
+            kind = KIND_BNODE
+        else:
+            kind = KIND_URI
+
+        value = str(term)
+        self.kinds.append(kind)
+        self.datatypes.append(datatype)
+        self.languages.append(language)
+        self.text.append(value)
+        self.text_length += len(value)
+        self.offsets.append(self.text_length)
+        return term_id
+
+
+def write_snapshot(graph, snap_file, source=None):
+    """Scrive lo snapshot binario del grafo in modo atomico (file temporaneo + rename)"""
+    start = time.time()
+    table = _TermTable()
+    subjects = array('I')
+    predicates = array('I')
+    objects = array('I')
+    intern = table.intern
+    for s, p, o in graph:
+        subjects.append(intern(s))
+        predicates.append(intern(p))
+        objects.append(intern(o))
+
+    # Gli offset sono in caratteri: il testo viene decodificato in un'unica stringa
+    sections = {
+        'kinds': table.kinds,
+        'datatypes': table.datatypes,
+        'languages': table.languages,
+        'offsets': table.offsets,
+        'text': ''.join(table.text).encode('utf-8'),
+        'subjects': subjects,
+        'predicates': predicates,
+        'objects': objects,
+    }
+
+    header = {
+        'version': FORMAT_VERSION,
+        'byteorder': sys.byteorder,
+        'terms': len(table.kinds),
+        'triples': len(subjects),
+        'datatypes': [dt for dt, _ in sorted(table.datatype_ids.items(), key=lambda item: item[1])],
+        'languages': [lang for lang, _ in sorted(table.language_ids.items(), key=lambda item: item[1])],
+        'namespaces': [[prefix, str(uri)] for prefix, uri in graph.namespaces()],
+        'source': source,
+        'created': time.time(),
+        'sections': {},
+    }
+
+    # Offset delle sezioni calcolati dopo l'header, allineati a 8 byte
+    blobs = [(name, bytes(sections[name]) if isinstance(sections[name], bytes) else sections[name].tobytes())
+             for name, _ in _SECTIONS]
+    header_bytes = b''
+    while True:
+        position = _align(len(MAGIC) + 8 + len(header_bytes))
+        for name, blob in blobs:
+            header['sections'][name] = [position, len(blob)]
+            position = _align(position + len(blob))
+        encoded = json.dumps(header).encode('utf-8')
+        if len(encoded) == len(header_bytes):
+            break
+        header_bytes = encoded
+    header_bytes = encoded
+
+    tmp_file = snap_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(8, 'little'))
+        f.write(header_bytes)
+        for name, blob in blobs:
+            offset = header['sections'][name][0]
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, snap_file)
+    return {'terms': header['terms'], 'triples': header['triples'],
+            'bytes': os.path.getsize(snap_file), 'seconds': round(time.time() - start, 3)}
+
+
+def _align(position, alignment=8):
+    return (position + alignment - 1) // alignment * alignment
+
+
+def read_header(snap_file):
+    """Header JSON di uno snapshot, senza mappare il file"""
+    with open(snap_file, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{snap_file} non è uno snapshot del knowledge graph")
+        header_length = int.from_bytes(f.read(8), 'little')
+        return json.loads(f.read(header_length).decode('utf-8'))
+
+
+class Snapshot:
+    """Snapshot aperto in sola lettura tramite mmap"""
+
+    def __init__(self, snap_file):
+        self.path = snap_file
+        self._file = open(snap_file, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{snap_file} non è uno snapshot del knowledge graph")
+        header_length = int.from_bytes(self._mmap[len(MAGIC):len(MAGIC) + 8], 'little')
+        start = len(MAGIC) + 8
+        self.header = json.loads(self._mmap[start:start + header_length].decode('utf-8'))
+        if self.header.get('version') != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"Versione dello snapshot non supportata: {self.header.get('version')}")
+        self._view = memoryview(self._mmap)
+
+    def section(self, name):
+        """Array della sezione indicata (memoryview sul file se possibile)"""
+        typecode = dict(_SECTIONS)[name]
+        offset, length = self.header['sections'][name]
+        view = self._view[offset:offset + length]
+        if self.header['byteorder'] != sys.byteorder and typecode != 'B':
+            values = array(typecode, view)
+            values.byteswap()
+            return values
+        return view.cast(typecode)
+
+    def terms(self):
+        """Costruisce la lista dei termini rdflib (indice = id del termine)"""
+        datatypes = [None] + [URIRef(dt) for dt in self.header['datatypes']]
+        languages = [None] + self.header['languages']
+        offset, length = self.header['sections']['text']
+        text = self._mmap[offset:offset + length].decode('utf-8')
+        kinds = self.section('kinds')
+        datatype_ids = self.section('datatypes')
+        language_ids = self.section('languages')
+        offsets = self.section('offsets')
+
+        terms = []
+        append = terms.append
+        for term_id in range(self.header['terms']):
+            value = text[offsets[term_id]:offsets[term_id + 1]]
+            kind = kinds[term_id]
+            if kind == KIND_URI:
+                append(URIRef(value))
+            elif kind == KIND_LITERAL:
+                append(Literal(value, lang=languages[language_ids[term_id]],
+                               datatype=datatypes[datatype_ids[term_id]]))
+            else:
+                append(BNode(value))
+        return terms
+
+    def load_into(self, graph):
+        """Aggiunge al grafo tutte le triple dello snapshot"""
+        terms = self.terms()
+        subjects = self.section('subjects')
+        predicates = self.section('predicates')
+        objects = self.section('objects')
+        for prefix, uri in self.header['namespaces']:
+            graph.bind(prefix, uri, override=True)
+        graph.addN((terms[s], terms[p], terms[o], graph)
+                   for s, p, o in zip(subjects, predicates, objects))
+        return graph
+
+    def close(self):
+        if getattr(self, '_view', None) is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_snapshot(snap_file, graph=None):
+    """Carica uno snapshot in un Graph (nuovo se non indicato)"""
+    graph = Graph() if graph is None else graph
+    with Snapshot(snap_file) as snapshot:
+        snapshot.load_into(graph)
+    return graph
+
+
+def source_info(kg_file, stat=None):
+    """Metadati del file sorgente registrati nello snapshot (`stat` se il
+    file è stato appena scritto con un altro nome e poi rinominato)"""
+    if stat is None:
+        if not kg_file or not os.path.exists(kg_file):
+            return None
+        stat = os.stat(kg_file)
+    return {'path': os.path.basename(kg_file), 'size': stat.st_size, 'mtime': stat.st_mtime,
+            'mtime_ns': stat.st_mtime_ns, 'inode': stat.st_ino}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Snapshot binario del Deliberation Knowledge Graph')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help='Crea lo snapshot da un file RDF')
+    build.add_argument('kg_file', help='File del knowledge graph (.ttl, .nt, .rdf, ...)')
+    build.add_argument('--output', help='Percorso dello snapshot (default: <kg_file>.snap)')
+    info = subparsers.add_parser('info', help='Mostra le informazioni di uno snapshot')
+    info.add_argument('snap_file')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.time()
+        graph = Graph()
+        graph.parse(args.kg_file)
+        print(f"Parsing di {args.kg_file}: {len(graph)} triple in {time.time() - start:.2f}s")
+        output = args.output or snapshot_path(args.kg_file)
+        stats = write_snapshot(graph, output, source=source_info(args.kg_file))
+        print(f"Snapshot scritto in {output}: {stats}")
+        start = time.time()
+        load_snapshot(output)
+        print(f"Caricamento dello snapshot: {time.time() - start:.2f}s")
+    else:
+        with Snapshot(args.snap_file) as snapshot:
+            header = dict(snapshot.header)
+            header.pop('sections')
+            print(json.dumps(header, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Statistiche materializzate del Deliberation Knowledge Graph.
+
+I conteggi usati da /api/stats (istanze per classe, numero di triple)
+vengono calcolati una sola volta al caricamento del grafo e poi aggiornati
+in modo incrementale con le triple aggiunte dall'ingest, quindi l'API li
+restituisce dalla memoria senza eseguire query SPARQL. I conteggi per
+piattaforma sono mantenuti da kg_platforms.PlatformIndex.
+"""
+
+import threading
+from collections import Counter
+
+from rdflib import Namespace, RDF
+
+DEL = Namespace("https://w3id.org/deliberation/ontology#")
+
+# Chiave della risposta di /api/stats -> classe conteggiata
+STAT_CLASSES = {
+    'totalProcesses': DEL.DeliberationProcess,
+    'totalParticipants': DEL.Participant,
+    'totalContributions': DEL.Contribution,
+    'totalTopics': DEL.Topic,
+    'totalOrganizations': DEL.Organization,
+}
+
+
+class GraphStatistics:
+    """Conteggi del grafo mantenuti in memoria"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.triples = 0
+        self.class_counts = Counter()
+
+    def rebuild(self, graph):
+        """Ricalcola tutti i conteggi con una scansione del grafo"""
+        class_counts = Counter(graph.objects(None, RDF.type))
+        with self._lock:
+            self.triples = len(graph)
+            self.class_counts = class_counts
+
+    def record_added(self, graph, triples):
+        """Aggiorna i conteggi con triple appena aggiunte al grafo.
+
+        `triples` deve contenere solo triple che prima non erano presenti."""
+        class_delta = Counter(o for s, p, o in triples if p == RDF.type)
+        with self._lock:
+            self.triples = len(graph)
+            self.class_counts.update(class_delta)
+
+    def summary(self, keys=None):
+        """Conteggi nel formato di /api/stats"""
+        with self._lock:
+            stats = {'totalTriples': self.triples}
+            for key in keys or STAT_CLASSES:
+                stats[key] = self.class_counts.get(STAT_CLASSES[key], 0)
+        return stats
@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+"""
+Store rdflib compatto con termini codificati in un dizionario di interi.
+
+Lo store Memory di rdflib tiene ogni tripla in più dizionari annidati con gli
+oggetti termine completi (spesso uno per occorrenza) e un dizionario dei
+contesti per tripla: centinaia di byte per tripla. CompactStore:
+
+- assegna a ogni termine distinto un id intero (dizionario termine -> id e
+  lista id -> termine), quindi ogni termine esiste in memoria una volta sola;
+- tiene le triple in tre permutazioni ordinate (SPO, POS, OSP), ciascuna in
+  tre array di interi a 32 bit: 36 byte per tripla;
+- risolve ogni pattern con una ricerca binaria (bisect) sull'intervallo
+  della permutazione che ha in testa i termini legati;
+- accumula le triple aggiunte dopo il caricamento (ingest, log delle
+  scritture) in un piccolo delta con indici per termine, fuso negli array
+  quando supera DELTA_MIN o una frazione del grafo. Le triple rimosse dagli
+  array sono nascoste da un insieme di cancellazioni fino alla fusione.
+
+La fusione non blocca l'ingest: delta e cancellazioni vengono congelati
+nella base letta dalle query, le nuove scritture vanno in un delta nuovo e
+le permutazioni fuse vengono costruite in un thread e sostituite alla base
+con un'unica assegnazione (le letture vedono base + delta in fusione +
+delta nuovo, con le stesse triple prima e dopo lo scambio).
+
+Durante il caricamento (parser, snapshot) le triple vengono solo accodate in
+un array non ordinato; la prima lettura costruisce le permutazioni ordinando
+blocchi di RUN_SIZE triple e fondendoli, con una memoria transitoria limitata.
+
+La riduzione di memoria rispetto a Memory dipende dalla forma del grafo: il
+dizionario dei termini conserva i letterali per intero, quindi nei grafi in
+cui prevalgono letterali distinti e testi lunghi (come comprehensive_real_kg,
+circa 3.3x) il guadagno è minore che nei grafi dominati da IRI ripetuti
+(circa 9x sul grafo sintetico di create_synthetic_kg.py).
+
+Lo store non gestisce i contesti (come SimpleMemory): è pensato per il Graph
+unico del server. Le letture concorrenti sono sicure; le scritture vanno
+serializzate dal chiamante (graph_lock nel server). I termini non più usati
+dopo una rimozione restano nel dizionario.
+
+Uso da riga di comando (confronto con lo store Memory):
+    python kg_store.py compare comprehensive_real_kg.ttl
+"""
+
+import argparse
+import heapq
+import itertools
+import sys
+import threading
+import time
+import tracemalloc
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice
+
+from rdflib import Graph
+from rdflib.store import Store
+
+# Triple del delta oltre le quali viene fuso nelle permutazioni ordinate...
+DELTA_MIN = 100000
+# ...o, per grafi grandi, frazione del grafo (1/DELTA_FRACTION)
+DELTA_FRACTION = 8
+# Triple ordinate per blocco nella costruzione delle permutazioni
+RUN_SIZE = 262144
+# Blocchi più piccoli per la fusione in background: ogni sorted() tiene il
+# GIL per tutta la sua durata e bloccherebbe l'ingest e le query
+MERGE_RUN_SIZE = 16384
+
+_EMPTY = ()
+
+
+def _columns(triples):
+    """Tre array di id da una sequenza di tuple"""
+    a, b, c = array('I'), array('I'), array('I')
+    for x, y, z in triples:
+        a.append(x)
+        b.append(y)
+        c.append(z)
+    return a, b, c
+
+
+def _sorted_runs(triples, run_size=None):
+    """Blocchi ordinati di al più RUN_SIZE triple, come iteratori di tuple"""
+    runs = []
+    triples = iter(triples)
+    while True:
+        chunk = sorted(islice(triples, run_size or RUN_SIZE))
+        if not chunk:
+            break
+        runs.append(_columns(chunk))
+        del chunk
+    return [zip(*columns) for columns in runs]
+
+
+def _merge_runs(runs, skip=None):
+    """Fonde sequenze ordinate di triple in tre array, senza duplicati né le triple in `skip`"""
+    a, b, c = array('I'), array('I'), array('I')
+    previous = None
+    for triple in heapq.merge(*runs):
+        if triple == previous or (skip and triple in skip):
+            continue
+        previous = triple
+        a.append(triple[0])
+        b.append(triple[1])
+        c.append(triple[2])
+    return a, b, c
+
+
+def _range(index, first, second=None):
+    """Intervallo [lo, hi) di una permutazione con il primo (e il secondo) id indicati"""
+    a, b, _ = index
+    lo = bisect_left(a, first)
+    hi = bisect_right(a, first, lo)
+    if second is not None and lo < hi:
+        lo, hi = bisect_left(b, second, lo, hi), bisect_right(b, second, lo, hi)
+    return lo, hi
+
+
+class _Base:
+    """Permutazioni ordinate e, durante una fusione in background, il delta e
+    le cancellazioni che vi vengono fusi. Non viene mai modificata: la fusione
+    la sostituisce per intero con un'unica assegnazione, quindi un lettore che
+    ne ha preso il riferimento vede sempre uno stato coerente."""
+
+    __slots__ = ('spo', 'pos', 'osp', 'delta', 'delta_index', 'deleted')
+
+    def __init__(self, spo, pos, osp, delta=frozenset(), delta_index=({}, {}, {}), deleted=frozenset()):
+        self.spo, self.pos, self.osp = spo, pos, osp
+        self.delta = delta              # triple in fusione non presenti negli array
+        self.delta_index = delta_index  # per posizione: id -> insieme delle triple di delta
+        self.deleted = deleted          # triple degli array rimosse prima della fusione
+
+    def __contains__(self, ids):
+        return ids in self.delta or (_in_index(self.spo, ids) and ids not in self.deleted)
+
+    def __len__(self):
+        return len(self.spo[0]) - len(self.deleted) + len(self.delta)
+
+
+def _in_index(spo, ids):
+    """True se la tripla di id è negli array SPO"""
+    subjects, predicates, objects = spo
+    lo = bisect_left(subjects, ids[0])
+    hi = bisect_right(subjects, ids[0], lo)
+    if lo == hi:
+        return False
+    lo = bisect_left(predicates, ids[1], lo, hi)
+    hi = bisect_right(predicates, ids[1], lo, hi)
+    position = bisect_left(objects, ids[2], lo, hi)
+    return position < hi and objects[position] == ids[2]
+
+
+def _build_base(spo, run_size=None):
+    """Base con le permutazioni POS e OSP ordinate a partire da SPO (già senza duplicati)"""
+    s, p, o = spo
+    pos = _merge_runs(_sorted_runs(zip(p, o, s), run_size))
+    osp = _merge_runs(_sorted_runs(zip(o, s, p), run_size))
+    return _Base(spo, pos, osp)
+
+
+def _delta_matches(delta, delta_index, ids):
+    """Triple di un delta che corrispondono al pattern di id (None = libero)"""
+    s, p, o = ids
+    # Il delta è piccolo: si parte dall'insieme del termine legato e si filtra
+    candidates = delta
+    for position, term_id in enumerate(ids):
+        if term_id is not None:
+            candidates = delta_index[position].get(term_id, _EMPTY)
+            break
+    return [triple for triple in candidates
+            if (s is None or triple[0] == s) and (p is None or triple[1] == p) and (o is None or triple[2] == o)]
+
+
+class CompactStore(Store):
+    """Store rdflib con dizionario dei termini e permutazioni ordinate in array"""
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, configuration=None, identifier=None, background_merge=True):
+        super().__init__(configuration)
+        self.identifier = identifier
+        self._ids = {}       # termine -> id
+        self._terms = []     # id -> termine
+        self._base = _Base(*[(array('I'), array('I'), array('I'))] * 3)
+        self._pending = array('I')  # triple del caricamento non ancora ordinate (s, p, o, s, ...)
+        self._loading = True        # fino alla prima lettura le aggiunte vanno in _pending
+        self._delta = set()         # triple aggiunte dopo la costruzione delle permutazioni
+        self._delta_index = ({}, {}, {})  # per posizione: id -> insieme delle triple del delta
+        self._deleted = set()       # triple della base rimosse (fino alla fusione)
+        self._lock = threading.Lock()
+        self._namespace = {}
+        self._prefix = {}
+        self.background_merge = background_merge
+        self._merge_thread = None
+        self.merges = 0
+
+    # Scrittura
+
+    def _intern(self, term):
+        term_id = self._ids.get(term)
+        if term_id is None:
+            term_id = self._ids[term] = len(self._terms)
+            self._terms.append(term)
+        return term_id
+
+    def add(self, triple, context=None, quoted=False):
+        s, p, o = triple
+        ids = (self._intern(s), self._intern(p), self._intern(o))
+        if self._loading:
+            self._pending.extend(ids)
+            return
+        if ids in self._deleted:
+            self._deleted.discard(ids)
+            return
+        if ids in self._delta or ids in self._base:
+            return
+        self._delta.add(ids)
+        for position, index in enumerate(self._delta_index):
+            index.setdefault(ids[position], set()).add(ids)
+        if len(self._delta) > self._merge_threshold():
+            self._merge()
+
+    def addN(self, quads):
+        for s, p, o, context in quads:
+            self.add((s, p, o), context)
+
+    def remove(self, triple_pattern, context=None):
+        self._settle()
+        for ids in list(self._match(triple_pattern)):
+            if ids in self._delta:
+                self._delta.discard(ids)
+                for position, index in enumerate(self._delta_index):
+                    bucket = index[ids[position]]
+                    bucket.discard(ids)
+                    if not bucket:
+                        del index[ids[position]]
+            else:
+                self._deleted.add(ids)
+        if len(self._deleted) > self._merge_threshold():
+            self._merge()
+
+    def _merge_threshold(self):
+        return max(DELTA_MIN, len(self._base.spo[0]) // DELTA_FRACTION)
+
+    def _settle(self):
+        """Costruisce le permutazioni con le triple del caricamento (alla prima lettura)"""
+        if not self._loading:
+            return
+        with self._lock:
+            if not self._loading:
+                return
+            pending = self._pending
+            self._pending = array('I')
+            loaded = zip(pending[0::3], pending[1::3], pending[2::3])
+            runs = _sorted_runs(loaded) + [zip(*self._base.spo)]
+            del pending, loaded
+            self._base = _build_base(_merge_runs(runs))
+            self._loading = False
+
+    def _merge(self):
+        """Fonde il delta e le cancellazioni nelle permutazioni ordinate.
+
+        Delta e cancellazioni passano nella base (che le letture continuano a
+        vedere) e l'ingest riparte da un delta vuoto; le nuove permutazioni
+        vengono costruite in un thread e sostituite alla base con
+        un'assegnazione. Se una fusione è già in corso il delta continua a
+        crescere e viene fuso alla prima scrittura dopo la sua conclusione."""
+        with self._lock:
+            if self._merge_thread is not None:
+                return
+            base = self._base
+            merging = _Base(base.spo, base.pos, base.osp, self._delta, self._delta_index, self._deleted)
+            self._base = merging
+            self._delta = set()
+            self._delta_index = ({}, {}, {})
+            self._deleted = set()
+            if not self.background_merge:
+                self._merge_thread = threading.current_thread()
+            else:
+                self._merge_thread = threading.Thread(target=self._finish_merge, args=(merging,),
+                                                      name='compact-store-merge', daemon=True)
+                self._merge_thread.start()
+                return
+        self._finish_merge(merging)
+
+    def _finish_merge(self, merging):
+        try:
+            delta = _sorted_runs(merging.delta, MERGE_RUN_SIZE)
+            spo = _merge_runs([zip(*merging.spo)] + delta, merging.deleted)
+            del delta
+            base = _build_base(spo, MERGE_RUN_SIZE)
+            del spo
+            with self._lock:
+                # Stesse triple visibili della base in fusione: nessun lock del grafo necessario
+                self._base = base
+                self.merges += 1
+        finally:
+            self._merge_thread = None
+
+    def wait_merge(self, timeout=None):
+        """Attende la fine della fusione in background in corso (se presente)"""
+        thread = self._merge_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        return self._merge_thread is None
+
+    # Lettura
+
+    def _in_base(self, ids):
+        return ids in self._base
+
+    def _match(self, triple_pattern):
+        """Triple di id (s, p, o) che corrispondono al pattern"""
+        ids = []
+        for term in triple_pattern:
+            if term is None:
+                ids.append(None)
+            else:
+                term_id = self._ids.get(term)
+                if term_id is None:
+                    return
+                ids.append(term_id)
+        s, p, o = ids
+        base = self._base
+        deleted = self._deleted
+
+        if s is not None and p is not None and o is not None:
+            triple = (s, p, o)
+            if triple in self._delta or (triple in base and triple not in deleted):
+                yield triple
+            return
+
+        if s is not None:
+            if o is not None and p is None:
+                lo, hi = _range(base.osp, o, s)
+                found = ((s, c, o) for c in base.osp[2][lo:hi])
+            else:
+                lo, hi = _range(base.spo, s, p)
+                a, b, c = base.spo
+                found = ((s, y, z) for y, z in zip(b[lo:hi], c[lo:hi]))
+        elif p is not None:
+            lo, hi = _range(base.pos, p, o)
+            a, b, c = base.pos
+            found = ((z, p, y) for y, z in zip(b[lo:hi], c[lo:hi]))
+        elif o is not None:
+            lo, hi = _range(base.osp, o)
+            a, b, c = base.osp
+            found = ((y, z, o) for y, z in zip(b[lo:hi], c[lo:hi]))
+        else:
+            found = zip(*base.spo)
+
+        hidden = base.deleted
+        if hidden and deleted:
+            found = (triple for triple in found if triple not in hidden and triple not in deleted)
+        elif hidden or deleted:
+            hidden = hidden or deleted
+            found = (triple for triple in found if triple not in hidden)
+        yield from found
+
+        if base.delta:
+            for triple in _delta_matches(base.delta, base.delta_index, ids):
+                if triple not in deleted:
+                    yield triple
+        if self._delta:
+            yield from _delta_matches(self._delta, self._delta_index, ids)
+
+    def triples(self, triple_pattern, context=None):
+        if self._loading:
+            self._settle()
+        s, p, o = triple_pattern
+        if s is not None and p is not None and o is not None:
+            # Tripla completa: solo una verifica di appartenenza
+            get = self._ids.get
+            ids = (get(s), get(p), get(o))
+            if None not in ids and (ids in self._delta or
+                                    (ids in self._base and ids not in self._deleted)):
+                yield (s, p, o), iter(_EMPTY)
+            return
+        terms = self._terms
+        for s, p, o in self._match(triple_pattern):
+            yield (terms[s], terms[p], terms[o]), iter(_EMPTY)
+
+    def __len__(self, context=None):
+        self._settle()
+        return len(self._base) - len(self._deleted) + len(self._delta)
+
+    def contexts(self, triple=None):
+        return iter(_EMPTY)
+
+    def subjects(self):
+        """Soggetti distinti, senza costruirne l'insieme (salvo quelli dei soli delta).
+
+        Permutazioni e delta vengono fissati alla prima lettura: la base non
+        viene mai modificata sul posto, quindi l'iterazione resta valida
+        anche se nel frattempo il delta viene fuso."""
+        self._settle()
+        terms = self._terms
+        base = self._base
+        subjects = base.spo[0]
+        delta_subjects = list(dict.fromkeys(itertools.chain(base.delta_index[0], self._delta_index[0])))
+        position, end = 0, len(subjects)
+        while position < end:
+            subject = subjects[position]
+            following = bisect_right(subjects, subject, position)
+            if not (base.deleted or self._deleted) or \
+                    any(True for _ in self._match((terms[subject], None, None))):
+                yield terms[subject]
+            position = following
+        for subject in delta_subjects:
+            lo, hi = _range(base.spo, subject)
+            # Le triple del delta in fusione possono essere state rimosse nel frattempo
+            if lo == hi and any(True for _ in self._match((terms[subject], None, None))):
+                yield terms[subject]
+
+    # Prefissi (come SimpleMemory)
+
+    def bind(self, prefix, namespace, override=True):
+        bound_namespace = self._namespace.get(prefix)
+        bound_prefix = self._prefix.get(namespace)
+        if bound_prefix is None and bound_namespace is not None:
+            bound_prefix = self._prefix.get(bound_namespace)
+        if override:
+            if bound_prefix is not None:
+                del self._namespace[bound_prefix]
+            if bound_namespace is not None:
+                del self._prefix[bound_namespace]
+            self._prefix[namespace] = prefix
+            self._namespace[prefix] = namespace
+        else:
+            namespace = bound_namespace if bound_namespace is not None else namespace
+            prefix = bound_prefix if bound_prefix is not None else prefix
+            self._prefix[namespace] = prefix
+            self._namespace[prefix] = namespace
+
+    def namespace(self, prefix):
+        return self._namespace.get(prefix)
+
+    def prefix(self, namespace):
+        return self._prefix.get(namespace)
+
+    def namespaces(self):
+        yield from list(self._namespace.items())
+
+    def stats(self):
+        """Dimensioni delle strutture dello store"""
+        self._settle()
+        base = self._base
+        index_bytes = sum(column.itemsize * len(column)
+                          for index in (base.spo, base.pos, base.osp) for column in index)
+        return {
+            'triples': len(self),
+            'terms': len(self._terms),
+            'indexBytes': index_bytes,
+            'delta': len(base.delta) + len(self._delta),
+            'deleted': len(base.deleted) + len(self._deleted),
+            'merging': self._merge_thread is not None,
+            'merges': self.merges
+        }
+
+
+def compact_graph():
+    """Graph vuoto basato su CompactStore"""
+    return Graph(store=CompactStore())
+
+
+def _measure_load(kg_file, graph_factory):
+    tracemalloc.start()
+    start = time.perf_counter()
+    graph = graph_factory()
+    graph.parse(kg_file)
+    len(graph)
+    seconds = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return graph, size, seconds
+
+
+def _time_patterns(graph, samples):
+    """Secondi per risolvere per intero ogni tipo di pattern sui termini di esempio"""
+    timings = {}
+    patterns = {
+        's??': [(s, None, None) for s, _, _ in samples],
+        'sp?': [(s, p, None) for s, p, _ in samples],
+        '?po': [(None, p, o) for _, p, o in samples],
+        '?p?': [(None, p, None) for _, p, _ in samples[:20]],
+        '??o': [(None, None, o) for _, _, o in samples],
+        'spo': list(samples),
+    }
+    for name, items in patterns.items():
+        start = time.perf_counter()
+        for pattern in items:
+            for _ in graph.triples(pattern):
+                pass
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Store compatto del Deliberation Knowledge Graph')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compare = subparsers.add_parser('compare', help='Memoria e velocità rispetto allo store Memory di rdflib')
+    compare.add_argument('kg_file')
+    compare.add_argument('--samples', type=int, default=2000, help='Pattern di esempio per tipo (default: 2000)')
+    args = parser.parse_args()
+
+    memory_graph, memory_bytes, memory_seconds = _measure_load(args.kg_file, Graph)
+    compact, compact_bytes, compact_seconds = _measure_load(args.kg_file, compact_graph)
+    triples = len(memory_graph)
+    if len(compact) != triples:
+        print(f"Errore: {len(compact)} triple nello store compatto, {triples} nello store Memory")
+        return 1
+
+    every = max(1, triples // args.samples)
+    samples = list(islice(memory_graph, 0, None, every))[:args.samples]
+    memory_times = _time_patterns(memory_graph, samples)
+    compact_times = _time_patterns(compact, samples)
+
+    print(f"{triples} triple, {compact.store.stats()['terms']} termini distinti")
+    print(f"{'store':10} {'byte/tripla':>12} {'caricamento s':>14}")
+    print(f"{'Memory':10} {memory_bytes / triples:12.1f} {memory_seconds:14.2f}")
+    print(f"{'Compact':10} {compact_bytes / triples:12.1f} {compact_seconds:14.2f}")
+    print(f"Riduzione: {memory_bytes / compact_bytes:.1f}x")
+    print(f"\n{'pattern':8} {'Memory ms':>10} {'Compact ms':>11}")
+    for name in memory_times:
+        print(f"{name:8} {memory_times[name] * 1000:10.1f} {compact_times[name] * 1000:11.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Log delle scritture (write-ahead log) del knowledge graph.
+
+Ogni lotto di triple aggiunto dall'ingest viene accodato a <kg-file>.wal in
+formato N-Quads (grafo di default), seguito da una riga di commit con il
+numero di triple del lotto, e il file viene sincronizzato su disco (fsync)
+prima di rispondere al client: un ingest confermato sopravvive a un crash e
+il costo di ogni salvataggio è proporzionale al lotto, non al grafo.
+
+All'avvio il server carica il file base (snapshot o Turtle) e riapplica i
+lotti completi del log; un lotto scritto a metà da un crash viene scartato.
+Un lotto completo che non si riesce a leggere (es. un IRI non valido scritto
+da una versione precedente) viene spostato in <kg-file>.wal.rejected invece
+di impedire l'avvio; append() rifiuta gli IRI non validi prima di scrivere.
+La compattazione riscrive periodicamente il file base con l'intero grafo e
+poi elimina il log:
+
+1. rotate(): il log corrente diventa <kg-file>.wal.compacting e le scritture
+   successive vanno in un nuovo log;
+2. il chiamante scrive il nuovo file base in modo atomico;
+3. finish_compaction(): il log ruotato viene eliminato.
+
+Un crash in qualsiasi punto lascia al più triple riapplicate due volte, che
+il grafo (un insieme) ignora.
+
+Uso da riga di comando:
+    python kg_wal.py info comprehensive_real_kg.ttl.wal
+"""
+
+import argparse
+import logging
+import os
+import re
+import sys
+import threading
+
+from rdflib import Graph, URIRef
+
+from sparql_results import nt_term
+
+logger = logging.getLogger(__name__)
+
+WAL_SUFFIX = '.wal'
+COMPACTING_SUFFIX = '.compacting'
+REJECTED_SUFFIX = '.rejected'
+_COMMIT_PREFIX = '# commit '
+# Caratteri che non possono comparire in un IRIREF di N-Triples
+_INVALID_IRI_RE = re.compile(r'[\x00-\x20<>"{}|^`\\]')
+# Righe accumulate prima di passarle al parser durante la riapplicazione
+_REPLAY_CHUNK_LINES = 50000
+
+
+def wal_path(kg_file):
+    """Percorso del log associato a un file del knowledge graph"""
+    return kg_file + WAL_SUFFIX
+
+
+def _nquad(triple):
+    for term in triple:
+        if isinstance(term, URIRef) and _INVALID_IRI_RE.search(term):
+            raise ValueError(f"IRI non valido, il lotto non viene scritto nel log: {term!r}")
+    s, p, o = triple
+    return nt_term(s) + ' ' + nt_term(p) + ' ' + nt_term(o) + ' .\n'
+
+
+def _commit_line(lines):
+    return f"{_COMMIT_PREFIX}{len(lines)}\n"
+
+
+def iter_records(log_file):
+    """Lotti completi di un log: coppie (righe N-Quads, offset di fine lotto).
+
+    La lettura si ferma al primo lotto incompleto o incoerente."""
+    with open(log_file, 'rb') as f:
+        lines = []
+        offset = 0
+        for raw in f:
+            offset += len(raw)
+            if not raw.endswith(b'\n'):
+                break  # Riga troncata da un crash durante la scrittura
+            line = raw.decode('utf-8')
+            if not line.startswith(_COMMIT_PREFIX):
+                lines.append(line)
+                continue
+            try:
+                count = int(line[len(_COMMIT_PREFIX):].split()[0])
+            except (IndexError, ValueError):
+                break
+            if count != len(lines):
+                break
+            yield lines, offset
+            lines = []
+
+
+class WriteAheadLog:
+    """Log delle triple aggiunte al grafo dopo l'ultimo file base"""
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.compacting_path = path + COMPACTING_SUFFIX
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = None
+        self.records = 0
+        self.triples = 0
+
+    def open(self):
+        """Apre il log in append, eliminando un eventuale lotto incompleto in coda"""
+        committed = 0
+        if os.path.exists(self.path):
+            for lines, offset in iter_records(self.path):
+                committed = offset
+            if committed != os.path.getsize(self.path):
+                logger.warning(f"Log {self.path}: scartati {os.path.getsize(self.path) - committed} byte "
+                               f"di un lotto incompleto")
+                with open(self.path, 'r+b') as f:
+                    f.truncate(committed)
+        self._file = open(self.path, 'ab')
+        return self
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def append(self, triples):
+        """Accoda un lotto di triple e lo rende persistente"""
+        if not triples:
+            return 0
+        data = (''.join(map(_nquad, triples)) + _commit_line(triples)).encode('utf-8')
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.records += 1
+            self.triples += len(triples)
+        return len(data)
+
+    def size(self):
+        """Byte nel log corrente e in quello in compattazione"""
+        size = 0
+        for path in (self.path, self.compacting_path):
+            if os.path.exists(path):
+                size += os.path.getsize(path)
+        return size
+
+    def replay(self, graph, repair=True):
+        """Riapplica al grafo i lotti completi (prima il log in compattazione).
+        Restituisce il numero di lotti riapplicati.
+
+        I lotti illeggibili vengono saltati; con repair vengono anche accodati
+        a <log>.rejected e tolti dal log (solo con il log non aperto in scrittura)."""
+        records = 0
+        for path in (self.compacting_path, self.path):
+            if not os.path.exists(path):
+                continue
+            rejected = []
+            pending = []
+            pending_lines = 0
+            for index, (lines, offset) in enumerate(iter_records(path)):
+                pending.append((index, lines))
+                pending_lines += len(lines)
+                if pending_lines >= _REPLAY_CHUNK_LINES:
+                    records += _apply_records(graph, pending, rejected)
+                    pending = []
+                    pending_lines = 0
+            if pending:
+                records += _apply_records(graph, pending, rejected)
+            if rejected:
+                logger.error(f"Log {path}: {len(rejected)} lotti illeggibili saltati")
+                if repair:
+                    self._set_aside(path, rejected)
+        return records
+
+    def _set_aside(self, path, rejected):
+        """Sposta i lotti illeggibili in <log>.rejected e riscrive il log senza"""
+        skip = {index for index, _ in rejected}
+        with open(path + REJECTED_SUFFIX, 'ab') as f:
+            for _, lines in rejected:
+                f.write((''.join(lines) + _commit_line(lines)).encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for index, (lines, offset) in enumerate(iter_records(path)):
+                if index not in skip:
+                    f.write((''.join(lines) + _commit_line(lines)).encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        _fsync_directory(path)
+        logger.warning(f"Lotti illeggibili spostati in {path + REJECTED_SUFFIX}")
+
+    def rotate(self):
+        """Inizia una compattazione: le scritture successive vanno in un nuovo log.
+
+        Se è rimasto il log di una compattazione interrotta, il log corrente
+        gli viene accodato, così nessun lotto va perso."""
+        with self._lock:
+            self._file.close()
+            if os.path.exists(self.compacting_path):
+                with open(self.path, 'rb') as src, open(self.compacting_path, 'ab') as dst:
+                    while True:
+                        chunk = src.read(1 << 20)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.compacting_path)
+            self._file = open(self.path, 'ab')
+            _fsync_directory(self.path)
+            self.records = 0
+            self.triples = 0
+
+    def finish_compaction(self):
+        """Elimina il log ruotato dopo che il nuovo file base è stato scritto"""
+        if os.path.exists(self.compacting_path):
+            os.remove(self.compacting_path)
+            _fsync_directory(self.path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'path': self.path,
+                'bytes': self.size(),
+                'records': self.records,
+                'triples': self.triples,
+                'compacting': os.path.exists(self.compacting_path)
+            }
+
+
+def _parse_records(records):
+    """Triple di una sequenza di lotti, lette in un grafo temporaneo
+    (un errore non lascia triple a metà nel grafo di destinazione)"""
+    parsed = Graph()
+    parsed.parse(data=''.join(line for _, lines in records for line in lines), format='nt')
+    return parsed
+
+
+def _apply_records(graph, records, rejected):
+    """Aggiunge al grafo i lotti leggibili e accoda gli altri a `rejected`;
+    restituisce il numero di lotti applicati"""
+    applied = len(records)
+    try:
+        parsed = [_parse_records(records)]
+    except Exception:
+        # Lettura lotto per lotto per isolare quelli illeggibili
+        parsed = []
+        for record in records:
+            try:
+                parsed.append(_parse_records([record]))
+            except Exception as e:
+                logger.warning(f"Lotto {record[0]} del log illeggibile: {e}")
+                rejected.append(record)
+                applied -= 1
+    for triples in parsed:
+        graph.addN((s, p, o, graph) for s, p, o in triples)
+    return applied
+
+
+def _fsync_directory(path):
+    """Rende persistenti rename e rimozioni nella directory del file"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Log delle scritture del Deliberation Knowledge Graph')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    info = subparsers.add_parser('info', help='Mostra il contenuto di un log')
+    info.add_argument('wal_file')
+    args = parser.parse_args()
+
+    records = triples = 0
+    end = 0
+    for lines, offset in iter_records(args.wal_file):
+        records += 1
+        triples += len(lines)
+        end = offset
+    size = os.path.getsize(args.wal_file)
+    print(f"{args.wal_file}: {records} lotti, {triples} triple, {size} byte")
+    if end != size:
+        print(f"  {size - end} byte finali incompleti (verranno scartati all'apertura)")
+    graph = Graph()
+    WriteAheadLog(args.wal_file).replay(graph, repair=False)
+    print(f"  triple distinte: {len(graph)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Modalità di servizio pre-fork per il server SPARQL di produzione.
+
+Il processo master carica il knowledge graph una sola volta, apre il socket
+in ascolto e crea N processi worker con fork(): ogni worker eredita il grafo
+già parsato (copy-on-write) e serve le richieste HTTP con il proprio GIL,
+quindi il throughput in lettura scala con i core disponibili.
+
+Le scritture (ingest) non vengono applicate nei worker: il worker inoltra il
+payload al master attraverso una pipe, il master lo applica al proprio grafo
+(unico writer) e, al massimo ogni `refork_interval` secondi, sostituisce i
+worker con nuovi fork che vedono la nuova versione. I vecchi worker smettono
+di accettare connessioni e terminano dopo aver completato le richieste in
+corso, quindi la sostituzione non interrompe il servizio.
+
+Ogni worker occupa un posto numerato (0..N-1): il worker che ne sostituisce
+un altro riceve lo stesso numero, così le metriche e i file per worker
+restano stabili attraverso le sostituzioni.
+"""
+
+import gc
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from multiprocessing.connection import wait as wait_connections
+
+from werkzeug.serving import make_server
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteWriteError(Exception):
+    """Errore restituito dal master durante l'applicazione di una scrittura"""
+
+
+class WriteForwarder:
+    """Inoltra le scritture dal worker al master e ne attende l'esito"""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._lock = threading.Lock()
+
+    def __call__(self, kind, payload):
+        with self._lock:
+            self._conn.send((kind, payload))
+            status, value = self._conn.recv()
+        if status == 'error':
+            raise RemoteWriteError(value)
+        return value
+
+
+def _http_worker_main(sock, app, conn, inherited_conns, on_worker_start, drain_timeout, slot):
+    """Processo worker: serve HTTP sul socket condiviso fino a SIGTERM"""
+    for other in inherited_conns:
+        other.close()
+    gc.freeze()
+    master_pid = os.getppid()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if on_worker_start:
+        on_worker_start(WriteForwarder(conn), slot)
+
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    server.socket.setblocking(False)
+    # Alla chiusura attende le richieste in corso invece di troncarle
+    server.daemon_threads = False
+
+    serve_thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.5}, daemon=True)
+    serve_thread.start()
+    while not stop.wait(1.0):
+        if os.getppid() != master_pid:
+            logger.warning("Master terminato: arresto del worker")
+            break
+
+    server.shutdown()
+    drain = threading.Thread(target=server.server_close, daemon=True)
+    drain.start()
+    drain.join(drain_timeout)
+    os._exit(0)
+
+
+class _HttpWorker:
+    def __init__(self, process, conn, version, slot):
+        self.process = process
+        self.conn = conn
+        self.version = version
+        self.slot = slot
+        self.retiring = False
+
+
+class PreforkServer:
+    """Master che gestisce i worker HTTP e applica le scritture"""
+
+    def __init__(self, app, host, port, workers, write_handlers, version_provider,
+                 on_worker_start=None, refork_interval=5.0, drain_timeout=30.0):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.write_handlers = write_handlers
+        self.version_provider = version_provider
+        self.on_worker_start = on_worker_start
+        self.refork_interval = refork_interval
+        self.drain_timeout = drain_timeout
+        self._context = multiprocessing.get_context('fork')
+        self._workers = []
+        self._running = False
+        self._last_fork = 0.0
+        self.socket = None
+
+    def bind(self):
+        """Apre il socket in ascolto condiviso da tutti i worker"""
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.socket.listen(1024)
+        # Non bloccante: un worker che perde la corsa su accept() non resta bloccato
+        self.socket.setblocking(False)
+        self.port = self.socket.getsockname()[1]
+        return self.port
+
+    def _spawn(self, slot):
+        version = self.version_provider()
+        parent_conn, child_conn = self._context.Pipe()
+        inherited = [w.conn for w in self._workers] + [parent_conn]
+        process = self._context.Process(
+            target=_http_worker_main,
+            args=(self.socket, self.app, child_conn, inherited,
+                  self.on_worker_start, self.drain_timeout, slot))
+        process.start()
+        child_conn.close()
+        worker = _HttpWorker(process, parent_conn, version, slot)
+        self._workers.append(worker)
+        return worker
+
+    def _retire(self, worker):
+        """Chiede al worker di terminare dopo le richieste in corso"""
+        if not worker.retiring:
+            worker.retiring = True
+            if worker.process.is_alive():
+                os.kill(worker.process.pid, signal.SIGTERM)
+
+    def _handle_write(self, worker):
+        try:
+            kind, payload = worker.conn.recv()
+        except (EOFError, OSError):
+            return False
+        handler = self.write_handlers.get(kind)
+        try:
+            if handler is None:
+                raise ValueError(f"Scrittura non supportata: {kind}")
+            reply = ('ok', handler(payload))
+        except Exception as e:
+            logger.error(f"Errore nella scrittura '{kind}' dal worker {worker.process.pid}: {e}", exc_info=True)
+            reply = ('error', str(e))
+        try:
+            worker.conn.send(reply)
+        except (BrokenPipeError, OSError):
+            pass
+        return True
+
+    def _reap(self):
+        """Rimuove i worker terminati e rimpiazza quelli morti inaspettatamente"""
+        for worker in list(self._workers):
+            if worker.process.is_alive():
+                continue
+            worker.process.join()
+            worker.conn.close()
+            self._workers.remove(worker)
+            if not worker.retiring and self._running:
+                logger.warning(f"Worker {worker.process.pid} terminato (exit {worker.process.exitcode}): riavvio")
+                self._spawn(worker.slot)
+
+    def _refork_if_needed(self):
+        """Sostituisce i worker che servono una versione vecchia del grafo"""
+        current = self.version_provider()
+        stale = [w for w in self._workers if not w.retiring and w.version != current]
+        if not stale or time.monotonic() - self._last_fork < self.refork_interval:
+            return
+        logger.info(f"Grafo alla versione {current}: ricreo {len(stale)} worker")
+        for worker in stale:
+            self._spawn(worker.slot)
+            self._retire(worker)
+        self._last_fork = time.monotonic()
+
+    def serve_forever(self):
+        if self.socket is None:
+            self.bind()
+        self._running = True
+
+        def request_stop(signum, frame):
+            self._running = False
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        for slot in range(self.workers):
+            self._spawn(slot)
+        self._last_fork = time.monotonic()
+        logger.info(f"Master {os.getpid()}: {self.workers} worker su http://{self.host}:{self.port}")
+
+        try:
+            while self._running:
+                connections = {w.conn: w for w in self._workers}
+                for conn in wait_connections(list(connections), timeout=0.5):
+                    if not self._handle_write(connections[conn]):
+                        self._retire(connections[conn])
+                self._reap()
+                self._refork_if_needed()
+        finally:
+            self._running = False
+            for worker in self._workers:
+                self._retire(worker)
+            deadline = time.monotonic() + self.drain_timeout
+            for worker in self._workers:
+                worker.process.join(max(0.0, deadline - time.monotonic()))
+                if worker.process.is_alive():
+                    worker.process.kill()
+            self.socket.close()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Cache dei risultati SPARQL per il Deliberation Knowledge Graph.
+
+Le voci sono indicizzate sul testo normalizzato della query, sulla versione
+corrente del grafo e su una variante (formato della risposta). Ogni ingest
+incrementa la versione del grafo tramite mark_graph_modified(), quindi i
+risultati calcolati su una versione precedente non vengono più restituiti e
+vengono rimossi con purge_stale() o espulsi dall'LRU.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+
+# Token SPARQL da preservare così come sono durante la normalizzazione:
+# stringhe lunghe e corte, IRI, commenti e sequenze di spazi.
+_QUERY_TOKEN_RE = re.compile(r'''
+    (?P<string>"""(?:[^"\\]|\\.|"(?!""))*"""
+              |'\'\'(?:[^'\\]|\\.|'(?!''))*'\'\'
+              |"(?:[^"\\\n]|\\.)*"
+              |'(?:[^'\\\n]|\\.)*')
+  | (?P<iri><[^<>"{}|^`\\\s]*>)
+  | (?P<comment>\#[^\n]*)
+  | (?P<space>\s+)
+''', re.VERBOSE)
+
+# Overhead approssimativo per voce (chiave, tupla, nodo dell'OrderedDict)
+ENTRY_OVERHEAD_BYTES = 256
+
+
+def normalize_query(query):
+    """Normalizza una query SPARQL: rimuove i commenti e compatta gli spazi
+    fuori da stringhe e IRI, in modo che varianti di formattazione della
+    stessa query condividano la voce di cache."""
+    parts = []
+    pos = 0
+    for match in _QUERY_TOKEN_RE.finditer(query):
+        if match.start() > pos:
+            parts.append(query[pos:match.start()])
+        if match.lastgroup in ('comment', 'space'):
+            if parts and parts[-1] != ' ':
+                parts.append(' ')
+        else:
+            parts.append(match.group())
+        pos = match.end()
+    parts.append(query[pos:])
+    return ''.join(parts).strip()
+
+
+class QueryResultCache:
+    """Cache LRU thread-safe dei risultati serializzati delle query SPARQL,
+    limitata sia nel numero di voci sia nella dimensione totale in byte."""
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, max_entry_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Una singola risposta enorme non deve svuotare tutta la cache
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 4
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def make_key(self, query, version, variant=''):
+        """Costruisce la chiave di cache per una query su una versione del grafo"""
+        return (normalize_query(query), version, variant)
+
+    def get(self, key):
+        """Restituisce (body, mimetype) se presente, altrimenti None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key, body, mimetype):
+        """Memorizza una risposta serializzata (bytes). Restituisce False se
+        la risposta supera il limite per singola voce."""
+        if not self.enabled:
+            return False
+        size = len(body) + len(key[0]) + ENTRY_OVERHEAD_BYTES
+        if size > self.max_entry_bytes:
+            with self._lock:
+                self.rejected += 1
+            return False
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (body, mimetype, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+                self.evictions += 1
+        return True
+
+    def tee(self, key, chunks, mimetype, still_valid=None):
+        """Inoltra i blocchi di una risposta in streaming e, se la risposta
+        completa rientra nel limite per voce, la memorizza al termine.
+        Se lo stream si interrompe prima della fine (client disconnesso o
+        eccezione del produttore, es. timeout del worker) non viene salvato nulla;
+        lo stesso se still_valid() è falso al termine (es. il grafo è cambiato
+        mentre le righe venivano lette)."""
+        buffered = []
+        size = 0
+        for chunk in chunks:
+            if buffered is not None:
+                size += len(chunk)
+                if size > self.max_entry_bytes:
+                    buffered = None
+                    with self._lock:
+                        self.rejected += 1
+                else:
+                    buffered.append(chunk)
+            yield chunk
+        if buffered is not None and (still_valid is None or still_valid()):
+            self.put(key, b''.join(buffered), mimetype)
+
+    def purge_stale(self, current_version):
+        """Rimuove subito le voci calcolate su versioni precedenti del grafo"""
+        with self._lock:
+            stale = [key for key in self._entries if key[1] != current_version]
+            for key in stale:
+                self._bytes -= self._entries.pop(key)[2]
+        return len(stale)
+
+    def recent_keys(self, limit):
+        """Coppie (query normalizzata, variante) usate più di recente, senza
+        ripetizioni tra versioni del grafo (per riscaldare la cache di un nuovo grafo)"""
+        with self._lock:
+            keys = list(reversed(self._entries))
+        recent = []
+        for query, _, variant in keys:
+            if (query, variant) not in recent:
+                recent.append((query, variant))
+                if len(recent) >= limit:
+                    break
+        return recent
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Contatori della cache (per monitoraggio)"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'maxEntries': self.max_entries,
+                'maxBytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRatio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'rejected': self.rejected
+            }
+
+
+def cache_bypass_requested(req):
+    """True se la richiesta chiede di non usare la cache
+    (parametro cache=false oppure header Cache-Control: no-cache)"""
+    value = req.values.get('cache', '')
+    if value.lower() in ('0', 'false', 'no', 'off'):
+        return True
+    cache_control = req.headers.get('Cache-Control', '').lower()
+    return 'no-cache' in cache_control or 'no-store' in cache_control
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Registro delle query SPARQL usate dalle API REST.
+
+Le query delle API sono fisse: vengono compilate una sola volta all'avvio
+con prepareQuery (parsing e traduzione in algebra) ed eseguite passando i
+parametri come initBindings, quindi ogni richiesta paga solo la valutazione
+e il valore fornito dall'utente viene sempre legato come termine RDF, mai
+interpolato nel testo della query.
+
+Per ogni query il registro tiene le statistiche dei tempi di esecuzione,
+esposte da /api/sparql/queries, e passa ogni esecuzione all'eventuale
+observer (ad esempio l'istogramma delle latenze di /metrics).
+"""
+
+import threading
+import time
+
+from rdflib import Namespace, RDF, RDFS, XSD
+from rdflib.plugins.sparql import prepareQuery
+
+DEL = Namespace("https://w3id.org/deliberation/ontology#")
+
+NAMESPACES = {
+    'del': DEL,
+    'rdf': RDF,
+    'rdfs': RDFS,
+    'xsd': XSD,
+}
+
+# Il parser SPARQL di rdflib (pyparsing) non è thread-safe
+parse_lock = threading.Lock()
+
+# Query delle API: nome -> testo (i parametri sono variabili legate con initBindings)
+API_QUERIES = {
+    'processes': """
+        SELECT ?process ?name ?startDate ?endDate
+        WHERE {
+            ?process a del:DeliberationProcess ;
+                     del:name ?name .
+            OPTIONAL { ?process del:startDate ?startDate }
+            OPTIONAL { ?process del:endDate ?endDate }
+        }
+        ORDER BY ?startDate
+    """,
+    'participants': """
+        SELECT ?participant ?name ?organization ?role
+        WHERE {
+            ?participant a del:Participant ;
+                        del:name ?name .
+            OPTIONAL {
+                ?participant del:isAffiliatedWith ?org .
+                ?org del:name ?organization
+            }
+            OPTIONAL {
+                ?participant del:hasRole ?r .
+                ?r del:name ?role
+            }
+        }
+        ORDER BY ?name
+    """,
+    # Parametro: ?contribution
+    'contribution_detail': """
+        SELECT ?p ?o WHERE {
+            ?contribution ?p ?o
+        }
+    """,
+}
+
+
+def prepare(query, namespaces=None):
+    """Compila una query SPARQL (parsing e algebra) in modo thread-safe"""
+    with parse_lock:
+        return prepareQuery(query, initNs=namespaces if namespaces is not None else NAMESPACES)
+
+
+class _QueryStats:
+    __slots__ = ('calls', 'errors', 'rows', 'total', 'max', 'last')
+
+    def __init__(self):
+        self.calls = self.errors = self.rows = 0
+        self.total = self.max = self.last = 0.0
+
+    def to_json(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'rows': self.rows,
+            'totalMs': round(self.total * 1000, 3),
+            'avgMs': round(self.total * 1000 / self.calls, 3) if self.calls else None,
+            'maxMs': round(self.max * 1000, 3),
+            'lastMs': round(self.last * 1000, 3)
+        }
+
+
+class QueryRegistry:
+    """Query con nome compilate una volta ed eseguite con parametri"""
+
+    def __init__(self, queries=API_QUERIES, namespaces=NAMESPACES, observer=None):
+        self.namespaces = dict(namespaces)
+        self.observer = observer  # observer(nome, secondi, righe, errore)
+        self._queries = {}
+        self._texts = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        for name, text in queries.items():
+            self.register(name, text)
+
+    def register(self, name, text):
+        """Compila e registra una query (solleva un errore di parsing se non valida)"""
+        prepared = prepare(text, self.namespaces)
+        with self._lock:
+            self._queries[name] = prepared
+            self._texts[name] = text
+            self._stats.setdefault(name, _QueryStats())
+
+    def __contains__(self, name):
+        return name in self._queries
+
+    def text(self, name):
+        return self._texts[name]
+
+    def execute(self, graph, name, **bindings):
+        """Esegue la query `name` sul grafo e restituisce le righe (lista).
+
+        I parametri sono termini RDF legati alle variabili omonime; le righe
+        vengono calcolate subito, così i tempi registrati comprendono
+        l'intera valutazione."""
+        query = self._queries[name]
+        start = time.perf_counter()
+        try:
+            rows = list(graph.query(query, initBindings=bindings or None))
+        except Exception:
+            self._record(name, time.perf_counter() - start, 0, error=True)
+            raise
+        self._record(name, time.perf_counter() - start, len(rows))
+        return rows
+
+    def _record(self, name, elapsed, rows, error=False):
+        with self._lock:
+            stats = self._stats[name]
+            stats.calls += 1
+            stats.rows += rows
+            stats.total += elapsed
+            stats.last = elapsed
+            stats.max = max(stats.max, elapsed)
+            if error:
+                stats.errors += 1
+        if self.observer is not None:
+            self.observer(name, elapsed, rows, error)
+
+    def stats(self):
+        """Statistiche dei tempi per query"""
+        with self._lock:
+            return {name: stats.to_json() for name, stats in sorted(self._stats.items())}
@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+"""
+Serializzazione in streaming dei risultati SPARQL.
+
+Invece di materializzare list(results) e un unico dizionario di binding da
+passare a jsonify, i risultati di rdflib vengono consumati riga per riga e
+scritti in blocchi da circa CHUNK_SIZE byte, così il primo byte arriva al
+client appena è pronta la prima riga. Le righe di una SELECT vengono lette
+dal generatore della valutazione (iter_rows) senza passare da Result.__iter__,
+che le conserverebbe tutte; operatori come ORDER BY o DISTINCT e i risultati
+CONSTRUCT/DESCRIBE vengono comunque materializzati da rdflib.
+
+Oltre a SPARQL JSON sono disponibili CSV, TSV e XML per SELECT/ASK e Turtle o
+N-Triples per CONSTRUCT/DESCRIBE, scelti con negotiate_format().
+
+iter_rows legge il generatore privato di Result (_genbindings) solo per le
+versioni di rdflib verificate (RESULT_GENERATOR_RDFLIB_VERSIONS); con altre
+versioni usa Result.__iter__.
+"""
+
+import itertools
+import json
+import re
+from xml.sax.saxutils import escape as xml_escape, quoteattr
+
+import rdflib
+from rdflib import BNode, Literal
+from rdflib.query import ResultRow
+
+from sparql_cache import normalize_query
+
+SPARQL_JSON_MIMETYPE = 'application/sparql-results+json'
+
+# Dimensione indicativa dei blocchi inviati al client
+CHUNK_SIZE = 64 * 1024
+
+_json_encode = json.JSONEncoder(ensure_ascii=False).encode
+
+# Versioni principali di rdflib in cui Result tiene il generatore dei binding
+# di una SELECT in _genbindings (consumato e copiato in _bindings da __iter__)
+RESULT_GENERATOR_RDFLIB_VERSIONS = ('6', '7')
+_RESULT_GENERATOR_SUPPORTED = rdflib.__version__.split('.')[0] in RESULT_GENERATOR_RDFLIB_VERSIONS
+
+
+def term_to_json(term):
+    """Converte un termine RDF nel formato di binding SPARQL 1.1 JSON"""
+    if isinstance(term, Literal):
+        binding = {'type': 'literal', 'value': str(term)}
+        if term.language:
+            binding['xml:lang'] = term.language
+        elif term.datatype:
+            binding['datatype'] = str(term.datatype)
+        return binding
+    if isinstance(term, BNode):
+        return {'type': 'bnode', 'value': str(term)}
+    return {'type': 'uri', 'value': str(term)}
+
+
+def result_variables(result):
+    """Nomi delle variabili di un risultato (s/p/o per CONSTRUCT e DESCRIBE)"""
+    if result.type in ('CONSTRUCT', 'DESCRIBE'):
+        return ['subject', 'predicate', 'object']
+    return [str(var) for var in (result.vars or [])]
+
+
+def iter_rows(result):
+    """Righe di un risultato, lette direttamente dal generatore della valutazione.
+
+    Result.__iter__ di rdflib conserva ogni binding di una SELECT in
+    result._bindings (per poter ripetere l'iterazione), quindi la memoria
+    crescerebbe con il numero di righe anche durante lo streaming. Il
+    risultato si può percorrere una sola volta. I risultati CONSTRUCT e
+    DESCRIBE sono comunque un Graph già costruito da rdflib."""
+    if not _RESULT_GENERATOR_SUPPORTED or result.type != 'SELECT':
+        return iter(result)
+    bindings = getattr(result, '_genbindings', None)
+    if bindings is None:
+        return iter(result)
+    result._genbindings = None
+    variables = result.vars
+    return (ResultRow(binding, variables) for binding in bindings if binding)
+
+
+def prime_rows(result):
+    """Avvia la valutazione della query e restituisce un iteratore sulle righe.
+
+    La prima riga viene calcolata subito, così gli errori di valutazione più
+    comuni emergono prima di iniziare la risposta (e possono ancora produrre
+    un codice di errore HTTP) anziché a metà dello stream."""
+    if result.type == 'ASK':
+        return iter(())
+    rows = iter_rows(result)
+    try:
+        first = next(rows)
+    except StopIteration:
+        return iter(())
+    return itertools.chain((first,), rows)
+
+
+def count_rows(rows, counted):
+    """Inoltra le righe contandole in counted[0]"""
+    for row in rows:
+        counted[0] += 1
+        yield row
+
+
+def _chunked(pieces, chunk_size):
+    """Raggruppa stringhe piccole in blocchi di byte di circa chunk_size"""
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def iter_sparql_json(result, rows=None, chunk_size=CHUNK_SIZE):
+    """Genera in streaming la serializzazione application/sparql-results+json"""
+    return _chunked(_sparql_json_pieces(result, rows), chunk_size)
+
+
+def _sparql_json_pieces(result, rows):
+    if result.type == 'ASK':
+        yield _json_encode({'head': {}, 'boolean': bool(result.askAnswer)})
+        return
+
+    variables = result_variables(result)
+    if rows is None:
+        rows = iter_rows(result)
+
+    yield '{"head": {"vars": ' + _json_encode(variables) + '}, "results": {"bindings": ['
+    separator = ''
+    for row in rows:
+        binding = {}
+        for name, value in zip(variables, row):
+            if value is not None:
+                binding[name] = term_to_json(value)
+        yield separator + _json_encode(binding)
+        separator = ', '
+    yield ']}}'
+
+
+# ---------------------------------------------------------------------------
+# Formati alternativi (CSV, TSV, XML) e risultati a grafo (Turtle, N-Triples)
+# ---------------------------------------------------------------------------
+
+SPARQL_XML_MIMETYPE = 'application/sparql-results+xml'
+CSV_MIMETYPE = 'text/csv'
+TSV_MIMETYPE = 'text/tab-separated-values'
+TURTLE_MIMETYPE = 'text/turtle'
+NTRIPLES_MIMETYPE = 'application/n-triples'
+NQUADS_MIMETYPE = 'application/n-quads'
+
+# Prefissi usati dal writer Turtle in streaming
+TURTLE_PREFIXES = [
+    ('del', 'https://w3id.org/deliberation/ontology#'),
+    ('rdf', 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'),
+    ('rdfs', 'http://www.w3.org/2000/01/rdf-schema#'),
+    ('xsd', 'http://www.w3.org/2001/XMLSchema#'),
+    ('skos', 'http://www.w3.org/2004/02/skos/core#'),
+]
+_PN_LOCAL_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_-]*$')
+_RDF_TYPE = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#type'
+
+_QUERY_FORM_RE = re.compile(
+    r'^(?:\s*(?:PREFIX\s+[^\s:]*:\s*<[^>]*>|BASE\s*<[^>]*>))*\s*(SELECT|CONSTRUCT|DESCRIBE|ASK)\b',
+    re.IGNORECASE)
+
+
+def query_form(query):
+    """Forma della query (SELECT, ASK, CONSTRUCT, DESCRIBE) letta dal testo,
+    senza fare il parsing completo. In caso di dubbio restituisce SELECT."""
+    match = _QUERY_FORM_RE.match(normalize_query(query))
+    return match.group(1).upper() if match else 'SELECT'
+
+
+def _escape_string(value):
+    """Escape di una stringa per N-Triples, Turtle e TSV (una sola riga)"""
+    return (value.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t'))
+
+
+def nt_term(term, prefixes=None):
+    """Termine RDF in sintassi N-Triples (o Turtle, se sono dati i prefissi)"""
+    if isinstance(term, Literal):
+        text = '"' + _escape_string(str(term)) + '"'
+        if term.language:
+            return text + '@' + term.language
+        if term.datatype:
+            return text + '^^' + nt_term(term.datatype, prefixes)
+        return text
+    if isinstance(term, BNode):
+        return '_:' + str(term)
+    iri = str(term)
+    if prefixes:
+        for prefix, namespace in prefixes:
+            if iri.startswith(namespace) and _PN_LOCAL_RE.match(iri[len(namespace):]):
+                return prefix + ':' + iri[len(namespace):]
+    return '<' + iri + '>'
+
+
+def _csv_value(term):
+    if term is None:
+        return ''
+    if isinstance(term, BNode):
+        return '_:' + str(term)
+    value = str(term)
+    if any(ch in value for ch in ',"\r\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def iter_sparql_csv(result, rows=None, chunk_size=CHUNK_SIZE):
+    """Genera in streaming il formato SPARQL 1.1 CSV (solo valori lessicali)"""
+    return _chunked(_sparql_csv_pieces(result, rows), chunk_size)
+
+
+def _sparql_csv_pieces(result, rows):
+    if result.type == 'ASK':
+        yield 'boolean\r\n' + ('true' if result.askAnswer else 'false') + '\r\n'
+        return
+    variables = result_variables(result)
+    yield ','.join(variables) + '\r\n'
+    for row in (iter_rows(result) if rows is None else rows):
+        yield ','.join(_csv_value(value) for value in row) + '\r\n'
+
+
+def iter_sparql_tsv(result, rows=None, chunk_size=CHUNK_SIZE):
+    """Genera in streaming il formato SPARQL 1.1 TSV (termini in sintassi Turtle)"""
+    return _chunked(_sparql_tsv_pieces(result, rows), chunk_size)
+
+
+def _sparql_tsv_pieces(result, rows):
+    if result.type == 'ASK':
+        yield '?boolean\n' + ('true' if result.askAnswer else 'false') + '\n'
+        return
+    variables = result_variables(result)
+    yield '\t'.join('?' + var for var in variables) + '\n'
+    for row in (iter_rows(result) if rows is None else rows):
+        yield '\t'.join('' if value is None else nt_term(value) for value in row) + '\n'
+
+
+def iter_sparql_xml(result, rows=None, chunk_size=CHUNK_SIZE):
+    """Genera in streaming il formato SPARQL Query Results XML"""
+    return _chunked(_sparql_xml_pieces(result, rows), chunk_size)
+
+
+def _xml_binding(name, term):
+    if isinstance(term, Literal):
+        attributes = ''
+        if term.language:
+            attributes = ' xml:lang=' + quoteattr(term.language)
+        elif term.datatype:
+            attributes = ' datatype=' + quoteattr(str(term.datatype))
+        value = '<literal' + attributes + '>' + xml_escape(str(term)) + '</literal>'
+    elif isinstance(term, BNode):
+        value = '<bnode>' + xml_escape(str(term)) + '</bnode>'
+    else:
+        value = '<uri>' + xml_escape(str(term)) + '</uri>'
+    return '<binding name=' + quoteattr(name) + '>' + value + '</binding>'
+
+
+def _sparql_xml_pieces(result, rows):
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<sparql xmlns="http://www.w3.org/2005/sparql-results#">\n')
+    if result.type == 'ASK':
+        yield '<head/>\n<boolean>' + ('true' if result.askAnswer else 'false') + '</boolean>\n</sparql>\n'
+        return
+    variables = result_variables(result)
+    yield '<head>' + ''.join('<variable name=' + quoteattr(var) + '/>' for var in variables) + '</head>\n<results>\n'
+    for row in (iter_rows(result) if rows is None else rows):
+        yield '<result>' + ''.join(_xml_binding(name, value)
+                                   for name, value in zip(variables, row)
+                                   if value is not None) + '</result>\n'
+    yield '</results>\n</sparql>\n'
+
+
+def iter_ntriples(triples, chunk_size=CHUNK_SIZE):
+    """Genera in streaming N-Triples da un iterabile di triple"""
+    return _chunked((nt_term(s) + ' ' + nt_term(p) + ' ' + nt_term(o) + ' .\n'
+                     for s, p, o in triples), chunk_size)
+
+
+def iter_nquads(quads, chunk_size=CHUNK_SIZE):
+    """Genera in streaming N-Quads da un iterabile di (s, p, o, grafo);
+    con grafo None la riga appartiene al grafo di default"""
+    return _chunked((nt_term(s) + ' ' + nt_term(p) + ' ' + nt_term(o)
+                     + (' ' + nt_term(g) if g is not None else '') + ' .\n'
+                     for s, p, o, g in quads), chunk_size)
+
+
+def iter_turtle(triples, chunk_size=CHUNK_SIZE, prefixes=TURTLE_PREFIXES):
+    """Genera in streaming Turtle da un iterabile di triple, raggruppando
+    le triple consecutive con lo stesso soggetto"""
+    return _chunked(_turtle_pieces(triples, prefixes), chunk_size)
+
+
+def _turtle_pieces(triples, prefixes):
+    yield ''.join('@prefix ' + prefix + ': <' + namespace + '> .\n'
+                  for prefix, namespace in prefixes) + '\n'
+    current = None
+    for s, p, o in triples:
+        predicate = 'a' if str(p) == _RDF_TYPE else nt_term(p, prefixes)
+        if s == current:
+            yield ' ;\n    ' + predicate + ' ' + nt_term(o, prefixes)
+        else:
+            yield (' .\n\n' if current is not None else '') + \
+                nt_term(s, prefixes) + ' ' + predicate + ' ' + nt_term(o, prefixes)
+            current = s
+    if current is not None:
+        yield ' .\n'
+
+
+def iter_jsonld(triples, chunk_size=CHUNK_SIZE):
+    """Genera in streaming JSON-LD in forma espansa (un nodo per gruppo di
+    triple consecutive con lo stesso soggetto)"""
+    return _chunked(_jsonld_pieces(triples), chunk_size)
+
+
+def _jsonld_id(term):
+    return '_:' + str(term) if isinstance(term, BNode) else str(term)
+
+
+def _jsonld_object(term):
+    if isinstance(term, Literal):
+        value = {'@value': str(term)}
+        if term.language:
+            value['@language'] = term.language
+        elif term.datatype:
+            value['@type'] = str(term.datatype)
+        return value
+    return {'@id': _jsonld_id(term)}
+
+
+def _jsonld_pieces(triples):
+    yield '['
+    separator = '\n'
+    node = None
+    current = None
+    for s, p, o in triples:
+        if s != current:
+            if node is not None:
+                yield separator + _json_encode(node)
+                separator = ',\n'
+            current = s
+            node = {'@id': _jsonld_id(s)}
+        if str(p) == _RDF_TYPE and not isinstance(o, Literal):
+            node.setdefault('@type', []).append(_jsonld_id(o))
+        else:
+            node.setdefault(str(p), []).append(_jsonld_object(o))
+    if node is not None:
+        yield separator + _json_encode(node)
+    yield '\n]\n'
+
+
+_RDF_NAMESPACE = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+_NCNAME_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9._-]*$')
+_NCNAME_TAIL_RE = re.compile(r'[A-Za-z_][A-Za-z0-9._-]*$')
+
+
+def _xml_qnames(predicates, namespaces):
+    """Nome qualificato (prefisso:locale) di ogni predicato e dichiarazioni
+    dei namespace usati. Solleva ValueError se un predicato non si può
+    scrivere in RDF/XML (nessun nome locale valido alla fine dell'IRI)."""
+    prefixes = {'rdf': _RDF_NAMESPACE}
+    by_namespace = {_RDF_NAMESPACE: 'rdf'}
+    for prefix, namespace in namespaces:
+        namespace = str(namespace)
+        if prefix and prefix not in prefixes and namespace not in by_namespace and _NCNAME_RE.match(prefix):
+            prefixes[prefix] = namespace
+            by_namespace[namespace] = prefix
+    qnames = {}
+    generated = 0
+    for predicate in predicates:
+        iri = str(predicate)
+        match = _NCNAME_TAIL_RE.search(iri)
+        if match is None or match.start() == 0:
+            raise ValueError(f"predicato non serializzabile in RDF/XML: {iri}")
+        namespace, local = iri[:match.start()], iri[match.start():]
+        prefix = by_namespace.get(namespace)
+        if prefix is None:
+            generated += 1
+            while f'ns{generated}' in prefixes:
+                generated += 1
+            prefix = f'ns{generated}'
+            prefixes[prefix] = namespace
+            by_namespace[namespace] = prefix
+        qnames[predicate] = prefix + ':' + local
+    used = {qname.split(':', 1)[0] for qname in qnames.values()} | {'rdf'}
+    return qnames, [(prefix, prefixes[prefix]) for prefix in sorted(used)]
+
+
+def iter_rdfxml(triples, namespaces=(), chunk_size=CHUNK_SIZE):
+    """Genera in streaming RDF/XML. Le triple vengono percorse due volte (la
+    prima per i namespace dei predicati), quindi devono essere una sequenza
+    ripetibile, ad esempio una copia congelata del grafo."""
+    qnames, declarations = _xml_qnames({p for _, p, _ in triples}, namespaces)
+    return _chunked(_rdfxml_pieces(triples, qnames, declarations), chunk_size)
+
+
+def _xml_node_attribute(term, about='rdf:about'):
+    if isinstance(term, BNode):
+        return 'rdf:nodeID=' + quoteattr(str(term))
+    return about + '=' + quoteattr(str(term))
+
+
+def _rdfxml_pieces(triples, qnames, declarations):
+    yield '<?xml version="1.0" encoding="utf-8"?>\n<rdf:RDF\n' + \
+        ''.join(f'   xmlns:{prefix}={quoteattr(namespace)}\n' for prefix, namespace in declarations) + '>\n'
+    current = None
+    for s, p, o in triples:
+        if s != current:
+            if current is not None:
+                yield '  </rdf:Description>\n'
+            yield '  <rdf:Description ' + _xml_node_attribute(s) + '>\n'
+            current = s
+        qname = qnames[p]
+        if isinstance(o, Literal):
+            if o.language:
+                attribute = ' xml:lang=' + quoteattr(o.language)
+            elif o.datatype:
+                attribute = ' rdf:datatype=' + quoteattr(str(o.datatype))
+            else:
+                attribute = ''
+            yield '    <' + qname + attribute + '>' + xml_escape(str(o)) + '</' + qname + '>\n'
+        else:
+            yield '    <' + qname + ' ' + _xml_node_attribute(o, 'rdf:resource') + '/>\n'
+    if current is not None:
+        yield '  </rdf:Description>\n'
+    yield '</rdf:RDF>\n'
+
+
+# Writer per una sequenza di triple, per formato rdflib (vedi kg_exports)
+TRIPLE_WRITERS = {
+    'turtle': lambda triples, namespaces: iter_turtle(triples, prefixes=turtle_prefixes(namespaces)),
+    'nt': lambda triples, namespaces: iter_ntriples(triples),
+    'json-ld': lambda triples, namespaces: iter_jsonld(triples),
+    'xml': iter_rdfxml,
+}
+
+
+def turtle_prefixes(namespaces):
+    """Prefissi di un grafo utilizzabili dal writer Turtle"""
+    return [(prefix, str(namespace)) for prefix, namespace in namespaces
+            if prefix == '' or _PN_LOCAL_RE.match(prefix)]
+
+
+def _result_writer(graph_writer):
+    def writer(result, rows=None, chunk_size=CHUNK_SIZE):
+        return graph_writer(iter_rows(result) if rows is None else rows, chunk_size)
+    return writer
+
+
+# Formati per risultati tabellari (SELECT, ASK) e a grafo (CONSTRUCT, DESCRIBE):
+# nome -> (mimetype, writer). Il primo di ogni elenco è il default.
+SOLUTION_FORMATS = {
+    'json': (SPARQL_JSON_MIMETYPE, iter_sparql_json),
+    'xml': (SPARQL_XML_MIMETYPE, iter_sparql_xml),
+    'csv': (CSV_MIMETYPE, iter_sparql_csv),
+    'tsv': (TSV_MIMETYPE, iter_sparql_tsv),
+}
+GRAPH_FORMATS = {
+    'turtle': (TURTLE_MIMETYPE, _result_writer(iter_turtle)),
+    'nt': (NTRIPLES_MIMETYPE, _result_writer(iter_ntriples)),
+}
+FORMAT_ALIASES = {
+    'ttl': 'turtle', 'n3': 'turtle', 'ntriples': 'nt', 'n-triples': 'nt',
+    'rdf': 'xml', 'sparql-json': 'json', 'srj': 'json', 'srx': 'xml',
+}
+# Mimetype accettati in Accept oltre a quelli principali
+_MIMETYPE_ALIASES = {
+    'application/json': 'json',
+    'application/xml': 'xml',
+    'text/xml': 'xml',
+    'application/x-turtle': 'turtle',
+    'text/plain': 'nt',
+}
+
+
+def negotiate_format(form, format_param=None, accept=None):
+    """Sceglie il formato della risposta per una query di forma `form`.
+
+    `format_param` (parametro format=) ha la precedenza sull'header Accept
+    (un oggetto werkzeug MIMEAccept). Restituisce (nome, mimetype, writer),
+    oppure None se il formato richiesto esplicitamente non è disponibile."""
+    formats = GRAPH_FORMATS if form in ('CONSTRUCT', 'DESCRIBE') else SOLUTION_FORMATS
+
+    if format_param:
+        name = format_param.lower()
+        name = FORMAT_ALIASES.get(name, _MIMETYPE_ALIASES.get(name, name))
+        for candidate, (mimetype, _) in formats.items():
+            if name == candidate or name == mimetype:
+                return (candidate,) + formats[candidate]
+        return None
+
+    if accept:
+        offered = [mimetype for mimetype, _ in formats.values()]
+        offered += [mimetype for mimetype, name in _MIMETYPE_ALIASES.items() if name in formats]
+        best = accept.best_match(offered)
+        if best:
+            name = _MIMETYPE_ALIASES.get(best)
+            if name is None:
+                name = next(n for n, (mimetype, _) in formats.items() if mimetype == best)
+            return (name,) + formats[name]
+
+    default = next(iter(formats))
+    return (default,) + formats[default]
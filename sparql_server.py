@@ -7,11 +7,19 @@ e gestire query SPARQL attraverso un'interfaccia web.
 import os
 import json
 import argparse
-from flask import Flask, request, jsonify, render_template_string, send_from_directory
+from flask import Flask, request, jsonify, render_template_string, send_from_directory, Response
 from flask_cors import CORS
-from rdflib import Graph, Namespace
-from rdflib.plugins.sparql import prepareQuery
+from rdflib import Graph, Namespace, URIRef
 import logging
+from sparql_cache import QueryResultCache, cache_bypass_requested
+from sparql_results import negotiate_format, prime_rows, query_form
+from sparql_queries import QueryRegistry, prepare
+from kg_stats import GraphStatistics
+from kg_search import SearchIndex, split_values
+from kg_platforms import PlatformIndex
+from kg_contributions import ContributionIndex, InvalidCursor, group_by_platform
+from kg_access import GraphAccess, sparql_engine_requested
+from kg_metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry, instrument_app, register_process_metrics
 
 # Configurazione logging
 logging.basicConfig(level=logging.INFO)
@@ -23,13 +31,48 @@ CORS(app)  # Abilita CORS per richieste cross-origin
 
 # Variabile globale per il knowledge graph
 knowledge_graph = None
+graph_version = 0  # Incrementata ad ogni (ri)caricamento del grafo
+
+# Cache dei risultati SPARQL
+sparql_cache = QueryResultCache()
+
+# Statistiche materializzate per /api/stats
+graph_stats = GraphStatistics()
+
+# Piattaforma canonica di contributi, processi e partecipanti
+platform_index = PlatformIndex()
+
+# Indice full-text per /api/search
+search_index = SearchIndex(platform_index)
+
+# Contributi ordinati per /api/contributions
+contribution_index = ContributionIndex(platform_index)
+
+# Query delle API compilate una sola volta
+api_queries = QueryRegistry()
+
+# Istanze, proprietà e righe di /api/processes e /api/participants senza SPARQL
+graph_access = GraphAccess()
+
+# Metriche esposte da /metrics
+metrics = MetricsRegistry()
+instrument_app(app, metrics)
+register_process_metrics(metrics)
+api_query_seconds = metrics.histogram('dkg_api_query_seconds', 'Tempo delle query SPARQL registrate delle API',
+                                      ('query',))
+metrics.gauge('dkg_graph_triples', 'Triple nel knowledge graph', lambda: graph_stats.triples)
+metrics.counter_function('dkg_sparql_cache_lookups_total', 'Ricerche nella cache SPARQL per esito',
+                         lambda: {('hit',): sparql_cache.hits, ('miss',): sparql_cache.misses}, ('result',))
+metrics.gauge('dkg_sparql_cache_hit_ratio', 'Frazione delle ricerche nella cache SPARQL servite dalla cache',
+              lambda: sparql_cache.stats()['hitRatio'])
+api_queries.observer = lambda name, elapsed, rows, error: api_query_seconds.observe(elapsed, query=name)
 
 # Namespaces
 DEL = Namespace("https://w3id.org/deliberation/ontology#")
 
 def load_knowledge_graph(kg_file):
     """Carica il knowledge graph da file"""
-    global knowledge_graph
+    global knowledge_graph, graph_version
     
     try:
         knowledge_graph = Graph()
@@ -48,6 +91,13 @@ def load_knowledge_graph(kg_file):
             format_type = 'turtle'  # default
         
         knowledge_graph.parse(kg_file, format=format_type)
+        graph_stats.rebuild(knowledge_graph)
+        platform_index.rebuild(knowledge_graph)
+        search_index.rebuild(knowledge_graph)
+        contribution_index.rebuild(knowledge_graph)
+        graph_access.rebuild(knowledge_graph)
+        graph_version += 1
+        sparql_cache.clear()
         logger.info(f"Knowledge graph caricato: {len(knowledge_graph)} triple da {kg_file}")
         return True
         
@@ -95,116 +145,65 @@ def sparql_endpoint():
     
     if not query:
         return jsonify({'error': 'Nessuna query fornita'}), 400
-    
+
+    # Formato della risposta: parametro format= oppure header Accept
+    negotiated = negotiate_format(query_form(query), request.values.get('format'),
+                                  request.accept_mimetypes)
+    if negotiated is None:
+        return jsonify({'error': f"Formato non supportato per questa query: {request.values.get('format')}"}), 406
+    format_name, mimetype, writer = negotiated
+
+    use_cache = not cache_bypass_requested(request)
+    cache_key = sparql_cache.make_key(query, graph_version, format_name)
+    if use_cache:
+        cached = sparql_cache.get(cache_key)
+        if cached:
+            body, cached_mimetype = cached
+            return Response(body, mimetype=cached_mimetype,
+                            headers={'X-Cache': 'HIT', 'Vary': 'Accept'})
+
     try:
-        # Esegui la query SPARQL
-        results = knowledge_graph.query(query)
-        
-        # Converti i risultati in formato JSON compatibile con SPARQL
-        response_data = {
-            'head': {
-                'vars': [str(var) for var in results.vars] if results.vars else []
-            },
-            'results': {
-                'bindings': []
-            }
-        }
-        
-        # Converti i risultati in lista per gestirli meglio
-        results_list = list(results)
-
-        # Ottieni le variabili
-        vars_list = []
-        if hasattr(results, 'vars') and results.vars:
-            vars_list = [str(var) for var in results.vars]
-        elif results_list:
-            # Fallback: usa la lunghezza della prima riga
-            vars_list = [f'var{i}' for i in range(len(results_list[0]))]
-
-        response_data['head']['vars'] = vars_list
-
-        for row in results_list:
-            binding = {}
-            for i, var in enumerate(vars_list):
-                if i < len(row) and row[i] is not None:
-                    value = row[i]
-                    try:
-                        # Controlla se è un Literal
-                        if hasattr(value, 'toPython') or str(type(value)).find('Literal') >= 0:
-                            binding[var] = {
-                                'type': 'literal',
-                                'value': str(value)
-                            }
-                            # Controlla datatype solo se esiste l'attributo
-                            if hasattr(value, 'datatype') and value.datatype:
-                                binding[var]['datatype'] = str(value.datatype)
-                            if hasattr(value, 'language') and value.language:
-                                binding[var]['xml:lang'] = value.language
-                        else:
-                            # È un URIRef
-                            binding[var] = {
-                                'type': 'uri',
-                                'value': str(value)
-                            }
-                    except Exception as ex:
-                        # Fallback sicuro
-                        binding[var] = {
-                            'type': 'literal',
-                            'value': str(value)
-                        }
-            response_data['results']['bindings'].append(binding)
-        
-        return jsonify(response_data)
-        
+        # Esegui la query SPARQL (la prima riga viene valutata subito)
+        results = knowledge_graph.query(prepare(query, dict(knowledge_graph.namespaces())))
+        rows = prime_rows(results)
     except Exception as e:
         logger.error(f"Errore nell'esecuzione della query: {str(e)}")
         return jsonify({'error': f'Errore nella query: {str(e)}'}), 400
 
+    # Risposta generata in streaming riga per riga nel formato negoziato
+    chunks = writer(results, rows)
+    if use_cache:
+        chunks = sparql_cache.tee(cache_key, chunks, mimetype)
+    return Response(chunks, mimetype=mimetype,
+                    headers={'X-Cache': 'MISS' if use_cache else 'BYPASS', 'Vary': 'Accept'})
+
+@app.route('/api/sparql/cache', methods=['GET', 'DELETE'])
+def sparql_cache_stats():
+    """Statistiche della cache SPARQL (DELETE per svuotarla)"""
+    if request.method == 'DELETE':
+        sparql_cache.clear()
+    stats = sparql_cache.stats()
+    stats['graphVersion'] = graph_version
+    return jsonify(stats)
+
+@app.route('/api/sparql/queries')
+def sparql_query_stats():
+    """Tempi di esecuzione delle query SPARQL delle API"""
+    return jsonify(api_queries.stats())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Metriche del processo in formato Prometheus"""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/api/stats')
 def api_stats():
     """API per ottenere statistiche del knowledge graph"""
     if not knowledge_graph:
         return jsonify({'error': 'Knowledge graph non caricato'}), 500
     
-    try:
-        # Query per ottenere statistiche
-        stats_query = """
-        PREFIX del: <https://w3id.org/deliberation/ontology#>
-        
-        SELECT 
-            (COUNT(DISTINCT ?process) AS ?totalProcesses)
-            (COUNT(DISTINCT ?participant) AS ?totalParticipants)
-            (COUNT(DISTINCT ?contribution) AS ?totalContributions)
-            (COUNT(DISTINCT ?topic) AS ?totalTopics)
-            (COUNT(DISTINCT ?organization) AS ?totalOrganizations)
-        WHERE {
-            OPTIONAL { ?process a del:DeliberationProcess }
-            OPTIONAL { ?participant a del:Participant }
-            OPTIONAL { ?contribution a del:Contribution }
-            OPTIONAL { ?topic a del:Topic }
-            OPTIONAL { ?organization a del:Organization }
-        }
-        """
-        
-        results = knowledge_graph.query(stats_query)
-        
-        stats = {}
-        for row in results:
-            stats = {
-                'totalTriples': len(knowledge_graph),
-                'totalProcesses': int(row[0]) if row[0] else 0,
-                'totalParticipants': int(row[1]) if row[1] else 0,
-                'totalContributions': int(row[2]) if row[2] else 0,
-                'totalTopics': int(row[3]) if row[3] else 0,
-                'totalOrganizations': int(row[4]) if row[4] else 0
-            }
-            break
-        
-        return jsonify(stats)
-        
-    except Exception as e:
-        logger.error(f"Errore nel calcolare le statistiche: {str(e)}")
-        return jsonify({'error': f'Errore nel calcolare le statistiche: {str(e)}'}), 500
+    # Conteggi materializzati al caricamento del grafo
+    return jsonify(graph_stats.summary())
 
 @app.route('/api/processes')
 def api_processes():
@@ -213,21 +212,11 @@ def api_processes():
         return jsonify({'error': 'Knowledge graph non caricato'}), 500
     
     try:
-        query = """
-        PREFIX del: <https://w3id.org/deliberation/ontology#>
-        
-        SELECT ?process ?name ?startDate ?endDate
-        WHERE {
-            ?process a del:DeliberationProcess ;
-                     del:name ?name .
-            OPTIONAL { ?process del:startDate ?startDate }
-            OPTIONAL { ?process del:endDate ?endDate }
-        }
-        ORDER BY ?startDate
-        """
-        
-        results = knowledge_graph.query(query)
-        
+        if not sparql_engine_requested(request):
+            return jsonify(graph_access.processes())
+
+        results = api_queries.execute(knowledge_graph, 'processes')
+
         processes = []
         for row in results:
             process = {
@@ -251,27 +240,11 @@ def api_participants():
         return jsonify({'error': 'Knowledge graph non caricato'}), 500
     
     try:
-        query = """
-        PREFIX del: <https://w3id.org/deliberation/ontology#>
-        
-        SELECT ?participant ?name ?organization ?role
-        WHERE {
-            ?participant a del:Participant ;
-                        del:name ?name .
-            OPTIONAL { 
-                ?participant del:isAffiliatedWith ?org .
-                ?org del:name ?organization 
-            }
-            OPTIONAL { 
-                ?participant del:hasRole ?r .
-                ?r del:name ?role 
-            }
-        }
-        ORDER BY ?name
-        """
-        
-        results = knowledge_graph.query(query)
-        
+        if not sparql_engine_requested(request):
+            return jsonify(graph_access.participants())
+
+        results = api_queries.execute(knowledge_graph, 'participants')
+
         participants = []
         for row in results:
             participant = {
@@ -290,7 +263,10 @@ def api_participants():
 
 @app.route('/api/search')
 def api_search():
-    """API per cercare nel knowledge graph"""
+    """API per cercare nel knowledge graph (indice full-text con ranking BM25)
+
+    Parametri: q (obbligatorio, `term*` per prefisso), type e platform
+    (filtri, valori separati da virgole), limit (default 50, max 500)"""
     if not knowledge_graph:
         return jsonify({'error': 'Knowledge graph non caricato'}), 500
     
@@ -298,46 +274,11 @@ def api_search():
     if not search_term:
         return jsonify({'error': 'Termine di ricerca mancante'}), 400
     
-    try:
-        query = f"""
-        PREFIX del: <https://w3id.org/deliberation/ontology#>
-        
-        SELECT DISTINCT ?entity ?type ?name ?text
-        WHERE {{
-            {{
-                ?entity a ?type ;
-                       del:name ?name .
-                FILTER(CONTAINS(LCASE(?name), LCASE("{search_term}")))
-            }}
-            UNION
-            {{
-                ?entity a del:Contribution ;
-                       del:text ?text .
-                FILTER(CONTAINS(LCASE(?text), LCASE("{search_term}")))
-                BIND(del:Contribution AS ?type)
-                OPTIONAL {{ ?entity del:name ?name }}
-            }}
-        }}
-        LIMIT 50
-        """
-        
-        results = knowledge_graph.query(query)
-        
-        search_results = []
-        for row in results:
-            result = {
-                'uri': str(row[0]),
-                'type': str(row[1]).split('#')[-1] if '#' in str(row[1]) else str(row[1]),
-                'name': str(row[2]) if row[2] else None,
-                'text': str(row[3])[:200] + '...' if row[3] and len(str(row[3])) > 200 else str(row[3]) if row[3] else None
-            }
-            search_results.append(result)
-        
-        return jsonify(search_results)
-        
-    except Exception as e:
-        logger.error(f"Errore nella ricerca: {str(e)}")
-        return jsonify({'error': f'Errore nella ricerca: {str(e)}'}), 500
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    results = search_index.search(search_term, limit=limit,
+                                  types=split_values(request.args.get('type')),
+                                  platforms=split_values(request.args.get('platform')))
+    return jsonify(results)
 
 @app.route('/visualize')
 def visualize():
@@ -382,112 +323,35 @@ def css_files(filename):
 
 @app.route('/api/contributions')
 def api_contributions():
-    """API per ottenere contribution organizzate per piattaforma con contesto completo"""
+    """API per ottenere contribution organizzate per piattaforma e processo
+    (stessi parametri di paginazione e filtro del server di produzione)"""
     if not knowledge_graph:
         return jsonify({'error': 'Knowledge graph non caricato'}), 500
 
-    try:
-        # Query semplificata e ottimizzata per production
-        query = """
-        PREFIX del: <https://w3id.org/deliberation/ontology#>
-        SELECT DISTINCT ?contribution ?text ?timestamp ?participantName ?processName ?platform WHERE {
-            ?contribution a del:Contribution .
-            OPTIONAL { ?contribution del:text ?text }
-            OPTIONAL { ?contribution del:timestamp ?timestamp }
-            OPTIONAL {
-                ?contribution del:madeBy ?participant .
-                ?participant del:name ?participantName
-            }
-            OPTIONAL {
-                ?process del:hasContribution ?contribution .
-                ?process del:name ?processName .
-                OPTIONAL { ?process del:platform ?platform }
-            }
-        }
-        ORDER BY ?processName ?timestamp
-        LIMIT 200
-
-            OPTIONAL { ?contribution del:text ?text }
-            OPTIONAL { ?contribution del:timestamp ?timestamp }
-            OPTIONAL { ?participant del:organization ?organization }
-            OPTIONAL { ?process del:platform ?platform }
-            OPTIONAL {
-                ?process del:hasTopic ?topicUri .
-                ?topicUri del:name ?topicName
-            }
-
-            BIND(?process AS ?processUri)
-        }
-        ORDER BY ?processName ?timestamp
-        """
-
-        results = knowledge_graph.query(query)
+    limit = min(max(request.args.get('limit', 1000, type=int), 1), 5000)
+    has_fallacy = request.args.get('has_fallacy')
+    if has_fallacy is not None:
+        has_fallacy = has_fallacy.lower() in ('1', 'true', 'yes')
 
-        # Organizza per piattaforma e processo
-        platforms = {}
-
-        for row in results:
-            process_name = str(row.processName) if row.processName else 'Unknown Process'
-            process_uri = str(row.processUri) if row.processUri else None
-
-            # Determina piattaforma dal nome del processo
-            platform = 'Unknown Platform'
-            if 'madrid' in process_name.lower() or 'decide madrid' in process_name.lower():
-                platform = 'Decide Madrid'
-            elif 'parliament' in process_name.lower() or 'ep_debate' in str(process_uri).lower():
-                platform = 'European Parliament'
-            elif 'delidata' in process_name.lower() or 'delidata' in str(process_uri).lower():
-                platform = 'DeliData'
-            elif 'have your say' in process_name.lower() or 'eu_have_your_say' in str(process_uri).lower():
-                platform = 'EU Have Your Say'
-            elif 'habermas' in process_name.lower():
-                platform = 'Habermas Machine'
-
-            if platform not in platforms:
-                platforms[platform] = {
-                    'name': platform,
-                    'processes': {}
-                }
-
-            if process_name not in platforms[platform]['processes']:
-                platforms[platform]['processes'][process_name] = {
-                    'name': process_name,
-                    'uri': process_uri,
-                    'contributions': [],
-                    'topics': set()
-                }
-
-            # Aggiungi topic se presente
-            if row.topicName:
-                platforms[platform]['processes'][process_name]['topics'].add(str(row.topicName))
-
-            contribution = {
-                'uri': str(row.contribution) if row.contribution else None,
-                'text': str(row.text) if row.text else '',
-                'timestamp': str(row.timestamp) if row.timestamp else None,
-                'participant': {
-                    'name': str(row.participantName) if row.participantName else 'Unknown',
-                    'organization': str(row.organization) if row.organization else None
-                },
-                'context': {
-                    'platform': platform,
-                    'process': process_name,
-                    'topic': str(row.topicName) if row.topicName else None
-                }
-            }
-
-            platforms[platform]['processes'][process_name]['contributions'].append(contribution)
-
-        # Converte set in list per serializzazione JSON
-        for platform in platforms.values():
-            for process in platform['processes'].values():
-                process['topics'] = list(process['topics'])
-
-        return jsonify(platforms)
-
-    except Exception as e:
-        logger.error(f"Errore nella query contributions: {str(e)}")
-        return jsonify({'error': f'Errore nella query contributions: {str(e)}'}), 500
+    try:
+        contributions, next_cursor = contribution_index.page(
+            limit,
+            cursor=request.args.get('cursor'),
+            platform=request.args.get('platform'),
+            process=request.args.get('process'),
+            participant=request.args.get('participant'),
+            date_from=request.args.get('from'),
+            date_to=request.args.get('to'),
+            has_fallacy=has_fallacy)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'platforms': group_by_platform(contributions),
+        'count': len(contributions),
+        'limit': limit,
+        'nextCursor': next_cursor
+    })
 
 @app.route('/api/contribution/<path:contribution_id>')
 def api_contribution_detail(contribution_id):
@@ -498,19 +362,17 @@ def api_contribution_detail(contribution_id):
     try:
         contribution_uri = f"https://w3id.org/deliberation/resource/{contribution_id}"
 
-        query = f"""
-        PREFIX del: <https://w3id.org/deliberation/ontology#>
-        SELECT ?p ?o WHERE {{
-            <{contribution_uri}> ?p ?o
-        }}
-        """
-
-        results = knowledge_graph.query(query)
+        if sparql_engine_requested(request):
+            # L'ID viene legato come termine: nessuna interpolazione nel testo della query
+            results = api_queries.execute(knowledge_graph, 'contribution_detail',
+                                          contribution=URIRef(contribution_uri))
+        else:
+            results = graph_access.properties(knowledge_graph, URIRef(contribution_uri))
         properties = {}
 
-        for row in results:
-            prop = str(row.p).split('#')[-1] if '#' in str(row.p) else str(row.p).split('/')[-1]
-            properties[prop] = str(row.o)
+        for p, o in results:
+            prop = str(p).split('#')[-1] if '#' in str(p) else str(p).split('/')[-1]
+            properties[prop] = str(o)
 
         return jsonify({
             'uri': contribution_uri,
@@ -566,8 +428,16 @@ def main():
     parser.add_argument('--host', default='localhost', help='Host del server')
     parser.add_argument('--port', type=int, default=5000, help='Porta del server')
     parser.add_argument('--debug', action='store_true', help='Modalità debug')
+    parser.add_argument('--cache-entries', type=int, default=256,
+                       help='Numero massimo di risultati SPARQL in cache (0 = disabilitata)')
+    parser.add_argument('--cache-mb', type=int, default=64,
+                       help='Memoria massima per la cache SPARQL in MB')
     
     args = parser.parse_args()
+
+    global sparql_cache
+    sparql_cache = QueryResultCache(max_entries=args.cache_entries,
+                                    max_bytes=args.cache_mb * 1024 * 1024)
     
     print("=== DELIBERATION KNOWLEDGE GRAPH SERVER ===")
     print(f"Caricamento knowledge graph da: {args.kg_file}")
@@ -1,12 +1,41 @@
 #!/usr/bin/env python3
 
+import functools
+import gc
+import hmac
+import ipaddress
+import json
 import logging
+import os
+import shutil
 import argparse
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
-from rdflib import Graph
+from rdflib import Graph, URIRef
 import time
 import threading
+from sparql_cache import QueryResultCache, cache_bypass_requested
+from sparql_results import count_rows, negotiate_format, prime_rows, query_form
+from sparql_queries import QueryRegistry, prepare
+from sparql_workers import QueryWorkerPool, QueryError, QueryTimeout, QueueFull, fork_available
+from prefork_server import PreforkServer
+from asgi_server import HAS_UVICORN, AsgiAdapter, serve as serve_asgi
+from kg_stats import GraphStatistics
+from kg_platforms import PlatformIndex
+from kg_search import MAX_PREFIX_EXPANSION, SearchIndex, split_values
+from kg_contributions import ContributionIndex, InvalidCursor, group_by_platform
+from kg_access import GraphAccess, sparql_engine_requested
+from kg_exports import (EXPORT_FORMATS, STREAM_FORMATS, ExportCache, export_format,
+                        gzip_chunks, stream_export, stream_format)
+from kg_ingest import InvalidItem, build_fallacy_batch, build_fallacy_triples, iter_batch_items, validate_fallacy_item
+from kg_snapshot import load_snapshot, snapshot_is_fresh, snapshot_path, source_info, write_snapshot
+from kg_wal import WriteAheadLog, wal_path
+from kg_concurrency import GraphSnapshot, ReadWriteLock, iter_locked
+from kg_store import compact_graph
+from kg_reload import FileWatcher, Reloader, file_signature
+from sparql_slowlog import SlowQueryLog, worker_log_path
+from kg_metrics import (CONTENT_TYPE as METRICS_CONTENT_TYPE, ROW_BUCKETS, SAVE_BUCKETS, MetricsRegistry,
+                        instrument_app, register_process_metrics, timed_chunks)
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -18,6 +47,119 @@ knowledge_graph = None
 kg_file_path = None
 graph_modified = False
 last_save_time = None
+graph_version = 0  # Incrementata ad ogni modifica del grafo (invalida la cache SPARQL)
+_version_lock = threading.Lock()
+graph_lock = ReadWriteLock()  # Letture concorrenti, scritture (ingest) esclusive e atomiche
+sparql_cache = QueryResultCache()
+query_pool = None  # QueryWorkerPool, avviato in main() se --query-workers > 0
+query_timeout = 30.0  # Secondi massimi per query SPARQL
+write_forwarder = None  # In modalità pre-fork inoltra le scritture al master
+use_snapshots = True  # Usa e aggiorna lo snapshot binario <kg-file>.snap
+compact_store = False  # Carica il grafo in kg_store.CompactStore invece dello store Memory di rdflib
+graph_stats = GraphStatistics()  # Conteggi per /api/stats
+platform_index = PlatformIndex()  # Piattaforma canonica di contributi, processi e partecipanti
+search_prefix_expansion = MAX_PREFIX_EXPANSION  # Termini massimi di una ricerca per prefisso (term*)
+search_index = SearchIndex(platform_index, search_prefix_expansion)  # Indice full-text per /api/search
+contribution_index = ContributionIndex(platform_index)  # Contributi ordinati per /api/contributions
+graph_access = GraphAccess()  # Istanze, proprietà e righe di /api/processes e /api/participants senza SPARQL
+materialize_platforms = False  # Aggiunge al grafo del:platform per le entità che non lo hanno
+export_cache = None  # ExportCache, configurata in main() con --export-dir
+export_wait_timeout = 60.0  # Secondi di attesa del primo export generato
+api_queries = QueryRegistry()  # Query SPARQL delle API compilate all'avvio
+sparql_lock_batch = 1000  # Righe SPARQL valutate per acquisizione del lock di lettura (senza worker)
+ingest_batch_size = 5000  # Contributi aggiunti al grafo con un'unica scrittura in /api/ingest/fallacy/batch
+use_wal = True  # Registra ogni ingest nel log <kg-file>.wal invece di salvare periodicamente il Turtle
+write_log = None  # WriteAheadLog del grafo caricato
+wal_compact_bytes = 64 * 1024 * 1024  # Dimensione del log oltre la quale viene compattato nel file base
+wal_compact_interval = 3600.0  # Secondi massimi prima di compattare un log non vuoto
+persist_lock = threading.Lock()  # Salvataggi e compattazioni del file base esclusi durante un ricaricamento
+base_files_signature = None  # Firma di <kg-file> e del suo snapshot all'ultimo caricamento o salvataggio
+reload_warm_queries = 32  # Query della cache SPARQL ricalcolate sul nuovo grafo prima dello scambio
+_reload_backlog = None  # Triple aggiunte durante un ricaricamento, riapplicate al nuovo grafo
+reloader = Reloader(lambda reason: reload_knowledge_graph(reason))  # Ricaricamento a caldo (/admin/reload, --watch-kg)
+admin_token = None  # --admin-token: richiesto dalle route di amministrazione (senza, solo connessioni locali)
+
+# Metriche esposte da /metrics (per processo; in pre-fork con l'etichetta worker)
+metrics = MetricsRegistry()
+instrument_app(app, metrics)
+register_process_metrics(metrics)
+sparql_phase_seconds = metrics.histogram('dkg_sparql_phase_seconds',
+                                         'Tempo delle query SPARQL per fase (parse, evaluate, serialize, worker)',
+                                         ('phase',))
+sparql_result_rows = metrics.histogram('dkg_sparql_result_rows', 'Righe dei risultati delle query SPARQL',
+                                       buckets=ROW_BUCKETS)
+api_query_seconds = metrics.histogram('dkg_api_query_seconds', 'Tempo delle query SPARQL registrate delle API',
+                                      ('query',))
+ingest_items_total = metrics.counter('dkg_ingest_items_total', 'Contributi ricevuti dall\'ingest per esito',
+                                     ('status',))
+ingest_triples_total = metrics.counter('dkg_ingest_triples_total', 'Triple aggiunte al grafo dall\'ingest')
+graph_reloads_total = metrics.counter('dkg_graph_reloads_total', 'Ricaricamenti a caldo del grafo per esito',
+                                      ('status',))
+graph_reload_seconds = metrics.histogram('dkg_graph_reload_seconds', 'Durata dei ricaricamenti a caldo del grafo',
+                                         buckets=SAVE_BUCKETS)
+graph_save_seconds = metrics.histogram('dkg_graph_save_seconds', 'Durata dei salvataggi del grafo',
+                                       ('kind',), buckets=SAVE_BUCKETS)
+metrics.gauge('dkg_graph_triples', 'Triple nel knowledge graph', lambda: graph_stats.triples)
+metrics.gauge('dkg_graph_version', 'Versione del grafo (incrementata a ogni modifica)', lambda: graph_version)
+metrics.gauge('dkg_graph_last_save_timestamp_seconds', 'Ora dell\'ultimo salvataggio del grafo (epoch Unix)',
+              lambda: last_save_time)
+metrics.counter_function('dkg_sparql_cache_lookups_total', 'Ricerche nella cache SPARQL per esito',
+              lambda: {('hit',): sparql_cache.hits, ('miss',): sparql_cache.misses}, ('result',))
+metrics.gauge('dkg_sparql_cache_hit_ratio', 'Frazione delle ricerche nella cache SPARQL servite dalla cache',
+              lambda: sparql_cache.stats()['hitRatio'])
+metrics.gauge('dkg_sparql_cache_bytes', 'Byte occupati dalla cache SPARQL', lambda: sparql_cache.stats()['bytes'])
+metrics.counter_function('dkg_sparql_worker_reforks_total',
+                         'Worker SPARQL ricreati per leggere una nuova versione del grafo',
+                         lambda: query_pool.reforks if query_pool is not None else None)
+metrics.gauge('dkg_search_documents', 'Documenti nell\'indice full-text di /api/search',
+              lambda: search_index.stats()['documents'])
+metrics.counter_function('dkg_search_truncated_prefix_expansions_total',
+                         'Ricerche per prefisso limitate a --search-prefix-expansion termini',
+                         lambda: search_index.truncated_expansions)
+metrics.counter_function('dkg_search_compactions_total',
+                         'Compattazioni dell\'indice full-text dopo le reindicizzazioni dell\'ingest',
+                         lambda: search_index.compactions)
+metrics.gauge('dkg_wal_bytes', 'Byte nel log delle scritture',
+              lambda: write_log.size() if write_log is not None else None)
+api_queries.observer = lambda name, elapsed, rows, error: api_query_seconds.observe(elapsed, query=name)
+slow_queries = SlowQueryLog()  # Statistiche per impronta delle query /sparql, configurato in main()
+
+# Header aggiunti dai reverse proxy (vedi MANUAL_NGINX_INSTRUCTIONS.md): la
+# connessione arriva dal loopback ma la richiesta no
+_PROXY_HEADERS = ('Forwarded', 'X-Forwarded-For', 'X-Real-IP')
+
+def local_request():
+    """True se la richiesta arriva dal loopback senza passare da un reverse proxy"""
+    if any(header in request.headers for header in _PROXY_HEADERS):
+        return False
+    try:
+        address = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    mapped = getattr(address, 'ipv4_mapped', None)
+    return (mapped or address).is_loopback
+
+def admin_denied():
+    """Risposta di errore se la richiesta non può usare le operazioni di
+    amministrazione: con --admin-token serve l'header Authorization: Bearer
+    <token>, altrimenti solo le connessioni locali sono ammesse"""
+    if admin_token:
+        supplied = request.headers.get('Authorization', '')
+        if hmac.compare_digest(supplied.encode('utf-8'), f'Bearer {admin_token}'.encode('utf-8')):
+            return None
+        return jsonify({'error': 'Token di amministrazione mancante o non valido'}), 401, \
+            {'WWW-Authenticate': 'Bearer'}
+    if local_request():
+        return None
+    return jsonify({'error': 'Operazione di amministrazione consentita solo in locale '
+                             '(avviare il server con --admin-token per l\'accesso remoto)'}), 403
+
+def admin_only(view):
+    """Route riservata all'amministrazione (vedi admin_denied)"""
+    @functools.wraps(view)
+    def guarded(*args, **kwargs):
+        return admin_denied() or view(*args, **kwargs)
+    return guarded
 
 @app.route('/')
 def redirect_to_dkg():
@@ -112,172 +254,70 @@ def api_stats():
     if not knowledge_graph:
         return jsonify({'error': 'Knowledge graph non caricato'}), 500
 
-    try:
-        # Query semplificata per conteggi
-        stats = {}
-
-        # Total triples
-        stats['totalTriples'] = len(knowledge_graph)
-
-        # Count contributions
-        query_contributions = """
-        PREFIX del: <https://w3id.org/deliberation/ontology#>
-        SELECT (COUNT(DISTINCT ?contribution) AS ?count) WHERE {
-            ?contribution a del:Contribution .
-        }
-        """
-        result = list(knowledge_graph.query(query_contributions))
-        stats['totalContributions'] = int(result[0][0]) if result and result[0][0] else 0
-
-        # Count participants
-        query_participants = """
-        PREFIX del: <https://w3id.org/deliberation/ontology#>
-        SELECT (COUNT(DISTINCT ?participant) AS ?count) WHERE {
-            ?participant a del:Participant .
-        }
-        """
-        result = list(knowledge_graph.query(query_participants))
-        stats['totalParticipants'] = int(result[0][0]) if result and result[0][0] else 0
-
-        # Count processes
-        query_processes = """
-        PREFIX del: <https://w3id.org/deliberation/ontology#>
-        SELECT (COUNT(DISTINCT ?process) AS ?count) WHERE {
-            ?process a del:DeliberationProcess .
-        }
-        """
-        result = list(knowledge_graph.query(query_processes))
-        stats['totalProcesses'] = int(result[0][0]) if result and result[0][0] else 0
-
-        return jsonify(stats)
-
-    except Exception as e:
-        logger.error(f"Errore nel calcolare le statistiche: {str(e)}")
-        return jsonify({'error': f'Errore nel calcolare le statistiche: {str(e)}'}), 500
+    # Conteggi materializzati al caricamento e aggiornati dall'ingest
+    with graph_lock.read():
+        stats = graph_stats.summary(['totalContributions', 'totalParticipants', 'totalProcesses'])
+    return jsonify(stats)
 
 @app.route('/api/contributions')
 @app.route('/dkg/api/contributions')
 def api_contributions():
-    """API ottimizzata per ottenere contributions con platform organization"""
+    """API per i contributi organizzati per piattaforma, con paginazione a cursore
+
+    Parametri (tutti opzionali):
+    - limit: contributi per pagina (default 1000, max 5000)
+    - cursor: valore di nextCursor della pagina precedente
+    - platform, process, participant: filtri (URI o nome per process/participant)
+    - from, to: intervallo di date ISO 8601 (to incluso)
+    - has_fallacy: true/false
+    """
     if not knowledge_graph:
         return jsonify({'error': 'Knowledge graph non caricato'}), 500
 
-    try:
-        # Query semplificata e veloce
-        query = """
-        PREFIX del: <https://w3id.org/deliberation/ontology#>
-        SELECT DISTINCT ?contribution ?text ?timestamp ?participantName ?processName ?platform WHERE {
-            ?contribution a del:Contribution .
-            OPTIONAL { ?contribution del:text ?text }
-            OPTIONAL { ?contribution del:timestamp ?timestamp }
-            OPTIONAL {
-                ?contribution del:madeBy ?participant .
-                ?participant del:name ?participantName
-            }
-            OPTIONAL {
-                ?process del:hasContribution ?contribution .
-                ?process del:name ?processName .
-                OPTIONAL { ?process del:platform ?platform }
-            }
-        }
-        ORDER BY ?processName ?timestamp
-        LIMIT 1000
-        """
-
-        results = knowledge_graph.query(query)
-
-        # Organizza per platform
-        platforms = {}
-
-        for row in results:
-            process_name = str(row.processName) if row.processName else 'Unknown Process'
-            platform = str(row.platform) if row.platform else None
-
-            # Determina platform dal nome se non definito esplicitamente
-            if not platform:
-                if 'madrid' in process_name.lower() or 'decide madrid' in process_name.lower():
-                    platform = 'Decide Madrid'
-                elif 'parliament' in process_name.lower() or 'ep_debate' in process_name.lower():
-                    platform = 'European Parliament'
-                elif 'decidim' in process_name.lower() or 'barcelona' in process_name.lower():
-                    platform = 'Decidim Barcelona'
-                elif 'delidata' in process_name.lower():
-                    platform = 'DeliData'
-                elif 'habermas' in process_name.lower():
-                    platform = 'Habermas Machine'
-                elif 'eu_have_your_say' in process_name.lower() or 'have your say' in process_name.lower():
-                    platform = 'EU Have Your Say'
-                elif 'supreme_court' in process_name.lower() or 'us_supreme' in process_name.lower():
-                    platform = 'US Supreme Court'
-                else:
-                    platform = 'Other Platform'
-
-            if platform not in platforms:
-                platforms[platform] = {
-                    'name': platform,
-                    'processes': {}
-                }
-
-            if process_name not in platforms[platform]['processes']:
-                platforms[platform]['processes'][process_name] = {
-                    'name': process_name,
-                    'contributions': []
-                }
-
-            contribution = {
-                'uri': str(row.contribution) if row.contribution else None,
-                'text': str(row.text) if row.text else '',
-                'timestamp': str(row.timestamp) if row.timestamp else None,
-                'participantName': str(row.participantName) if row.participantName else 'Unknown',
-                'processName': process_name,
-                'platform': platform
-            }
-
-            platforms[platform]['processes'][process_name]['contributions'].append(contribution)
+    limit = min(max(request.args.get('limit', 1000, type=int), 1), 5000)
+    has_fallacy = request.args.get('has_fallacy')
+    if has_fallacy is not None:
+        has_fallacy = has_fallacy.lower() in ('1', 'true', 'yes')
 
-        return jsonify({'platforms': platforms})
-
-    except Exception as e:
-        logger.error(f"Errore nell'API contributions: {str(e)}")
-        return jsonify({'error': f'Errore nell\'API contributions: {str(e)}'}), 500
+    try:
+        with graph_lock.read():
+            contributions, next_cursor = contribution_index.page(
+                limit,
+                cursor=request.args.get('cursor'),
+                platform=request.args.get('platform'),
+                process=request.args.get('process'),
+                participant=request.args.get('participant'),
+                date_from=request.args.get('from'),
+                date_to=request.args.get('to'),
+                has_fallacy=has_fallacy)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'platforms': group_by_platform(contributions),
+        'count': len(contributions),
+        'limit': limit,
+        'nextCursor': next_cursor
+    })
 
 @app.route('/api/export/<format>')
 @app.route('/dkg/api/export/<format>')
 def api_export(format):
-    """API per esportare il knowledge graph"""
+    """API per esportare il knowledge graph (export pre-generati e compressi)"""
     if not knowledge_graph:
         return jsonify({'error': 'Knowledge graph non caricato'}), 500
 
-    try:
-        if format.lower() == 'ttl' or format.lower() == 'turtle':
-            content = knowledge_graph.serialize(format='turtle')
-            mimetype = 'text/turtle'
-            filename = 'deliberation_kg.ttl'
-        elif format.lower() == 'rdf' or format.lower() == 'xml':
-            content = knowledge_graph.serialize(format='xml')
-            mimetype = 'application/rdf+xml'
-            filename = 'deliberation_kg.rdf'
-        elif format.lower() == 'json' or format.lower() == 'jsonld':
-            content = knowledge_graph.serialize(format='json-ld')
-            mimetype = 'application/ld+json'
-            filename = 'deliberation_kg.jsonld'
-        elif format.lower() == 'nt' or format.lower() == 'ntriples':
-            content = knowledge_graph.serialize(format='nt')
-            mimetype = 'application/n-triples'
-            filename = 'deliberation_kg.nt'
-        else:
-            return jsonify({'error': f'Formato non supportato: {format}. Supportati: ttl, rdf, json, nt'}), 400
+    streaming = request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+    if streaming or format.lower() in ('nq', 'nquads'):
+        name = stream_format(format)
+        if name is None:
+            return jsonify({'error': f'Formato non supportato in streaming: {format}. Supportati: nt, nq'}), 400
+        return stream_graph_export(name)
 
-        from flask import Response
-        return Response(
-            content,
-            mimetype=mimetype,
-            headers={'Content-Disposition': f'attachment; filename={filename}'}
-        )
-
-    except Exception as e:
-        logger.error(f"Errore nell'export: {str(e)}")
-        return jsonify({'error': f'Errore nell\'export: {str(e)}'}), 500
+    name = export_format(format)
+    if name is None:
+        return jsonify({'error': f'Formato non supportato: {format}. Supportati: ttl, rdf, json, nt, nq'}), 400
+    return serve_export(name, as_attachment=True)
 
 @app.route('/knowledge_graph/deliberation_kg.jsonld')
 @app.route('/dkg/knowledge_graph/deliberation_kg.jsonld')
@@ -286,14 +326,67 @@ def knowledge_graph_jsonld():
     if not knowledge_graph:
         return jsonify({'error': 'Knowledge graph non caricato'}), 500
 
+    return serve_export('jsonld', as_attachment=False)
+
+@app.route('/api/exports')
+@app.route('/dkg/api/exports')
+def api_exports_status():
+    """Stato degli export pre-generati"""
+    if export_cache is None:
+        return jsonify({'enabled': False})
+    stats = export_cache.stats()
+    stats['enabled'] = True
+    stats['graphVersion'] = graph_version
+    return jsonify(stats)
+
+def stream_graph_export(name):
+    """Export N-Triples/N-Quads in streaming, a memoria costante
+
+    Parametri: prefix (prefisso IRI del soggetto), platform (contributi,
+    processi e partecipanti della piattaforma), separati da virgole;
+    gzip=1 per scaricare il file compresso al volo"""
+    prefixes = tuple(split_values(request.args.get('prefix'))) or None
+    subjects = None
+    platforms = split_values(request.args.get('platform'))
+    if platforms:
+        subjects = (entity for platform in platforms
+                    for entity in platform_index.entities(platform_index.resolve_filter(platform)))
+
+    chunks = stream_export(knowledge_graph, name, subject_prefixes=prefixes, subjects=subjects,
+                           platform_of=platform_index.platform_of, lock=graph_lock)
+    mimetype, filename = STREAM_FORMATS[name]
+    if request.args.get('gzip', '').lower() in ('1', 'true', 'yes'):
+        chunks = gzip_chunks(chunks)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    return Response(chunks, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}',
+                             'X-Graph-Version': str(graph_version)})
+
+def serve_export(name, as_attachment):
+    """Restituisce l'export pre-generato del formato indicato"""
+    if export_cache is None:
+        # Export non configurati (es. app importata senza main): serializzazione diretta
+        rdf_format, mimetype, filename = EXPORT_FORMATS[name]
+        headers = {'Content-Disposition': f'attachment; filename={filename}'} if as_attachment else {}
+        body = b''.join(freeze_graph().serialize(rdf_format))
+        return Response(body, mimetype=mimetype, headers=headers)
+
+    manifest = export_cache.current(name)
+    if manifest is None:
+        # Primo avvio: l'export è in generazione nel master
+        export_cache.schedule()
+        manifest = export_cache.wait(name, export_wait_timeout)
+    if manifest is None:
+        response = jsonify({'error': f'Export {name} in preparazione, riprovare tra poco'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+
     try:
-        # Serializza il knowledge graph in JSON-LD
-        jsonld_data = knowledge_graph.serialize(format='json-ld')
-        from flask import Response
-        return Response(jsonld_data, mimetype='application/ld+json')
+        return export_cache.response(request, manifest, as_attachment=as_attachment)
     except Exception as e:
-        logger.error(f"Errore nella serializzazione JSON-LD: {str(e)}")
-        return jsonify({'error': f'Errore nella serializzazione: {str(e)}'}), 500
+        logger.error(f"Errore nell'export {name}: {e}")
+        return jsonify({'error': f'Errore nell\'export: {str(e)}'}), 500
 
 @app.route('/sparql', methods=['GET', 'POST'])
 @app.route('/dkg/sparql', methods=['GET', 'POST'])
@@ -310,53 +403,116 @@ def sparql_endpoint():
     if not query:
         return jsonify({'error': 'Query SPARQL mancante'}), 400
 
+    # Formato della risposta: parametro format= oppure header Accept
+    negotiated = negotiate_format(query_form(query), request.values.get('format'),
+                                  request.accept_mimetypes)
+    if negotiated is None:
+        return jsonify({'error': f"Formato non supportato per questa query: {request.values.get('format')}"}), 406
+    format_name, mimetype, writer = negotiated
+
+    use_cache = not cache_bypass_requested(request)
+    version = graph_version
+    cache_key = sparql_cache.make_key(query, version, format_name)
+    still_valid = None
+    if use_cache:
+        cached = sparql_cache.get(cache_key)
+        if cached:
+            body, cached_mimetype = cached
+            return Response(body, mimetype=cached_mimetype,
+                            headers={'X-Cache': 'HIT', 'Vary': 'Accept'})
+
+    if query_pool is not None:
+        # Esecuzione isolata in un processo worker con tempo massimo
+        timeout = requested_query_timeout()
+
+        def plan():
+            # L'algebra viene calcolata qui solo per le query scritte nel log
+            return prepare(query, dict(knowledge_graph.namespaces())).algebra
+
+        start = time.perf_counter()
+        completed = {}
+        try:
+            chunks = query_pool.execute(query, format_name, timeout,
+                                        on_complete=lambda rows: completed.update(rows=rows))
+        except QueueFull:
+            logger.warning("Query SPARQL rifiutata: coda dei worker piena")
+            return jsonify({'error': 'Server occupato: troppe query in coda, riprovare'}), 503, {'Retry-After': '1'}
+        except QueryTimeout:
+            logger.warning(f"Query SPARQL interrotta dopo {timeout}s: {query[:200]}")
+            slow_queries.record(query, time.perf_counter() - start, status='timeout', plan=plan)
+            return jsonify({'error': f'Timeout: la query ha superato il limite di {timeout} secondi',
+                            'timeout': timeout}), 504
+        except QueryError as e:
+            logger.error(f"Errore nella query SPARQL: {str(e)}")
+            slow_queries.record(query, time.perf_counter() - start, status='error')
+            return jsonify({'error': f'Errore nella query SPARQL: {str(e)}'}), 500
+        waited = time.perf_counter() - start
+
+        def finished(elapsed):
+            # Nei worker le fasi non sono separabili: tempo totale fino all'ultimo blocco
+            sparql_phase_seconds.observe(waited + elapsed, phase='worker')
+            rows = completed.get('rows')
+            if rows is not None:
+                sparql_result_rows.observe(rows)
+            slow_queries.record(query, waited + elapsed, rows=rows, plan=plan)
+
+        chunks = timed_chunks(chunks, finished)
+    else:
+        start = time.perf_counter()
+        graph = knowledge_graph
+        try:
+            # La valutazione di rdflib è pigra: la prima riga viene calcolata
+            # subito (gli errori più comuni diventano ancora un 500), le altre
+            # a blocchi di sparql_lock_batch righe sotto il lock di lettura,
+            # che viene rilasciato mentre il blocco viene serializzato e
+            # inviato. Come negli export in streaming, ogni blocco vede ogni
+            # ingest per intero o per nulla; un ricaricamento non tocca il
+            # grafo già in uso dalla query.
+            prepared = prepare(query, dict(graph.namespaces()))
+            parsed = time.perf_counter()
+            with graph_lock.read():
+                results = graph.query(prepared)
+                rows = prime_rows(results)
+            evaluated = time.perf_counter()
+        except Exception as e:
+            logger.error(f"Errore nella query SPARQL: {str(e)}")
+            slow_queries.record(query, time.perf_counter() - start, status='error')
+            return jsonify({'error': f'Errore nella query SPARQL: {str(e)}'}), 500
+        phases = {'parse': parsed - start, 'evaluate': evaluated - parsed}
+        sparql_phase_seconds.observe(phases['parse'], phase='parse')
+        sparql_phase_seconds.observe(phases['evaluate'], phase='evaluate')
+        counted = [0]
+
+        def finished(elapsed):
+            # Dopo la prima riga valutazione e serializzazione sono intercalate
+            phases['serialize'] = elapsed
+            sparql_phase_seconds.observe(elapsed, phase='serialize')
+            sparql_result_rows.observe(counted[0])
+            slow_queries.record(query, sum(phases.values()), rows=counted[0], phases=phases,
+                                plan=lambda: prepared.algebra)
+
+        rows = count_rows(iter_locked(rows, graph_lock, sparql_lock_batch), counted)
+        # Una risposta che ha attraversato un ingest non corrisponde a una
+        # sola versione del grafo: non viene messa in cache
+        still_valid = lambda: graph_version == version
+        # Risposta generata in streaming riga per riga nel formato negoziato
+        chunks = timed_chunks(writer(results, rows), finished)
+
+    if use_cache:
+        chunks = sparql_cache.tee(cache_key, chunks, mimetype, still_valid)
+    return Response(chunks, mimetype=mimetype,
+                    headers={'X-Cache': 'MISS' if use_cache else 'BYPASS', 'Vary': 'Accept'})
+
+def requested_query_timeout():
+    """Tempo massimo per la query corrente: il parametro timeout= può solo
+    ridurre il limite configurato sul server"""
     try:
-        results = knowledge_graph.query(query)
-
-        # Format response as SPARQL JSON
-        response_data = {
-            'head': {'vars': []},
-            'results': {'bindings': []}
-        }
-
-        results_list = list(results)
-        if results_list and hasattr(results, 'vars'):
-            response_data['head']['vars'] = [str(var) for var in results.vars]
-
-            for row in results_list:
-                binding = {}
-                for i, var in enumerate(results.vars):
-                    if i < len(row) and row[i] is not None:
-                        value = row[i]
-                        if hasattr(value, 'datatype') and value.datatype:
-                            binding[str(var)] = {
-                                'type': 'literal',
-                                'value': str(value),
-                                'datatype': str(value.datatype)
-                            }
-                        elif hasattr(value, 'language') and value.language:
-                            binding[str(var)] = {
-                                'type': 'literal',
-                                'value': str(value),
-                                'xml:lang': value.language
-                            }
-                        elif str(type(value)).find('Literal') >= 0:
-                            binding[str(var)] = {
-                                'type': 'literal',
-                                'value': str(value)
-                            }
-                        else:
-                            binding[str(var)] = {
-                                'type': 'uri',
-                                'value': str(value)
-                            }
-                response_data['results']['bindings'].append(binding)
-
-        return jsonify(response_data)
-
-    except Exception as e:
-        logger.error(f"Errore nella query SPARQL: {str(e)}")
-        return jsonify({'error': f'Errore nella query SPARQL: {str(e)}'}), 500
+        requested = float(request.values.get('timeout', 0))
+    except ValueError:
+        requested = 0
+    if requested > 0:
+        return min(requested, query_timeout)
+    return query_timeout
 
 # Static file serving
 @app.route('/js/<path:filename>')
@@ -397,138 +553,112 @@ def serve_root_images(filename):
                 continue
     return jsonify({'error': f'Immagine {filename} non trovata'}), 404
 
-@app.route('/api/platforms', methods=['GET'])
-@app.route('/dkg/api/platforms', methods=['GET'])
-def get_platforms():
-    """
-    Endpoint che restituisce dinamicamente tutte le piattaforme presenti nel grafo
-    """
+@app.route('/api/search')
+@app.route('/dkg/api/search')
+def api_search():
+    """API per cercare nel knowledge graph (indice full-text con ranking BM25)
+
+    Parametri: q (obbligatorio, `term*` per prefisso), type e platform
+    (filtri, valori separati da virgole), limit (default 50, max 500)"""
+    if not knowledge_graph:
+        return jsonify({'error': 'Knowledge graph non caricato'}), 500
+
+    search_term = request.args.get('q', '').strip()
+    if not search_term:
+        return jsonify({'error': 'Termine di ricerca mancante'}), 400
+
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    with graph_lock.read():
+        results = search_index.search(search_term, limit=limit,
+                                      types=split_values(request.args.get('type')),
+                                      platforms=split_values(request.args.get('platform')))
+    return jsonify(results)
+
+@app.route('/api/processes')
+@app.route('/dkg/api/processes')
+def api_processes():
+    """API per ottenere tutti i processi deliberativi"""
     if not knowledge_graph:
         return jsonify({'error': 'Knowledge graph non caricato'}), 500
 
     try:
-        from rdflib import Namespace
-
-        DEL = Namespace("https://w3id.org/deliberation/ontology#")
-
-        # Query per trovare tutte le piattaforme con statistiche
-        query = """
-        PREFIX del: <https://w3id.org/deliberation/ontology#>
-        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-
-        SELECT ?platformName (COUNT(DISTINCT ?contribution) as ?count)
-        WHERE {
-            ?contribution a del:Contribution .
-            OPTIONAL { ?contribution del:platform ?platformName }
-            FILTER(BOUND(?platformName))
-        }
-        GROUP BY ?platformName
-        ORDER BY DESC(?count)
-        """
-
-        results = knowledge_graph.query(query)
-        platforms = []
-
-        # Mappa nomi da del:platform a ID standard
-        platform_name_to_id = {
-            'your priorities': 'yourpriorities',
-            'your fallacious priorities': 'yourpriorities'
-        }
-
-        # Mappa nomi leggibili (definita PRIMA del loop)
-        platform_names = {
-            'habermas': 'Habermas Machine',
-            'decidemadrid': 'Decide Madrid',
-            'ep_debate': 'European Parliament Debates',
-            'haveyoursay': 'EU Have Your Say',
-            'yourpriorities': 'Your Fallacious Priorities',
-            'scotus': 'US Supreme Court',
-            'decidim_barcelona': 'Decidim Barcelona',
-            'delidata': 'DeliData'
-        }
-
-        for row in results:
-            platform_name = str(row.platformName) if row.platformName else None
-            # Access the SPARQL variable using dict-style or attribute, but avoid calling count() method
-            count_value = row[1] if len(row) > 1 else 0  # Second column is the count
-            count = int(str(count_value)) if count_value else 0
-
-            if platform_name:
-                # Normalizza il nome per mapping a ID standard
-                platform_name_lower = platform_name.lower()
-                platform_id = platform_name_to_id.get(platform_name_lower,
-                    platform_name_lower.replace(' ', '_').replace('.', '_'))
-
-                platforms.append({
-                    'id': platform_id,
-                    'name': platform_names.get(platform_id, platform_name),  # USA nome mappato!
-                    'count': count
-                })
-
-        # SEMPRE cerca anche per URI pattern per includere piattaforme senza del:platform
-        query_fallback = """
-        PREFIX del: <https://w3id.org/deliberation/ontology#>
-
-        SELECT ?contribution
-        WHERE {
-            ?contribution a del:Contribution .
-        }
-        """
-
-        results_fallback = knowledge_graph.query(query_fallback)
-        platform_counts = {}
-
-        for row in results_fallback:
-            uri = str(row.contribution)
-            # Estrai la piattaforma dall'URI
-            if 'yourpriorities' in uri.lower() or '/point-' in uri.lower():
-                platform_counts['yourpriorities'] = platform_counts.get('yourpriorities', 0) + 1
-            elif 'habermas' in uri.lower() or 'hm_' in uri.lower():
-                platform_counts['habermas'] = platform_counts.get('habermas', 0) + 1
-            elif 'decidemadrid' in uri.lower() or 'madrid' in uri.lower() or 'dm_' in uri.lower():
-                platform_counts['decidemadrid'] = platform_counts.get('decidemadrid', 0) + 1
-            elif 'haveyoursay' in uri.lower() or 'eu_hys' in uri.lower():
-                platform_counts['haveyoursay'] = platform_counts.get('haveyoursay', 0) + 1
-            elif 'scotus' in uri.lower() or 'sc_' in uri.lower():
-                platform_counts['scotus'] = platform_counts.get('scotus', 0) + 1
-            elif 'decidim' in uri.lower() or 'db_' in uri.lower():
-                platform_counts['decidim_barcelona'] = platform_counts.get('decidim_barcelona', 0) + 1
-            elif 'delidata' in uri.lower() or 'dd_' in uri.lower():
-                platform_counts['delidata'] = platform_counts.get('delidata', 0) + 1
-            else:
-                # Tutti gli altri (principalmente European Parliament con URI w3id.org/deliberation/resource/contribution_*)
-                platform_counts['ep_debate'] = platform_counts.get('ep_debate', 0) + 1
+        if sparql_engine_requested(request):
+            with graph_lock.read():
+                results = api_queries.execute(knowledge_graph, 'processes')
+            return jsonify([{
+                'uri': str(row[0]),
+                'name': str(row[1]),
+                'startDate': str(row[2]) if row[2] else None,
+                'endDate': str(row[3]) if row[3] else None
+            } for row in results])
+        return jsonify(graph_access.processes())
+    except Exception as e:
+        logger.error(f"Errore nel recuperare i processi: {str(e)}")
+        return jsonify({'error': f'Errore nel recuperare i processi: {str(e)}'}), 500
 
-        # Converti in lista
-        platforms_from_uri = [
-            {
-                'id': pid,
-                'name': platform_names.get(pid, pid.title()),
-                'count': count
-            }
-            for pid, count in platform_counts.items()
-        ]
+@app.route('/api/participants')
+@app.route('/dkg/api/participants')
+def api_participants():
+    """API per ottenere tutti i partecipanti"""
+    if not knowledge_graph:
+        return jsonify({'error': 'Knowledge graph non caricato'}), 500
 
-        # Merge con piattaforme da del:platform (se presenti)
-        platform_dict = {p['id']: p for p in platforms}
-        for p in platforms_from_uri:
-            if p['id'] not in platform_dict:
-                platform_dict[p['id']] = p
-            else:
-                # Se esiste già, NON sommare (evita doppio conteggio)
-                # Prendi il count maggiore tra i due
-                platform_dict[p['id']]['count'] = max(platform_dict[p['id']]['count'], p['count'])
-                platform_dict[p['id']]['name'] = p['name']  # Usa nome da platform_names
+    try:
+        if sparql_engine_requested(request):
+            with graph_lock.read():
+                results = api_queries.execute(knowledge_graph, 'participants')
+            return jsonify([{
+                'uri': str(row[0]),
+                'name': str(row[1]),
+                'organization': str(row[2]) if row[2] else None,
+                'role': str(row[3]) if row[3] else None
+            } for row in results])
+        return jsonify(graph_access.participants())
+    except Exception as e:
+        logger.error(f"Errore nel recuperare i partecipanti: {str(e)}")
+        return jsonify({'error': f'Errore nel recuperare i partecipanti: {str(e)}'}), 500
 
-        platforms = list(platform_dict.values())
-        platforms.sort(key=lambda x: x['count'], reverse=True)
+@app.route('/api/contribution/<path:contribution_id>')
+@app.route('/dkg/api/contribution/<path:contribution_id>')
+def api_contribution_detail(contribution_id):
+    """API per ottenere dettagli di una contribution specifica"""
+    if not knowledge_graph:
+        return jsonify({'error': 'Knowledge graph non caricato'}), 500
 
-        logger.info(f"Found {len(platforms)} platforms in knowledge graph")
-        return jsonify({'platforms': platforms})
+    try:
+        contribution_uri = f"https://w3id.org/deliberation/resource/{contribution_id}"
+        with graph_lock.read():
+            if sparql_engine_requested(request):
+                # L'ID viene legato come termine: nessuna interpolazione nel testo della query
+                results = api_queries.execute(knowledge_graph, 'contribution_detail',
+                                              contribution=URIRef(contribution_uri))
+            else:
+                results = graph_access.properties(knowledge_graph, URIRef(contribution_uri))
+        properties = {}
+        for p, o in results:
+            prop = str(p).split('#')[-1] if '#' in str(p) else str(p).split('/')[-1]
+            properties[prop] = str(o)
 
+        return jsonify({
+            'uri': contribution_uri,
+            'properties': properties
+        })
     except Exception as e:
-        logger.error(f"Errore nel recupero delle piattaforme: {e}", exc_info=True)
-        return jsonify({'error': str(e)}), 500
+        logger.error(f"Errore nella query contribution detail: {str(e)}")
+        return jsonify({'error': f'Errore nella query contribution detail: {str(e)}'}), 500
+
+@app.route('/api/platforms', methods=['GET'])
+@app.route('/dkg/api/platforms', methods=['GET'])
+def get_platforms():
+    """
+    Endpoint che restituisce dinamicamente tutte le piattaforme presenti nel grafo
+    """
+    if not knowledge_graph:
+        return jsonify({'error': 'Knowledge graph non caricato'}), 500
+
+    with graph_lock.read():
+        platforms = platform_index.platforms()
+    return jsonify({'platforms': platforms})
 
 @app.route('/api/ingest/fallacy', methods=['POST'])
 @app.route('/dkg/api/ingest/fallacy', methods=['POST'])
@@ -564,217 +694,712 @@ def ingest_fallacy():
         return jsonify({'error': 'Knowledge graph non caricato'}), 500
 
     try:
-        from rdflib import URIRef, Literal, Namespace, RDF, RDFS, XSD
-        from datetime import datetime
-        import uuid
-
         data = request.json
         if not data:
             return jsonify({'error': 'Nessun dato ricevuto'}), 400
 
         logger.info(f"Ricevuta richiesta ingest per contribution: {data.get('contribution_id')}")
+        validate_fallacy_item(data)
 
-        # Define namespaces
-        DEL = Namespace("https://w3id.org/deliberation/ontology#")
-        YP = Namespace("https://yourpriorities.org/")
-
-        # Create contribution URI
-        contrib_id = data.get('contribution_id', f"point-{uuid.uuid4()}")
-        contrib_uri = URIRef(f"{YP}{contrib_id}")
-
-        # Add contribution as both Contribution and Argument
-        knowledge_graph.add((contrib_uri, RDF.type, DEL.Contribution))
-        knowledge_graph.add((contrib_uri, RDF.type, DEL.Argument))
-
-        # Add platform name
-        knowledge_graph.add((contrib_uri, DEL.platform, Literal("Your Priorities")))
-
-        # Add text content
-        if data.get('text'):
-            knowledge_graph.add((contrib_uri, DEL.text, Literal(data['text'], lang='it')))
-
-        # Add timestamp
-        if data.get('timestamp'):
-            knowledge_graph.add((contrib_uri, DEL.hasTimestamp,
-                               Literal(data['timestamp'], datatype=XSD.dateTime)))
-
-        # Create and link Participant (user)
-        if data.get('user_id'):
-            user_uri = URIRef(f"{YP}user-{data['user_id']}")
-            knowledge_graph.add((user_uri, RDF.type, DEL.Participant))
-            if data.get('user_name'):
-                knowledge_graph.add((user_uri, RDFS.label, Literal(data['user_name'])))
-                knowledge_graph.add((user_uri, DEL.name, Literal(data['user_name'])))
-
-            # Link contribution to participant
-            knowledge_graph.add((contrib_uri, DEL.madeBy, user_uri))
-
-        # Create Topic (post/proposal)
-        if data.get('post_id'):
-            topic_uri = URIRef(f"{YP}post-{data['post_id']}")
-            knowledge_graph.add((topic_uri, RDF.type, DEL.Topic))
-            if data.get('post_name'):
-                knowledge_graph.add((topic_uri, RDFS.label, Literal(data['post_name'])))
-                knowledge_graph.add((topic_uri, DEL.name, Literal(data['post_name'])))
-
-            # Link contribution to topic
-            knowledge_graph.add((contrib_uri, DEL.isAbout, topic_uri))
-
-            # Add supports/attacks relationship based on value
-            value = data.get('value', 0)
-            if value == 1:
-                # FOR = supports the topic/post
-                knowledge_graph.add((contrib_uri, DEL.supports, topic_uri))
-            elif value == -1:
-                # AGAINST = attacks the topic/post
-                knowledge_graph.add((contrib_uri, DEL.attacks, topic_uri))
-
-        # Handle point-to-point responses (parent_point_id)
-        if data.get('parent_point_id'):
-            parent_uri = URIRef(f"{YP}point-{data['parent_point_id']}")
-            # Link as response
-            knowledge_graph.add((contrib_uri, DEL.respondsTo, parent_uri))
-
-            # Add supports/attacks relationship based on value
-            value = data.get('value', 0)
-            if value == 1:
-                knowledge_graph.add((contrib_uri, DEL.supports, parent_uri))
-            elif value == -1:
-                knowledge_graph.add((contrib_uri, DEL.attacks, parent_uri))
-
-        # Create DeliberationProcess (group/community)
-        process_created = False
-        if data.get('group_id'):
-            process_uri = URIRef(f"{YP}group-{data['group_id']}")
-            knowledge_graph.add((process_uri, RDF.type, DEL.DeliberationProcess))
-            if data.get('group_name'):
-                knowledge_graph.add((process_uri, RDFS.label, Literal(data['group_name'])))
-                knowledge_graph.add((process_uri, DEL.name, Literal(data['group_name'])))
-
-            # Link contribution to process
-            knowledge_graph.add((contrib_uri, DEL.partOf, process_uri))
-
-            # Link topic to process
-            if data.get('post_id'):
-                knowledge_graph.add((process_uri, DEL.hasTopic, topic_uri))
-
-            # Link participant to process
-            if data.get('user_id'):
-                knowledge_graph.add((process_uri, DEL.hasParticipant, user_uri))
-
-            process_created = True
-
-        # Add fallacies
-        fallacy_count = 0
-        for fallacy in data.get('fallacies', []):
-            fallacy_id = f"fallacy-{uuid.uuid4()}"
-            fallacy_uri = URIRef(f"{YP}{fallacy_id}")
-
-            # Create fallacy instance
-            knowledge_graph.add((fallacy_uri, RDF.type, DEL.FallacyType))
-            knowledge_graph.add((fallacy_uri, RDFS.label, Literal(fallacy.get('type'))))
-
-            # Add confidence score
-            if 'score' in fallacy:
-                knowledge_graph.add((fallacy_uri, DEL.hasConfidence,
-                                   Literal(fallacy['score'], datatype=XSD.float)))
-
-            # Add rationale
-            if 'rationale' in fallacy:
-                knowledge_graph.add((fallacy_uri, RDFS.comment,
-                                   Literal(fallacy['rationale'], lang='it')))
-
-            # Link fallacy to contribution
-            knowledge_graph.add((contrib_uri, DEL.containsFallacy, fallacy_uri))
-            fallacy_count += 1
-
-        logger.info(f"Ingest completato per {contrib_id}: {fallacy_count} fallacies, participant: {data.get('user_id')}, topic: {data.get('post_id')}, process: {process_created}")
-        logger.info(f"Knowledge graph ora contiene {len(knowledge_graph)} triple")
+        if write_forwarder is not None:
+            # Modalità pre-fork: la scrittura viene applicata dal master
+            result = write_forwarder('ingest_fallacy', data)
+        else:
+            result = apply_fallacy_ingest(data)
+        ingest_items_total.inc(status='created')
+        ingest_triples_total.inc(result.get('triples_added', 0))
+
+        return jsonify(result), 201
 
+    except InvalidItem as e:
+        ingest_items_total.inc(status='failed')
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Errore nell'ingest di fallacy: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+def apply_fallacy_ingest(data):
+    """Aggiunge al knowledge graph un contributo di Your Priorities e ne
+    restituisce il riepilogo (vedi ingest_fallacy per il formato)"""
+    validate_fallacy_item(data)
+    triples, summary = build_fallacy_triples(data)
+
+    with graph_lock.write():
+        summary['triples_added'] = len(add_to_graph(triples))
         # Mark graph as modified (will be saved periodically)
         mark_graph_modified()
+        summary['total_triples'] = len(knowledge_graph)
 
-        return jsonify({
-            'status': 'success',
-            'contribution_id': contrib_id,
-            'fallacies_added': fallacy_count,
-            'participant_created': bool(data.get('user_id')),
-            'topic_created': bool(data.get('post_id')),
-            'process_created': process_created,
-            'total_triples': len(knowledge_graph)
-        }), 201
+    logger.info(f"Ingest completato per {summary['contribution_id']}: {summary['fallacies_added']} fallacies, "
+                f"participant: {data.get('user_id')}, topic: {data.get('post_id')}, "
+                f"process: {summary['process_created']}, triple: {summary['total_triples']}")
+    return summary
+
+@app.route('/api/ingest/fallacy/batch', methods=['POST'])
+@app.route('/dkg/api/ingest/fallacy/batch', methods=['POST'])
+def ingest_fallacy_batch():
+    """
+    Ingest in blocco di contributi di Your Priorities.
+
+    Il corpo è NDJSON (un contributo per riga, nel formato di
+    /api/ingest/fallacy) oppure un array JSON. Gli elementi vengono validati
+    e aggiunti al grafo a lotti di --ingest-batch-size, ognuno con un'unica
+    scrittura; un elemento non valido viene segnalato nel suo esito senza
+    bloccare gli altri.
 
+    Con ?progress=1 (o Accept: application/x-ndjson) la risposta è NDJSON e
+    riporta l'esito di ogni lotto appena applicato, utile per caricamenti
+    molto grandi; altrimenti restituisce un unico JSON con tutti gli esiti.
+    """
+    if not knowledge_graph:
+        logger.error("Knowledge graph non caricato")
+        return jsonify({'error': 'Knowledge graph non caricato'}), 500
+
+    progress = request.args.get('progress', '').lower() in ('1', 'true', 'yes') or \
+        request.accept_mimetypes.best == 'application/x-ndjson'
+    stream = request.stream
+
+    def batches():
+        batch = []
+        for item in iter_batch_items(stream):
+            batch.append(item)
+            if len(batch) >= ingest_batch_size:
+                yield apply_batch(batch)
+                batch = []
+        if batch:
+            yield apply_batch(batch)
+
+    def apply_batch(batch):
+        if write_forwarder is not None:
+            # Modalità pre-fork: la scrittura viene applicata dal master
+            return write_forwarder('ingest_fallacy_batch', batch)
+        return apply_fallacy_batch(batch)
+
+    totals = {'received': 0, 'created': 0, 'failed': 0, 'triples_added': 0, 'total_triples': None}
+
+    def account(result):
+        totals['received'] += len(result['items'])
+        totals['created'] += result['created']
+        totals['failed'] += result['failed']
+        totals['triples_added'] += result['triples_added']
+        totals['total_triples'] = result['total_triples']
+        ingest_items_total.inc(result['created'], status='created')
+        ingest_items_total.inc(result['failed'], status='failed')
+        ingest_triples_total.inc(result['triples_added'])
+
+    if progress:
+        def generate():
+            try:
+                for result in batches():
+                    account(result)
+                    yield json.dumps(dict(result, event='batch', received=totals['received'])) + '\n'
+                yield json.dumps(dict(totals, event='done', status='success')) + '\n'
+            except Exception as e:
+                logger.error(f"Errore nell'ingest in blocco: {e}", exc_info=True)
+                yield json.dumps(dict(totals, event='error', status='error', error=str(e))) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    try:
+        items = []
+        for result in batches():
+            account(result)
+            items.extend(result['items'])
+    except InvalidItem as e:
+        return jsonify(dict(totals, status='error', error=str(e), items=items)), 400
     except Exception as e:
-        logger.error(f"Errore nell'ingest di fallacy: {e}", exc_info=True)
-        return jsonify({'error': str(e)}), 500
+        logger.error(f"Errore nell'ingest in blocco: {e}", exc_info=True)
+        return jsonify(dict(totals, status='error', error=str(e), items=items)), 500
+
+    if not totals['received']:
+        return jsonify({'error': 'Nessun dato ricevuto'}), 400
+    status_code = 201 if totals['created'] else 400
+    return jsonify(dict(totals, status='success' if totals['created'] else 'error', items=items)), status_code
+
+def apply_fallacy_batch(items):
+    """Aggiunge al knowledge graph un lotto di contributi con un'unica
+    scrittura. `items` è una lista di coppie (posizione, dati)."""
+    start = time.time()
+    triples, results = build_fallacy_batch(items)
+    created = sum(1 for result in results if result['status'] == 'success')
+
+    with graph_lock.write():
+        new_triples = add_to_graph(triples) if triples else []
+        if new_triples:
+            mark_graph_modified()
+        total_triples = len(knowledge_graph)
+
+    logger.info(f"Ingest in blocco: {created}/{len(results)} contributi, {len(new_triples)} triple nuove "
+                f"in {time.time() - start:.2f}s (grafo: {total_triples} triple)")
+    return {
+        'items': results,
+        'created': created,
+        'failed': len(results) - created,
+        'triples_added': len(new_triples),
+        'total_triples': total_triples
+    }
+
+@app.route('/api/sparql/cache', methods=['GET', 'DELETE'])
+@app.route('/dkg/api/sparql/cache', methods=['GET'])
+def sparql_cache_stats():
+    """Statistiche della cache SPARQL (DELETE per svuotarla, riservato
+    all'amministrazione e non disponibile sotto /dkg/)"""
+    if request.method == 'DELETE':
+        denied = admin_denied()
+        if denied:
+            return denied
+        sparql_cache.clear()
+    stats = sparql_cache.stats()
+    stats['graphVersion'] = graph_version
+    return jsonify(stats)
+
+@app.route('/api/sparql/queries')
+@app.route('/dkg/api/sparql/queries')
+def sparql_query_stats():
+    """Tempi di esecuzione delle query SPARQL delle API"""
+    return jsonify(api_queries.stats())
+
+@app.route('/admin/slow-queries', methods=['GET', 'DELETE'])
+@admin_only
+def slow_query_summary():
+    """Impronte delle query SPARQL ordinate per tempo totale (?order=total|max|avg|calls,
+    ?limit=N) e ultime query lente; DELETE azzera le statistiche"""
+    if request.method == 'DELETE':
+        slow_queries.reset()
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 500))
+    except ValueError:
+        return jsonify({'error': 'limit deve essere un intero'}), 400
+    return jsonify(slow_queries.summary(limit=limit, order=request.args.get('order', 'total')))
+
+@app.route('/admin/reload', methods=['GET', 'POST'])
+@admin_only
+def admin_reload():
+    """Ricarica a caldo --kg-file (POST, 202) senza interrompere il servizio;
+    GET restituisce lo stato dell'ultimo ricaricamento"""
+    if request.method == 'GET':
+        if write_forwarder is not None:
+            return jsonify(write_forwarder('reload_status', None))
+        return jsonify(reloader.status())
+    if write_forwarder is not None:
+        # Modalità pre-fork: il grafo viene ricaricato dal master
+        status = write_forwarder('reload', None)
+    else:
+        status = request_reload()
+    if not status.pop('started'):
+        return jsonify(dict(status, error='Ricaricamento già in corso')), 409
+    return jsonify(status), 202
+
+@app.route('/metrics')
+@app.route('/dkg/metrics')
+def metrics_endpoint():
+    """Metriche del processo in formato Prometheus"""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+def add_to_graph(triples):
+    """Aggiunge triple al grafo e aggiorna le statistiche materializzate.
+    Restituisce le triple effettivamente nuove."""
+    new_triples = []
+    seen = set()
+    for triple in triples:
+        if triple not in seen and triple not in knowledge_graph:
+            seen.add(triple)
+            new_triples.append(triple)
+    if write_log is not None:
+        # Prima il log: una scrittura confermata è già persistente
+        write_log.append(new_triples)
+    knowledge_graph.addN((s, p, o, knowledge_graph) for s, p, o in new_triples)
+    graph_stats.record_added(knowledge_graph, new_triples)
+    # Prima le piattaforme: gli altri indici le leggono
+    platform_index.record_added(knowledge_graph, new_triples)
+    search_index.record_added(knowledge_graph, new_triples)
+    contribution_index.record_added(knowledge_graph, new_triples)
+    graph_access.record_added(knowledge_graph, new_triples)
+    if _reload_backlog is not None:
+        # Ricaricamento in corso: le stesse triple andranno aggiunte al nuovo grafo
+        _reload_backlog.extend(new_triples)
+    return new_triples
 
 def mark_graph_modified():
-    """Marca il grafo come modificato"""
-    global graph_modified
-    graph_modified = True
+    """Marca il grafo come modificato e ne incrementa la versione"""
+    global graph_modified, graph_version
+    with _version_lock:
+        graph_version += 1
+        graph_modified = True
+    sparql_cache.purge_stale(graph_version)
+    if export_cache is not None:
+        export_cache.schedule()
+
+def freeze_graph():
+    """Copia congelata del grafo corrente (vedi kg_concurrency.GraphSnapshot)"""
+    with graph_lock.read():
+        return GraphSnapshot(knowledge_graph, graph_version)
+
+def save_knowledge_graph(snapshot=None):
+    """Salva il knowledge graph su file (file temporaneo + rename, con
+    il file precedente conservato in <kg-file>.backup).
+
+    La serializzazione lavora su una copia congelata del grafo, quindi
+    l'ingest non resta bloccato per tutta la durata del salvataggio."""
+    if not persist_lock.acquire(blocking=False):
+        logger.warning("Ricaricamento del knowledge graph in corso: salvataggio rinviato")
+        return False
+    try:
+        return write_base_file(snapshot)
+    finally:
+        persist_lock.release()
 
-def save_knowledge_graph():
-    """Salva il knowledge graph su file"""
-    global knowledge_graph, kg_file_path, graph_modified, last_save_time
-    import time
+def write_base_file(snapshot=None):
+    """Scrive il file base e lo snapshot (con persist_lock già preso)"""
+    global graph_modified, last_save_time
 
     try:
         if not knowledge_graph or not kg_file_path:
             logger.warning("Knowledge graph o path non disponibili per il salvataggio")
             return False
+        if base_file_replaced():
+            # Una nuova build è stata messa al posto del file: non va sovrascritta
+            logger.warning(f"{kg_file_path} è stato sostituito: salvataggio annullato in attesa del ricaricamento")
+            return False
 
-        # Create backup of current file
-        import shutil
-        import os
+        start = time.time()
+        if snapshot is None:
+            snapshot = freeze_graph()
+        tmp_path = f"{kg_file_path}.tmp-{os.getpid()}"
+        snapshot.write(tmp_path, 'turtle')
+        # Metadati del file scritto qui (il rename li conserva): se un deploy
+        # sostituisce il file subito dopo, lo snapshot non gli corrisponde
+        written = source_info(kg_file_path, os.stat(tmp_path))
 
+        # Backup del file corrente: hard link se possibile, altrimenti copia
         backup_path = f"{kg_file_path}.backup"
         if os.path.exists(kg_file_path):
-            shutil.copy2(kg_file_path, backup_path)
-
-        # Save graph to file
-        knowledge_graph.serialize(destination=kg_file_path, format='turtle')
-        graph_modified = False
+            if os.path.exists(backup_path):
+                os.remove(backup_path)
+            try:
+                os.link(kg_file_path, backup_path)
+            except OSError:
+                shutil.copy2(kg_file_path, backup_path)
+        os.replace(tmp_path, kg_file_path)
+
+        with _version_lock:
+            # Modifiche arrivate durante il salvataggio: restano da salvare
+            if graph_version == snapshot.version:
+                graph_modified = False
         last_save_time = time.time()
-        logger.info(f"Knowledge graph salvato: {len(knowledge_graph)} triple in {kg_file_path}")
+        graph_save_seconds.observe(last_save_time - start, kind='turtle')
+        logger.info(f"Knowledge graph salvato: {len(snapshot)} triple in {kg_file_path} "
+                    f"({last_save_time - start:.2f}s)")
+
+        # Snapshot binario accanto al Turtle (più recente, quindi usato al prossimo avvio)
+        if use_snapshots:
+            save_snapshot(snapshot, source=written)
+        remember_base_files()
         return True
 
     except Exception as e:
         logger.error(f"Errore nel salvare il knowledge graph: {e}")
         return False
 
+def compact_knowledge_graph():
+    """Riscrive il file base con l'intero grafo ed elimina il log delle scritture"""
+    if write_log is None:
+        return save_knowledge_graph()
+    if not persist_lock.acquire(blocking=False):
+        logger.warning("Ricaricamento del knowledge graph in corso: compattazione rinviata")
+        return False
+    try:
+        if base_file_replaced():
+            logger.warning(f"{kg_file_path} è stato sostituito: compattazione annullata in attesa del ricaricamento")
+            return False
+        # Rotazione del log e copia del grafo avvengono insieme: il nuovo log
+        # contiene solo scritture successive alla copia
+        with graph_lock.write():
+            write_log.rotate()
+            snapshot = GraphSnapshot(knowledge_graph, graph_version)
+        saved = write_base_file(snapshot)
+        if saved:
+            write_log.finish_compaction()
+            logger.info("Log delle scritture compattato nel file base")
+        return saved
+    finally:
+        persist_lock.release()
+
+def save_snapshot(graph=None, kg_file=None, source=None):
+    """Scrive lo snapshot binario del grafo (o di una sua copia congelata)
+    accanto al file Turtle; `source` descrive il file da cui proviene il grafo"""
+    graph = freeze_graph() if graph is None else graph
+    kg_file = kg_file or kg_file_path
+    try:
+        start = time.time()
+        stats = write_snapshot(graph, snapshot_path(kg_file), source=source or source_info(kg_file))
+        graph_save_seconds.observe(time.time() - start, kind='snapshot')
+        logger.info(f"Snapshot binario salvato in {snapshot_path(kg_file)}: {stats}")
+        return True
+    except Exception as e:
+        logger.error(f"Errore nel salvare lo snapshot binario: {e}")
+        return False
+
 def periodic_save_worker():
-    """Worker thread per salvare periodicamente il grafo se modificato"""
-    import time
+    """Worker thread che rende persistenti le modifiche al grafo: con il log
+    delle scritture lo compatta quando supera --wal-compact-mb o è più vecchio
+    di --wal-compact-interval, altrimenti salva il Turtle ogni 5 minuti"""
     global graph_modified
 
+    if write_log is None:
+        while True:
+            time.sleep(300)  # Salva ogni 5 minuti
+            if graph_modified:
+                logger.info("Salvataggio periodico del knowledge graph...")
+                save_knowledge_graph()
+
+    last_compaction = time.monotonic()
     while True:
-        time.sleep(300)  # Salva ogni 5 minuti
-        if graph_modified:
-            logger.info("Salvataggio periodico del knowledge graph...")
-            save_knowledge_graph()
+        time.sleep(min(60.0, wal_compact_interval))
+        size = write_log.size()
+        if not size:
+            last_compaction = time.monotonic()
+            continue
+        if size >= wal_compact_bytes or time.monotonic() - last_compaction >= wal_compact_interval:
+            logger.info(f"Compattazione del log delle scritture ({size} byte)...")
+            compact_knowledge_graph()
+            last_compaction = time.monotonic()
+
+def new_graph():
+    """Graph vuoto con lo store scelto da --compact-store"""
+    return compact_graph() if compact_store else Graph()
+
+def build_knowledge_graph(kg_file, open_log=True):
+    """Carica il grafo da <kg-file> (o dal suo snapshot) e ne costruisce gli
+    indici derivati, senza toccare lo stato globale del server.
+    Restituisce un dizionario da passare a install_knowledge_graph."""
+    snap_file = snapshot_path(kg_file)
+    graph = None
+    # Lo snapshot vale solo se registra proprio questo file (dimensione, mtime
+    # e inode): dopo la sostituzione di <kg-file> viene ignorato e riscritto
+    fresh = use_snapshots and snapshot_is_fresh(kg_file, snap_file)
+    if use_snapshots and not fresh and os.path.exists(snap_file):
+        logger.info(f"Snapshot {snap_file} non corrisponde a {kg_file}: uso il Turtle")
+    if fresh:
+        try:
+            start = time.time()
+            graph = load_snapshot(snap_file, new_graph())
+            logger.info(f"Snapshot {snap_file} caricato in {time.time() - start:.2f}s")
+        except Exception as e:
+            logger.warning(f"Snapshot {snap_file} non utilizzabile, uso il Turtle: {e}")
+            graph = None
+
+    if graph is None:
+        logger.info(f"Caricamento knowledge graph da: {kg_file}")
+        start = time.time()
+        source = source_info(kg_file)
+        graph = new_graph()
+        graph.parse(kg_file, format='turtle')
+        logger.info(f"Parsing di {kg_file} completato in {time.time() - start:.2f}s")
+        if use_snapshots:
+            save_snapshot(graph, kg_file, source=source)
+
+    log = None
+    if use_wal:
+        # Scritture successive all'ultimo file base
+        start = time.time()
+        log = WriteAheadLog(wal_path(kg_file))
+        replayed = log.replay(graph, repair=open_log)
+        if replayed:
+            logger.info(f"Riapplicati {replayed} lotti da {log.path} in {time.time() - start:.2f}s")
+        if open_log:
+            log.open()
+        else:
+            log = None
+
+    # Indici nuovi: quelli in uso restano validi per le letture in corso
+    start = time.time()
+    platforms = PlatformIndex()
+    platforms.rebuild(graph)
+    if materialize_platforms:
+        platform_triples = platforms.materialize(graph)
+        graph.addN((s, p, o, graph) for s, p, o in platform_triples)
+        logger.info(f"Aggiunte {len(platform_triples)} triple del:platform")
+    stats = GraphStatistics()
+    stats.rebuild(graph)
+    search = SearchIndex(platforms, search_prefix_expansion)
+    search.rebuild(graph)
+    contributions = ContributionIndex(platforms)
+    contributions.rebuild(graph)
+    access = GraphAccess()
+    access.rebuild(graph)
+    logger.info(f"Statistiche e indici calcolati in {time.time() - start:.2f}s")
+    return {'graph': graph, 'write_log': log, 'graph_stats': stats, 'platform_index': platforms,
+            'search_index': search, 'contribution_index': contributions, 'graph_access': access}
+
+def apply_backlog(loaded, triples):
+    """Aggiunge al grafo caricato le triple scritte nel frattempo sul grafo in uso"""
+    graph = loaded['graph']
+    new_triples = [triple for triple in dict.fromkeys(triples) if triple not in graph]
+    graph.addN((s, p, o, graph) for s, p, o in new_triples)
+    # Stesso ordine di add_to_graph
+    loaded['graph_stats'].record_added(graph, new_triples)
+    loaded['platform_index'].record_added(graph, new_triples)
+    loaded['search_index'].record_added(graph, new_triples)
+    loaded['contribution_index'].record_added(graph, new_triples)
+    loaded['graph_access'].record_added(graph, new_triples)
+    loaded['backlog'] = loaded.get('backlog', 0) + len(new_triples)
+    return len(new_triples)
+
+def install_knowledge_graph(loaded, kg_file, reloading=False):
+    """Sostituisce grafo e indici in uso con quelli caricati. Lo scambio
+    avviene sotto il lock di scrittura e costa quanto un ingest: le richieste
+    che hanno già letto i riferimenti precedenti terminano sulla vecchia versione.
+    Restituisce la versione del grafo installato."""
+    global knowledge_graph, kg_file_path, graph_version, graph_modified, write_log, _reload_backlog
+    global graph_stats, platform_index, search_index, contribution_index, graph_access
+
+    with graph_lock.write():
+        if reloading:
+            # Ultime scritture arrivate mentre il nuovo grafo veniva preparato
+            backlog, _reload_backlog = _reload_backlog, None
+            if backlog:
+                loaded['late'] = apply_backlog(loaded, backlog)
+        knowledge_graph = loaded['graph']
+        kg_file_path = kg_file  # Store path for saving later
+        graph_stats = loaded['graph_stats']
+        platform_index = loaded['platform_index']
+        search_index = loaded['search_index']
+        contribution_index = loaded['contribution_index']
+        graph_access = loaded['graph_access']
+        if loaded['write_log'] is not None:
+            if write_log is not None:
+                write_log.close()
+            write_log = loaded['write_log']
+        with _version_lock:
+            graph_version += 1
+            version = graph_version
+            if reloading:
+                # Con il log le scritture riapplicate sono già persistenti
+                graph_modified = bool(loaded.get('backlog')) and not use_wal
+    remember_base_files()
+    sparql_cache.purge_stale(version)
+    if export_cache is not None:
+        export_cache.schedule()
+    return version
 
 def load_knowledge_graph(kg_file):
     """Carica il knowledge graph"""
-    global knowledge_graph, kg_file_path
-
     try:
-        logger.info(f"Caricamento knowledge graph da: {kg_file}")
-        knowledge_graph = Graph()
-        knowledge_graph.parse(kg_file, format='turtle')
-        kg_file_path = kg_file  # Store path for saving later
+        install_knowledge_graph(build_knowledge_graph(kg_file), kg_file)
+        sparql_cache.clear()
         logger.info(f"Knowledge graph caricato: {len(knowledge_graph)} triple da {kg_file}")
         return True
     except Exception as e:
         logger.error(f"Errore nel caricare il knowledge graph: {e}")
         return False
 
+def reload_knowledge_graph(reason='admin'):
+    """Ricarica a caldo <kg-file>: il nuovo grafo e i suoi indici vengono
+    costruiti in background mentre il server continua a rispondere con il
+    grafo in uso, poi i riferimenti globali vengono scambiati in un colpo.
+    Le scritture arrivate nel frattempo vengono riapplicate al nuovo grafo."""
+    global _reload_backlog
+
+    if not kg_file_path:
+        raise RuntimeError('Knowledge graph non caricato')
+    if not use_wal and graph_modified:
+        logger.warning("Ricaricamento con scritture non salvate: senza log delle scritture andranno perse")
+    start = time.time()
+    logger.info(f"Ricaricamento del knowledge graph da {kg_file_path} ({reason})")
+    # Nessun salvataggio del vecchio grafo sopra la nuova build durante il ricaricamento
+    with persist_lock:
+        try:
+            with graph_lock.write():
+                _reload_backlog = []
+            # Il log delle scritture resta quello aperto: è lo stesso file
+            loaded = build_knowledge_graph(kg_file_path, open_log=False)
+            # Le scritture arrivate durante il caricamento vengono applicate
+            # fuori dal lock, resta da riapplicare solo la coda finale
+            with graph_lock.write():
+                backlog, _reload_backlog = _reload_backlog, []
+            apply_backlog(loaded, backlog)
+            warmed = warm_sparql_cache(loaded['graph'], reload_warm_queries)
+            version = install_knowledge_graph(loaded, kg_file_path, reloading=True)
+        except Exception:
+            with graph_lock.write():
+                _reload_backlog = None
+            graph_reloads_total.inc(status='error')
+            raise
+    if loaded.get('late'):
+        warmed = {}  # Calcolati prima delle ultime scritture
+    for (query, variant), (body, mimetype) in warmed.items():
+        sparql_cache.put(sparql_cache.make_key(query, version, variant), body, mimetype)
+    backlog_triples = loaded.get('backlog', 0)
+    del loaded
+    # Il vecchio grafo viene liberato quando terminano le richieste che lo usano
+    gc.collect()
+    elapsed = time.time() - start
+    graph_reloads_total.inc(status='ok')
+    graph_reload_seconds.observe(elapsed)
+    logger.info(f"Knowledge graph ricaricato in {elapsed:.2f}s: {len(knowledge_graph)} triple, "
+                f"{backlog_triples} triple riapplicate, {len(warmed)} query in cache")
+    return {'triples': len(knowledge_graph), 'graphVersion': version, 'kgFile': kg_file_path,
+            'backlogTriples': backlog_triples, 'warmedQueries': len(warmed)}
+
+def warm_sparql_cache(graph, limit):
+    """Ricalcola sul grafo indicato le query SPARQL usate più di recente.
+    Restituisce {(query, variante): (body, mimetype)}."""
+    warmed = {}
+    if limit <= 0 or not sparql_cache.enabled:
+        return warmed
+    namespaces = dict(graph.namespaces())
+    for query, variant in sparql_cache.recent_keys(limit):
+        try:
+            negotiated = negotiate_format(query_form(query), variant)
+            if negotiated is None:
+                continue
+            _, mimetype, writer = negotiated
+            # Il grafo non è ancora installato: nessun lock, righe lette in streaming
+            results = graph.query(prepare(query, namespaces))
+            warmed[(query, variant)] = (b''.join(writer(results, prime_rows(results))), mimetype)
+        except Exception as e:
+            logger.warning(f"Query non ricalcolata per la cache: {e}")
+    return warmed
+
+def current_base_files():
+    """Firma attuale di <kg-file> e del suo snapshot"""
+    return file_signature(kg_file_path), file_signature(snapshot_path(kg_file_path))
+
+def remember_base_files():
+    """Registra i file base appena caricati o scritti dal server"""
+    global base_files_signature
+    base_files_signature = current_base_files()
+
+def base_file_replaced():
+    """True se <kg-file> è stato sostituito dopo l'ultimo caricamento o salvataggio"""
+    return (base_files_signature is not None
+            and file_signature(kg_file_path) != base_files_signature[0])
+
+def request_reload(reason='admin'):
+    """Avvia un ricaricamento in background e ne restituisce lo stato"""
+    started = reloader.start(reason)
+    return dict(reloader.status(), started=started)
+
+def start_export_cache(directory, delay):
+    """Avvia la generazione in background degli export del grafo"""
+    global export_cache
+    # Gli export vengono serializzati da una copia congelata del grafo
+    export_cache = ExportCache(directory, freeze_graph, lambda: graph_version, delay=delay)
+    export_cache.start()
+    logger.info(f"Export pre-generati in {directory}")
+
+def configure_sparql_cache(max_entries, max_mb):
+    """Ricrea la cache SPARQL con i limiti indicati"""
+    global sparql_cache
+    sparql_cache = QueryResultCache(max_entries=max_entries, max_bytes=max_mb * 1024 * 1024)
+
+def configure_slow_query_log(path, threshold_ms, sample_rate, max_mb):
+    """Ricrea il log delle query lente con soglia, campionamento e rotazione indicati"""
+    global slow_queries
+    slow_queries = SlowQueryLog(None if path.lower() == 'none' else path, threshold=threshold_ms / 1000.0,
+                                sample_rate=min(max(sample_rate, 0.0), 1.0), max_bytes=max_mb * 1024 * 1024)
+
+def start_query_pool(workers, timeout, max_queue, refork_interval=5.0):
+    """Avvia il pool di processi per le query SPARQL con timeout"""
+    global query_pool, query_timeout
+    query_timeout = timeout
+    if workers <= 0:
+        return
+    if not fork_available():
+        logger.warning("fork() non disponibile: le query SPARQL verranno eseguite nel server senza timeout")
+        return
+    query_pool = QueryWorkerPool(lambda: knowledge_graph, lambda: graph_version,
+                                 size=workers, max_queue=max_queue, timeout=timeout,
+                                 fork_guard=graph_lock.read, refork_interval=refork_interval)
+    query_pool.start()
+
 def main():
     parser = argparse.ArgumentParser(description='SPARQL Server per Deliberation Knowledge Graph - Production')
     parser.add_argument('--kg-file', required=True, help='Path del file knowledge graph (.ttl)')
     parser.add_argument('--port', type=int, default=8080, help='Porta del server (default: 8080)')
     parser.add_argument('--host', default='127.0.0.1', help='Host del server (default: 127.0.0.1)')
+    parser.add_argument('--cache-entries', type=int, default=256,
+                        help='Numero massimo di risultati SPARQL in cache (0 = disabilitata, default: 256)')
+    parser.add_argument('--cache-mb', type=int, default=64,
+                        help='Memoria massima per la cache SPARQL in MB (default: 64)')
+
+    parser.add_argument('--query-workers', type=int, default=4,
+                        help='Processi worker per le query SPARQL (0 = esecuzione nel server, default: 4)')
+    parser.add_argument('--query-timeout', type=float, default=30.0,
+                        help='Tempo massimo per query SPARQL in secondi (default: 30)')
+    parser.add_argument('--max-queued-queries', type=int, default=32,
+                        help='Query massime in attesa di un worker libero (default: 32)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Processi HTTP pre-fork che condividono il grafo (0 = singolo processo, default: 0)')
+    parser.add_argument('--asgi', action='store_true',
+                        help='Serve le stesse route come app ASGI con uvicorn: le risposte lente non occupano thread')
+    parser.add_argument('--asgi-threads', type=int, default=32,
+                        help='Thread per le view in modalità ASGI (default: 32)')
+    parser.add_argument('--admin-token',
+                        help='Token richiesto dalle route di amministrazione (header Authorization: Bearer '
+                             '<token>); senza, sono consentite solo le richieste locali non inoltrate da un proxy')
+    parser.add_argument('--refork-interval', type=float, default=5.0,
+                        help='Secondi minimi tra due ricreazioni dei worker HTTP e SPARQL dopo un ingest '
+                             '(default: 5)')
+
+    parser.add_argument('--no-snapshot', action='store_true',
+                        help='Non usare né aggiornare lo snapshot binario <kg-file>.snap')
+    parser.add_argument('--compact-store', action='store_true',
+                        help='Tieni il grafo nello store compatto (termini codificati in interi, '
+                             'indici ordinati in array): molta meno memoria per tripla')
+    parser.add_argument('--export-dir',
+                        help='Directory degli export pre-generati (default: <kg-file>.exports, "none" per disabilitarli)')
+    parser.add_argument('--export-delay', type=float, default=5.0,
+                        help='Secondi di attesa dopo un ingest prima di rigenerare gli export (default: 5)')
+    parser.add_argument('--no-wal', action='store_true',
+                        help='Non usare il log delle scritture <kg-file>.wal: il grafo viene salvato ogni 5 minuti')
+    parser.add_argument('--wal-compact-mb', type=int, default=64,
+                        help='Dimensione del log oltre la quale viene compattato nel file base in MB (default: 64)')
+    parser.add_argument('--wal-compact-interval', type=float, default=3600.0,
+                        help='Secondi massimi prima di compattare un log non vuoto (default: 3600)')
+    parser.add_argument('--ingest-batch-size', type=int, default=5000,
+                        help='Contributi aggiunti al grafo con una sola scrittura in /api/ingest/fallacy/batch (default: 5000)')
+    parser.add_argument('--slow-query-log',
+                        help='File JSON lines delle query SPARQL lente (default: slow_queries.log, "none" per non scriverlo; '
+                             'con --workers ogni worker scrive in <nome>.worker-N<estensione>)')
+    parser.add_argument('--slow-query-ms', type=float, default=1000.0,
+                        help='Durata oltre la quale una query SPARQL è lenta in millisecondi (default: 1000)')
+    parser.add_argument('--slow-query-sample', type=float, default=1.0,
+                        help='Frazione delle query lente scritte nel log con il loro albero algebrico (default: 1)')
+    parser.add_argument('--slow-query-log-mb', type=int, default=10,
+                        help='Dimensione oltre la quale il log delle query lente viene ruotato in MB (default: 10)')
+    parser.add_argument('--search-prefix-expansion', type=int, default=MAX_PREFIX_EXPANSION,
+                        help='Termini massimi in cui si espande una ricerca per prefisso (term*) in /api/search '
+                             f'(default: {MAX_PREFIX_EXPANSION})')
+    parser.add_argument('--materialize-platforms', action='store_true',
+                        help='Aggiunge al grafo la piattaforma risolta (del:platform) delle entità che non la dichiarano')
+    parser.add_argument('--watch-kg', type=float, default=0.0, metavar='SECONDS',
+                        help='Controlla ogni SECONDS secondi se --kg-file o il suo snapshot sono stati sostituiti '
+                             'e li ricarica a caldo (default: 0, disattivato; vedi anche /admin/reload)')
+    parser.add_argument('--reload-warm-queries', type=int, default=32,
+                        help='Query SPARQL recenti ricalcolate sul nuovo grafo prima dello scambio (default: 32)')
 
     args = parser.parse_args()
+    configure_sparql_cache(args.cache_entries, args.cache_mb)
+    slow_query_log_path = args.slow_query_log or 'slow_queries.log'
+    # In modalità pre-fork il master non serve query: il file lo aprono i worker
+    configure_slow_query_log(slow_query_log_path if args.workers <= 0 else 'none', args.slow_query_ms,
+                             args.slow_query_sample, args.slow_query_log_mb)
+
+    global use_snapshots, compact_store, materialize_platforms, ingest_batch_size
+    global use_wal, wal_compact_bytes, wal_compact_interval, reload_warm_queries, search_prefix_expansion
+    global admin_token
+    use_snapshots = not args.no_snapshot
+    compact_store = args.compact_store
+    use_wal = not args.no_wal
+    wal_compact_bytes = args.wal_compact_mb * 1024 * 1024
+    wal_compact_interval = args.wal_compact_interval
+    ingest_batch_size = max(1, args.ingest_batch_size)
+    materialize_platforms = args.materialize_platforms
+    reload_warm_queries = max(0, args.reload_warm_queries)
+    search_prefix_expansion = max(1, args.search_prefix_expansion)
+    search_index.max_prefix_expansion = search_prefix_expansion
+    admin_token = args.admin_token
 
     print("=== DELIBERATION KNOWLEDGE GRAPH SERVER - PRODUCTION ===")
 
@@ -783,18 +1408,79 @@ def main():
         print("Errore nel caricamento del knowledge graph")
         return 1
 
+    # Export generati in background nel processo che possiede il grafo
+    export_dir = args.export_dir or args.kg_file + '.exports'
+    if export_dir.lower() != 'none':
+        start_export_cache(export_dir, args.export_delay)
+
+    if args.workers <= 0:
+        # Avvia i worker SPARQL dopo il caricamento, così ereditano il grafo
+        start_query_pool(args.query_workers, args.query_timeout, args.max_queued_queries,
+                         args.refork_interval)
+
     print(f"Server avviato su http://{args.host}:{args.port}")
     print(f"Interfaccia principale: http://{args.host}:{args.port}/")
     print(f"Endpoint SPARQL: http://{args.host}:{args.port}/sparql")
     print(f"API Contributions: http://{args.host}:{args.port}/api/contributions")
     print(f"API Statistiche: http://{args.host}:{args.port}/api/stats")
-    print(f"Salvataggio automatico ogni 5 minuti")
+    print(f"Ricaricamento a caldo: POST http://{args.host}:{args.port}/admin/reload"
+          f" ({'con --admin-token' if admin_token else 'solo richieste locali'})")
+    if write_log is not None:
+        print(f"Log delle scritture: {write_log.path} (compattato oltre {args.wal_compact_mb} MB)")
+    else:
+        print(f"Salvataggio automatico ogni 5 minuti")
 
     # Avvia worker thread per salvataggio periodico
     import threading
     save_thread = threading.Thread(target=periodic_save_worker, daemon=True)
     save_thread.start()
 
+    if args.watch_kg > 0:
+        watcher = FileWatcher(current_base_files, lambda: base_files_signature,
+                              lambda: reloader.start('watch'), interval=args.watch_kg)
+        watcher.start()
+        print(f"Controllo di {args.kg_file} ogni {args.watch_kg:g}s per il ricaricamento a caldo")
+
+    if args.workers > 0:
+        # Modalità pre-fork: il master mantiene il grafo e applica le scritture
+        if not fork_available():
+            print("Errore: la modalità --workers richiede fork()")
+            return 1
+        pool_size = max(1, args.query_workers // args.workers) if args.query_workers > 0 else 0
+
+        def on_worker_start(forwarder, slot):
+            global write_forwarder, graph_lock
+            write_forwarder = forwarder
+            # Metriche del solo worker, distinte per posto (vedi kg_metrics)
+            metrics.reset()
+            metrics.set_constant_labels(worker=slot)
+            # Un file per worker: la rotazione non è sicura tra processi diversi
+            configure_slow_query_log(worker_log_path(slow_query_log_path, slot), args.slow_query_ms,
+                                     args.slow_query_sample, args.slow_query_log_mb)
+            # Il lock ereditato dal fork può risultare preso da thread del master
+            graph_lock = ReadWriteLock()
+            start_query_pool(pool_size, args.query_timeout, args.max_queued_queries, args.refork_interval)
+
+        server = PreforkServer(app, args.host, args.port, args.workers,
+                               write_handlers={'ingest_fallacy': apply_fallacy_ingest,
+                                               'ingest_fallacy_batch': apply_fallacy_batch,
+                                               'reload': lambda payload: request_reload(),
+                                               'reload_status': lambda payload: reloader.status()},
+                               version_provider=lambda: graph_version,
+                               on_worker_start=on_worker_start,
+                               refork_interval=args.refork_interval)
+        print(f"Modalità pre-fork: {args.workers} worker HTTP")
+        server.serve_forever()
+        return 0
+
+    if args.asgi:
+        if not HAS_UVICORN:
+            print("Errore: la modalità --asgi richiede uvicorn (pip install uvicorn)")
+            return 1
+        print(f"Modalità ASGI: {args.asgi_threads} thread per le view")
+        serve_asgi(AsgiAdapter(app, threads=args.asgi_threads), args.host, args.port)
+        return 0
+
     # Avvia il server Flask
     app.run(host=args.host, port=args.port, debug=False, threaded=True)
 
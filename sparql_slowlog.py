@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Log delle query SPARQL lente con impronte delle query.
+
+Ogni query eseguita da /sparql viene ricondotta alla sua impronta: il testo
+normalizzato (vedi sparql_cache.normalize_query) con stringhe e numeri
+sostituiti da '?', così le varianti della stessa query di una dashboard che
+cambiano solo i valori cercati vengono contate insieme. Per ogni impronta si
+accumulano chiamate, tempo totale e massimo e righe restituite; il riepilogo
+(/admin/slow-queries) ordina le impronte per tempo totale, cioè per il carico
+che producono sul server.
+
+Le query che superano la soglia vengono scritte, con probabilità
+`sample_rate`, in un file JSON lines a rotazione (RotatingFileHandler): testo,
+impronta, durata, righe e albero algebrico di rdflib della query, utile per
+capire quale join o OPTIONAL domina la valutazione. In modalità pre-fork
+ogni worker HTTP scrive in un proprio file (worker_log_path), perché più
+processi che ruotano lo stesso file con RotatingFileHandler si perdono o
+sovrascrivono le righe a vicenda.
+
+Uso da riga di comando (riepilogo di uno o più file di log):
+    python sparql_slowlog.py summary slow_queries.log
+    python sparql_slowlog.py summary slow_queries.worker-*.log
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+from rdflib.plugins.sparql.parserutils import CompValue
+
+from sparql_cache import normalize_query
+
+# Impronte mantenute in memoria: oltre il limite si scartano quelle con meno tempo totale
+MAX_FINGERPRINTS = 2000
+# Query lente recenti restituite dal riepilogo
+RECENT_SLOW_QUERIES = 50
+# File di log conservati dalla rotazione
+LOG_BACKUPS = 5
+
+# Stringhe, IRI e nomi (variabili, nomi prefissati, parole chiave) vanno
+# riconosciuti prima dei numeri, così le cifre al loro interno restano intatte
+_FINGERPRINT_TOKEN_RE = re.compile(r'''
+    (?P<string>"""(?:[^"\\]|\\.|"(?!""))*"""
+              |'\'\'(?:[^'\\]|\\.|'(?!''))*'\'\'
+              |"(?:[^"\\\n]|\\.)*"
+              |'(?:[^'\\\n]|\\.)*')
+  | (?P<iri><[^<>"{}|^`\\\s]*>)
+  | (?P<name>[?$]?[A-Za-z_][\w\-.]*(?::[\w\-.%]*)?|:[\w\-.%]*|@[A-Za-z][\w\-]*)
+  | (?P<number>[+-]?(?:\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?))
+''', re.VERBOSE)
+
+
+def worker_log_path(path, slot):
+    """File del log delle query lente del worker pre-fork `slot`
+    (slow_queries.log -> slow_queries.worker-0.log)"""
+    if not path or path.lower() == 'none':
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.worker-{slot}{extension}"
+
+
+def fingerprint_text(query):
+    """Testo della query normalizzato con i letterali sostituiti da '?'"""
+    def replace(match):
+        return '?' if match.lastgroup in ('string', 'number') else match.group()
+    return _FINGERPRINT_TOKEN_RE.sub(replace, normalize_query(query))
+
+
+def fingerprint(query):
+    """(identificativo breve, testo) dell'impronta di una query"""
+    text = fingerprint_text(query)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16], text
+
+
+def algebra_tree(algebra, indent='  '):
+    """Albero algebrico di rdflib come testo indentato (come pprintAlgebra)"""
+    lines = []
+
+    def visit(node, depth, label=''):
+        prefix = indent * depth + (f"{label} = " if label else '')
+        if isinstance(node, CompValue):
+            lines.append(prefix + node.name)
+            for key, value in node.items():
+                visit(value, depth + 1, key)
+        elif isinstance(node, (list, tuple)) and any(isinstance(item, CompValue) for item in node):
+            lines.append(prefix + '[')
+            for item in node:
+                visit(item, depth + 1)
+            lines.append(indent * depth + ']')
+        else:
+            lines.append(prefix + repr(node))
+
+    visit(algebra, 0)
+    return '\n'.join(lines)
+
+
+class _FingerprintStats:
+    __slots__ = ('text', 'example', 'calls', 'slow', 'errors', 'total', 'max', 'rows', 'last_seen')
+
+    def __init__(self, text, example):
+        self.text = text
+        self.example = example
+        self.calls = self.slow = self.errors = self.rows = 0
+        self.total = self.max = 0.0
+        self.last_seen = None
+
+    def to_json(self, fingerprint_id):
+        return {
+            'fingerprint': fingerprint_id,
+            'query': self.text,
+            'example': self.example,
+            'calls': self.calls,
+            'slowCalls': self.slow,
+            'errors': self.errors,
+            'totalMs': round(self.total * 1000, 3),
+            'avgMs': round(self.total * 1000 / self.calls, 3) if self.calls else None,
+            'maxMs': round(self.max * 1000, 3),
+            'rows': self.rows,
+            'lastSeen': self.last_seen
+        }
+
+
+class SlowQueryLog:
+    """Statistiche per impronta di tutte le query e log di quelle lente"""
+
+    def __init__(self, path=None, threshold=1.0, sample_rate=1.0, max_bytes=10 * 1024 * 1024,
+                 backups=LOG_BACKUPS):
+        self.path = path
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._recent = deque(maxlen=RECENT_SLOW_QUERIES)
+        self.logged = 0
+        self._logger = None
+        if path:
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self._logger = logging.getLogger(f"{__name__}.{id(self)}")
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            self._logger.addHandler(handler)
+
+    def record(self, query, duration, rows=None, status='ok', plan=None, phases=None):
+        """Registra un'esecuzione. `plan` è una funzione che restituisce
+        l'algebra della query, chiamata solo se la query viene scritta nel log."""
+        fingerprint_id, text = fingerprint(query)
+        slow = duration >= self.threshold
+        now = time.time()
+        with self._lock:
+            stats = self._stats.get(fingerprint_id)
+            if stats is None:
+                if len(self._stats) >= MAX_FINGERPRINTS:
+                    self._evict()
+                stats = self._stats[fingerprint_id] = _FingerprintStats(text, query)
+            stats.calls += 1
+            stats.total += duration
+            stats.max = max(stats.max, duration)
+            stats.rows += rows or 0
+            stats.last_seen = now
+            if status != 'ok':
+                stats.errors += 1
+            if slow:
+                stats.slow += 1
+        if not slow or random.random() >= self.sample_rate:
+            return False
+
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(now)),
+            'fingerprint': fingerprint_id,
+            'durationMs': round(duration * 1000, 3),
+            'rows': rows,
+            'status': status,
+            'query': query
+        }
+        if phases:
+            entry['phasesMs'] = {name: round(value * 1000, 3) for name, value in phases.items()}
+        if plan is not None:
+            try:
+                entry['algebra'] = algebra_tree(plan())
+            except Exception as e:
+                entry['algebra'] = f"non disponibile: {e}"
+        with self._lock:
+            self.logged += 1
+            self._recent.append(entry)
+        if self._logger is not None:
+            self._logger.info(json.dumps(entry, ensure_ascii=False))
+        return True
+
+    def _evict(self):
+        # Metà delle impronte con meno tempo totale (chiamato con il lock preso)
+        victims = sorted(self._stats, key=lambda key: self._stats[key].total)[:len(self._stats) // 2]
+        for key in victims:
+            del self._stats[key]
+
+    def summary(self, limit=20, order='total'):
+        """Impronte ordinate per tempo totale (o 'max', 'calls', 'avg') e query lente recenti"""
+        sort_keys = {
+            'total': lambda stats: stats.total,
+            'max': lambda stats: stats.max,
+            'calls': lambda stats: stats.calls,
+            'avg': lambda stats: stats.total / stats.calls,
+        }
+        sort_key = sort_keys.get(order, sort_keys['total'])
+        with self._lock:
+            ranked = sorted(self._stats.items(), key=lambda item: sort_key(item[1]), reverse=True)
+            total = sum(stats.total for stats in self._stats.values())
+            return {
+                'thresholdMs': round(self.threshold * 1000, 3),
+                'sampleRate': self.sample_rate,
+                'logFile': self.path,
+                'fingerprints': len(self._stats),
+                'totalMs': round(total * 1000, 3),
+                'logged': self.logged,
+                'top': [stats.to_json(key) for key, stats in ranked[:limit]],
+                'recent': list(reversed(self._recent))
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._recent.clear()
+
+
+def iter_log(paths):
+    """Voci di uno o più file di log (le righe non valide vengono saltate)"""
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Log delle query SPARQL lente del Deliberation Knowledge Graph')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    summary = subparsers.add_parser('summary', help='Impronte ordinate per tempo totale')
+    summary.add_argument('log_files', nargs='+')
+    summary.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    totals = {}
+    for entry in iter_log(args.log_files):
+        stats = totals.setdefault(entry['fingerprint'], {'calls': 0, 'total': 0.0, 'max': 0.0,
+                                                         'query': entry['query']})
+        stats['calls'] += 1
+        stats['total'] += entry['durationMs']
+        stats['max'] = max(stats['max'], entry['durationMs'])
+    ranked = sorted(totals.items(), key=lambda item: item[1]['total'], reverse=True)
+    for fingerprint_id, stats in ranked[:args.limit]:
+        print(f"{fingerprint_id}  {stats['calls']:6d} query  totale {stats['total']:10.1f} ms  "
+              f"max {stats['max']:9.1f} ms")
+        print(f"    {normalize_query(stats['query'])[:200]}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Pool di processi worker per l'esecuzione isolata delle query SPARQL.
+
+I worker vengono creati con fork() dopo il caricamento del knowledge graph e
+quindi condividono il grafo in copy-on-write senza riparsarlo. Ogni query
+viene valutata e serializzata nel worker, che invia la risposta al processo
+principale a blocchi attraverso una pipe; se supera il tempo massimo il
+worker viene terminato e sostituito, senza bloccare il GIL del server.
+
+Quando il grafo cambia (ingest) i worker creati su una versione precedente
+vengono ricreati da un thread di manutenzione, al massimo ogni
+`refork_interval` secondi: sotto un flusso continuo di ingest le query
+leggono una versione vecchia al più di qualche secondo, ma nessuna richiesta
+attende un fork. Lo stesso thread sostituisce i worker terminati (timeout,
+client disconnesso durante lo streaming).
+"""
+
+import contextlib
+import gc
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+from sparql_results import GRAPH_FORMATS, SOLUTION_FORMATS, count_rows, prime_rows
+
+logger = logging.getLogger(__name__)
+
+_WRITERS = dict(SOLUTION_FORMATS, **GRAPH_FORMATS)
+
+# Tipo dei messaggi della risposta nella pipe (primo byte): blocco di dati,
+# fine della risposta (seguito dal numero di righe), errore durante la serializzazione
+_DATA = b'd'
+_END = b'e'
+_FAILED = b'x'
+
+
+class QueryTimeout(Exception):
+    """La query ha superato il tempo massimo consentito"""
+
+
+class QueueFull(Exception):
+    """Troppe query in attesa di un worker libero"""
+
+
+class QueryError(Exception):
+    """Errore di parsing o di valutazione della query nel worker"""
+
+
+def _worker_main(conn, graph, inherited_conns):
+    """Ciclo principale del processo worker"""
+    # Le connessioni degli altri worker ereditate dal fork vanno chiuse,
+    # altrimenti i worker non vedrebbero mai la chiusura della propria pipe
+    for other in inherited_conns:
+        other.close()
+    # Il grafo ereditato non deve essere visitato dal GC (eviterebbe la
+    # condivisione copy-on-write delle pagine)
+    gc.freeze()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+
+        query, format_name = message
+        try:
+            result = graph.query(query)
+            rows = prime_rows(result)
+        except Exception as e:
+            conn.send(('error', str(e)))
+            continue
+
+        conn.send(('ok', None))
+        counted = [0]
+        try:
+            for chunk in _WRITERS[format_name][1](result, count_rows(rows, counted)):
+                conn.send_bytes(_DATA + chunk)
+        except Exception as e:
+            logger.error(f"Errore nella serializzazione della query: {e}")
+            # La risposta è incompleta: il processo principale la interrompe
+            conn.send_bytes(_FAILED + str(e).encode('utf-8'))
+            continue
+        conn.send_bytes(_END + str(counted[0]).encode('ascii'))
+
+
+class _Worker:
+    def __init__(self, process, conn, version):
+        self.process = process
+        self.conn = conn
+        self.version = version
+
+
+class QueryWorkerPool:
+    """Pool di worker con limite di concorrenza e di coda"""
+
+    def __init__(self, graph_provider, version_provider, size=4, max_queue=32, timeout=30.0,
+                 fork_guard=None, refork_interval=5.0):
+        self.graph_provider = graph_provider
+        self.version_provider = version_provider
+        # Context manager tenuto durante il fork (es. lock di lettura del grafo),
+        # così un worker non eredita una scrittura applicata a metà
+        self.fork_guard = fork_guard or contextlib.nullcontext
+        self.size = size
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.refork_interval = refork_interval
+        self._context = multiprocessing.get_context('fork')
+        self._cond = threading.Condition()
+        self._idle = []
+        self._workers = set()
+        self._waiting = 0
+        self._wake = threading.Event()
+        self._running = False
+        self._maintainer = None
+        self._last_fork = 0.0
+        self.timeouts = 0
+        self.rejected = 0
+        self.reforks = 0
+
+    def start(self):
+        """Crea i worker (da chiamare dopo il caricamento del grafo)"""
+        for _ in range(self.size):
+            worker = self._spawn()
+            with self._cond:
+                self._idle.append(worker)
+        self._last_fork = time.monotonic()
+        self._running = True
+        self._maintainer = threading.Thread(target=self._maintain, name='sparql-workers', daemon=True)
+        self._maintainer.start()
+        logger.info(f"Avviati {self.size} worker SPARQL (timeout {self.timeout}s, coda max {self.max_queue})")
+
+    def close(self):
+        self._running = False
+        self._wake.set()
+        if self._maintainer is not None:
+            self._maintainer.join()
+        with self._cond:
+            workers = list(self._workers)
+            self._idle = []
+        for worker in workers:
+            self._kill(worker)
+
+    def _maintain(self):
+        """Thread di manutenzione: sostituisce subito i worker mancanti e
+        ricrea quelli inattivi su una versione vecchia del grafo"""
+        while self._running:
+            self._wake.wait(0.5)
+            self._wake.clear()
+            try:
+                self._replace_missing()
+                self._refork_if_needed()
+            except Exception as e:
+                logger.error(f"Errore nella manutenzione dei worker SPARQL: {e}")
+
+    def _replace_missing(self):
+        with self._cond:
+            missing = self.size - len(self._workers)
+        for _ in range(missing):
+            if not self._running:
+                return
+            self._release(self._spawn())
+
+    def _refork_if_needed(self):
+        """Ricrea i worker inattivi creati prima dell'ultima modifica del grafo;
+        quelli occupati vengono ricreati a un passaggio successivo"""
+        if time.monotonic() - self._last_fork < self.refork_interval:
+            return
+        current = self.version_provider()
+        with self._cond:
+            stale = sum(1 for w in self._idle if w.version != current)
+        if not stale:
+            return
+        logger.info(f"Grafo alla versione {current}: ricreo {stale} worker SPARQL")
+        for _ in range(stale):
+            # Un worker alla volta: gli altri restano disponibili durante il fork
+            with self._cond:
+                worker = next((w for w in self._idle if w.version != current), None)
+                if worker is None:
+                    break
+                self._idle.remove(worker)
+            self._kill(worker)
+            if not self._running:
+                return
+            self._release(self._spawn())
+            self.reforks += 1
+        self._last_fork = time.monotonic()
+
+    def _spawn(self):
+        parent_conn, child_conn = self._context.Pipe()
+        with self._cond:
+            inherited = [w.conn for w in self._workers] + [parent_conn]
+        with self.fork_guard():
+            version = self.version_provider()
+            process = self._context.Process(
+                target=_worker_main,
+                args=(child_conn, self.graph_provider(), inherited),
+                daemon=True)
+            process.start()
+        child_conn.close()
+        worker = _Worker(process, parent_conn, version)
+        with self._cond:
+            self._workers.add(worker)
+        return worker
+
+    def _kill(self, worker):
+        with self._cond:
+            self._workers.discard(worker)
+        try:
+            worker.process.kill()
+        except OSError:
+            pass
+        worker.process.join(timeout=5)
+        worker.conn.close()
+
+    def _acquire(self, deadline):
+        while True:
+            with self._cond:
+                if not self._idle and self._waiting >= self.max_queue:
+                    self.rejected += 1
+                    raise QueueFull(f"{self._waiting} query già in coda")
+                self._waiting += 1
+                try:
+                    while not self._idle:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.timeouts += 1
+                            raise QueryTimeout("nessun worker libero entro il tempo massimo")
+                        self._cond.wait(remaining)
+                    worker = self._idle.pop()
+                finally:
+                    self._waiting -= 1
+            if worker.process.is_alive():
+                return worker
+            # Worker terminato: lo sostituisce il thread di manutenzione
+            self._discard(worker)
+
+    def _release(self, worker):
+        with self._cond:
+            self._idle.append(worker)
+            self._cond.notify()
+
+    def _discard(self, worker):
+        """Termina un worker occupato; il thread di manutenzione ne crea uno nuovo"""
+        self._kill(worker)
+        self._wake.set()
+
+    def execute(self, query, format_name, timeout=None, on_complete=None):
+        """Esegue una query in un worker e restituisce un generatore dei
+        blocchi della risposta serializzata. Se indicata, `on_complete`
+        riceve il numero di righe quando il worker ha inviato l'intera risposta.
+
+        Solleva QueueFull, QueryTimeout o QueryError prima di restituire il
+        generatore, così che il chiamante possa rispondere con un errore HTTP.
+        Durante lo streaming il generatore solleva QueryTimeout o QueryError:
+        la risposta va interrotta (e non messa in cache), non chiusa come completa."""
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        worker = self._acquire(deadline)
+        try:
+            worker.conn.send((query, format_name))
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not worker.conn.poll(remaining):
+                raise QueryTimeout(f"la query ha superato {timeout}s")
+            status, message = worker.conn.recv()
+        except QueryTimeout:
+            self.timeouts += 1
+            self._discard(worker)
+            raise
+        except (EOFError, OSError) as e:
+            self._discard(worker)
+            raise QueryError(f"worker terminato inaspettatamente: {e}")
+
+        if status == 'error':
+            self._release(worker)
+            raise QueryError(message)
+        return self._stream(worker, deadline - time.monotonic(), timeout, on_complete)
+
+    def _stream(self, worker, budget, timeout, on_complete=None):
+        """Blocchi della risposta del worker. Il tempo massimo conta solo
+        l'attesa dei blocchi prodotti dal worker: il tempo in cui il client
+        scarica la risposta (con il worker fermo sulla pipe piena) è escluso."""
+        completed = False
+        try:
+            while True:
+                start = time.monotonic()
+                if budget <= 0 or not worker.conn.poll(budget):
+                    raise QueryTimeout(f"la query ha superato {timeout}s")
+                message = worker.conn.recv_bytes()
+                budget -= time.monotonic() - start
+                kind = message[:1]
+                if kind == _DATA:
+                    yield message[1:]
+                    continue
+                # Fine della risposta: il worker è di nuovo libero
+                completed = True
+                if kind == _FAILED:
+                    raise QueryError(message[1:].decode('utf-8', 'replace'))
+                if on_complete is not None:
+                    on_complete(int(message[1:] or 0))
+                return
+        except QueryTimeout:
+            self.timeouts += 1
+            logger.warning(f"Query interrotta durante lo streaming dopo {timeout}s")
+            raise
+        except (EOFError, OSError) as e:
+            logger.error(f"Worker SPARQL terminato durante lo streaming: {e}")
+            raise QueryError(f"worker terminato durante lo streaming: {e}") from e
+        finally:
+            # Il client si è disconnesso o la query è scaduta: il worker ha
+            # ancora dati nella pipe e viene sostituito
+            if completed:
+                self._release(worker)
+            else:
+                self._discard(worker)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'workers': len(self._workers),
+                'idle': len(self._idle),
+                'queued': self._waiting,
+                'maxQueue': self.max_queue,
+                'timeout': self.timeout,
+                'timeouts': self.timeouts,
+                'rejected': self.rejected,
+                'reforks': self.reforks
+            }
+
+
+def fork_available():
+    """True se la piattaforma supporta l'avvio dei worker con fork()"""
+    return hasattr(os, 'fork') and 'fork' in multiprocessing.get_all_start_methods()
@@ -40,6 +40,18 @@ echo ""
 # Determina la porta
 PORT=${1:-8085}
 
+# Processi HTTP pre-fork (0 = singolo processo multi-thread)
+WORKERS=${DKG_WORKERS:-0}
+
+# Controllo del file KG per il ricaricamento a caldo in secondi (0 = solo POST /admin/reload)
+WATCH_KG=${DKG_WATCH_KG:-0}
+
+# Token per le route di amministrazione (vuoto = consentite solo in locale, non attraverso il proxy)
+ADMIN_TOKEN_ARGS=()
+if [ -n "$DKG_ADMIN_TOKEN" ]; then
+    ADMIN_TOKEN_ARGS=(--admin-token "$DKG_ADMIN_TOKEN")
+fi
+
 echo "🚀 Avvio server production sulla porta $PORT..."
 echo ""
 echo "🌐 URL principali:"
@@ -49,10 +61,15 @@ echo "   Visualizzazione KG:     http://localhost:$PORT/visualize"
 echo "   API Statistiche:        http://localhost:$PORT/api/stats"
 echo "   Export KG:              http://localhost:$PORT/api/export/ttl"
 echo "   Endpoint SPARQL:        http://localhost:$PORT/sparql"
+if [ -n "$DKG_ADMIN_TOKEN" ]; then
+    echo "   Ricaricamento KG:       curl -X POST -H \"Authorization: Bearer \$DKG_ADMIN_TOKEN\" http://localhost:$PORT/admin/reload"
+else
+    echo "   Ricaricamento KG:       curl -X POST http://localhost:$PORT/admin/reload"
+fi
 echo ""
 echo "📝 Per terminare il server: Ctrl+C"
 echo "========================================================"
 echo ""
 
 # Avvia il server
-python3 sparql_server_production.py --kg-file comprehensive_real_kg.ttl --port $PORT --host 0.0.0.0
\ No newline at end of file
+python3 sparql_server_production.py --kg-file comprehensive_real_kg.ttl --port $PORT --host 0.0.0.0 --workers $WORKERS --watch-kg $WATCH_KG "${ADMIN_TOKEN_ARGS[@]}"
\ No newline at end of file
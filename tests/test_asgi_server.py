@@ -0,0 +1,162 @@
+import asyncio
+import json
+from urllib.parse import urlencode
+
+import pytest
+from flask import Flask, Response, request, send_file
+
+import sparql_server_production as server
+from asgi_server import AsgiAdapter
+
+
+def call(adapter, method, path, query_string=b'', headers=(), body_chunks=(b'',)):
+    """Esegue una richiesta ASGI e restituisce (stato, header, messaggi del corpo)"""
+    pending = [{'type': 'http.request', 'body': chunk, 'more_body': index < len(body_chunks) - 1}
+               for index, chunk in enumerate(body_chunks)]
+    sent = []
+
+    async def receive():
+        if pending:
+            return pending.pop(0)
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query_string,
+             'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+             'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 1234)}
+    asyncio.run(adapter(scope, receive, send))
+    start, *bodies = sent
+    assert start['type'] == 'http.response.start'
+    assert bodies and not bodies[-1].get('more_body', False)
+    return start['status'], dict((k.decode(), v.decode()) for k, v in start['headers']), bodies
+
+
+def body_of(bodies):
+    return b''.join(message.get('body', b'') for message in bodies)
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    path = tmp_path / 'export.nt'
+    path.write_bytes(b''.join(b'<http://example.org/s%d> <http://example.org/p> "%d" .\n' % (i, i)
+                              for i in range(20000)))
+
+    @app.route('/echo', methods=['POST'])
+    def echo():
+        lines = [json.loads(line) for line in request.stream if line.strip()]
+        return {'items': len(lines), 'ids': [line['id'] for line in lines],
+                'path': request.path, 'arg': request.args.get('q')}
+
+    @app.route('/stream')
+    def stream():
+        return Response((f'{i}\n' for i in range(1000)), mimetype='text/plain')
+
+    @app.route('/file')
+    def file():
+        return send_file(str(path), mimetype='application/n-triples', conditional=True)
+
+    @app.route('/fail')
+    def fail():
+        raise RuntimeError('errore nella view')
+
+    return AsgiAdapter(app, threads=4), path
+
+
+def test_post_body_read_in_chunks(app):
+    adapter, _ = app
+    items = [json.dumps({'id': i}).encode() + b'\n' for i in range(50)]
+    # Le righe attraversano i confini dei messaggi ASGI
+    body = b''.join(items)
+    chunks = [body[i:i + 7] for i in range(0, len(body), 7)]
+    status, headers, bodies = call(adapter, 'POST', '/echo', b'q=caf%C3%A8',
+                                   [('content-type', 'application/x-ndjson')], chunks)
+    assert status == 200
+    data = json.loads(body_of(bodies))
+    assert data == {'items': 50, 'ids': list(range(50)), 'path': '/echo', 'arg': 'cafè'}
+
+
+def test_streaming_response(app):
+    adapter, _ = app
+    status, headers, bodies = call(adapter, 'GET', '/stream')
+    assert status == 200
+    assert len(bodies) > 2
+    assert body_of(bodies) == ''.join(f'{i}\n' for i in range(1000)).encode()
+
+
+def test_head_has_no_body(app):
+    adapter, _ = app
+    status, headers, bodies = call(adapter, 'HEAD', '/stream')
+    assert status == 200
+    assert body_of(bodies) == b''
+
+
+def test_file_and_range(app):
+    adapter, path = app
+    content = path.read_bytes()
+    status, headers, bodies = call(adapter, 'GET', '/file')
+    assert status == 200
+    assert body_of(bodies) == content
+
+    status, headers, bodies = call(adapter, 'GET', '/file', headers=[('range', 'bytes=100-299999')])
+    assert status == 206
+    assert headers['content-range'] == f'bytes 100-299999/{len(content)}'
+    assert body_of(bodies) == content[100:300000]
+
+
+def test_view_error_returns_500(app):
+    adapter, _ = app
+    status, headers, bodies = call(adapter, 'GET', '/fail')
+    assert status == 500
+    assert adapter.active == 0
+
+
+def test_lifespan():
+    events = []
+    adapter = AsgiAdapter(Flask(__name__), threads=1, on_startup=lambda: events.append('startup'),
+                          on_shutdown=lambda: events.append('shutdown'))
+    messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message['type'])
+
+    asyncio.run(adapter({'type': 'lifespan'}, receive, send))
+    assert events == ['startup', 'shutdown']
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+
+
+@pytest.fixture
+def production_app(tmp_path, monkeypatch):
+    path = tmp_path / 'kg.ttl'
+    path.write_text('<http://example.org/a> <http://example.org/p> "a" .\n')
+    monkeypatch.setattr(server, 'use_wal', False)
+    monkeypatch.setattr(server, 'use_snapshots', False)
+    server.configure_slow_query_log('none', 1000.0, 1.0, 1)
+    assert server.load_knowledge_graph(str(path))
+    return AsgiAdapter(server.app, threads=4)
+
+
+def test_production_ingest_and_query(production_app):
+    lines = [json.dumps({'contribution_id': f'point-asgi-{i}', 'text': f'testo {i}'}) for i in range(5)]
+    body = ('\n'.join(lines) + '\n').encode()
+    status, _, bodies = call(production_app, 'POST', '/api/ingest/fallacy/batch',
+                             headers=[('content-type', 'application/x-ndjson')],
+                             body_chunks=[body[:10], body[10:40], body[40:]])
+    assert status in (200, 201)
+    results = json.loads(body_of(bodies))
+    assert results['created'] == 5
+
+    query = 'SELECT ?s WHERE { ?s ?p ?o FILTER(STRSTARTS(STR(?s), "https://yourpriorities.org/point-asgi-")) }'
+    status, headers, bodies = call(production_app, 'POST', '/sparql',
+                                   headers=[('content-type', 'application/x-www-form-urlencoded'),
+                                            ('accept', 'application/sparql-results+json')],
+                                   body_chunks=[urlencode({'query': query}).encode()])
+    assert status == 200
+    rows = json.loads(body_of(bodies))['results']['bindings']
+    assert {row['s']['value'] for row in rows} == {f'https://yourpriorities.org/point-asgi-{i}' for i in range(5)}
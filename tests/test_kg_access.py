@@ -0,0 +1,128 @@
+from rdflib import Graph, Literal, Namespace, RDF, XSD
+
+import sparql_server_production as server
+from kg_access import GraphAccess
+from sparql_queries import QueryRegistry
+
+DEL = Namespace('https://w3id.org/deliberation/ontology#')
+EX = Namespace('http://example.org/')
+
+
+def sample_graph():
+    graph = Graph()
+    processes = [
+        (EX.p1, ['Bilancio partecipativo'], '2024-03-01', '2024-06-30'),
+        (EX.p2, ['Piano urbano', 'Urban plan'], '2023-01-15', None),
+        (EX.p3, ['Consultazione senza date'], None, None),
+        (EX.p4, ['Assemblea'], '2024-03-01', None),
+    ]
+    for process, names, start, end in processes:
+        graph.add((process, RDF.type, DEL.DeliberationProcess))
+        for name in names:
+            graph.add((process, DEL.name, Literal(name)))
+        if start:
+            graph.add((process, DEL.startDate, Literal(start, datatype=XSD.date)))
+        if end:
+            graph.add((process, DEL.endDate, Literal(end, datatype=XSD.date)))
+    # Un processo senza nome non compare nelle righe
+    graph.add((EX.p5, RDF.type, DEL.DeliberationProcess))
+
+    graph.add((EX.org, DEL.name, Literal('Comune')))
+    graph.add((EX.org2, DEL.name, Literal('Associazione')))
+    graph.add((EX.speaker, DEL.name, Literal('Relatore')))
+    participants = [
+        (EX.anna, 'Anna', [EX.org, EX.org2], [EX.speaker]),
+        (EX.bruno, 'Bruno', [EX.org], []),
+        (EX.carla, 'Carla', [EX.unnamed_org], [EX.speaker]),
+        (EX.dario, 'Anna', [], []),
+    ]
+    for participant, name, organizations, roles in participants:
+        graph.add((participant, RDF.type, DEL.Participant))
+        graph.add((participant, DEL.name, Literal(name)))
+        for organization in organizations:
+            graph.add((participant, DEL.isAffiliatedWith, organization))
+        for role in roles:
+            graph.add((participant, DEL.hasRole, role))
+    return graph
+
+
+def sparql_processes(graph):
+    return [{'uri': str(row[0]), 'name': str(row[1]),
+             'startDate': str(row[2]) if row[2] else None,
+             'endDate': str(row[3]) if row[3] else None}
+            for row in QueryRegistry().execute(graph, 'processes')]
+
+
+def sparql_participants(graph):
+    return [{'uri': str(row[0]), 'name': str(row[1]),
+             'organization': str(row[2]) if row[2] else None,
+             'role': str(row[3]) if row[3] else None}
+            for row in QueryRegistry().execute(graph, 'participants')]
+
+
+def assert_same_rows(rows, expected, order_key):
+    key = lambda row: sorted((k, v or '') for k, v in row.items())
+    assert sorted(rows, key=key) == sorted(expected, key=key)
+    # Stesso ordinamento della query (a parità di chiave l'ordine SPARQL non è definito)
+    assert [order_key(row) for row in rows] == [order_key(row) for row in expected]
+
+
+def process_order(row):
+    return row['startDate'] is not None, row['startDate'] or ''
+
+
+def participant_order(row):
+    return row['name']
+
+
+def assert_matches_sparql(graph, access):
+    assert_same_rows(access.processes(), sparql_processes(graph), process_order)
+    assert_same_rows(access.participants(), sparql_participants(graph), participant_order)
+
+
+def test_rows_equal_api_queries():
+    graph = sample_graph()
+    access = GraphAccess()
+    access.rebuild(graph)
+    assert len(access.processes()) == 5
+    assert len(access.participants()) == 5
+    assert_matches_sparql(graph, access)
+
+
+def test_rows_follow_ingest():
+    graph = sample_graph()
+    access = GraphAccess()
+    access.rebuild(graph)
+    # Righe ordinate già calcolate: l'ingest deve invalidarle
+    access.processes()
+    access.participants()
+
+    triples = [
+        (EX.p3, DEL.startDate, Literal('2022-05-05', datatype=XSD.date)),
+        (EX.p5, DEL.name, Literal('Nuovo nome')),
+        (EX.unnamed_org, DEL.name, Literal('Ente')),
+        (EX.bruno, DEL.hasRole, EX.speaker),
+        (EX.eva, RDF.type, DEL.Participant),
+        (EX.eva, DEL.name, Literal('Eva')),
+        (EX.speaker, DEL.name, Literal('Moderatore')),
+    ]
+    for triple in triples:
+        graph.add(triple)
+    access.record_added(graph, triples)
+    assert_matches_sparql(graph, access)
+    assert {'uri': str(EX.carla), 'name': 'Carla', 'organization': 'Ente', 'role': 'Moderatore'} \
+        in access.participants()
+
+
+def test_api_endpoints_match_sparql_engine(tmp_path, monkeypatch):
+    path = tmp_path / 'kg.nt'
+    sample_graph().serialize(str(path), format='nt', encoding='utf-8')
+    monkeypatch.setattr(server, 'use_wal', False)
+    monkeypatch.setattr(server, 'use_snapshots', False)
+    server.configure_slow_query_log('none', 1000.0, 1.0, 1)
+    assert server.load_knowledge_graph(str(path))
+    client = server.app.test_client()
+    for route, order_key in (('/api/processes', process_order), ('/api/participants', participant_order)):
+        indexed = client.get(route).get_json()
+        queried = client.get(route + '?engine=sparql').get_json()
+        assert_same_rows(indexed, queried, order_key)
@@ -0,0 +1,123 @@
+import threading
+
+import pytest
+from rdflib import BNode, Dataset, Graph, Literal, Namespace, RDF, URIRef, XSD
+from rdflib.compare import isomorphic
+
+import kg_concurrency
+from kg_concurrency import GraphSnapshot, ReadWriteLock, all_subjects, iter_all_triples, memory_index
+from kg_store import CompactStore
+
+EX = Namespace('http://example.org/')
+DEL = Namespace('https://w3id.org/deliberation/ontology#')
+
+
+def sample_graph(store='default'):
+    graph = Graph(store=CompactStore()) if store == 'compact' else Graph()
+    graph.bind('del', DEL)
+    graph.bind('ex', EX)
+    node = BNode()
+    graph.add((EX.c1, RDF.type, DEL.Contribution))
+    graph.add((EX.c1, DEL.text, Literal('testo "citato"\nsu due righe <b>', lang='it')))
+    graph.add((EX.c1, DEL.hasTimestamp, Literal('2024-01-01T10:00:00', datatype=XSD.dateTime)))
+    graph.add((EX.c1, DEL.hasConfidence, Literal(0.75, datatype=XSD.float)))
+    graph.add((EX.c1, DEL.madeBy, node))
+    graph.add((node, RDF.type, DEL.Participant))
+    graph.add((node, DEL.name, Literal('Anna & Bruno')))
+    graph.add((URIRef('http://example.org/other/x-1'), URIRef('http://example.org/other/p'), EX.c1))
+    for index in range(50):
+        graph.add((EX[f'topic-{index}'], DEL.name, Literal(f'Topic {index}')))
+    return graph
+
+
+def test_memory_index_available_on_installed_rdflib():
+    # Se fallisce, rdflib ha cambiato l'indice privato di Memory:
+    # aggiornare MEMORY_INDEX_RDFLIB_VERSIONS dopo averlo verificato
+    graph = sample_graph()
+    spo = memory_index(graph)
+    assert spo is not None
+    assert set(spo) == set(graph.subjects())
+
+
+def test_memory_index_disabled_for_other_versions(monkeypatch):
+    graph = sample_graph()
+    monkeypatch.setattr(kg_concurrency, '_MEMORY_INDEX_SUPPORTED', False)
+    assert memory_index(graph) is None
+    assert set(iter_all_triples(graph)) == set(graph)
+    assert set(all_subjects(graph)) == set(graph.subjects())
+
+
+@pytest.mark.parametrize('store', ['default', 'compact'])
+def test_iter_all_triples_and_subjects(store):
+    graph = sample_graph(store)
+    assert set(iter_all_triples(graph)) == set(graph)
+    subjects = list(all_subjects(graph))
+    assert len(subjects) == len(set(subjects))
+    assert set(subjects) == set(graph.subjects())
+
+
+def test_iter_all_triples_on_dataset():
+    dataset = Dataset(default_union=True)
+    dataset.graph(EX.g1).add((EX.a, EX.p, EX.b))
+    dataset.graph(EX.g2).add((EX.c, EX.p, EX.d))
+    assert memory_index(dataset) is None
+    assert set(iter_all_triples(dataset)) == {(EX.a, EX.p, EX.b), (EX.c, EX.p, EX.d)}
+
+
+def test_all_subjects_resumes_after_growth():
+    graph = sample_graph()
+    seen = []
+    for index, subject in enumerate(all_subjects(graph)):
+        seen.append(subject)
+        if index == 3:
+            graph.add((EX.late, DEL.name, Literal('nuovo')))
+    assert len(seen) == len(set(seen))
+    assert set(seen) == set(graph.subjects())
+
+
+@pytest.mark.parametrize('rdf_format', ['turtle', 'nt', 'json-ld', 'xml'])
+def test_snapshot_serialization_round_trip(rdf_format):
+    graph = sample_graph()
+    snapshot = GraphSnapshot(graph, version=3)
+    body = b''.join(snapshot.serialize(rdf_format))
+    parsed = Graph().parse(data=body, format=rdf_format)
+    assert isomorphic(parsed, graph)
+
+
+def test_snapshot_is_frozen(tmp_path):
+    graph = sample_graph()
+    snapshot = GraphSnapshot(graph)
+    graph.add((EX.after, DEL.name, Literal('dopo la copia')))
+    path = tmp_path / 'base.ttl'
+    snapshot.write(str(path), 'turtle')
+    parsed = Graph().parse(str(path), format='turtle')
+    assert len(parsed) == len(snapshot) == len(graph) - 1
+    assert (EX.after, None, None) not in parsed
+
+
+def test_writer_waits_for_readers():
+    lock = ReadWriteLock()
+    events = []
+    reading = threading.Event()
+    release = threading.Event()
+
+    def reader():
+        with lock.read():
+            reading.set()
+            release.wait(5)
+            events.append('read')
+
+    def writer():
+        with lock.write():
+            events.append('write')
+
+    threads = [threading.Thread(target=reader)]
+    threads[0].start()
+    reading.wait(5)
+    threads.append(threading.Thread(target=writer))
+    threads[1].start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert events == ['read', 'write']
+    assert lock.stats()['reads'] == 1 and lock.stats()['writes'] == 1
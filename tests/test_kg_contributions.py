@@ -0,0 +1,176 @@
+from rdflib import Graph, Literal, Namespace, RDF, XSD
+
+from kg_contributions import ContributionIndex
+from kg_platforms import PlatformIndex
+
+DEL = Namespace('https://w3id.org/deliberation/ontology#')
+EX = Namespace('http://example.org/')
+
+
+def add_process(graph, process, name):
+    graph.add((process, RDF.type, DEL.DeliberationProcess))
+    graph.add((process, DEL.name, Literal(name)))
+    graph.add((process, DEL.platform, Literal('Decidim')))
+
+
+def contribution_triples(contribution, process, timestamp, author=None):
+    triples = [(contribution, RDF.type, DEL.Contribution),
+               (contribution, DEL.text, Literal(f'testo {contribution}')),
+               (contribution, DEL.hasTimestamp, Literal(timestamp, datatype=XSD.dateTime)),
+               (process, DEL.hasContribution, contribution)]
+    if author is not None:
+        triples.append((contribution, DEL.madeBy, author))
+    return triples
+
+
+def build(graph):
+    platforms = PlatformIndex()
+    platforms.rebuild(graph)
+    index = ContributionIndex(platforms)
+    index.rebuild(graph)
+    return platforms, index
+
+
+def ingest(graph, platforms, index, triples):
+    for triple in triples:
+        graph.add(triple)
+    platforms.record_added(graph, triples)
+    index.record_added(graph, triples)
+
+
+def all_pages(index, limit, **filters):
+    uris, cursor = [], None
+    while True:
+        page, cursor = index.page(limit, cursor, **filters)
+        uris.extend(c['uri'] for c in page)
+        if cursor is None:
+            return uris
+
+
+def sample_graph():
+    graph = Graph()
+    add_process(graph, EX.alpha, 'Alpha')
+    add_process(graph, EX.beta, 'Beta')
+    for day in range(1, 9):
+        for process in (EX.alpha, EX.beta):
+            contribution = EX[f'{local(process)}-{day}']
+            for triple in contribution_triples(contribution, process, f'2024-03-{day:02d}T10:00:00'):
+                graph.add(triple)
+    return graph
+
+
+def local(uri):
+    return str(uri).rsplit('/', 1)[-1]
+
+
+def test_cursor_stable_across_ingest_between_pages():
+    graph = sample_graph()
+    platforms, index = build(graph)
+    before = all_pages(index, 100)
+
+    first, cursor = index.page(5)
+    assert [c['uri'] for c in first] == before[:5]
+    last = first[-1]
+    assert (last['processName'], last['timestamp']) == ('Alpha', '2024-03-05T10:00:00')
+
+    # Un contributo prima del cursore e due dopo, uno nello stesso processo
+    ingest(graph, platforms, index,
+           contribution_triples(EX['alpha-early'], EX.alpha, '2024-03-01T09:00:00')
+           + contribution_triples(EX['alpha-late'], EX.alpha, '2024-03-05T11:00:00')
+           + contribution_triples(EX['beta-late'], EX.beta, '2024-03-09T10:00:00'))
+
+    rest = []
+    while cursor is not None:
+        page, cursor = index.page(5, cursor)
+        rest.extend(c['uri'] for c in page)
+    # Nessuna voce ripetuta o saltata: i nuovi contributi dopo il cursore compaiono al loro posto
+    assert str(EX['alpha-early']) not in rest
+    expected = [uri for uri in all_pages(index, 100) if uri not in before[:5]]
+    assert rest == [uri for uri in expected if uri != str(EX['alpha-early'])]
+    assert rest[0] == str(EX['alpha-late'])
+    assert rest[-1] == str(EX['beta-late'])
+    assert len(rest) == len(before) - 5 + 2
+
+
+def test_reindexed_contribution_keeps_single_position():
+    graph = sample_graph()
+    platforms, index = build(graph)
+    cursor = index.page(3)[1]
+    # Una nuova data sposta il contributo dopo il cursore, senza duplicarlo
+    ingest(graph, platforms, index, [(EX['alpha-1'], DEL.timestamp, Literal('2024-03-20T00:00:00'))])
+    uris = []
+    while cursor is not None:
+        page, cursor = index.page(4, cursor)
+        uris.extend(c['uri'] for c in page)
+    assert uris.count(str(EX['alpha-1'])) == 1
+    assert uris.index(str(EX['alpha-1'])) == uris.index(str(EX['alpha-8'])) + 1
+    assert len(index) == 16
+
+
+def test_touched_contribution_resolved_once(monkeypatch):
+    graph = sample_graph()
+    graph.add((EX.anna, RDF.type, DEL.Participant))
+    graph.add((EX['alpha-2'], DEL.madeBy, EX.anna))
+    platforms, index = build(graph)
+    resolved = []
+    original = index._resolve
+    monkeypatch.setattr(index, '_resolve', lambda g, c: resolved.append(c) or original(g, c))
+
+    # Lo stesso contributo toccato direttamente, dal processo e dal partecipante
+    ingest(graph, platforms, index, [(EX['alpha-2'], DEL.text, Literal('aggiunto')),
+                                     (EX.alpha, DEL.name, Literal('Alpha bis')),
+                                     (EX.anna, DEL.name, Literal('Anna'))])
+    assert sorted(map(str, resolved)) == sorted(str(EX[f'alpha-{day}']) for day in range(1, 9))
+    entry = index.page(1, participant='Anna')[0][0]
+    assert entry['uri'] == str(EX['alpha-2'])
+    assert len(index) == 16
+
+
+def naive_dates(index, date_from=None, date_to=None):
+    return [uri for uri in all_pages(index, 1000)
+            if (timestamp := index._entries[uri].key[1])
+            and (not date_from or timestamp >= date_from)
+            and (not date_to or timestamp[:len(date_to)] <= date_to)]
+
+
+def test_date_filters_match_scan_across_pages():
+    graph = sample_graph()
+    contribution = EX['beta-undated']
+    graph.add((contribution, RDF.type, DEL.Contribution))
+    graph.add((EX.beta, DEL.hasContribution, contribution))
+    platforms, index = build(graph)
+    for date_from, date_to in [('2024-03-03', None), (None, '2024-03-02'), ('2024-03-03', '2024-03-05'),
+                               ('2024-03-05T10:00:00', '2024-03-05'), ('2025-01-01', None),
+                               (None, '2023-12-31')]:
+        expected = naive_dates(index, date_from, date_to)
+        for limit in (1, 2, 5):
+            assert all_pages(index, limit, date_from=date_from, date_to=date_to) == expected
+        platform = index.page(1)[0][0]['platformId']
+        assert all_pages(index, 2, date_from=date_from, date_to=date_to, platform=platform) == expected
+
+
+class CountingKeys(list):
+    reads = 0
+
+    def __getitem__(self, position):
+        CountingKeys.reads += 1
+        return super().__getitem__(position)
+
+
+def test_date_filter_bisects_instead_of_scanning():
+    graph = Graph()
+    processes = [EX[f'process{i}'] for i in range(5)]
+    for number, process in enumerate(processes):
+        add_process(graph, process, f'Processo {number}')
+        for day in range(200):
+            timestamp = f'2024-{day // 28 + 1:02d}-{day % 28 + 1:02d}T12:00:00'
+            for triple in contribution_triples(EX[f'c{number}-{day}'], process, timestamp):
+                graph.add(triple)
+    platforms, index = build(graph)
+    keys = CountingKeys(index._keys)
+    CountingKeys.reads = 0
+    matches = list(index._iter_after(keys, None, '2024-03-10', '2024-03-12'))
+    assert len(matches) == 15
+    # Poche ricerche binarie per processo invece delle 1000 chiavi
+    assert CountingKeys.reads < 200
+    assert [key[2] for key in matches] == naive_dates(index, '2024-03-10', '2024-03-12')
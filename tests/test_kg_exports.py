@@ -0,0 +1,106 @@
+import gzip
+
+import pytest
+from flask import Flask, request
+from rdflib import Graph, Literal, URIRef
+
+import kg_exports
+from kg_concurrency import GraphSnapshot, ReadWriteLock
+from kg_exports import ExportCache, stream_export
+from kg_store import CompactStore
+
+P = URIRef('http://example.org/p')
+
+
+def make_graph(store, count=3000):
+    graph = Graph(store=CompactStore()) if store == 'compact' else Graph()
+    graph.addN((URIRef(f'http://example.org/s{i}'), P, Literal(i), graph) for i in range(count))
+    return graph
+
+
+def parse_nt(body):
+    graph = Graph()
+    graph.parse(data=body.decode('utf-8'), format='nt')
+    return graph
+
+
+@pytest.mark.parametrize('store', ['memory', 'compact'])
+def test_stream_export_with_concurrent_ingest(store, monkeypatch):
+    monkeypatch.setattr(kg_exports, 'STREAM_LOCK_BATCH', 100)
+    graph = make_graph(store)
+    original = set(graph)
+    lock = ReadWriteLock()
+    chunks = []
+    added = 0
+    for chunk in stream_export(graph, 'nt', lock=lock):
+        chunks.append(chunk)
+        # Nuovi soggetti e nuove triple di soggetti esistenti tra un blocco e l'altro
+        with lock.write():
+            for _ in range(50):
+                graph.add((URIRef(f'http://example.org/new{added}'), P, Literal(added)))
+                graph.add((URIRef(f'http://example.org/s{added}'), P, Literal(f'nuovo {added}')))
+                added += 1
+    exported = set(parse_nt(b''.join(chunks)))
+    assert original <= exported
+    assert added > 0
+
+
+def test_stream_export_filters_by_prefix():
+    graph = make_graph('memory', 200)
+    body = b''.join(stream_export(graph, 'nt', subject_prefixes=('http://example.org/s1',),
+                                  lock=ReadWriteLock()))
+    subjects = {str(s) for s in parse_nt(body).subjects()}
+    assert subjects and all(s.startswith('http://example.org/s1') for s in subjects)
+
+
+def test_stream_export_error_aborts_response(monkeypatch):
+    monkeypatch.setattr(kg_exports, 'STREAM_LOCK_BATCH', 5)
+    graph = make_graph('memory', 10)
+
+    class FailingLock(ReadWriteLock):
+        calls = 0
+
+        def read(self):
+            FailingLock.calls += 1
+            if FailingLock.calls > 1:
+                raise RuntimeError('grafo non leggibile')
+            return super().read()
+
+    with pytest.raises(RuntimeError):
+        b''.join(stream_export(graph, 'nt', lock=FailingLock()))
+
+
+@pytest.fixture
+def export_app(tmp_path):
+    graph = make_graph('memory', 500)
+    cache = ExportCache(str(tmp_path), lambda: GraphSnapshot(graph), lambda: 7, delay=0)
+    cache.start()
+    assert cache.wait('nt', 30) is not None
+    app = Flask(__name__)
+
+    @app.route('/export')
+    def export():
+        return cache.response(request, cache.current('nt'))
+    return app.test_client(), graph
+
+
+def test_export_etag_and_conditional_request(export_app):
+    client, graph = export_app
+    response = client.get('/export')
+    assert response.status_code == 200
+    assert response.headers['X-Graph-Version'] == '7'
+    assert set(parse_nt(response.data)) == set(graph)
+    etag = response.headers['ETag']
+    assert client.get('/export', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_export_range_and_encoding(export_app):
+    client, _ = export_app
+    full = client.get('/export').data
+    partial = client.get('/export', headers={'Range': 'bytes=10-99'})
+    assert partial.status_code == 206
+    assert partial.data == full[10:100]
+    assert partial.headers['Content-Range'] == f'bytes 10-99/{len(full)}'
+    compressed = client.get('/export', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == full
@@ -0,0 +1,32 @@
+import pytest
+from rdflib import URIRef
+
+from kg_ingest import DEL, InvalidItem, build_fallacy_triples, validate_fallacy_item
+
+
+@pytest.mark.parametrize('contribution_id', ['point 12', 'a<b>', 'say"hi"', 'x{y}', 'a|b', 'a^b', 'a`b',
+                                             'a\\b', 'tab\tid', 'line\nid', '', ' '])
+def test_ids_that_cannot_be_iris_are_rejected(contribution_id):
+    with pytest.raises(InvalidItem):
+        validate_fallacy_item({'contribution_id': contribution_id})
+
+
+@pytest.mark.parametrize('contribution_id', ['point-12', 'a/b#c', 'proposta-città', 42])
+def test_valid_ids(contribution_id):
+    validate_fallacy_item({'contribution_id': contribution_id})
+
+
+@pytest.mark.parametrize('value, relation', [(1, DEL.supports), ('1', DEL.supports), (1.0, DEL.supports),
+                                             (-1, DEL.attacks), ('-1', DEL.attacks), (0, None), ('0.5', None)])
+def test_vote_values_are_coerced(value, relation):
+    data = {'contribution_id': 'point-1', 'post_id': 7, 'value': value}
+    validate_fallacy_item(data)
+    triples, _ = build_fallacy_triples(data)
+    predicates = {p for s, p, o in triples if o == URIRef('https://yourpriorities.org/post-7')}
+    assert (relation in predicates) if relation else not predicates & {DEL.supports, DEL.attacks}
+
+
+@pytest.mark.parametrize('value', ['contro', [1], {'v': 1}])
+def test_non_numeric_vote_values_are_rejected(value):
+    with pytest.raises(InvalidItem):
+        validate_fallacy_item({'contribution_id': 'point-1', 'value': value})
@@ -0,0 +1,30 @@
+from kg_metrics import MetricsRegistry
+
+
+def test_constant_labels_on_every_series():
+    registry = MetricsRegistry()
+    requests = registry.counter('dkg_requests_total', 'Richieste', ('route',))
+    rows = registry.histogram('dkg_rows', 'Righe', buckets=(1, 10))
+    registry.gauge('dkg_triples', 'Triple', lambda: 42)
+    requests.inc(route='/sparql')
+    rows.observe(5)
+    registry.set_constant_labels(worker=2)
+    text = registry.render()
+    assert 'dkg_requests_total{route="/sparql",worker="2"} 1' in text
+    assert 'dkg_rows_bucket{worker="2",le="10"} 1' in text
+    assert 'dkg_rows_count{worker="2"} 1' in text
+    assert 'dkg_triples{worker="2"} 42' in text
+
+
+def test_reset_clears_counters_and_histograms():
+    registry = MetricsRegistry()
+    requests = registry.counter('dkg_requests_total', 'Richieste', ('route',))
+    rows = registry.histogram('dkg_rows', 'Righe')
+    registry.gauge('dkg_triples', 'Triple', lambda: 42)
+    requests.inc(3, route='/sparql')
+    rows.observe(5)
+    registry.reset()
+    assert requests.value(route='/sparql') == 0
+    text = registry.render()
+    assert 'dkg_rows_count' not in text
+    assert 'dkg_triples 42' in text
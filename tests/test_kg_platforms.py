@@ -0,0 +1,82 @@
+from rdflib import Graph, Literal, Namespace, RDF
+
+from kg_platforms import OTHER_PLATFORM, PlatformIndex
+
+DEL = Namespace('https://w3id.org/deliberation/ontology#')
+EX = Namespace('http://example.org/')
+
+
+def sample_graph():
+    graph = Graph()
+    graph.add((EX.process, RDF.type, DEL.DeliberationProcess))
+    for number in range(3):
+        contribution = EX[f'contribution{number}']
+        graph.add((contribution, RDF.type, DEL.Contribution))
+        graph.add((EX.process, DEL.hasContribution, contribution))
+        graph.add((contribution, DEL.madeBy, EX.anna))
+    graph.add((EX.anna, RDF.type, DEL.Participant))
+    graph.add((EX.loose, RDF.type, DEL.Contribution))
+    graph.add((EX.loose, DEL.madeBy, EX.bruno))
+    graph.add((EX.bruno, RDF.type, DEL.Participant))
+    return graph
+
+
+def build(graph):
+    index = PlatformIndex()
+    index.rebuild(graph)
+    return index
+
+
+def ingest(graph, index, triples):
+    for triple in triples:
+        graph.add(triple)
+    index.record_added(graph, triples)
+
+
+def assert_matches_rebuild(graph, index):
+    fresh = build(graph)
+    for entity in set(graph.subjects(RDF.type, None)):
+        assert index.platform_of(entity) == fresh.platform_of(entity), entity
+    assert index.platforms() == fresh.platforms()
+
+
+def test_explicit_platform_propagates_to_contributions_and_participants():
+    graph = sample_graph()
+    index = build(graph)
+    assert index.platform_of(EX.contribution0) == OTHER_PLATFORM
+
+    ingest(graph, index, [(EX.process, DEL.platform, Literal('Decide Madrid'))])
+    assert index.platform_of(EX.process) == 'decidemadrid'
+    assert {index.platform_of(EX[f'contribution{n}']) for n in range(3)} == {'decidemadrid'}
+    assert index.platform_of(EX.anna) == 'decidemadrid'
+    assert index.platform_of(EX.bruno) == OTHER_PLATFORM
+    counts = {p['id']: p for p in index.platforms()}
+    assert (counts['decidemadrid']['count'], counts['decidemadrid']['processes'],
+            counts['decidemadrid']['participants']) == (3, 1, 1)
+    assert_matches_rebuild(graph, index)
+
+
+def test_process_name_resolves_platform():
+    graph = sample_graph()
+    index = build(graph)
+    ingest(graph, index, [(EX.process, DEL.name, Literal('European Parliament plenary'))])
+    assert index.platform_of(EX.contribution2) == 'ep_debate'
+    assert index.platform_of(EX.anna) == 'ep_debate'
+    assert_matches_rebuild(graph, index)
+
+
+def test_new_link_moves_contribution_and_author():
+    graph = sample_graph()
+    graph.add((EX.process, DEL.platform, Literal('Habermas Machine')))
+    index = build(graph)
+    assert index.platform_of(EX.loose) == OTHER_PLATFORM
+
+    ingest(graph, index, [(EX.loose, DEL.partOf, EX.process)])
+    assert index.platform_of(EX.loose) == 'habermas'
+    assert index.platform_of(EX.bruno) == 'habermas'
+    assert_matches_rebuild(graph, index)
+
+    # Il valore esplicito sul contributo prevale sul processo
+    ingest(graph, index, [(EX.loose, DEL.platform, Literal('Your Priorities'))])
+    assert index.platform_of(EX.loose) == 'yourpriorities'
+    assert_matches_rebuild(graph, index)
@@ -0,0 +1,166 @@
+import threading
+import time
+
+import pytest
+from rdflib import URIRef
+
+import sparql_server_production as server
+from kg_reload import FileWatcher
+
+COUNT_QUERY = 'SELECT (COUNT(*) AS ?n) WHERE { ?s ?p ?o }'
+
+
+def write_kg(path, prefix, count):
+    with open(path, 'w') as f:
+        for i in range(count):
+            f.write(f'<http://example.org/{prefix}{i}> <http://example.org/p> "{prefix} {i}" .\n')
+
+
+@pytest.fixture
+def kg_file(tmp_path, monkeypatch):
+    path = str(tmp_path / 'kg.ttl')
+    write_kg(path, 'old', 200)
+    monkeypatch.setattr(server, 'use_wal', True)
+    monkeypatch.setattr(server, 'use_snapshots', False)
+    server.configure_slow_query_log('none', 1000.0, 1.0, 1)
+    assert server.load_knowledge_graph(path)
+    yield path
+    server.reloader.wait(60)
+    if server.write_log is not None:
+        server.write_log.close()
+        server.write_log = None
+
+
+def test_reload_keeps_concurrent_ingests(kg_file, monkeypatch):
+    client = server.app.test_client()
+    ingested = []
+    errors = []
+    stop = threading.Event()
+    progress = threading.Condition()
+
+    def ingest(worker):
+        i = 0
+        while not stop.is_set():
+            contribution_id = f'point-{worker}-{i}'
+            response = client.post('/api/ingest/fallacy', json={'contribution_id': contribution_id, 'text': 'x'})
+            if response.status_code != 201:
+                errors.append(response.data)
+            with progress:
+                ingested.append(contribution_id)
+                progress.notify_all()
+            response = client.get('/sparql', query_string={'query': COUNT_QUERY, 'format': 'json'})
+            if response.status_code != 200:
+                errors.append(response.data)
+            i += 1
+
+    # Il caricamento del nuovo grafo termina solo dopo altri ingest sul grafo in uso
+    build = server.build_knowledge_graph
+
+    def slow_build(*args, **kwargs):
+        loaded = build(*args, **kwargs)
+        with progress:
+            target = len(ingested) + 10
+            assert progress.wait_for(lambda: len(ingested) >= target, 30)
+        return loaded
+
+    monkeypatch.setattr(server, 'build_knowledge_graph', slow_build)
+    write_kg(kg_file, 'new', 300)
+
+    threads = [threading.Thread(target=ingest, args=(worker,)) for worker in range(3)]
+    for thread in threads:
+        thread.start()
+    response = client.post('/admin/reload')
+    assert response.status_code == 202
+    assert client.post('/admin/reload').status_code == 409
+    assert server.reloader.wait(60)
+    with progress:
+        progress.wait_for(lambda: len(ingested) >= 5, 30)
+    stop.set()
+    for thread in threads:
+        thread.join(30)
+
+    assert errors == []
+    status = client.get('/admin/reload').get_json()
+    assert status['state'] == 'ok'
+    # Scritture arrivate durante il caricamento, riapplicate al nuovo grafo
+    assert status['backlogTriples'] > 0
+    graph = server.knowledge_graph
+    assert (URIRef('http://example.org/new299'), None, None) in graph
+    assert (URIRef('http://example.org/old0'), None, None) not in graph
+    missing = [c for c in ingested if (URIRef(f'https://yourpriorities.org/{c}'), None, None) not in graph]
+    assert missing == []
+    assert server.graph_stats.triples == len(graph)
+    body = client.get('/sparql', query_string={'query': COUNT_QUERY, 'format': 'json'}).get_json()
+    assert int(body['results']['bindings'][0]['n']['value']) == len(graph)
+
+
+def test_file_watcher_waits_for_a_stable_signature(kg_file):
+    started = []
+    watcher = FileWatcher(server.current_base_files, lambda: server.base_files_signature,
+                          lambda: started.append(True) or True)
+    assert not watcher.check() and not watcher.check()
+    time.sleep(0.01)
+    write_kg(kg_file, 'replaced', 50)
+    # Prima osservazione della nuova firma: il file potrebbe essere ancora in scrittura
+    assert not watcher.check()
+    assert watcher.check()
+    # Stessa firma: nessun secondo ricaricamento
+    assert not watcher.check()
+    assert started == [True]
+
+
+def test_reload_ignores_snapshot_of_replaced_file(tmp_path, monkeypatch):
+    import os
+
+    from kg_snapshot import snapshot_path
+
+    path = str(tmp_path / 'kg.ttl')
+    write_kg(path, 'old', 20)
+    monkeypatch.setattr(server, 'use_wal', True)
+    monkeypatch.setattr(server, 'use_snapshots', True)
+    server.configure_slow_query_log('none', 1000.0, 1.0, 1)
+    try:
+        assert server.load_knowledge_graph(path)
+        assert os.path.exists(snapshot_path(path))
+
+        # Nuova build con la data originale, più vecchia dello snapshot (mv, rsync -a)
+        build = str(tmp_path / 'build.ttl')
+        write_kg(build, 'new', 30)
+        old_time = os.path.getmtime(snapshot_path(path)) - 3600
+        os.utime(build, (old_time, old_time))
+        os.replace(build, path)
+
+        watcher = FileWatcher(server.current_base_files, lambda: server.base_files_signature,
+                              lambda: server.reloader.start('watch'))
+        assert not watcher.check()
+        assert watcher.check()
+        assert server.reloader.wait(60)
+        assert server.reloader.status()['state'] == 'ok'
+        graph = server.knowledge_graph
+        assert (URIRef('http://example.org/new29'), None, None) in graph
+        assert (URIRef('http://example.org/old0'), None, None) not in graph
+        # Lo snapshot riscritto per la nuova build non avvia un altro ricaricamento
+        assert not watcher.check() and not watcher.check()
+    finally:
+        server.reloader.wait(60)
+        if server.write_log is not None:
+            server.write_log.close()
+            server.write_log = None
+
+
+def test_reload_requires_admin_access(kg_file, monkeypatch):
+    client = server.app.test_client()
+    remote = {'REMOTE_ADDR': '203.0.113.7'}
+    assert client.post('/admin/reload', environ_base=remote).status_code == 403
+    # Attraverso un reverse proxy locale la connessione arriva dal loopback
+    assert client.post('/admin/reload', headers={'X-Forwarded-For': '203.0.113.7'}).status_code == 403
+    assert client.post('/dkg/admin/reload').status_code == 404
+    assert server.reloader.status()['state'] != 'running'
+
+    monkeypatch.setattr(server, 'admin_token', 's3greto')
+    assert client.post('/admin/reload').status_code == 401
+    assert client.get('/admin/reload', headers={'Authorization': 'Bearer altro'}).status_code == 401
+    response = client.post('/admin/reload', environ_base=remote,
+                           headers={'Authorization': 'Bearer s3greto', 'X-Forwarded-For': '203.0.113.7'})
+    assert response.status_code == 202
+    assert server.reloader.wait(60)
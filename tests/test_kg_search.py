@@ -0,0 +1,104 @@
+import pytest
+from rdflib import Graph, Literal, Namespace, RDF
+
+import kg_search
+import sparql_server_production as server
+from kg_platforms import PlatformIndex
+from kg_search import SearchIndex
+
+DEL = Namespace('https://w3id.org/deliberation/ontology#')
+EX = Namespace('http://example.org/')
+
+
+def contribution(graph, name, text=None, subject=None):
+    subject = subject or EX[name]
+    graph.add((subject, RDF.type, DEL.Contribution))
+    graph.add((subject, DEL.name, Literal(name)))
+    if text is not None:
+        graph.add((subject, DEL.text, Literal(text)))
+    return subject
+
+
+def build(graph, **options):
+    platforms = PlatformIndex()
+    platforms.rebuild(graph)
+    index = SearchIndex(platforms, **options)
+    index.rebuild(graph)
+    return index
+
+
+def uris(results):
+    return [result['uri'] for result in results]
+
+
+def test_bm25_ranking():
+    graph = Graph()
+    contribution(graph, 'bilancio', 'Proposta sul trasporto pubblico')
+    contribution(graph, 'trasporto', 'Proposta di revisione')
+    contribution(graph, 'lungo', 'trasporto ' + 'parole diverse in un testo lungo ' * 20)
+    contribution(graph, 'scuola', 'Proposta sulla scuola')
+    index = build(graph)
+
+    # Il nome pesa più del testo, un testo lungo diluisce il termine
+    assert uris(index.search('trasporto')) == [str(EX.trasporto), str(EX.bilancio), str(EX.lungo)]
+    # Tutti i termini devono comparire; il termine raro pesa più di quello comune
+    assert uris(index.search('proposta scuola')) == [str(EX.scuola)]
+    scores = {r['uri']: r['score'] for r in index.search('proposta')}
+    rare = index.search('scuola')[0]['score']
+    assert rare > scores[str(EX.scuola)]
+    # Parole vuote e accenti non contano
+    assert uris(index.search('SCUÒLA della')) == [str(EX.scuola)]
+
+
+def test_prefix_expansion_capped():
+    graph = Graph()
+    for word in ['parco', 'parcheggio', 'parete', 'partito', 'parola']:
+        contribution(graph, word)
+    index = build(graph, max_prefix_expansion=3)
+
+    # Termini ordinati: parcheggio, parco, parete | parola, partito oltre il limite
+    assert set(uris(index.search('par*'))) == {str(EX.parcheggio), str(EX.parco), str(EX.parete)}
+    assert index.stats()['truncatedPrefixExpansions'] == 1
+    # Un prefisso entro il limite non viene contato
+    assert set(uris(index.search('parc*'))) == {str(EX.parcheggio), str(EX.parco)}
+    assert index.stats()['truncatedPrefixExpansions'] == 1
+
+
+def test_removed_documents_compacted(monkeypatch):
+    monkeypatch.setattr(kg_search, 'COMPACT_MIN_REMOVED', 4)
+    graph = Graph()
+    subjects = [contribution(graph, f'voce{i}', 'testo iniziale') for i in range(10)]
+    index = build(graph)
+
+    for round_ in range(3):
+        triples = [(s, DEL.text, Literal(f'aggiornamento {round_}')) for s in subjects[:6]]
+        for triple in triples:
+            graph.add(triple)
+        index.record_added(graph, triples)
+        if round_ == 0:
+            # Prima della compattazione le occorrenze dei documenti rimossi sono ignorate
+            assert index.stats()['removedDocuments'] == 6
+            assert index.stats()['compactions'] == 0
+            assert len(index.search('testo', limit=100)) == 10
+
+    stats = index.stats()
+    assert stats['compactions'] >= 1
+    assert stats['documents'] == 10
+    assert stats['removedDocuments'] <= max(4, stats['documents'])
+    # Dopo la rinumerazione ogni documento è ancora trovato una sola volta
+    assert sorted(uris(index.search('aggiornamento', limit=100))) == sorted(str(s) for s in subjects[:6])
+    assert len(index.search('testo', limit=100)) == 10
+    assert uris(index.search('voce7')) == [str(subjects[7])]
+
+
+def test_search_counters_exported(monkeypatch):
+    graph = Graph()
+    for word in ['parco', 'parete']:
+        contribution(graph, word)
+    index = build(graph, max_prefix_expansion=1)
+    index.search('par*')
+    monkeypatch.setattr(server, 'search_index', index)
+    text = server.metrics.render()
+    assert 'dkg_search_truncated_prefix_expansions_total 1' in text
+    assert 'dkg_search_compactions_total 0' in text
+    assert 'dkg_search_documents 2' in text
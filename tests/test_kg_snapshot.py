@@ -0,0 +1,94 @@
+import os
+
+from rdflib import BNode, Graph, Literal, Namespace, URIRef, XSD
+from rdflib.compare import isomorphic
+
+from kg_snapshot import (Snapshot, load_snapshot, read_header, snapshot_is_fresh, snapshot_path,
+                         source_info, write_snapshot)
+
+EX = Namespace('http://example.org/')
+
+
+def sample_graph():
+    graph = Graph()
+    graph.bind('ex', EX)
+    node = BNode()
+    graph.add((EX.a, EX.text, Literal('testo àèì\n"citato"', lang='it')))
+    graph.add((EX.a, EX.when, Literal('2024-01-01T10:00:00', datatype=XSD.dateTime)))
+    graph.add((EX.a, EX.score, Literal(0.5)))
+    graph.add((EX.a, EX.madeBy, node))
+    graph.add((node, EX.name, Literal('Anna')))
+    graph.add((EX.b, EX.link, EX.a))
+    return graph
+
+
+def write_kg(path, subject):
+    with open(path, 'w') as f:
+        f.write(f'<http://x/{subject}> <http://x/p> "{subject}" .\n')
+
+
+def test_round_trip(tmp_path):
+    graph = sample_graph()
+    snap_file = str(tmp_path / 'kg.ttl.snap')
+    stats = write_snapshot(graph, snap_file)
+    assert stats['triples'] == len(graph)
+    loaded = load_snapshot(snap_file)
+    assert isomorphic(loaded, graph)
+    assert dict(loaded.namespaces())['ex'] == URIRef(str(EX))
+    with Snapshot(snap_file) as snapshot:
+        assert snapshot.header['terms'] == stats['terms']
+
+
+def test_fresh_only_for_the_recorded_source(tmp_path):
+    kg_file = str(tmp_path / 'kg.ttl')
+    write_kg(kg_file, 'old')
+    snap_file = snapshot_path(kg_file)
+    assert not snapshot_is_fresh(kg_file)
+    write_snapshot(Graph().parse(kg_file), snap_file, source=source_info(kg_file))
+    assert snapshot_is_fresh(kg_file)
+    assert read_header(snap_file)['source']['size'] == os.path.getsize(kg_file)
+
+
+def test_replacement_with_older_mtime_is_stale(tmp_path):
+    kg_file = str(tmp_path / 'kg.ttl')
+    write_kg(kg_file, 'old')
+    write_snapshot(Graph().parse(kg_file), snapshot_path(kg_file), source=source_info(kg_file))
+
+    # Deploy che conserva la data della build (mv, rsync -a, cp -p)
+    build = str(tmp_path / 'build.ttl')
+    write_kg(build, 'new')
+    old_time = os.path.getmtime(snapshot_path(kg_file)) - 3600
+    os.utime(build, (old_time, old_time))
+    os.replace(build, kg_file)
+    assert os.path.getmtime(kg_file) < os.path.getmtime(snapshot_path(kg_file))
+    assert not snapshot_is_fresh(kg_file)
+
+
+def test_snapshot_without_source_is_stale(tmp_path):
+    kg_file = str(tmp_path / 'kg.ttl')
+    write_kg(kg_file, 'old')
+    write_snapshot(Graph().parse(kg_file), snapshot_path(kg_file))
+    assert not snapshot_is_fresh(kg_file)
+
+
+def test_server_restart_after_older_mtime_deploy(tmp_path, monkeypatch):
+    import sparql_server_production as server
+
+    monkeypatch.setattr(server, 'use_wal', False)
+    monkeypatch.setattr(server, 'use_snapshots', True)
+    server.configure_slow_query_log('none', 1000.0, 1.0, 1)
+    kg_file = str(tmp_path / 'kg.ttl')
+    write_kg(kg_file, 'old')
+    assert server.load_knowledge_graph(kg_file)
+    assert snapshot_is_fresh(kg_file)
+
+    build = str(tmp_path / 'build.ttl')
+    write_kg(build, 'new')
+    old_time = os.path.getmtime(snapshot_path(kg_file)) - 3600
+    os.utime(build, (old_time, old_time))
+    os.replace(build, kg_file)
+    assert server.load_knowledge_graph(kg_file)
+    assert (URIRef('http://x/new'), None, None) in server.knowledge_graph
+    assert (URIRef('http://x/old'), None, None) not in server.knowledge_graph
+    # Lo snapshot è stato riscritto per il nuovo file
+    assert snapshot_is_fresh(kg_file)
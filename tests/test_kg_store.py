@@ -0,0 +1,133 @@
+import random
+import threading
+
+import pytest
+from rdflib import Graph, Literal, URIRef
+
+import kg_store
+from kg_store import CompactStore
+
+QUERY = '''
+SELECT ?s ?label (COUNT(?o) AS ?n) WHERE {
+  ?s <http://example.org/p0> ?o .
+  OPTIONAL { ?s <http://example.org/p1> ?label }
+} GROUP BY ?s ?label ORDER BY ?s ?label
+'''
+
+
+def term(rng):
+    kind = rng.random()
+    if kind < 0.6:
+        return URIRef(f'http://example.org/n{rng.randrange(60)}')
+    return Literal(f'valore {rng.randrange(40)}', lang='it' if kind < 0.8 else None)
+
+
+def random_triple(rng):
+    return (URIRef(f'http://example.org/n{rng.randrange(60)}'),
+            URIRef(f'http://example.org/p{rng.randrange(5)}'), term(rng))
+
+
+def patterns(rng, count=30):
+    for _ in range(count):
+        s, p, o = random_triple(rng)
+        yield from [(s, None, None), (s, p, None), (None, p, o), (None, None, o), (s, None, o),
+                    (None, p, None), (s, p, o)]
+    yield (None, None, None)
+
+
+def assert_equivalent(compact, memory, rng):
+    assert len(compact) == len(memory)
+    for pattern in patterns(rng):
+        found = list(compact.triples(pattern))
+        assert len(found) == len(set(found))
+        assert set(found) == set(memory.triples(pattern)), pattern
+    subjects = list(compact.store.subjects())
+    assert len(subjects) == len(set(subjects))
+    assert set(subjects) == set(memory.subjects())
+    assert list(compact.query(QUERY)) == list(memory.query(QUERY))
+
+
+@pytest.fixture(params=[True, False], ids=['background', 'sync'])
+def graphs(request, monkeypatch):
+    monkeypatch.setattr(kg_store, 'DELTA_MIN', 25)
+    rng = random.Random(7)
+    compact = Graph(store=CompactStore(background_merge=request.param))
+    memory = Graph()
+    for _ in range(400):
+        triple = random_triple(rng)
+        compact.add(triple)
+        memory.add(triple)
+    return compact, memory, rng
+
+
+def test_equivalent_after_load(graphs):
+    compact, memory, rng = graphs
+    assert_equivalent(compact, memory, rng)
+
+
+def test_equivalent_through_adds_removes_and_merges(graphs):
+    compact, memory, rng = graphs
+    len(compact)
+    for step in range(600):
+        triple = random_triple(rng)
+        if rng.random() < 0.3:
+            pattern = rng.choice([triple, (triple[0], None, None), (None, triple[1], triple[2])])
+            compact.remove(pattern)
+            memory.remove(pattern)
+        else:
+            compact.add(triple)
+            memory.add(triple)
+        if step % 50 == 0:
+            assert_equivalent(compact, memory, rng)
+    assert compact.store.wait_merge(30)
+    assert compact.store.merges > 0
+    assert_equivalent(compact, memory, rng)
+
+
+def test_reads_and_writes_during_background_merge(monkeypatch):
+    monkeypatch.setattr(kg_store, 'DELTA_MIN', 25)
+    rng = random.Random(11)
+    compact = Graph(store=CompactStore())
+    memory = Graph()
+    for _ in range(300):
+        triple = random_triple(rng)
+        compact.add(triple)
+        memory.add(triple)
+    len(compact)
+
+    release = threading.Event()
+    build_base = kg_store._build_base
+
+    def slow_build(spo, run_size=None):
+        release.wait(30)
+        return build_base(spo, run_size)
+
+    monkeypatch.setattr(kg_store, '_build_base', slow_build)
+    while compact.store.stats()['merging'] is False:
+        triple = random_triple(rng)
+        compact.add(triple)
+        memory.add(triple)
+
+    # La fusione è ferma: scritture e letture vedono base + delta in fusione + delta nuovo
+    frozen = list(memory)[:20]
+    for triple in frozen[:10]:
+        compact.remove(triple)
+        memory.remove(triple)
+    for _ in range(20):
+        triple = random_triple(rng)
+        compact.add(triple)
+        memory.add(triple)
+    for triple in frozen[:5]:
+        compact.add(triple)
+        memory.add(triple)
+    assert compact.store.stats()['merging']
+    assert_equivalent(compact, memory, rng)
+
+    subjects = compact.store.subjects()
+    first = next(subjects)
+    release.set()
+    assert compact.store.wait_merge(30)
+    rest = list(subjects)
+    assert len([first] + rest) == len(set([first] + rest))
+    assert compact.store.merges == 1
+    assert_equivalent(compact, memory, rng)
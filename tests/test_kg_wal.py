@@ -0,0 +1,118 @@
+import os
+
+import pytest
+from rdflib import Graph, Literal, URIRef
+
+import sparql_server_production as server
+from kg_wal import REJECTED_SUFFIX, WriteAheadLog, iter_records, wal_path
+
+P = URIRef('http://example.org/p')
+
+
+def triple(i):
+    return URIRef(f'http://example.org/s{i}'), P, Literal(f'valore "{i}"\nriga', lang='it')
+
+
+def test_append_and_replay(tmp_path):
+    log = WriteAheadLog(str(tmp_path / 'kg.ttl.wal')).open()
+    log.append([triple(1), triple(2)])
+    log.append([triple(3)])
+    log.close()
+    graph = Graph()
+    assert WriteAheadLog(log.path).replay(graph) == 2
+    assert set(graph) == {triple(1), triple(2), triple(3)}
+
+
+def test_crash_during_append_discards_partial_record(tmp_path):
+    log = WriteAheadLog(str(tmp_path / 'kg.ttl.wal')).open()
+    log.append([triple(1)])
+    log.close()
+    with open(log.path, 'ab') as f:
+        # Lotto interrotto prima della riga di commit, ultima riga troncata
+        f.write(b'<http://example.org/s2> <http://example.org/p> "x" .\n<http://example.org/s3> <ht')
+    graph = Graph()
+    assert WriteAheadLog(log.path).replay(graph) == 1
+    assert set(graph) == {triple(1)}
+    reopened = WriteAheadLog(log.path).open()
+    reopened.append([triple(4)])
+    reopened.close()
+    graph = Graph()
+    WriteAheadLog(log.path).replay(graph)
+    assert set(graph) == {triple(1), triple(4)}
+
+
+def test_compaction_keeps_rotated_records_until_finished(tmp_path):
+    log = WriteAheadLog(str(tmp_path / 'kg.ttl.wal')).open()
+    log.append([triple(1)])
+    log.rotate()
+    log.append([triple(2)])
+    graph = Graph()
+    WriteAheadLog(log.path).replay(graph)
+    assert set(graph) == {triple(1), triple(2)}
+    log.finish_compaction()
+    graph = Graph()
+    WriteAheadLog(log.path).replay(graph)
+    assert set(graph) == {triple(2)}
+    log.close()
+
+
+def test_append_rejects_invalid_iri(tmp_path):
+    log = WriteAheadLog(str(tmp_path / 'kg.ttl.wal')).open()
+    with pytest.raises(ValueError):
+        log.append([(URIRef('https://yourpriorities.org/point 12'), P, Literal('x'))])
+    log.close()
+    assert os.path.getsize(log.path) == 0
+
+
+def test_unreadable_record_is_set_aside(tmp_path):
+    path = str(tmp_path / 'kg.ttl.wal')
+    log = WriteAheadLog(path).open()
+    log.append([triple(1)])
+    log.close()
+    # Lotto scritto da una versione che non validava gli IRI
+    with open(path, 'ab') as f:
+        f.write(b'<https://yourpriorities.org/point 12> <http://example.org/p> "x" .\n# commit 1\n')
+    log = WriteAheadLog(path).open()
+    log.append([triple(2)])
+    log.close()
+
+    graph = Graph()
+    assert WriteAheadLog(path).replay(graph) == 2
+    assert set(graph) == {triple(1), triple(2)}
+    assert len(list(iter_records(path + REJECTED_SUFFIX))) == 1
+    assert len(list(iter_records(path))) == 2
+    # Il log riparato non produce più scarti
+    WriteAheadLog(path).replay(Graph())
+    assert len(list(iter_records(path + REJECTED_SUFFIX))) == 1
+
+
+@pytest.fixture
+def kg_file(tmp_path, monkeypatch):
+    path = tmp_path / 'kg.ttl'
+    path.write_text('<http://example.org/a> <http://example.org/p> "a" .\n')
+    monkeypatch.setattr(server, 'use_wal', True)
+    monkeypatch.setattr(server, 'use_snapshots', False)
+    server.configure_slow_query_log('none', 1000.0, 1.0, 1)
+    yield str(path)
+    if server.write_log is not None:
+        server.write_log.close()
+        server.write_log = None
+
+
+def test_invalid_id_ingest_then_restart(kg_file):
+    assert server.load_knowledge_graph(kg_file)
+    client = server.app.test_client()
+    response = client.post('/api/ingest/fallacy', json={'contribution_id': 'point 12', 'text': 'x'})
+    assert response.status_code == 400
+    response = client.post('/api/ingest/fallacy', json={'contribution_id': 'point-13', 'text': 'x'})
+    assert response.status_code == 201
+
+    # Riavvio con un lotto illeggibile lasciato da una versione precedente
+    with open(wal_path(kg_file), 'ab') as f:
+        f.write(b'<https://yourpriorities.org/point 12> <http://example.org/p> "x" .\n# commit 1\n')
+    assert server.load_knowledge_graph(kg_file)
+    assert (URIRef('https://yourpriorities.org/point-13'), None, None) in server.knowledge_graph
+    assert os.path.exists(wal_path(kg_file) + REJECTED_SUFFIX)
+    assert server.compact_knowledge_graph()
+    assert server.load_knowledge_graph(kg_file)
+    assert (URIRef('https://yourpriorities.org/point-13'), None, None) in server.knowledge_graph
@@ -0,0 +1,93 @@
+import json
+import threading
+
+import pytest
+from rdflib import Graph, Literal, URIRef
+
+import sparql_server_production as server
+from sparql_results import count_rows
+
+P = URIRef('http://example.org/p')
+ROWS = 3000
+SELECT = 'SELECT ?s ?o WHERE { ?s <http://example.org/p> ?o }'
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    graph = Graph()
+    for i in range(ROWS):
+        graph.add((URIRef(f'http://example.org/s{i}'), P, Literal(f'valore {i}')))
+    path = tmp_path / 'kg.ttl'
+    graph.serialize(str(path), format='nt')
+    monkeypatch.setattr(server, 'use_wal', False)
+    monkeypatch.setattr(server, 'use_snapshots', False)
+    monkeypatch.setattr(server, 'query_pool', None)
+    monkeypatch.setattr(server, 'sparql_lock_batch', 100)
+    server.configure_slow_query_log('none', 1000.0, 1.0, 1)
+    assert server.load_knowledge_graph(str(path))
+    server.sparql_cache.clear()
+    yield server.app.test_client()
+    server.sparql_cache.clear()
+
+
+def ingest(triples):
+    with server.graph_lock.write():
+        server.add_to_graph(triples)
+    server.mark_graph_modified()
+
+
+def test_large_select_streams_rows_outside_the_lock(client, monkeypatch):
+    counters = []
+
+    def spy(rows, counted):
+        counters.append(counted)
+        return count_rows(rows, counted)
+
+    monkeypatch.setattr(server, 'count_rows', spy)
+    response = client.get('/sparql', query_string={'query': SELECT, 'format': 'json'},
+                          buffered=False)
+    assert response.status_code == 200
+    chunks = iter(response.response)
+    body = [next(chunks)]
+    # Al primo blocco inviato solo una parte delle righe è stata valutata
+    assert 0 < counters[0][0] < ROWS
+
+    # Tra un blocco e l'altro il lock di lettura è libero: l'ingest non attende la fine
+    writer = threading.Thread(target=ingest, args=([(URIRef('http://example.org/new'),
+                                                     URIRef('http://example.org/q'), Literal('x'))],))
+    writer.start()
+    writer.join(timeout=5)
+    assert not writer.is_alive()
+
+    body.extend(chunks)
+    response.close()
+    bindings = json.loads(b''.join(body))['results']['bindings']
+    assert len(bindings) == ROWS == counters[0][0]
+    # La risposta ha attraversato un ingest: non viene memorizzata in cache
+    assert server.sparql_cache.stats()['entries'] == 0
+
+
+def test_unchanged_graph_response_is_cached(client):
+    first = client.get('/sparql', query_string={'query': SELECT, 'format': 'json'})
+    body = first.get_data()
+    second = client.get('/sparql', query_string={'query': SELECT, 'format': 'json'})
+    assert first.headers['X-Cache'] == 'MISS'
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.get_data() == body
+
+
+def test_cache_clear_requires_admin_access(client, monkeypatch):
+    client.get('/sparql', query_string={'query': SELECT, 'format': 'json'}).get_data()
+    remote = {'REMOTE_ADDR': '203.0.113.7'}
+    assert client.get('/dkg/api/sparql/cache', environ_base=remote).get_json()['entries'] == 1
+    assert client.delete('/api/sparql/cache', environ_base=remote).status_code == 403
+    assert client.delete('/api/sparql/cache', headers={'Forwarded': 'for=203.0.113.7'}).status_code == 403
+    assert client.delete('/dkg/api/sparql/cache').status_code == 405
+    assert server.sparql_cache.stats()['entries'] == 1
+
+    monkeypatch.setattr(server, 'admin_token', 's3greto')
+    assert client.delete('/api/sparql/cache').status_code == 401
+    response = client.delete('/api/sparql/cache', environ_base=remote,
+                             headers={'Authorization': 'Bearer s3greto'})
+    assert response.status_code == 200
+    assert response.get_json()['entries'] == 0
@@ -0,0 +1,73 @@
+from urllib.parse import quote
+
+import pytest
+from rdflib import Graph, Literal, Namespace, RDF, URIRef
+
+import sparql_server_production as server
+from sparql_queries import API_QUERIES, QueryRegistry
+
+DEL = Namespace('https://w3id.org/deliberation/ontology#')
+RES = Namespace('https://w3id.org/deliberation/resource/')
+
+INJECTIONS = [
+    'c1> ?p ?o } UNION { ?contribution ?p ?o',
+    'c1> . ?contribution ?p ?o } #',
+    '" } UNION { ?s ?p ?o } #',
+    '?contribution',
+]
+
+
+@pytest.fixture
+def graph():
+    graph = Graph()
+    for number in (1, 2):
+        contribution = RES[f'c{number}']
+        graph.add((contribution, RDF.type, DEL.Contribution))
+        graph.add((contribution, DEL.text, Literal(f'testo {number}')))
+    return graph
+
+
+def test_api_queries_compiled_once():
+    registry = QueryRegistry()
+    assert all(name in registry for name in API_QUERIES)
+    assert registry.text('processes') == API_QUERIES['processes']
+    with pytest.raises(Exception):
+        registry.register('broken', 'SELECT ?s WHERE { ?s ')
+
+
+def test_parameter_bound_as_term(graph):
+    registry = QueryRegistry()
+    rows = registry.execute(graph, 'contribution_detail', contribution=RES.c1)
+    assert sorted((str(p), str(o)) for p, o in rows) == sorted([(str(DEL.text), 'testo 1'),
+                                                                (str(RDF.type), str(DEL.Contribution))])
+    # Senza parametro la stessa query compilata restituisce tutto il grafo
+    assert len(registry.execute(graph, 'contribution_detail')) == len(graph)
+    stats = registry.stats()['contribution_detail']
+    assert (stats['calls'], stats['rows'], stats['errors']) == (2, 2 + len(graph), 0)
+
+
+@pytest.mark.parametrize('value', INJECTIONS)
+@pytest.mark.parametrize('term', [URIRef, Literal])
+def test_injected_text_never_changes_the_query(graph, value, term):
+    registry = QueryRegistry()
+    assert registry.execute(graph, 'contribution_detail', contribution=term(str(RES) + value)) == []
+    assert registry.execute(graph, 'contribution_detail', contribution=term(value)) == []
+    # La query compilata resta la stessa per le richieste successive
+    assert len(registry.execute(graph, 'contribution_detail', contribution=RES.c2)) == 2
+
+
+@pytest.mark.parametrize('value', INJECTIONS)
+def test_contribution_detail_endpoint_binds_the_id(tmp_path, monkeypatch, graph, value):
+    path = tmp_path / 'kg.nt'
+    graph.serialize(str(path), format='nt', encoding='utf-8')
+    monkeypatch.setattr(server, 'use_wal', False)
+    monkeypatch.setattr(server, 'use_snapshots', False)
+    server.configure_slow_query_log('none', 1000.0, 1.0, 1)
+    assert server.load_knowledge_graph(str(path))
+    client = server.app.test_client()
+
+    body = client.get('/api/contribution/c1?engine=sparql').get_json()
+    assert body['properties'] == {'type': str(DEL.Contribution), 'text': 'testo 1'}
+    response = client.get('/api/contribution/' + quote(value, safe='') + '?engine=sparql')
+    assert response.status_code == 200
+    assert response.get_json()['properties'] == {}
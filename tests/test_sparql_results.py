@@ -0,0 +1,156 @@
+import io
+import json
+
+import pytest
+from rdflib import BNode, Graph, Literal, Namespace, URIRef, XSD
+from rdflib.compare import isomorphic
+from rdflib.query import Result
+from werkzeug.datastructures import MIMEAccept
+
+import sparql_results
+import sparql_server_production as server
+from sparql_results import GRAPH_FORMATS, SOLUTION_FORMATS, iter_rows, negotiate_format, prime_rows
+
+EX = Namespace('http://example.org/')
+
+SELECT = '''
+SELECT ?s ?label ?extra WHERE {
+    ?s <http://example.org/label> ?label
+    OPTIONAL { ?s <http://example.org/extra> ?extra }
+} ORDER BY ?s ?label
+'''
+CONSTRUCT = 'CONSTRUCT { ?s ?p ?o } WHERE { ?s ?p ?o }'
+
+
+@pytest.fixture
+def graph():
+    graph = Graph()
+    graph.add((EX.a, EX.label, Literal('testo "citato", con virgola\nsu due righe\tcon tab', lang='it')))
+    graph.add((EX.a, EX.extra, Literal(42)))
+    graph.add((EX.b, EX.label, Literal('àèìòù <b> & €')))
+    graph.add((EX.c, EX.label, Literal('2024-01-01T10:00:00', datatype=XSD.dateTime)))
+    graph.add((EX.c, EX.label, EX.target))
+    graph.add((BNode(), EX.label, Literal('nodo anonimo')))
+    return graph
+
+
+def write(graph, query, format_name, chunk_size=7):
+    writer = dict(SOLUTION_FORMATS, **GRAPH_FORMATS)[format_name][1]
+    return b''.join(writer(graph.query(query), chunk_size=chunk_size))
+
+
+def normalize(rows, variables):
+    """Righe confrontabili: i nodi anonimi cambiano etichetta dopo il parsing"""
+    normalized = []
+    for row in rows:
+        values = tuple('_:' if isinstance(row[var], BNode) else row[var] for var in variables)
+        normalized.append(values)
+    return sorted(normalized, key=repr)
+
+
+def json_bindings(body):
+    """Binding SPARQL JSON confrontabili (ordine delle chiavi ininfluente)"""
+    data = json.loads(body)
+    return data['head'], sorted((sorted(binding.items()) for binding in data['results']['bindings']),
+                                key=repr)
+
+
+@pytest.mark.parametrize('generator_supported', [True, False])
+def test_streamed_json_matches_rdflib(graph, monkeypatch, generator_supported):
+    monkeypatch.setattr(sparql_results, '_RESULT_GENERATOR_SUPPORTED', generator_supported)
+    expected = graph.query(SELECT).serialize(format='json')
+    streamed = write(graph, SELECT, 'json')
+    head, bindings = json_bindings(streamed)
+    expected_head, expected_bindings = json_bindings(expected)
+    assert head == expected_head
+    # Stesse etichette dei nodi anonimi: entrambe le valutazioni partono dallo stesso grafo
+    assert bindings == expected_bindings
+
+
+def test_rows_not_retained_by_result(graph):
+    result = graph.query(SELECT)
+    rows = list(prime_rows(result))
+    assert len(rows) == 5
+    # Con il generatore di rdflib le righe non vengono copiate nel risultato
+    assert not getattr(result, '_bindings', None)
+
+
+def test_unsupported_rdflib_version_uses_public_iteration(graph, monkeypatch):
+    monkeypatch.setattr(sparql_results, '_RESULT_GENERATOR_SUPPORTED', False)
+    result = graph.query(SELECT)
+    assert list(iter_rows(result)) == list(result)
+
+
+@pytest.mark.parametrize('format_name', ['json', 'xml', 'tsv'])
+def test_select_round_trip(graph, format_name):
+    expected = graph.query(SELECT)
+    parsed = Result.parse(io.BytesIO(write(graph, SELECT, format_name)), format=format_name)
+    assert [str(var) for var in parsed.vars] == ['s', 'label', 'extra']
+    variables = expected.vars
+    assert normalize(parsed, variables) == normalize(expected, variables)
+
+
+def test_select_csv_round_trip(graph):
+    # CSV conserva solo i valori: lingua e datatype dei letterali si perdono
+    expected = graph.query(SELECT)
+    parsed = Result.parse(io.BytesIO(write(graph, SELECT, 'csv')), format='csv')
+    variables = expected.vars
+
+    def values(rows):
+        return sorted((tuple('_:' if isinstance(row[var], BNode) else str(row[var] or '')
+                             for var in variables) for row in rows), key=repr)
+
+    assert values(parsed) == values(expected)
+
+
+@pytest.mark.parametrize('format_name', ['json', 'xml'])
+@pytest.mark.parametrize('query, answer', [('ASK { ?s <http://example.org/extra> 42 }', True),
+                                           ('ASK { ?s <http://example.org/extra> 43 }', False)])
+def test_ask_round_trip(graph, format_name, query, answer):
+    parsed = Result.parse(io.BytesIO(write(graph, query, format_name)), format=format_name)
+    assert parsed.askAnswer is answer
+
+
+@pytest.mark.parametrize('format_name, rdf_format', [('turtle', 'turtle'), ('nt', 'nt')])
+def test_construct_round_trip(graph, format_name, rdf_format):
+    parsed = Graph().parse(data=write(graph, CONSTRUCT, format_name).decode('utf-8'), format=rdf_format)
+    assert isomorphic(parsed, graph)
+
+
+@pytest.mark.parametrize('form, accept, expected', [
+    ('SELECT', [('text/csv', 0.5), ('application/sparql-results+xml', 0.9)], 'xml'),
+    ('SELECT', [('application/sparql-results+json', 0.2), ('text/tab-separated-values', 1)], 'tsv'),
+    ('SELECT', [('text/html', 1), ('*/*', 0.1)], 'json'),
+    ('SELECT', [('application/json', 1)], 'json'),
+    ('CONSTRUCT', [('text/turtle', 0.3), ('application/n-triples', 0.8)], 'nt'),
+    ('CONSTRUCT', [('application/sparql-results+json', 1)], 'turtle'),
+    ('DESCRIBE', [('text/plain', 1)], 'nt'),
+])
+def test_negotiate_accept_quality(form, accept, expected):
+    assert negotiate_format(form, accept=MIMEAccept(accept))[0] == expected
+
+
+def test_negotiate_format_parameter():
+    accept = MIMEAccept([('text/csv', 1)])
+    assert negotiate_format('SELECT', 'srx', accept)[0] == 'xml'
+    assert negotiate_format('CONSTRUCT', 'ttl')[0] == 'turtle'
+    assert negotiate_format('SELECT', 'turtle') is None
+    assert negotiate_format('CONSTRUCT', 'csv') is None
+
+
+def test_unsupported_format_is_406(tmp_path, monkeypatch, graph):
+    path = tmp_path / 'kg.nt'
+    graph.serialize(str(path), format='nt', encoding='utf-8')
+    monkeypatch.setattr(server, 'use_wal', False)
+    monkeypatch.setattr(server, 'use_snapshots', False)
+    monkeypatch.setattr(server, 'query_pool', None)
+    server.configure_slow_query_log('none', 1000.0, 1.0, 1)
+    assert server.load_knowledge_graph(str(path))
+    client = server.app.test_client()
+    response = client.get('/sparql', query_string={'query': SELECT, 'format': 'turtle'})
+    assert response.status_code == 406
+    response = client.get('/sparql', query_string={'query': CONSTRUCT},
+                          headers={'Accept': 'text/csv;q=0.9, application/n-triples;q=0.5'})
+    assert response.status_code == 200
+    assert response.mimetype == GRAPH_FORMATS['nt'][0]
+    assert isomorphic(Graph().parse(data=response.get_data(as_text=True), format='nt'), graph)
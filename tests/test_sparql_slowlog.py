@@ -0,0 +1,46 @@
+import json
+
+import sparql_server_production as server
+from sparql_slowlog import SlowQueryLog, fingerprint, iter_log, worker_log_path
+
+
+def test_fingerprint_ignores_literal_values():
+    first = fingerprint('SELECT ?s WHERE { ?s <http://example.org/p> "uno" } LIMIT 10')
+    second = fingerprint('SELECT ?s  WHERE { ?s <http://example.org/p> "due" } LIMIT 20')
+    assert first == second
+
+
+def test_worker_log_path():
+    assert worker_log_path('slow_queries.log', 3) == 'slow_queries.worker-3.log'
+    assert worker_log_path('/var/log/dkg/slow', 0) == '/var/log/dkg/slow.worker-0'
+    assert worker_log_path('none', 1) == 'none'
+
+
+def test_worker_logs_are_separate_files(tmp_path):
+    base = str(tmp_path / 'slow.log')
+    logs = [SlowQueryLog(worker_log_path(base, slot), threshold=0.0) for slot in range(2)]
+    for slot, log in enumerate(logs):
+        assert log.record(f'SELECT * WHERE {{ ?s ?p {slot} }}', 0.5, rows=slot)
+    paths = sorted(str(path) for path in tmp_path.iterdir())
+    assert paths == [worker_log_path(base, 0), worker_log_path(base, 1)]
+    entries = list(iter_log(paths))
+    assert [entry['rows'] for entry in entries] == [0, 1]
+    assert json.loads(open(paths[1]).read())['durationMs'] == 500.0
+
+
+def test_slow_query_admin_route_requires_admin_access(monkeypatch):
+    server.configure_slow_query_log('none', 1000.0, 1.0, 1)
+    server.slow_queries.record('SELECT * WHERE { ?s ?p ?o }', 0.2, rows=3)
+    client = server.app.test_client()
+    remote = {'REMOTE_ADDR': '203.0.113.7'}
+    assert client.get('/admin/slow-queries', environ_base=remote).status_code == 403
+    assert client.delete('/admin/slow-queries', headers={'X-Real-IP': '203.0.113.7'}).status_code == 403
+    assert client.delete('/dkg/admin/slow-queries').status_code == 404
+    assert client.get('/admin/slow-queries').get_json()['fingerprints'] == 1
+
+    monkeypatch.setattr(server, 'admin_token', 's3greto')
+    assert client.delete('/admin/slow-queries').status_code == 401
+    response = client.delete('/admin/slow-queries', environ_base=remote,
+                             headers={'Authorization': 'Bearer s3greto'})
+    assert response.status_code == 200
+    assert response.get_json()['fingerprints'] == 0
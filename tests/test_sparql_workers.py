@@ -0,0 +1,128 @@
+import json
+import time
+
+import pytest
+from rdflib import Graph, Literal, URIRef
+
+from sparql_cache import QueryResultCache
+from sparql_workers import QueryError, QueryWorkerPool, fork_available
+
+pytestmark = pytest.mark.skipif(not fork_available(), reason='i worker richiedono fork()')
+
+QUERY = 'SELECT ?s ?o WHERE { ?s <http://example.org/p> ?o }'
+
+
+@pytest.fixture
+def pool():
+    graph = Graph()
+    for i in range(5000):
+        graph.add((URIRef(f'http://example.org/s{i}'), URIRef('http://example.org/p'), Literal(f'valore {i}')))
+    pool = QueryWorkerPool(lambda: graph, lambda: 1, size=1, timeout=5.0)
+    pool.start()
+    yield pool
+    pool.close()
+
+
+def test_stream_complete(pool):
+    body = b''.join(pool.execute(QUERY, 'json'))
+    assert len(json.loads(body)['results']['bindings']) == 5000
+
+
+def test_row_count_reported_on_completion(pool):
+    counts = []
+    chunks = pool.execute(QUERY, 'csv', on_complete=counts.append)
+    assert counts == []
+    b''.join(chunks)
+    assert counts == [5000]
+    b''.join(pool.execute('ASK { ?s ?p ?o }', 'json', on_complete=counts.append))
+    assert counts == [5000, 0]
+
+
+def test_slow_client_does_not_time_out(pool):
+    # Il client impiega più del tempo massimo a scaricare una query veloce
+    chunks = []
+    for chunk in pool.execute(QUERY, 'json'):
+        chunks.append(chunk)
+        time.sleep(0.6)
+    assert len(chunks) * 0.6 > pool.timeout
+    assert len(json.loads(b''.join(chunks))['results']['bindings']) == 5000
+    assert pool.timeouts == 0
+
+
+def test_worker_lost_mid_stream_aborts_and_is_not_cached(pool):
+    cache = QueryResultCache()
+    key = cache.make_key(QUERY, 1, 'json')
+    chunks = cache.tee(key, pool.execute(QUERY, 'json'), 'application/sparql-results+json')
+    next(chunks)
+    for worker in list(pool._workers):
+        worker.process.kill()
+    with pytest.raises(QueryError):
+        for _ in chunks:
+            pass
+    assert cache.get(key) is None
+    # Il worker perso viene sostituito
+    assert len(json.loads(b''.join(pool.execute(QUERY, 'json')))['results']['bindings']) == 5000
+
+
+def rows_seen(pool):
+    return len(json.loads(b''.join(pool.execute(QUERY, 'json')))['results']['bindings'])
+
+
+def worker_pids(pool):
+    return {worker.process.pid for worker in pool._workers}
+
+
+def test_stale_workers_reforked_in_background():
+    graph = Graph()
+    graph.add((URIRef('http://example.org/s0'), URIRef('http://example.org/p'), Literal('a')))
+    version = [1]
+    pool = QueryWorkerPool(lambda: graph, lambda: version[0], size=2, timeout=5.0, refork_interval=0.3)
+    pool.start()
+    try:
+        pids = worker_pids(pool)
+        graph.add((URIRef('http://example.org/s1'), URIRef('http://example.org/p'), Literal('b')))
+        version[0] = 2
+        # Le richieste non attendono un fork: i worker leggono ancora la versione precedente
+        assert rows_seen(pool) == 1
+        assert worker_pids(pool) == pids
+        deadline = time.monotonic() + 5
+        while pool.reforks < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert pool.reforks == 2
+        assert worker_pids(pool).isdisjoint(pids)
+        assert rows_seen(pool) == 2
+    finally:
+        pool.close()
+
+
+def test_reforks_rate_limited_under_write_load():
+    graph = Graph()
+    version = [1]
+    pool = QueryWorkerPool(lambda: graph, lambda: version[0], size=1, timeout=5.0, refork_interval=60.0)
+    pool.start()
+    try:
+        pids = worker_pids(pool)
+        for i in range(20):
+            graph.add((URIRef(f'http://example.org/s{i}'), URIRef('http://example.org/p'), Literal(i)))
+            version[0] += 1
+            rows_seen(pool)
+        time.sleep(0.6)
+        assert pool.reforks == 0
+        assert worker_pids(pool) == pids
+    finally:
+        pool.close()
+
+
+def test_tee_stores_only_complete_streams():
+    cache = QueryResultCache()
+
+    def truncated():
+        yield b'{"head": '
+        raise QueryError('interrotta')
+
+    key = cache.make_key('SELECT * WHERE { ?s ?p ?o }', 1, 'json')
+    with pytest.raises(QueryError):
+        b''.join(cache.tee(key, truncated(), 'application/json'))
+    assert cache.get(key) is None
+    assert b''.join(cache.tee(key, iter([b'a', b'b']), 'text/plain')) == b'ab'
+    assert cache.get(key) == (b'ab', 'text/plain')